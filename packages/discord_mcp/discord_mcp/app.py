@@ -5,10 +5,12 @@ from threading import Thread
 import uvicorn
 from fastapi import FastAPI
 
+from discord_mcp import db
 from discord_mcp.background_worker import (
     run_discord_mesage_download_and_write_background_worker_loop,
 )
 from discord_mcp.embedding_background_worker import (
+    get_embedding_status,
     start_embedding_background_worker_embedding,
 )
 from discord_mcp.mcp_server import mcp
@@ -25,6 +27,10 @@ def start_background_worker_download_and_write():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with contextlib.AsyncExitStack() as stack:
+        # Run migrations once, before any worker or tool touches the db
+        db.get_connection_manager().initialize()
+        stack.callback(db.close_connections)
+
         # Start embedding background worker
         print("Starting embedding background worker...")
         embedding_thread = start_embedding_background_worker_embedding()
@@ -39,5 +45,7 @@ async def lifespan(app: FastAPI):
 
 if __name__ == "__main__":
     app = FastAPI(lifespan=lifespan)
+    # Embedding backlog, budget use and ETA
+    app.add_api_route("/embedding_status", get_embedding_status, methods=["GET"])
     app.mount("/mcp", mcp.streamable_http_app())
     uvicorn.run(app, host="0.0.0.0", port=8008)
@@ -1,20 +1,45 @@
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional
+from typing import Dict, List
 
 from discord_mcp.client import DiscordClient
 from discord_mcp.db import (
+    delete_permission_snapshot,
+    get_channel_sync_state,
+    get_connection_stats,
     get_discord_connection,
-    get_earliest_timestamp_from_db,
-    get_latest_timestamp_from_db,
     get_message_count,
-    upsert_channel,
+    get_permission_snapshot,
+    upsert_channel_sync_state,
+    upsert_channels,
     upsert_guild,
-    upsert_message,
-    upsert_user,
+    upsert_messages,
+    upsert_permission_snapshot,
+    upsert_users,
+)
+from discord_mcp.exceptions import ForbiddenException
+from discord_mcp.models import (
+    ChannelSyncState,
+    DiscordChannel,
+    DiscordGuild,
+    DiscordMessage,
+    DiscordUser,
+    datetime_to_snowflake,
+)
+from discord_mcp.permissions_api import (
+    TEXT_CHANNEL_TYPES,
+    fetch_permission_snapshot,
+    has_read_access,
+    is_snapshot_stale,
+    resolve_channel_permissions,
 )
-from discord_mcp.models import DiscordChannel, DiscordGuild, DiscordMessage, DiscordUser
+
+# Channels whose messages are downloaded at the same time
+SYNC_CONCURRENCY = 4
 
 
 def get_discord_client():
@@ -40,57 +65,152 @@ def datetime_to_discord_timestamp(dt: datetime) -> str:
         return iso_string + "Z"
 
 
-def get_time_windows_to_fetch(
-    earliest_ts: Optional[str], latest_ts: Optional[str], days_back: int = 365
-) -> List[tuple[datetime, datetime]]:
-    """
-    Get time windows that need to be fetched, avoiding already indexed ranges.
+def get_message_users(messages: List[Dict]) -> Dict[str, DiscordUser]:
+    """Authors and mentioned users of a page of messages"""
+    users: Dict[str, DiscordUser] = {}
+    for message_data in messages:
+        if message_data.get("author"):
+            author_data = message_data["author"]
+            users.setdefault(author_data["id"], DiscordUser(**author_data))
+        for mention in message_data.get("mentions", []):
+            users.setdefault(mention["id"], DiscordUser(**mention))
+    return users
 
-    Args:
-        earliest_ts: Earliest message timestamp in database (ISO string)
-        latest_ts: Latest message timestamp in database (ISO string)
-        days_back: Number of days to go back from now
 
-    Returns:
-        List of (start_time, end_time) tuples to fetch
+def write_message_page(
+    conn, messages: List[Dict], state: ChannelSyncState
+) -> tuple[int, int]:
     """
-    # Use timezone-aware datetime from the start
-    now = datetime.now(timezone.utc)
-    min_time = now - timedelta(days=days_back)
-
-    windows = []
+    Store a page of messages, their users and the sync state it advances to.
+    Returns (n_inserted, n_updated) messages.
+    """
+    upsert_users(conn, list(get_message_users(messages).values()))
+    counts = upsert_messages(
+        conn, [DiscordMessage.from_discord_api(m) for m in messages]
+    )
+    upsert_channel_sync_state(conn, state)
+    return counts
 
-    if earliest_ts is None or latest_ts is None:
-        # No data in database, fetch everything
-        windows.append((min_time, now))
-    else:
-        earliest_dt = parse_discord_timestamp(earliest_ts)
-        latest_dt = parse_discord_timestamp(latest_ts)
 
-        # Fetch newer messages (from latest_dt to now)
-        if latest_dt < now:
-            windows.append((latest_dt, now))
+def sync_channel(
+    client: DiscordClient, channel_id: str, min_snowflake: str, writer
+) -> int:
+    """
+    Download the messages of a channel that are not stored yet.
 
-        # Fetch older messages (from min_time to earliest_dt)
-        if earliest_dt > min_time:
-            windows.append((min_time, earliest_dt))
+    New messages are fetched with after= the newest stored message, which is a
+    single request for a quiet channel. Until the backfill is complete, older
+    messages are fetched with before= the oldest stored message, down to
+    min_snowflake. The sync state is stored with every page, so an interrupted
+    sync resumes where it stopped.
 
-    return windows
+    Returns the number of new messages stored.
+    """
+    with writer() as conn:
+        state = get_channel_sync_state(conn, channel_id)
+    message_count = 0
+
+    if state.latest_message_id is not None:
+        for page in client.get_message_pages_after(channel_id, state.latest_message_id):
+            state.latest_message_id = page[-1]["id"]
+            with writer() as conn:
+                n_inserted, _ = write_message_page(conn, page, state)
+            message_count += n_inserted
+
+    if not state.backfill_complete:
+        started_at = datetime_to_snowflake(datetime.now(timezone.utc))
+        for page in client.get_message_pages_before(
+            channel_id, state.oldest_message_id
+        ):
+            in_window = [m for m in page if int(m["id"]) >= int(min_snowflake)]
+            if in_window:
+                if state.latest_message_id is None:
+                    state.latest_message_id = in_window[0]["id"]
+                state.oldest_message_id = in_window[-1]["id"]
+            with writer() as conn:
+                n_inserted, _ = write_message_page(conn, in_window, state)
+            message_count += n_inserted
+            if len(in_window) < len(page):
+                break
+
+        # Reached the start of the channel or the sync window
+        state.backfill_complete = True
+        if state.latest_message_id is None:
+            state.latest_message_id = started_at
+        with writer() as conn:
+            upsert_channel_sync_state(conn, state)
+
+    return message_count
+
+
+def get_writer(conn=None):
+    """
+    Context manager factory for the writes of a sync. Without a connection the
+    shared writer is checked out per page, so other writers are not blocked for
+    the whole sync. A given connection is shared between the crawler threads.
+    """
+    lock = threading.Lock()
+
+    @contextmanager
+    def writer():
+        if conn is None:
+            with get_discord_connection() as write_conn:
+                yield write_conn
+        else:
+            with lock:
+                yield conn
+
+    return writer
+
+
+def get_readable_channels(
+    writer,
+    client: DiscordClient,
+    guild_id: str,
+    user_id: str,
+    channels: List[Dict],
+    owner_id: str = None,
+) -> List[Dict]:
+    """
+    The channels the user can read, from the stored permission snapshot. The
+    roles are only fetched when the snapshot is stale, and all channels are
+    evaluated together. If the roles can not be fetched all channels are kept.
+    """
+    with writer() as conn:
+        snapshot = get_permission_snapshot(conn, guild_id, user_id)
+    if is_snapshot_stale(snapshot):
+        snapshot = fetch_permission_snapshot(
+            client, guild_id, user_id, owner_id, previous=snapshot
+        )
+        if snapshot is None:
+            return channels
+        with writer() as conn:
+            upsert_permission_snapshot(conn, snapshot)
+
+    with writer() as conn:
+        permissions = resolve_channel_permissions(conn, snapshot, channels)
+    return [c for c in channels if has_read_access(permissions[c["id"]])]
 
 
 def run_discord_mesage_download_and_write_background_worker_single(
-    conn, client: DiscordClient, guild_names: List[str] = None, days_back: int = 100
+    conn,
+    client: DiscordClient,
+    guild_names: List[str] = None,
+    days_back: int = 100,
+    max_workers: int = SYNC_CONCURRENCY,
 ):
     """
     Download Discord messages from specified guilds or all accessible guilds.
 
     Args:
-        conn: Database connection
+        conn: Database connection, or None to check out the writer per page
         client: Discord API client
         guild_names: List of guild names to process, or None for all guilds
         days_back: Number of days to go back from now (default: 100)
+        max_workers: Number of channels that are downloaded concurrently
     """
     print("Starting Discord message dump background worker")
+    writer = get_writer(conn)
 
     # Get guilds to process
     all_guilds = list(client.get_user_guilds())
@@ -105,116 +225,88 @@ def run_discord_mesage_download_and_write_background_worker_single(
         print("No guilds found to process")
         return
 
-    # Get time windows that need to be fetched
-    earliest_message_ts = get_earliest_timestamp_from_db(conn)
-    latest_message_ts = get_latest_timestamp_from_db(conn)
-
-    print(f"Database message range: {earliest_message_ts} to {latest_message_ts}")
-
-    windows_to_fetch = get_time_windows_to_fetch(
-        earliest_message_ts, latest_message_ts, days_back
-    )
-
-    if not windows_to_fetch:
-        print("No new time windows to fetch")
-        return
-
-    print(f"Will fetch {len(windows_to_fetch)} time windows")
+    try:
+        user_id = client.get_current_user()["id"]
+    except Exception as e:
+        print(f"Could not get current user, syncing all channels: {e}")
+        user_id = None
 
-    # Process each guild
+    # Collect the channels of all guilds, the messages are fetched per channel
+    channels_to_sync: List[Dict] = []
     for guild_info in guilds_to_process:
         guild_id = guild_info["id"]
         guild_name = guild_info["name"]
 
         print(f"\nProcessing guild: {guild_name} ({guild_id})")
 
-        # Upsert guild info
         try:
             # Get detailed guild info if not DM
+            owner_id = None
             if guild_id != "@me":
                 detailed_guild = client.get_guild(guild_id)
-                guild_model = DiscordGuild(**detailed_guild)
-                upsert_guild(conn, guild_model)
+                owner_id = detailed_guild.get("owner_id")
+                with writer() as write_conn:
+                    upsert_guild(write_conn, DiscordGuild(**detailed_guild))
 
             # Get channels for this guild
             channels = list(client.get_guild_channels(guild_id))
             print(f"Found {len(channels)} channels in guild {guild_name}")
 
-            # Process each channel
-            for channel_info in channels:
-                channel_id = channel_info["id"]
-                channel_name = channel_info.get("name", f"Channel-{channel_id}")
-                channel_type = channel_info.get("type", 0)
-
-                # Skip voice channels and categories
-                if channel_type not in [0, 1, 5, 10, 11, 12]:  # Text channel types
-                    continue
-
-                print(f"  Processing channel: {channel_name} ({channel_id})")
-
-                # Upsert channel info
-                channel_model = DiscordChannel(**channel_info)
-                upsert_channel(conn, channel_model)
-
-                # Process each time window for this channel
-                for start_time, end_time in windows_to_fetch:
-                    print(f"    Fetching messages from {start_time} to {end_time}")
-
-                    try:
-                        # Get messages in this time window
-                        message_count = 0
-                        user_cache: Dict[str, DiscordUser] = {}
-
-                        for message_data in client.get_messages_since(
-                            channel_id, start_time, until=end_time
-                        ):
-                            message_count += 1
-
-                            # Process message author
-                            if "author" in message_data and message_data["author"]:
-                                author_data = message_data["author"]
-                                author_id = author_data["id"]
-
-                                if author_id not in user_cache:
-                                    user_model = DiscordUser(**author_data)
-                                    user_cache[author_id] = user_model
-
-                            # Process mentioned users
-                            for mention in message_data.get("mentions", []):
-                                user_id = mention["id"]
-                                if user_id not in user_cache:
-                                    user_model = DiscordUser(**mention)
-                                    user_cache[user_id] = user_model
-
-                            # Create and store message
-                            message_model = DiscordMessage.from_discord_api(
-                                message_data
-                            )
-                            upsert_message(conn, message_model)
-
-                        # Upsert all users found in this batch
-                        for user_model in user_cache.values():
-                            upsert_user(conn, user_model)
-
-                        if message_count > 0:
-                            print(
-                                f"    Added {message_count} messages and {len(user_cache)} users"
-                            )
-
-                    except Exception as e:
-                        print(
-                            f"    Error fetching messages for channel {channel_name}: {e}"
-                        )
-                        continue
+            # Skip voice channels and categories
+            text_channels = [
+                c for c in channels if c.get("type", 0) in TEXT_CHANNEL_TYPES
+            ]
+            with writer() as write_conn:
+                upsert_channels(
+                    write_conn, [DiscordChannel(**c) for c in text_channels]
+                )
+
+            # Skip channels the user can not read, instead of failing on them
+            if guild_id != "@me" and user_id is not None:
+                readable_channels = get_readable_channels(
+                    writer, client, guild_id, user_id, text_channels, owner_id
+                )
+                n_skipped = len(text_channels) - len(readable_channels)
+                if n_skipped:
+                    print(f"Skipping {n_skipped} channels without read access")
+                text_channels = readable_channels
+            channels_to_sync.extend(text_channels)
 
         except Exception as e:
             print(f"Error processing guild {guild_name}: {e}")
             continue
 
-    total_messages = get_message_count(conn)
+    min_snowflake = datetime_to_snowflake(
+        datetime.now(timezone.utc) - timedelta(days=days_back)
+    )
+
+    def sync(channel_info: Dict):
+        channel_id = channel_info["id"]
+        channel_name = channel_info.get("name", f"Channel-{channel_id}")
+        try:
+            message_count = sync_channel(client, channel_id, min_snowflake, writer)
+            if message_count > 0:
+                print(f"  Added {message_count} messages in {channel_name}")
+        except ForbiddenException as e:
+            # The permissions changed, fetch the roles again on the next run
+            print(f"  No access to channel {channel_name}: {e}")
+            guild_id = channel_info.get("guild_id")
+            if guild_id and user_id is not None:
+                with writer() as write_conn:
+                    delete_permission_snapshot(write_conn, guild_id, user_id)
+        except Exception as e:
+            print(f"  Error fetching messages for channel {channel_name}: {e}")
+
+    print(f"Syncing {len(channels_to_sync)} channels")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(sync, channels_to_sync))
+
+    with writer() as read_conn:
+        total_messages = get_message_count(read_conn)
     print(
         f"\nBackground worker completed. Total messages in database: {total_messages}"
     )
+    print(f"Database connection stats: {get_connection_stats()}")
 
 
 def run_discord_mesage_download_and_write_background_worker_loop(
@@ -234,14 +326,13 @@ def run_discord_mesage_download_and_write_background_worker_loop(
 
     while True:
         try:
-            with get_discord_connection() as conn:
-                client = get_discord_client()
-                try:
-                    run_discord_mesage_download_and_write_background_worker_single(
-                        conn, client, guild_names, days_back
-                    )
-                finally:
-                    client.close()
+            client = get_discord_client()
+            try:
+                run_discord_mesage_download_and_write_background_worker_single(
+                    None, client, guild_names, days_back
+                )
+            finally:
+                client.close()
 
             print(f"Sleeping for {sleep_interval} seconds...")
             time.sleep(sleep_interval)
@@ -0,0 +1,47 @@
+"""Group consecutive messages of a channel into windows that are embedded together."""
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from toolbox_store.chat import window_conversations
+
+from discord_mcp.models import DiscordMessage
+
+
+def message_time(message: DiscordMessage) -> float:
+    return datetime.fromisoformat(message.timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def window_to_chunk(
+    window: List[DiscordMessage], chunk_id: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "chunk_id": chunk_id or str(uuid.uuid4()),
+        "message_ids": [message.id for message in window],
+        "chunk_text": "\n".join(message.content for message in window),
+    }
+
+
+def chunk_messages(
+    messages: List[DiscordMessage],
+    trailing_chunks: Optional[Dict[str, Tuple[str, List[DiscordMessage]]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Group new messages into per-channel windows.
+
+    trailing_chunks maps a channel id to the id and messages of its last embedded
+    chunk, that chunk is replaced if the new messages extend it, see
+    toolbox_store.chat.window_conversations.
+    """
+    return [
+        window_to_chunk(window, chunk_id)
+        for chunk_id, window in window_conversations(
+            messages,
+            get_conversation=lambda m: m.channel_id,
+            get_position=lambda m: int(m.id),
+            get_text=lambda m: m.content,
+            get_time=message_time,
+            trailing_windows=trailing_chunks,
+        )
+    ]
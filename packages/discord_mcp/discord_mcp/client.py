@@ -15,6 +15,8 @@ from discord_mcp.exceptions import (
     ForbiddenException,
     NotFoundException,
 )
+from discord_mcp.models import datetime_to_snowflake
+from discord_mcp.rate_limit import DiscordRateLimiter, get_rate_limiter, get_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +38,12 @@ class RateLimitPreference(Enum):
 
 
 class DiscordClient:
-    """Discord API client with rate limiting and retry logic."""
+    """Discord API client with rate limiting and retry logic.
+
+    Requests wait only for the rate limit bucket of their own route and channel
+    or guild, so the client can be shared by threads that crawl different
+    channels.
+    """
 
     BASE_URL = "https://discord.com/api/v10"
     MAX_RETRIES = 8
@@ -47,30 +54,22 @@ class DiscordClient:
         self,
         token: str,
         rate_limit_preference: RateLimitPreference = RateLimitPreference.RESPECT_ALL,
+        rate_limiter: Optional[DiscordRateLimiter] = None,
+        transport: Optional[httpx.BaseTransport] = None,
     ):
         """Initialize Discord client.
 
         Args:
             token: Discord token (user or bot)
             rate_limit_preference: How to handle rate limits
+            rate_limiter: Rate limit state, shared by all clients of the token by default
+            transport: HTTP transport, e.g. a mock transport in tests
         """
         self.token = token
         self.rate_limit_preference = rate_limit_preference
+        self.rate_limiter = rate_limiter or get_rate_limiter(token)
         self._resolved_token_kind: Optional[TokenKind] = None
-        self._session = httpx.Client(timeout=30.0)
-
-    def close(self):
-        """Close the HTTP session."""
-        if self._session:
-            self._session.close()
-
-    def __enter__(self):
-        """Context manager entry for backward compatibility."""
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit for backward compatibility."""
-        self.close()
+        self._session = httpx.Client(timeout=30.0, transport=transport)
 
     def _should_respect_rate_limits(self, token_kind: TokenKind) -> bool:
         """Check if rate limits should be respected for the given token kind."""
@@ -90,6 +89,63 @@ class DiscordClient:
         else:
             return self.token
 
+    def _get_headers(self, token_kind: TokenKind) -> Dict[str, str]:
+        return {
+            "Authorization": self._get_auth_header(token_kind),
+            "User-Agent": (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                "AppleWebKit/537.36 (KHTML, like Gecko) "
+                "Chrome/120.0.0.0 Safari/537.36"
+            ),
+            "Accept": "*/*",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Referer": "https://discord.com/channels/@me",
+            "Origin": "https://discord.com",
+            "Sec-Fetch-Dest": "empty",
+            "Sec-Fetch-Mode": "cors",
+            "Sec-Fetch-Site": "same-origin",
+        }
+
+    def _get_url(self, endpoint: str) -> str:
+        return f"{self.BASE_URL}/{endpoint.lstrip('/')}"
+
+    def _get_retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before retrying a rate limited request."""
+        if response.headers.get("Retry-After"):
+            return min(get_retry_after(response), self.MAX_DELAY)
+        # Fallback to exponential backoff
+        return min(self.INITIAL_DELAY * (2**attempt) + 1, self.MAX_DELAY)
+
+    def _get_backoff_delay(self, attempt: int) -> float:
+        return min(self.INITIAL_DELAY * (2**attempt) + 1, self.MAX_DELAY)
+
+    def _raise_for_status(self, response: httpx.Response, endpoint: str):
+        """Raise the exception for an error response, 429s are retried by the caller."""
+        if response.status_code == 401:
+            raise AuthenticationException("Authentication token is invalid")
+        elif response.status_code == 403:
+            raise ForbiddenException(f"Request to '{endpoint}' failed: forbidden")
+        elif response.status_code == 404:
+            raise NotFoundException(f"Request to '{endpoint}' failed: not found")
+        elif response.status_code >= 400 and response.status_code != 429:
+            error_text = response.text
+            raise DiscordException(
+                f"Request to '{endpoint}' failed with status {response.status_code}: {error_text}"
+            )
+
+    def close(self):
+        """Close the HTTP session."""
+        if self._session:
+            self._session.close()
+
+    def __enter__(self):
+        """Context manager entry for backward compatibility."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit for backward compatibility."""
+        self.close()
+
     def _resolve_token_kind(self) -> TokenKind:
         """Resolve the token kind by attempting authentication."""
         if self._resolved_token_kind is not None:
@@ -127,66 +183,16 @@ class DiscordClient:
         if token_kind is None:
             token_kind = self._resolve_token_kind()
 
-        url = f"{self.BASE_URL}/{endpoint.lstrip('/')}"
-        headers = {
-            "Authorization": self._get_auth_header(token_kind),
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Referer": "https://discord.com/channels/@me",
-            "Origin": "https://discord.com",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-        }
+        url = self._get_url(endpoint)
+        headers = self._get_headers(token_kind)
+        respect_rate_limits = self._should_respect_rate_limits(token_kind)
 
         for attempt in range(self.MAX_RETRIES + 1):
+            if respect_rate_limits:
+                self.rate_limiter.acquire(method, endpoint)
+            response = None
             try:
                 response = self._session.request(method, url, headers=headers, **kwargs)
-
-                # Handle rate limiting before checking response status
-                if self._should_respect_rate_limits(token_kind):
-                    self._handle_rate_limiting(response)
-
-                # Check for HTTP errors
-                if response.status_code == 401:
-                    raise AuthenticationException("Authentication token is invalid")
-                elif response.status_code == 403:
-                    raise ForbiddenException(
-                        f"Request to '{endpoint}' failed: forbidden"
-                    )
-                elif response.status_code == 404:
-                    raise NotFoundException(
-                        f"Request to '{endpoint}' failed: not found"
-                    )
-                elif response.status_code == 429:
-                    # Handle rate limiting
-                    retry_after = response.headers.get("Retry-After")
-                    if retry_after:
-                        delay = float(retry_after) + 1.0  # Add 1 second buffer
-                        logger.warning(f"Rate limited. Waiting {delay} seconds...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        # Fallback to exponential backoff
-                        delay = min(
-                            self.INITIAL_DELAY * (2**attempt) + 1, self.MAX_DELAY
-                        )
-                        time.sleep(delay)
-                        continue
-                elif response.status_code >= 400:
-                    error_text = response.text
-                    raise DiscordException(
-                        f"Request to '{endpoint}' failed with status {response.status_code}: {error_text}"
-                    )
-
-                # Parse JSON response
-                return response.json()
-
             except (httpx.RequestError, httpx.TimeoutException) as e:
                 if attempt == self.MAX_RETRIES:
                     raise DiscordException(
@@ -194,31 +200,30 @@ class DiscordClient:
                     )
 
                 # Exponential backoff
-                delay = min(self.INITIAL_DELAY * (2**attempt) + 1, self.MAX_DELAY)
+                delay = self._get_backoff_delay(attempt)
                 logger.warning(
                     f"Request failed (attempt {attempt + 1}), retrying in {delay} seconds..."
                 )
                 time.sleep(delay)
+                continue
+            finally:
+                if respect_rate_limits:
+                    self.rate_limiter.update(method, endpoint, response)
+
+            self._raise_for_status(response, endpoint)
+            if response.status_code == 429:
+                # The limiter already blocks the bucket, only wait here if it is ignored
+                if not respect_rate_limits:
+                    delay = self._get_retry_delay(response, attempt)
+                    logger.warning(f"Rate limited. Waiting {delay} seconds...")
+                    time.sleep(delay)
+                continue
+
+            # Parse JSON response
+            return response.json()
 
         raise DiscordException("Maximum retries exceeded")
 
-    def _handle_rate_limiting(self, response: httpx.Response) -> None:
-        """Handle Discord's advisory rate limiting."""
-        remaining = response.headers.get("X-RateLimit-Remaining")
-        reset_after = response.headers.get("X-RateLimit-Reset-After")
-
-        if remaining is not None and reset_after is not None:
-            remaining_requests = int(remaining)
-            reset_delay = float(reset_after)
-
-            # If this was the last request before hitting rate limit, wait
-            if remaining_requests <= 0:
-                delay = min(reset_delay + 1.0, self.MAX_DELAY)  # Add 1 second buffer
-                logger.info(
-                    f"Proactive rate limit handling. Waiting {delay} seconds..."
-                )
-                time.sleep(delay)
-
     def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get a user by ID."""
         try:
@@ -286,6 +291,49 @@ class DiscordClient:
             if len(response) < min(limit, 100):
                 break
 
+    def get_message_pages_after(
+        self, channel_id: str, after: str
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        """Get pages of up to 100 messages newer than `after`, oldest first."""
+        while True:
+            params = {"limit": "100", "after": after}
+            response = self._make_request(
+                "GET", f"channels/{channel_id}/messages?{urlencode(params)}"
+            )
+            if not response:
+                break
+
+            page = sorted(response, key=lambda m: int(m["id"]))
+            yield page
+            after = page[-1]["id"]
+
+            if len(response) < 100:
+                break
+
+    def get_message_pages_before(
+        self, channel_id: str, before: Optional[str] = None
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        """Get pages of up to 100 messages older than `before`, newest first.
+
+        Without `before` the first page holds the newest messages of the channel.
+        """
+        while True:
+            params = {"limit": "100"}
+            if before:
+                params["before"] = before
+            response = self._make_request(
+                "GET", f"channels/{channel_id}/messages?{urlencode(params)}"
+            )
+            if not response:
+                break
+
+            page = sorted(response, key=lambda m: int(m["id"]), reverse=True)
+            yield page
+            before = page[-1]["id"]
+
+            if len(response) < 100:
+                break
+
     def get_messages_since(
         self,
         channel_id: str,
@@ -295,15 +343,12 @@ class DiscordClient:
     ) -> Generator[Dict[str, Any], None, None]:
         """Get messages from a channel since a specific datetime."""
         # Convert datetime to Discord snowflake (approximate)
-        timestamp_ms = int(since.timestamp() * 1000)
-        discord_epoch = 1420070400000  # Discord epoch: January 1, 2015
-        snowflake = str((timestamp_ms - discord_epoch) << 22)
+        snowflake = datetime_to_snowflake(since)
 
         # Convert until datetime to snowflake if provided
         until_snowflake = before
         if until and not before:
-            until_ms = int(until.timestamp() * 1000)
-            until_snowflake = str((until_ms - discord_epoch) << 22)
+            until_snowflake = datetime_to_snowflake(until)
 
         for message in self.get_messages(
             channel_id, after=snowflake, before=until_snowflake
@@ -1,15 +1,24 @@
-import sqlite3
+import json
+import threading
+import time
 from collections import defaultdict
-from contextlib import contextmanager
-from datetime import datetime, timedelta
 from pathlib import Path
 
 import numpy as np
-import sqlite_vec
-from rapidfuzz import process
 from sqlite_vec import serialize_float32
-
-from discord_mcp.models import DiscordChannel, DiscordGuild, DiscordMessage, DiscordUser
+from toolbox_store.chat import MessageChunkTables, to_fts_query
+from toolbox_store.connection import ConnectionManager, ConnectionRegistry
+from toolbox_store.name_index import NameIndex
+
+from discord_mcp.models import (
+    DISCORD_EPOCH_MS,
+    ChannelSyncState,
+    DiscordChannel,
+    DiscordGuild,
+    DiscordMessage,
+    DiscordUser,
+    PermissionSnapshot,
+)
 
 HOME = Path.home()
 DISCORD_MCP_DB_PATH = HOME / ".discord_mcp" / "db.sqlite"
@@ -17,30 +26,38 @@ DISCORD_MCP_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 EMBEDDINGS_TABLE = "message_embeddings_vec"
 EMBEDDINGS_LEN = 768
+MESSAGES_FTS_TABLE = "messages_fts"
 
 
 def deserialize_float32(blob: bytes) -> list[float]:
     return np.frombuffer(blob, dtype=np.float32).tolist()
 
 
-def _get_discord_connection(path: Path = DISCORD_MCP_DB_PATH):
-    conn = sqlite3.connect(path)
-    conn.row_factory = sqlite3.Row
+_connections = ConnectionRegistry(
+    migrate=lambda conn: create_tables(conn),
+    default_path=lambda: DISCORD_MCP_DB_PATH,
+)
+
+
+def get_connection_manager(path: Path | None = None) -> ConnectionManager:
+    """The shared connection manager for a database, migrations run on first use"""
+    return _connections.get(path)
+
+
+def get_discord_connection(path: Path | None = None, readonly: bool = False):
+    """
+    Check out a shared connection. Writers are serialized, readonly connections
+    are per thread and can be used while a write is in progress.
+    """
+    return _connections.connect(path, readonly=readonly)
 
-    conn.enable_load_extension(True)
-    sqlite_vec.load(conn)
-    conn.enable_load_extension(False)
-    create_tables(conn)
-    return conn
 
+def get_connection_stats() -> list[dict]:
+    return _connections.get_stats()
 
-@contextmanager
-def get_discord_connection(path: Path = DISCORD_MCP_DB_PATH):
-    conn = _get_discord_connection(path)
-    try:
-        yield conn
-    finally:
-        conn.close()
+
+def close_connections():
+    _connections.close()
 
 
 def create_tables(conn):
@@ -113,11 +130,15 @@ def create_tables(conn):
         embeds TEXT,
         components TEXT,
         flags INTEGER,
+        ts_ms INTEGER,
         FOREIGN KEY (channel_id) REFERENCES channels(id),
         FOREIGN KEY (author_id) REFERENCES users(id)
     )
     """)
 
+    add_message_ts_ms(conn)
+    add_messages_fts(conn)
+
     cursor.execute(
         f"""
             create virtual table if not exists {EMBEDDINGS_TABLE} using vec0(
@@ -135,10 +156,144 @@ def create_tables(conn):
         FOREIGN KEY (message_id) REFERENCES messages(id)
     )
     """)
+    # Lookups from a message to its chunks, used to find unembedded messages
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_chunk_messages_message_id
+    ON chunk_messages (message_id)
+    """)
+    # One row per embedding request, the worker budgets tokens per minute from it
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS embedding_ledger (
+        id INTEGER PRIMARY KEY,
+        created_at REAL NOT NULL,
+        n_messages INTEGER NOT NULL,
+        n_chunks INTEGER NOT NULL,
+        n_tokens INTEGER NOT NULL,
+        duration_seconds REAL NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_embedding_ledger_created_at
+    ON embedding_ledger (created_at)
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS channel_sync_state (
+        channel_id TEXT PRIMARY KEY,
+        latest_message_id TEXT,
+        oldest_message_id TEXT,
+        backfill_complete BOOLEAN NOT NULL DEFAULT 0,
+        updated_at REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS permission_snapshots (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        member_role_ids TEXT NOT NULL,
+        role_permissions TEXT NOT NULL,
+        is_owner BOOLEAN NOT NULL DEFAULT 0,
+        fetched_at REAL,
+        roles_updated_at REAL,
+        PRIMARY KEY (guild_id, user_id)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS channel_permissions (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        permissions INTEGER NOT NULL,
+        overwrites_hash TEXT,
+        computed_at REAL NOT NULL,
+        PRIMARY KEY (guild_id, user_id, channel_id)
+    )
+    """)
 
     conn.commit()
 
 
+def add_message_ts_ms(conn):
+    """
+    Add the ts_ms column to databases created without it, fill it from the
+    message ids and index it for time range scans per channel and per author.
+    """
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "ts_ms" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN ts_ms INTEGER")
+    conn.execute(
+        f"""
+    UPDATE messages SET ts_ms = (CAST(id AS INTEGER) >> 22) + {DISCORD_EPOCH_MS}
+    WHERE ts_ms IS NULL
+    """
+    )
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_messages_channel_id_ts_ms
+    ON messages (channel_id, ts_ms)
+    """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_messages_author_id_ts_ms
+    ON messages (author_id, ts_ms)
+    """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_messages_ts_ms ON messages (ts_ms)
+    """)
+
+
+def add_messages_fts(conn):
+    """
+    Full text index over message content, kept in sync by triggers. It is an
+    external-content table over messages, so the text is only stored once and
+    the FTS rowid is the rowid of the message. Messages are upserted in place,
+    so a message keeps its rowid. Indexes that kept their own copy of the
+    content are rebuilt.
+    """
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = ?", (MESSAGES_FTS_TABLE,)
+    ).fetchone()
+    exists = row is not None and "content=" in row["sql"]
+    if row is not None and not exists:
+        for trigger in ("insert", "delete", "update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS messages_fts_{trigger}")
+        conn.execute(f"DROP TABLE {MESSAGES_FTS_TABLE}")
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {MESSAGES_FTS_TABLE} USING fts5(
+        content,
+        content='messages',
+        content_rowid='rowid',
+        tokenize='porter unicode61'
+    )
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO {MESSAGES_FTS_TABLE} (rowid, content)
+        VALUES (new.rowid, new.content);
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO {MESSAGES_FTS_TABLE} ({MESSAGES_FTS_TABLE}, rowid, content)
+        VALUES ('delete', old.rowid, old.content);
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO {MESSAGES_FTS_TABLE} ({MESSAGES_FTS_TABLE}, rowid, content)
+        VALUES ('delete', old.rowid, old.content);
+        INSERT INTO {MESSAGES_FTS_TABLE} (rowid, content)
+        VALUES (new.rowid, new.content);
+    END
+    """)
+    if not exists:
+        conn.execute(
+            f"INSERT INTO {MESSAGES_FTS_TABLE} ({MESSAGES_FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def get_cutoff_ms(n_days_old: int) -> int:
+    """Unix time in milliseconds n days ago"""
+    return int(time.time() * 1000) - n_days_old * 24 * 60 * 60 * 1000
+
+
 def upsert_guild(conn, guild: DiscordGuild):
     cursor = conn.cursor()
     cursor.execute(
@@ -151,54 +306,230 @@ def upsert_guild(conn, guild: DiscordGuild):
     conn.commit()
 
 
+UPSERT_CHANNEL_SQL = """
+INSERT OR REPLACE INTO channels (id, type, guild_id, name, parent_id, topic, position, rate_limit_per_user, permission_overwrites, nsfw, last_message_id, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_USER_SQL = """
+INSERT OR REPLACE INTO users (id, username, discriminator, avatar, global_name, public_flags, banner, accent_color, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+MESSAGE_COLUMNS = [
+    "id",
+    "channel_id",
+    "author_id",
+    "content",
+    "timestamp",
+    "edited_timestamp",
+    "type",
+    "pinned",
+    "mention_everyone",
+    "tts",
+    "mentions",
+    "mention_roles",
+    "attachments",
+    "embeds",
+    "components",
+    "flags",
+    "ts_ms",
+]
+
+# An update instead of a replace, so the FTS triggers see the old row
+UPSERT_MESSAGE_SQL = f"""
+INSERT INTO messages ({", ".join(MESSAGE_COLUMNS)})
+VALUES ({", ".join("?" for _ in MESSAGE_COLUMNS)})
+ON CONFLICT (id) DO UPDATE SET
+{", ".join(f"{column} = excluded.{column}" for column in MESSAGE_COLUMNS[1:])}
+"""
+
+
+def get_existing_ids(conn, table: str, ids: list[str]) -> set[str]:
+    """Return the ids among ids that are stored in table"""
+    if not ids:
+        return set()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {table}.id FROM json_each(?) AS k JOIN {table} ON {table}.id = k.value",
+        (json.dumps(ids),),
+    )
+    return {row["id"] for row in cursor.fetchall()}
+
+
+def _upsert_rows(conn, table: str, sql: str, items) -> tuple[int, int]:
+    # Last write wins for duplicate ids within a batch, same as sequential upserts
+    rows_by_id = {item.id: item.to_sql_tuple() for item in items}
+    if not rows_by_id:
+        return 0, 0
+
+    with conn:
+        existing = get_existing_ids(conn, table, list(rows_by_id))
+        conn.executemany(sql, list(rows_by_id.values()))
+
+    n_updated = len(existing)
+    return len(rows_by_id) - n_updated, n_updated
+
+
+def upsert_channels(conn, channels: list[DiscordChannel]) -> tuple[int, int]:
+    """
+    Upsert a batch of channels in a single transaction.
+    Returns (n_inserted, n_updated).
+    """
+    return _upsert_rows(conn, "channels", UPSERT_CHANNEL_SQL, channels)
+
+
+def upsert_users(conn, users: list[DiscordUser]) -> tuple[int, int]:
+    """
+    Upsert a batch of users in a single transaction.
+    Returns (n_inserted, n_updated).
+    """
+    return _upsert_rows(conn, "users", UPSERT_USER_SQL, users)
+
+
+def upsert_messages(conn, messages: list[DiscordMessage]) -> tuple[int, int]:
+    """
+    Upsert a batch of messages in a single transaction.
+    Returns (n_inserted, n_updated).
+    """
+    return _upsert_rows(conn, "messages", UPSERT_MESSAGE_SQL, messages)
+
+
 def upsert_channel(conn, channel: DiscordChannel):
+    upsert_channels(conn, [channel])
+
+
+def upsert_user(conn, user: DiscordUser):
+    upsert_users(conn, [user])
+
+
+def upsert_message(conn, message: DiscordMessage):
+    upsert_messages(conn, [message])
+
+
+def get_channel_sync_state(conn, channel_id: str) -> ChannelSyncState:
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM channel_sync_state WHERE channel_id = ?", (channel_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return ChannelSyncState(channel_id=channel_id)
+    return ChannelSyncState(**dict(row))
+
+
+def upsert_channel_sync_state(conn, state: ChannelSyncState):
     cursor = conn.cursor()
     cursor.execute(
         """
-    INSERT OR REPLACE INTO channels (id, type, guild_id, name, parent_id, topic, position, rate_limit_per_user, permission_overwrites, nsfw, last_message_id, created_at)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    INSERT OR REPLACE INTO channel_sync_state (channel_id, latest_message_id, oldest_message_id, backfill_complete, updated_at)
+    VALUES (?, ?, ?, ?, ?)
     """,
-        channel.to_sql_tuple(),
+        (
+            state.channel_id,
+            state.latest_message_id,
+            state.oldest_message_id,
+            state.backfill_complete,
+            time.time(),
+        ),
     )
     conn.commit()
 
 
-def upsert_user(conn, user: DiscordUser):
+def get_permission_snapshot(
+    conn, guild_id: str, user_id: str
+) -> PermissionSnapshot | None:
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM permission_snapshots WHERE guild_id = ? AND user_id = ?",
+        (guild_id, user_id),
+    )
+    row = cursor.fetchone()
+    return PermissionSnapshot.from_sql_row(row) if row is not None else None
+
+
+def upsert_permission_snapshot(conn, snapshot: PermissionSnapshot):
     cursor = conn.cursor()
     cursor.execute(
         """
-    INSERT OR REPLACE INTO users (id, username, discriminator, avatar, global_name, public_flags, banner, accent_color, created_at)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    INSERT OR REPLACE INTO permission_snapshots (guild_id, user_id, member_role_ids, role_permissions, is_owner, fetched_at, roles_updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
     """,
-        user.to_sql_tuple(),
+        snapshot.to_sql_tuple(),
     )
     conn.commit()
 
 
-def upsert_message(conn, message: DiscordMessage):
+def delete_permission_snapshot(conn, guild_id: str, user_id: str):
+    """Forget the roles and cached channel permissions of a user in a guild"""
+    with conn:
+        conn.execute(
+            "DELETE FROM permission_snapshots WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id),
+        )
+        conn.execute(
+            "DELETE FROM channel_permissions WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id),
+        )
+
+
+def get_cached_channel_permissions(
+    conn, guild_id: str, user_id: str, since: float
+) -> dict[str, tuple[int, str]]:
+    """channel id -> (permissions, overwrites hash), for results computed since"""
     cursor = conn.cursor()
     cursor.execute(
         """
-    INSERT OR REPLACE INTO messages (id, channel_id, author_id, content, timestamp, edited_timestamp, type, pinned, mention_everyone, tts, mentions, mention_roles, attachments, embeds, components, flags)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    SELECT channel_id, permissions, overwrites_hash FROM channel_permissions
+    WHERE guild_id = ? AND user_id = ? AND computed_at >= ?
     """,
-        message.to_sql_tuple(),
+        (guild_id, user_id, since),
     )
-    conn.commit()
+    return {
+        row["channel_id"]: (row["permissions"], row["overwrites_hash"])
+        for row in cursor.fetchall()
+    }
+
+
+def upsert_channel_permissions(
+    conn, guild_id: str, user_id: str, rows: list[tuple[str, int, str]]
+):
+    """Store (channel id, permissions, overwrites hash) results"""
+    if not rows:
+        return
+    computed_at = time.time()
+    with conn:
+        conn.executemany(
+            """
+        INSERT OR REPLACE INTO channel_permissions (guild_id, user_id, channel_id, permissions, overwrites_hash, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (
+                    guild_id,
+                    user_id,
+                    channel_id,
+                    permissions,
+                    overwrites_hash,
+                    computed_at,
+                )
+                for channel_id, permissions, overwrites_hash in rows
+            ],
+        )
 
 
 def get_earliest_timestamp_from_db(conn):
     cursor = conn.cursor()
-    cursor.execute("SELECT MIN(timestamp) AS min_ts FROM messages;")
+    cursor.execute("SELECT timestamp FROM messages ORDER BY ts_ms ASC LIMIT 1")
     result = cursor.fetchone()
-    return result[0] if result[0] else None
+    return result[0] if result else None
 
 
 def get_latest_timestamp_from_db(conn):
     cursor = conn.cursor()
-    cursor.execute("SELECT MAX(timestamp) AS max_ts FROM messages;")
+    cursor.execute("SELECT timestamp FROM messages ORDER BY ts_ms DESC LIMIT 1")
     result = cursor.fetchone()
-    return result[0] if result[0] else None
+    return result[0] if result else None
 
 
 def get_message_count(conn):
@@ -212,15 +543,13 @@ def get_messages_from_channel(
 ) -> list[DiscordMessage]:
     """Get messages from a specific channel within the last n days"""
     cursor = conn.cursor()
-    cutoff_date = (datetime.now() - timedelta(days=n_days_old)).isoformat()
-
     cursor.execute(
         """
         SELECT * FROM messages
-        WHERE channel_id = ? AND timestamp >= ?
-        ORDER BY timestamp DESC
+        WHERE channel_id = ? AND ts_ms >= ?
+        ORDER BY ts_ms DESC
     """,
-        (channel_id, cutoff_date),
+        (channel_id, get_cutoff_ms(n_days_old)),
     )
 
     return [DiscordMessage.from_sql_row(row) for row in cursor.fetchall()]
@@ -229,16 +558,14 @@ def get_messages_from_channel(
 def get_messages_from_dm(conn, author_id: str, n_days_old: int) -> list[DiscordMessage]:
     """Get messages from DMs with a specific user within the last n days"""
     cursor = conn.cursor()
-    cutoff_date = (datetime.now() - timedelta(days=n_days_old)).isoformat()
-
     cursor.execute(
         """
         SELECT m.* FROM messages m
         JOIN channels c ON m.channel_id = c.id
-        WHERE c.type = 1 AND m.author_id = ? AND m.timestamp >= ?
-        ORDER BY m.timestamp DESC
+        WHERE c.type = 1 AND m.author_id = ? AND m.ts_ms >= ?
+        ORDER BY m.ts_ms DESC
     """,
-        (author_id, cutoff_date),
+        (author_id, get_cutoff_ms(n_days_old)),
     )
 
     return [DiscordMessage.from_sql_row(row) for row in cursor.fetchall()]
@@ -249,16 +576,14 @@ def get_messages_from_all_channels(
 ) -> list[DiscordMessage]:
     """Get messages from all channels within the last n days"""
     cursor = conn.cursor()
-    cutoff_date = (datetime.now() - timedelta(days=n_days_old)).isoformat()
-
     cursor.execute(
         """
         SELECT * FROM messages
-        WHERE timestamp >= ?
-        ORDER BY timestamp DESC
+        WHERE ts_ms >= ?
+        ORDER BY ts_ms DESC
         LIMIT ?
     """,
-        (cutoff_date, limit),
+        (get_cutoff_ms(n_days_old), limit),
     )
 
     return [DiscordMessage.from_sql_row(row) for row in cursor.fetchall()]
@@ -278,86 +603,165 @@ def get_users(conn) -> list[DiscordUser]:
     return [DiscordUser.from_sql_row(row) for row in cursor.fetchall()]
 
 
+class UserChannelNameIndex:
+    """
+    Names of the users and channels of one database, kept in memory.
+
+    Users and channels are never deleted, and an upsert replaces the row which
+    gives it a new rowid. Rows at or past the last seen rowid are therefore all
+    that can have changed since the last refresh, also when another process
+    wrote them. The row that held the maximum rowid can get it back on replace,
+    so it is read again on every refresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = NameIndex()
+        self._watermarks = {"users": 0, "channels": 0}
+
+    def refresh(self, conn):
+        with self._lock:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT rowid, id, username, global_name FROM users WHERE rowid >= ? ORDER BY rowid",
+                (self._watermarks["users"],),
+            )
+            for row in cursor.fetchall():
+                self.index.upsert(
+                    ("user", row["id"]),
+                    [row["username"], row["global_name"]],
+                    {"id": row["id"], "type": "user"},
+                )
+                self._watermarks["users"] = row["rowid"]
+
+            cursor.execute(
+                "SELECT rowid, id, name FROM channels WHERE rowid >= ? ORDER BY rowid",
+                (self._watermarks["channels"],),
+            )
+            for row in cursor.fetchall():
+                self.index.upsert(
+                    ("channel", row["id"]),
+                    [row["name"]],
+                    {"id": row["id"], "type": "channel"},
+                )
+                self._watermarks["channels"] = row["rowid"]
+
+
+_name_indexes: dict[str, UserChannelNameIndex] = {}
+_name_indexes_lock = threading.Lock()
+
+
+def get_name_index(conn) -> NameIndex:
+    """The up to date name index of the database conn is connected to"""
+    path = conn.execute("PRAGMA database_list").fetchone()["file"]
+    with _name_indexes_lock:
+        if path not in _name_indexes:
+            _name_indexes[path] = UserChannelNameIndex()
+        name_index = _name_indexes[path]
+    name_index.refresh(conn)
+    return name_index.index
+
+
 def get_user_id_for_name(conn, query: str, top_n: int = 5) -> list[dict]:
     """Get user or channel ID for a name using fuzzy matching (similar to slack mcp)"""
-    cursor = conn.cursor()
+    matches = get_name_index(conn).search(query, limit=top_n)
+    return [
+        {
+            "query": query,
+            "name": name,
+            "score": score,
+            "id": match_info["id"],
+            "type": match_info["type"],
+        }
+        for name, score, match_info in matches
+    ]
 
-    # Get all users and channels for matching
-    cursor.execute("SELECT id, username, global_name FROM users")
-    users = cursor.fetchall()
-
-    cursor.execute("SELECT id, name FROM channels WHERE name IS NOT NULL")
-    channels = cursor.fetchall()
-
-    # Build name to ID mapping like in slack MCP
-    name_to_id = {}
-    all_names = []
-
-    # Add users (both username and global_name if available)
-    for user in users:
-        user_dict = dict(user)
-        username = user_dict.get("username", "")
-        global_name = user_dict.get("global_name", "")
-
-        if username:
-            name_to_id[username] = {"id": user_dict["id"], "type": "user"}
-            all_names.append(username)
-
-        if global_name and global_name != username:
-            name_to_id[global_name] = {"id": user_dict["id"], "type": "user"}
-            all_names.append(global_name)
-
-    # Add channels
-    for channel in channels:
-        channel_dict = dict(channel)
-        channel_name = channel_dict.get("name", "")
-
-        if channel_name:
-            name_to_id[channel_name] = {"id": channel_dict["id"], "type": "channel"}
-            all_names.append(channel_name)
-
-    # Use rapidfuzz to find matches like in slack MCP
-    matches = process.extract(query, all_names, limit=top_n)
-
-    # Format results
-    result = []
-    for name, score, _ in matches:
-        match_info = name_to_id[name]
-        result.append(
-            {
-                "query": query,
-                "name": name,
-                "score": score,
-                "id": match_info["id"],
-                "type": match_info["type"],
-            }
-        )
 
-    return result
+CHUNK_TABLES = MessageChunkTables(
+    EMBEDDINGS_TABLE,
+    key_columns={"message_id": "id"},
+    position="CAST(messages.id AS INTEGER)",
+    from_row=DiscordMessage.from_sql_row,
+    message_filter="TRIM(messages.content) != ''",
+)
 
 
-def get_messages_without_embeddings(conn, limit=10):
-    """Get messages that don't have embeddings yet"""
+def get_messages_without_embeddings(conn, limit=10) -> list[DiscordMessage]:
+    """Get messages with content that don't have embeddings yet, oldest first per channel"""
+    return CHUNK_TABLES.get_messages_without_chunks(conn, limit)
+
+
+def get_channel_condition(channel_id: str) -> tuple[str, tuple[str]]:
+    return "messages.channel_id = ?", (channel_id,)
+
+
+def get_trailing_chunk(conn, channel_id: str):
+    """Get the id and messages of the chunk holding the latest embedded message of a channel"""
+    return CHUNK_TABLES.get_trailing_chunk(conn, *get_channel_condition(channel_id))
+
+
+def get_trailing_chunks(conn, channel_ids) -> dict:
+    """The trailing chunks of the channels that have one"""
+    return CHUNK_TABLES.get_trailing_chunks(conn, channel_ids, get_channel_condition)
+
+
+def count_messages_without_embeddings(conn) -> int:
+    return CHUNK_TABLES.count_messages_without_chunks(conn)
+
+
+def record_embedding_call(
+    conn,
+    n_messages: int,
+    n_chunks: int,
+    n_tokens: int,
+    duration_seconds: float,
+    retention_seconds: float = 24 * 60 * 60,
+):
+    """Add an embedding request to the ledger, and drop entries past retention"""
+    now = time.time()
+    conn.execute(
+        """
+    INSERT INTO embedding_ledger (created_at, n_messages, n_chunks, n_tokens, duration_seconds)
+    VALUES (?, ?, ?, ?, ?)
+    """,
+        (now, n_messages, n_chunks, n_tokens, duration_seconds),
+    )
+    conn.execute(
+        "DELETE FROM embedding_ledger WHERE created_at < ?", (now - retention_seconds,)
+    )
+    conn.commit()
+
+
+def get_embedding_ledger_totals(conn, since: float) -> dict:
+    """Summed embedding requests since a unix timestamp"""
     cursor = conn.cursor()
     cursor.execute(
         """
-    SELECT messages.*
-    FROM messages
-    LEFT JOIN chunk_messages ON messages.id = chunk_messages.message_id
-    WHERE chunk_messages.chunk_id IS NULL
-    LIMIT ?
+    SELECT COUNT(*) AS n_calls,
+        COALESCE(SUM(n_messages), 0) AS n_messages,
+        COALESCE(SUM(n_chunks), 0) AS n_chunks,
+        COALESCE(SUM(n_tokens), 0) AS n_tokens,
+        COALESCE(SUM(duration_seconds), 0.0) AS duration_seconds,
+        MIN(created_at) AS first_at
+    FROM embedding_ledger
+    WHERE created_at >= ?
     """,
-        (limit,),
+        (since,),
     )
-    return [DiscordMessage.from_sql_row(msg) for msg in cursor.fetchall()]
+    return dict(cursor.fetchone())
 
 
 def get_latest_message_timestamp(conn):
     """Get the timestamp of the latest message for rate limiting"""
     cursor = conn.cursor()
-    cursor.execute("SELECT MAX(timestamp) AS max_timestamp FROM messages")
+    cursor.execute("SELECT timestamp FROM messages ORDER BY ts_ms DESC LIMIT 1")
     result = cursor.fetchone()
-    return result[0] if result[0] else None
+    return result[0] if result else None
+
+
+def delete_chunks(conn, chunk_ids: list[str]):
+    """Remove chunks and their message mapping, without committing"""
+    CHUNK_TABLES.delete_chunks(conn, chunk_ids)
 
 
 def upsert_chunks(conn, chunks):
@@ -366,51 +770,84 @@ def upsert_chunks(conn, chunks):
         if chunk.get("embedding") is None:
             raise ValueError("Chunk embedding is required")
 
-    cursor = conn.cursor()
-    cursor.executemany(
-        f"""
-    INSERT OR REPLACE INTO {EMBEDDINGS_TABLE} (chunk_id, sample_embedding, chunk_text)
-    VALUES (?, ?, ?)
-    """,
+    CHUNK_TABLES.upsert_chunks(
+        conn,
         [
             (
                 chunk["chunk_id"],
-                serialize_float32(chunk["embedding"]),
+                chunk["embedding"],
                 chunk["chunk_text"],
+                [(message_id,) for message_id in chunk["message_ids"]],
             )
             for chunk in chunks
         ],
     )
-    cursor.executemany(
-        """
-    INSERT OR REPLACE INTO chunk_messages (chunk_id, message_id)
-    VALUES (?, ?)
-    """,
-        [
-            (chunk["chunk_id"], message_id)
-            for chunk in chunks
-            for message_id in chunk["message_ids"]
-        ],
-    )
-    conn.commit()
 
 
-def get_matching_chunks(conn, query_embedding: list[float], limit=10):
-    """Get chunks matching the query embedding"""
+MESSAGE_FILTERS = ("channel_id", "author_id", "since", "until")
+
+
+def build_message_filters(filters: dict | None, alias: str = "m") -> tuple[str, list]:
+    """
+    SQL conditions on the messages table for channel_id, author_id, since and
+    until filters. Times are datetimes, compared on the ts_ms column.
+    Returns (" AND ..." or "", params).
+    """
+    conditions = []
+    params = []
+    for key, value in (filters or {}).items():
+        if key not in MESSAGE_FILTERS:
+            raise ValueError(f"Unknown message filter: {key}")
+        if value is None:
+            continue
+        if key == "since":
+            conditions.append(f"{alias}.ts_ms >= ?")
+            params.append(int(value.timestamp() * 1000))
+        elif key == "until":
+            conditions.append(f"{alias}.ts_ms < ?")
+            params.append(int(value.timestamp() * 1000))
+        else:
+            conditions.append(f"{alias}.{key} = ?")
+            params.append(value)
+    if not conditions:
+        return "", []
+    return " AND " + " AND ".join(conditions), params
+
+
+def get_matching_chunks(
+    conn, query_embedding: list[float], limit=10, filters: dict | None = None
+):
+    """
+    Get chunks matching the query embedding, sorted by distance. filters
+    restricts the search to chunks with at least one matching message, the
+    matching chunks are selected by a subquery so they never leave SQLite.
+    """
+    params = [serialize_float32(query_embedding), limit]
+    chunk_filter = ""
+    where_clause, where_params = build_message_filters(filters)
+    if where_clause:
+        chunk_filter = f"""AND chunk_id IN (
+        SELECT cm.chunk_id FROM messages m
+        JOIN chunk_messages cm ON cm.message_id = m.id
+        WHERE 1 = 1 {where_clause}
+    )"""
+        params.extend(where_params)
+
     cursor = conn.cursor()
     cursor.execute(
         f"""
     SELECT chunks.chunk_id, chunks.chunk_text, chunks.sample_embedding as embedding, chunk_messages.message_id
     FROM (
-    SELECT * FROM {EMBEDDINGS_TABLE} WHERE sample_embedding match ?
-    ORDER BY distance
-    LIMIT ?
+    SELECT chunk_id, chunk_text, sample_embedding, distance FROM {EMBEDDINGS_TABLE}
+    WHERE sample_embedding match ? AND k = ? {chunk_filter}
     ) as chunks
     JOIN chunk_messages ON chunks.chunk_id = chunk_messages.chunk_id
+    ORDER BY chunks.distance, CAST(chunk_messages.message_id AS INTEGER)
     """,
-        (serialize_float32(query_embedding), limit),
+        params,
     )
     all_rows = cursor.fetchall()
+    # dicts keep insertion order, so chunks stay sorted by distance
     rows_for_chunk = defaultdict(list)
     for row in all_rows:
         rows_for_chunk[row["chunk_id"]].append(row)
@@ -428,24 +865,91 @@ def get_matching_chunks(conn, query_embedding: list[float], limit=10):
     return res
 
 
-def get_chunk_messages(conn, chunks):
-    """Get full message details for chunks"""
+def get_keyword_matches(
+    conn, query: str, limit: int = 10, filters: dict | None = None
+) -> list[dict]:
+    """
+    Messages matching the query terms, best BM25 rank first, with the first
+    chunk each message belongs to or None if it has not been embedded yet.
+    """
+    fts_query = to_fts_query(query)
+    if not fts_query:
+        return []
+    where_clause, params = build_message_filters(filters)
+    params = [fts_query, *params, limit]
+
     cursor = conn.cursor()
-    res = []
-    for chunk in chunks:
-        placeholders = ",".join(["?"] * len(chunk["message_ids"]))
-        cursor.execute(
-            f"""
-        SELECT * FROM messages WHERE id IN ({placeholders})
-        """,
-            chunk["message_ids"],
-        )
-        messages = [DiscordMessage.from_sql_row(msg) for msg in cursor.fetchall()]
-        chunk_with_messages = {
+    cursor.execute(
+        f"""
+    SELECT m.id AS message_id, m.content, f.rank AS rank,
+        (SELECT MIN(cm.chunk_id) FROM chunk_messages cm WHERE cm.message_id = m.id)
+        AS chunk_id
+    FROM {MESSAGES_FTS_TABLE} f
+    JOIN messages m ON m.rowid = f.rowid
+    WHERE {MESSAGES_FTS_TABLE} MATCH ? {where_clause}
+    ORDER BY f.rank
+    LIMIT ?
+    """,
+        params,
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def get_chunks_by_id(conn, chunk_ids: list[str]) -> list[dict]:
+    """Chunk texts and message ids, in the order of chunk_ids"""
+    if not chunk_ids:
+        return []
+    chunk_ids_json = json.dumps(chunk_ids)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+    SELECT chunk_id, chunk_text FROM {EMBEDDINGS_TABLE}
+    WHERE chunk_id IN (SELECT value FROM json_each(?))
+    """,
+        (chunk_ids_json,),
+    )
+    texts = {row["chunk_id"]: row["chunk_text"] for row in cursor.fetchall()}
+    cursor.execute(
+        """
+    SELECT chunk_id, message_id FROM chunk_messages
+    WHERE chunk_id IN (SELECT value FROM json_each(?))
+    ORDER BY CAST(message_id AS INTEGER)
+    """,
+        (chunk_ids_json,),
+    )
+    message_ids = defaultdict(list)
+    for row in cursor.fetchall():
+        message_ids[row["chunk_id"]].append(row["message_id"])
+
+    return [
+        {
+            "chunk_id": chunk_id,
+            "message_ids": message_ids[chunk_id],
+            "chunk_text": texts[chunk_id],
+        }
+        for chunk_id in chunk_ids
+        if chunk_id in texts
+    ]
+
+
+def get_chunk_messages(conn, chunks, filters: dict | None = None):
+    """
+    Get full message details for chunks in one query, keeping the order of chunks.
+    With filters, only the messages matching them are returned.
+    """
+    where_clause, params = build_message_filters(filters, alias="messages")
+    messages = CHUNK_TABLES.get_chunk_messages(
+        conn,
+        [[(message_id,) for message_id in chunk["message_ids"]] for chunk in chunks],
+        where_clause,
+        params,
+    )
+    return [
+        {
             "chunk_id": chunk["chunk_id"],
             "message_ids": chunk["message_ids"],
             "chunk_text": chunk["chunk_text"],
-            "messages": messages,
+            "messages": chunk_messages,
         }
-        res.append(chunk_with_messages)
-    return res
+        for chunk, chunk_messages in zip(chunks, messages)
+    ]
@@ -1,165 +1,275 @@
+import logging
+import subprocess
 import threading
 import time
-import uuid
-from datetime import datetime, timedelta
-from typing import Any, Dict, List
+from contextlib import contextmanager
+from typing import List
 
 import requests
+from toolbox_store.embedding import approx_token_count
 
+from discord_mcp.chunking import chunk_messages
 from discord_mcp.db import (
+    count_messages_without_embeddings,
     get_discord_connection,
-    get_latest_message_timestamp,
+    get_embedding_ledger_totals,
     get_messages_without_embeddings,
+    get_trailing_chunks,
+    record_embedding_call,
     upsert_chunks,
 )
 from discord_mcp.settings import settings
 
+logger = logging.getLogger(__name__)
 
-def get_embedding_ollama(query: str) -> List[float]:
-    """Get the embedding for a query using Ollama API"""
-    import subprocess
+OLLAMA_MODEL = "nomic-embed-text:v1.5"
+# Unembedded messages grouped into chunks per iteration
+MAX_MESSAGES_PER_ITERATION = 200
+# Sleep between checks when there is nothing to embed
+IDLE_SECONDS = 30
+# Window the embedding rate and the ETA are measured over
+THROUGHPUT_WINDOW_SECONDS = 10 * 60
 
-    try:
-        subprocess.run(
-            ["ollama", "pull", "nomic-embed-text:v1.5"],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    except Exception:
-        pass
+_ollama_session = requests.Session()
+_ollama_model_ready = False
+_ollama_model_lock = threading.Lock()
+
+
+def ensure_ollama_model():
+    """Pull the embedding model once per process, a failed pull is retried"""
+    global _ollama_model_ready
 
-    payload = {"model": "nomic-embed-text:v1.5", "prompt": query}
-    response = requests.post(
-        f"{settings.ollama_url}/api/embeddings", json=payload, timeout=10
+    with _ollama_model_lock:
+        if _ollama_model_ready:
+            return
+        try:
+            subprocess.run(
+                ["ollama", "pull", OLLAMA_MODEL],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception as e:
+            # The model may already be available, the embed request will tell
+            logger.warning(f"Failed to pull Ollama model {OLLAMA_MODEL}: {e}")
+            return
+        _ollama_model_ready = True
+
+
+def get_embeddings_ollama(texts: List[str]) -> tuple[List[List[float]], int]:
+    """Embed texts in a single Ollama request, returns (embeddings, n_tokens)"""
+    ensure_ollama_model()
+    payload = {"model": OLLAMA_MODEL, "input": texts}
+    response = _ollama_session.post(
+        f"{settings.ollama_url}/api/embed", json=payload, timeout=120
     )
     response.raise_for_status()
     data = response.json()
-    embedding = data.get("embedding")
-    if embedding is None or not isinstance(embedding, list):
-        raise ValueError(f"No embedding returned from Ollama: {data}")
-    return embedding
+    embeddings = data.get("embeddings")
+    if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+        raise ValueError(f"No embeddings returned from Ollama: {data}")
+    n_tokens = data.get("prompt_eval_count") or sum(map(approx_token_count, texts))
+    return embeddings, n_tokens
 
 
-def get_embedding_syftbox(query: str) -> List[float]:
+def get_embeddings_syftbox(texts: List[str]) -> tuple[List[List[float]], int]:
     """Get embeddings from SyftBox (placeholder for now)"""
     raise NotImplementedError("SyftBox embedding provider not implemented yet")
 
 
-def get_embedding(query: str) -> List[float]:
-    """Get embedding based on configured provider"""
+def get_embeddings(texts: List[str]) -> tuple[List[List[float]], int]:
+    """Get embeddings and the number of tokens used, based on configured provider"""
     if settings.embedding_provider == "ollama":
-        return get_embedding_ollama(query)
+        return get_embeddings_ollama(texts)
     elif settings.embedding_provider == "syftbox":
-        return get_embedding_syftbox(query)
+        return get_embeddings_syftbox(texts)
     else:
         raise ValueError(f"Unknown embedding provider: {settings.embedding_provider}")
 
 
-def check_rate_limit(conn) -> bool:
-    """Check if we're within the rate limit for embeddings"""
-    latest_timestamp = get_latest_message_timestamp(conn)
-    if not latest_timestamp:
-        return True
-
-    # Parse the ISO timestamp and check if it's within the last hour
-    try:
-        latest_dt = datetime.fromisoformat(latest_timestamp.replace("Z", "+00:00"))  # noqa: F841
-        one_hour_ago = datetime.now() - timedelta(hours=1)
-
-        # Count messages from the last hour (simplified check)
-        # In a real implementation, you might want to track actual embedding requests
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT COUNT(*) FROM messages
-            WHERE timestamp >= ?
-        """,
-            (one_hour_ago.isoformat(),),
-        )
-
-        recent_message_count = cursor.fetchone()[0]
-        return recent_message_count < settings.max_messages_per_hour
-    except Exception:
-        return True
-
-
-def chunk_messages(messages) -> List[Dict[str, Any]]:
-    """Convert messages to chunks for embedding"""
-    chunks = []
-    for message in messages:
-        if message.content.strip():  # Only process messages with content
-            chunk = {
-                "chunk_id": str(uuid.uuid4()),
-                "message_ids": [message.id],
-                "chunk_text": message.content,
-            }
-            chunks.append(chunk)
-    return chunks
+def get_embedding(query: str) -> List[float]:
+    """Get the embedding for a query"""
+    embeddings, _ = get_embeddings([query])
+    return embeddings[0]
+
+
+def gather_chunks_without_embeddings(
+    conn, max_messages: int = MAX_MESSAGES_PER_ITERATION
+):
+    """Group unembedded messages into windows, extending each channel's trailing chunk"""
+    messages = get_messages_without_embeddings(conn, limit=max_messages)
+    trailing_chunks = get_trailing_chunks(
+        conn, {message.channel_id for message in messages}
+    )
+    return messages, chunk_messages(messages, trailing_chunks)
 
 
-def run_embedding_background_worker_single(conn):
+@contextmanager
+def _checkout(conn=None, readonly: bool = False):
+    """The given connection, or a short checkout of the shared one"""
+    if conn is not None:
+        yield conn
+    else:
+        with get_discord_connection(readonly=readonly) as checked_out:
+            yield checked_out
+
+
+class EmbeddingScheduler:
+    """
+    Drains the embedding backlog as fast as the token budget allows.
+
+    Every embedding request is recorded in the embedding_ledger table, with the
+    tokens it used. An iteration sends the oldest chunks in batched requests,
+    as long as the tokens used in the last minute stay within the budget, and
+    then tells the loop how long to wait: not at all while there is backlog and
+    budget, until the oldest request leaves the window when the budget is used
+    up, and IDLE_SECONDS when there is nothing to embed.
+
+    The database is only checked out to read the backlog and to store results,
+    not while the embedding requests run.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int | None = None,
+        batch_size: int | None = None,
+        max_messages: int = MAX_MESSAGES_PER_ITERATION,
+    ):
+        self.tokens_per_minute = (
+            tokens_per_minute or settings.embedding_tokens_per_minute
+        )
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.max_messages = max_messages
+
+    def _seconds_until_budget(self, conn, tokens_needed: int) -> float:
+        """Wait until enough of last minute's tokens have left the window"""
+        window_start = time.time() - 60
+        totals = get_embedding_ledger_totals(conn, window_start)
+        if totals["first_at"] is None:
+            return 0.0
+        if totals["n_tokens"] + tokens_needed <= self.tokens_per_minute:
+            return 0.0
+        return max(totals["first_at"] - window_start, 1.0)
+
+    def select_chunks(self, chunks: list[dict], tokens_available: int) -> list[dict]:
+        """The leading chunks that fit the budget, at least one if any budget is left"""
+        if tokens_available <= 0:
+            return []
+        selected = []
+        n_tokens = 0
+        for chunk in chunks:
+            n_tokens += approx_token_count(chunk["chunk_text"])
+            # Later windows of a channel extend earlier ones, so stop at the first
+            # chunk that does not fit instead of skipping it
+            if selected and n_tokens > tokens_available:
+                break
+            selected.append(chunk)
+        return selected
+
+    def run_once(self, conn=None) -> float:
+        """Embed one round of chunks, returns the seconds to wait before the next"""
+        with _checkout(conn, readonly=True) as read_conn:
+            messages, chunks = gather_chunks_without_embeddings(
+                read_conn, self.max_messages
+            )
+            if not chunks:
+                print("No messages found without embeddings")
+                return IDLE_SECONDS
+            tokens_used = get_embedding_ledger_totals(read_conn, time.time() - 60)[
+                "n_tokens"
+            ]
+
+        selected = self.select_chunks(chunks, self.tokens_per_minute - tokens_used)
+        if not selected:
+            with _checkout(conn, readonly=True) as read_conn:
+                wait = self._seconds_until_budget(
+                    read_conn, approx_token_count(chunks[0]["chunk_text"])
+                )
+            print(f"Embedding budget used up, waiting {wait:.1f}s")
+            return wait
+
+        new_message_ids = {message.id for message in messages}
+        print(f"Embedding {len(selected)} chunks of {len(messages)} new messages")
+        for start in range(0, len(selected), self.batch_size):
+            batch = selected[start : start + self.batch_size]
+            started_at = time.perf_counter()
+            try:
+                embeddings, n_tokens = get_embeddings([c["chunk_text"] for c in batch])
+            except Exception as e:
+                print(f"Failed to generate embeddings for {len(batch)} chunks: {e}")
+                return IDLE_SECONDS
+            duration = time.perf_counter() - started_at
+            for chunk, embedding in zip(batch, embeddings):
+                chunk["embedding"] = embedding
+
+            n_messages = len(
+                {m for c in batch for m in c["message_ids"]} & new_message_ids
+            )
+            with _checkout(conn) as write_conn:
+                upsert_chunks(write_conn, batch)
+                record_embedding_call(
+                    write_conn, n_messages, len(batch), n_tokens, duration
+                )
+        return 0.0
+
+    def get_status(self, conn) -> dict:
+        """Backlog, budget use and the estimated time until the backlog is embedded"""
+        now = time.time()
+        backlog = count_messages_without_embeddings(conn)
+        last_minute = get_embedding_ledger_totals(conn, now - 60)
+        recent = get_embedding_ledger_totals(conn, now - THROUGHPUT_WINDOW_SECONDS)
+
+        messages_per_second = None
+        if recent["n_calls"] > 0:
+            elapsed = max(now - recent["first_at"], recent["duration_seconds"], 1.0)
+            messages_per_second = recent["n_messages"] / elapsed
+        eta_seconds = None
+        if backlog == 0:
+            eta_seconds = 0.0
+        elif messages_per_second:
+            eta_seconds = round(backlog / messages_per_second, 1)
+
+        return {
+            "backlog_messages": backlog,
+            "tokens_last_minute": last_minute["n_tokens"],
+            "tokens_per_minute_budget": self.tokens_per_minute,
+            "requests_last_minute": last_minute["n_calls"],
+            "messages_per_second": (
+                round(messages_per_second, 3) if messages_per_second else None
+            ),
+            "eta_seconds": eta_seconds,
+        }
+
+
+embedding_scheduler = EmbeddingScheduler()
+
+
+def run_embedding_background_worker_single(conn=None) -> float:
     """Run a single iteration of the embedding background worker"""
     print("Checking for messages without embeddings...")
+    return embedding_scheduler.run_once(conn)
 
-    # Check rate limit
-    if not check_rate_limit(conn):
-        print(
-            f"Rate limit reached ({settings.max_messages_per_hour} messages/hour), skipping this iteration"
-        )
-        return
-
-    # Get messages that need embeddings
-    messages = get_messages_without_embeddings(conn, limit=10)
-    if not messages:
-        print("No messages found without embeddings")
-        return
-
-    print(f"Found {len(messages)} messages to embed")
-
-    # Chunk the messages
-    chunks = chunk_messages(messages)
-    if not chunks:
-        print("No chunks created from messages")
-        return
 
-    # Generate embeddings for each chunk
-    for chunk in chunks:
-        try:
-            print(f"Generating embedding for chunk {chunk['chunk_id'][:8]}...")
-            embedding = get_embedding(chunk["chunk_text"])
-            chunk["embedding"] = embedding
-        except Exception as e:
-            print(f"Failed to generate embedding for chunk {chunk['chunk_id']}: {e}")
-            continue
-
-    # Filter out chunks that failed to get embeddings
-    successful_chunks = [c for c in chunks if "embedding" in c]
-
-    if successful_chunks:
-        print(f"Storing {len(successful_chunks)} chunks with embeddings...")
-        upsert_chunks(conn, successful_chunks)
-        print(f"Successfully stored {len(successful_chunks)} chunks")
-    else:
-        print("No chunks successfully embedded")
+def get_embedding_status() -> dict:
+    with get_discord_connection(readonly=True) as conn:
+        return embedding_scheduler.get_status(conn)
 
 
 def run_embedding_background_worker_loop(stop_event: threading.Event = None):
     """Run the embedding background worker in a loop"""
     print("Starting embedding background worker loop...")
+    stop_event = stop_event or threading.Event()
 
-    while True:
-        if stop_event and stop_event.is_set():
-            break
-
+    while not stop_event.is_set():
         try:
-            with get_discord_connection() as conn:
-                run_embedding_background_worker_single(conn)
+            wait = run_embedding_background_worker_single()
         except Exception as e:
             print(f"Error in embedding background worker: {e}")
+            wait = IDLE_SECONDS
 
-        # Wait before next iteration
-        time.sleep(30)  # 30 seconds between iterations
+        # Loop straight on while there is backlog and budget
+        if wait > 0:
+            stop_event.wait(wait)
 
     print("Embedding background worker stopped")
 
@@ -6,6 +6,7 @@ from mcp.server.fastmcp import FastMCP
 
 from discord_mcp import db
 from discord_mcp.embedding_background_worker import get_embedding
+from discord_mcp.search import MessageQueryBuilder, get_message_filters
 
 DISCORD_MCP_PORT = os.getenv("DISCORD_MCP_PORT", 8008)
 mcp = FastMCP("Discord MCP service", stateless_http=True, port=DISCORD_MCP_PORT)
@@ -19,7 +20,7 @@ def get_last_messages_in_my_channels(last_n_days: int = 7, limit: int = -1) -> d
     If limit is -1, get all messages.
     """
     try:
-        with db.get_discord_connection() as conn:
+        with db.get_discord_connection(readonly=True) as conn:
             messages = db.get_messages_from_all_channels(conn, last_n_days, limit)
             return {"messages": [msg.model_dump() for msg in messages]}
     except Exception:
@@ -32,7 +33,7 @@ def get_channels() -> dict:
     """Get all Discord channels. This can be a long list, so if you are looking for a single channel
     or a few channels, use the get_user_id_for_name function."""
     try:
-        with db.get_discord_connection() as conn:
+        with db.get_discord_connection(readonly=True) as conn:
             channels = db.get_channels(conn)
             return {"channels": [channel.model_dump() for channel in channels]}
     except Exception:
@@ -44,7 +45,7 @@ def get_channels() -> dict:
 def get_users() -> dict:
     """Get all Discord users from the database"""
     try:
-        with db.get_discord_connection() as conn:
+        with db.get_discord_connection(readonly=True) as conn:
             users = db.get_users(conn)
             return {"users": [user.model_dump() for user in users]}
     except Exception:
@@ -61,7 +62,7 @@ def get_history(channel_id: str, last_n_days: int = 30) -> dict:
         last_n_days: Number of days back to get messages (default 30)
     """
     try:
-        with db.get_discord_connection() as conn:
+        with db.get_discord_connection(readonly=True) as conn:
             messages = db.get_messages_from_channel(conn, channel_id, last_n_days)
             return {"messages": [msg.model_dump() for msg in messages]}
     except Exception:
@@ -78,7 +79,7 @@ def get_user_id_for_name(query: str, top_n: int = 5) -> dict:
         top_n: Number of top matches to return
     """
     try:
-        with db.get_discord_connection() as conn:
+        with db.get_discord_connection(readonly=True) as conn:
             matches = db.get_user_id_for_name(conn, query, top_n)
             return {"matches": matches}
     except Exception:
@@ -86,36 +87,70 @@ def get_user_id_for_name(query: str, top_n: int = 5) -> dict:
         raise ValueError(traceback.format_exc())
 
 
+def search_message_chunks(
+    query: str,
+    limit: int = 10,
+    channel_id: str | None = None,
+    author_id: str | None = None,
+    last_n_days: int | None = None,
+) -> list[dict]:
+    """Hybrid search over the chunks and messages in the discord db"""
+    # Embed before checking out a connection, keyword search works without it
+    try:
+        query_embedding = get_embedding(query)
+    except Exception as e:
+        logger.warning(f"Could not embed query, using keyword search only: {e}")
+        query_embedding = None
+
+    with db.get_discord_connection(readonly=True) as conn:
+        builder = (
+            MessageQueryBuilder(conn)
+            .keyword(query)
+            .where(get_message_filters(channel_id, author_id, last_n_days))
+            .limit(limit)
+        )
+        if query_embedding is not None:
+            builder.semantic(query_embedding)
+        return builder.get_with_messages()
+
+
 @mcp.tool()
-def search_messages(query: str, limit: int = 10) -> dict:
-    """Search Discord messages using semantic similarity (RAG)
+def search_messages(
+    query: str,
+    limit: int = 10,
+    channel_id: str | None = None,
+    author_id: str | None = None,
+    last_n_days: int | None = None,
+) -> dict:
+    """Search Discord messages by keywords and semantic similarity (RAG)
+
+    Results are chunks of consecutive messages. The filters apply to messages:
+    a chunk matches if one of its messages does, and only the matching messages
+    are returned, chunk_text still shows the whole conversation.
 
     Args:
-        query: The search query
+        query: The search query, exact terms like names, error codes and URLs also match
         limit: Maximum number of results to return (default 10)
+        channel_id: Only search messages in this channel
+        author_id: Only search messages by this user
+        last_n_days: Only search messages from the last n days
     """
     try:
-        with db.get_discord_connection() as conn:
-            # Get embedding for the query
-            query_embedding = get_embedding(query)
-
-            # Find matching chunks
-            matching_chunks = db.get_matching_chunks(conn, query_embedding, limit)
-
-            # Get full message details for the chunks
-            chunks_with_messages = db.get_chunk_messages(conn, matching_chunks)
-
-            return {
-                "query": query,
-                "results": [
-                    {
-                        "chunk_id": chunk["chunk_id"],
-                        "chunk_text": chunk["chunk_text"],
-                        "messages": [msg.model_dump() for msg in chunk["messages"]],
-                    }
-                    for chunk in chunks_with_messages
-                ],
-            }
+        chunks_with_messages = search_message_chunks(
+            query, limit, channel_id, author_id, last_n_days
+        )
+
+        return {
+            "query": query,
+            "results": [
+                {
+                    "chunk_id": chunk["chunk_id"],
+                    "chunk_text": chunk["chunk_text"],
+                    "messages": [msg.model_dump() for msg in chunk["messages"]],
+                }
+                for chunk in chunks_with_messages
+            ],
+        }
     except Exception:
         logger.error(traceback.format_exc())
         raise ValueError(traceback.format_exc())
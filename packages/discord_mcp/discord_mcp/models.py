@@ -18,13 +18,26 @@ def load_json_or_none(data: dict, key: str) -> Any:
     return json.loads(data[key])
 
 
+DISCORD_EPOCH_MS = 1420070400000  # January 1, 2015
+
+
+def snowflake_to_timestamp_ms(snowflake_id: str) -> int:
+    """Unix time in milliseconds at which a Discord snowflake ID was created"""
+    return (int(snowflake_id) >> 22) + DISCORD_EPOCH_MS
+
+
 def snowflake_to_datetime(snowflake_id: str) -> str:
     """Convert Discord snowflake ID to ISO timestamp"""
-    discord_epoch = 1420070400000  # January 1, 2015
-    timestamp_ms = (int(snowflake_id) >> 22) + discord_epoch
+    timestamp_ms = snowflake_to_timestamp_ms(snowflake_id)
     return datetime.fromtimestamp(timestamp_ms / 1000).isoformat()
 
 
+def datetime_to_snowflake(dt: datetime) -> str:
+    """Smallest snowflake ID at the given time, for after/before pagination"""
+    timestamp_ms = int(dt.timestamp() * 1000)
+    return str(max(timestamp_ms - DISCORD_EPOCH_MS, 0) << 22)
+
+
 class DiscordGuild(BaseModel):
     id: str
     name: str
@@ -188,6 +201,7 @@ class DiscordMessage(BaseModel):
             json_or_none(self.embeds),
             json_or_none(self.components),
             self.flags,
+            snowflake_to_timestamp_ms(self.id),
         )
 
     @classmethod
@@ -198,4 +212,51 @@ class DiscordMessage(BaseModel):
         data["attachments"] = load_json_or_none(data, "attachments")
         data["embeds"] = load_json_or_none(data, "embeds")
         data["components"] = load_json_or_none(data, "components")
+        data.pop("ts_ms", None)  # Derived from the id
+        return cls(**data)
+
+
+class ChannelSyncState(BaseModel):
+    """How far a channel has been downloaded"""
+
+    channel_id: str
+    # Newest message stored, incremental syncs fetch everything after it
+    latest_message_id: Optional[str] = None
+    # Oldest message stored so far, the backfill continues before it
+    oldest_message_id: Optional[str] = None
+    # The backfill reached the start of the channel or the sync window
+    backfill_complete: bool = False
+    updated_at: Optional[float] = None
+
+
+class PermissionSnapshot(BaseModel):
+    """The roles a user's channel permissions in a guild are computed from"""
+
+    guild_id: str
+    user_id: str
+    member_role_ids: list[str]
+    # role id -> permission bits
+    role_permissions: dict[str, int]
+    is_owner: bool = False
+    # When the roles were last fetched from the API
+    fetched_at: Optional[float] = None
+    # When the fetched roles last differed from the stored ones
+    roles_updated_at: Optional[float] = None
+
+    def to_sql_tuple(self) -> tuple:
+        return (
+            self.guild_id,
+            self.user_id,
+            json.dumps(self.member_role_ids),
+            json.dumps(self.role_permissions),
+            self.is_owner,
+            self.fetched_at,
+            self.roles_updated_at,
+        )
+
+    @classmethod
+    def from_sql_row(cls, data: sqlite3.Row) -> "PermissionSnapshot":
+        data = dict(data)
+        data["member_role_ids"] = json.loads(data["member_role_ids"])
+        data["role_permissions"] = json.loads(data["role_permissions"])
         return cls(**data)
@@ -1,90 +1,210 @@
 """Discord permission calculation utilities."""
 
-from typing import Any, Dict, List
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 
 from discord_mcp.client import DiscordClient
+from discord_mcp.db import get_cached_channel_permissions, upsert_channel_permissions
+from discord_mcp.models import PermissionSnapshot
 
 # Discord Permission Constants
 PERMISSIONS = {
+    "ADMINISTRATOR": 1 << 3,  # 8 - Bypasses all channel overwrites
     "VIEW_CHANNEL": 1 << 10,  # 1024 - Can view the channel
     "READ_MESSAGE_HISTORY": 1 << 16,  # 65536 - Can read message history
     "SEND_MESSAGES": 1 << 11,  # 2048 - Can send messages
 }
+READ_ACCESS = PERMISSIONS["VIEW_CHANNEL"] | PERMISSIONS["READ_MESSAGE_HISTORY"]
+# Owners and administrators, kept below 2**63 so it fits an SQLite INTEGER
+ALL_PERMISSIONS = (1 << 63) - 1
 
+# Roles and member roles are fetched again after this long
+PERMISSION_SNAPSHOT_TTL_SECONDS = 60 * 60
 
-def _calculate_base_permissions(
-    member_roles: List[str], guild_roles: Dict[str, Dict[str, Any]]
-) -> int:
-    """Calculate base permissions from guild roles."""
-    # Start with @everyone role permissions
-    everyone_role = None
-    for role in guild_roles.values():
-        if role["name"] == "@everyone":
-            everyone_role = role
-            break
-
-    if not everyone_role:
-        print("  ⚠️  Could not find @everyone role")
-        return 0
+TEXT_CHANNEL_TYPES = [0, 1, 5, 10, 11, 12]
+THREAD_CHANNEL_TYPES = [10, 11, 12]
 
-    permissions = int(everyone_role.get("permissions", "0"))
+ROLE_OVERWRITE = 0
+MEMBER_OVERWRITE = 1
 
-    # Add permissions from other roles
-    for role_id in member_roles:
-        if role_id in guild_roles:
-            role_perms = int(guild_roles[role_id].get("permissions", "0"))
-            permissions |= role_perms
 
+def fetch_permission_snapshot(
+    client: DiscordClient,
+    guild_id: str,
+    user_id: str,
+    owner_id: Optional[str] = None,
+    previous: Optional[PermissionSnapshot] = None,
+) -> Optional[PermissionSnapshot]:
+    """
+    Fetch the guild roles and the member's roles in two API calls.
+    Returns None if the roles could not be fetched.
+    """
+    guild_roles = client.get_guild_roles(guild_id)
+    if not guild_roles:
+        return None
+    member_role_ids = client.get_member_roles(guild_id, user_id)
+
+    role_permissions = {
+        role_id: int(role.get("permissions", "0"))
+        for role_id, role in guild_roles.items()
+    }
+    # The @everyone role has the guild's id, older guilds may only have the name
+    if guild_id not in role_permissions:
+        for role_id, role in guild_roles.items():
+            if role["name"] == "@everyone":
+                role_permissions[guild_id] = role_permissions[role_id]
+                break
+
+    now = time.time()
+    snapshot = PermissionSnapshot(
+        guild_id=guild_id,
+        user_id=user_id,
+        member_role_ids=sorted(member_role_ids),
+        role_permissions=role_permissions,
+        is_owner=owner_id is not None and owner_id == user_id,
+        fetched_at=now,
+        roles_updated_at=now,
+    )
+    if previous is not None and (
+        previous.member_role_ids,
+        previous.role_permissions,
+        previous.is_owner,
+    ) == (snapshot.member_role_ids, snapshot.role_permissions, snapshot.is_owner):
+        # Unchanged roles keep the results computed from them
+        snapshot.roles_updated_at = previous.roles_updated_at
+    return snapshot
+
+
+def is_snapshot_stale(
+    snapshot: Optional[PermissionSnapshot],
+    max_age: float = PERMISSION_SNAPSHOT_TTL_SECONDS,
+) -> bool:
+    return snapshot is None or time.time() - (snapshot.fetched_at or 0) > max_age
+
+
+def get_base_permissions(snapshot: PermissionSnapshot) -> int:
+    """The @everyone permissions and those of the member's roles"""
+    if snapshot.is_owner:
+        return ALL_PERMISSIONS
+    permissions = snapshot.role_permissions.get(snapshot.guild_id, 0)
+    for role_id in snapshot.member_role_ids:
+        permissions |= snapshot.role_permissions.get(role_id, 0)
+    if permissions & PERMISSIONS["ADMINISTRATOR"]:
+        return ALL_PERMISSIONS
     return permissions
 
 
-def _apply_channel_overwrites(
-    base_permissions: int,
-    channel_overwrites: List[Dict[str, Any]],
-    user_id: str,
-    member_roles: List[str],
-    everyone_role_id: str,
-) -> int:
-    """Apply channel-specific permission overwrites following Discord's algorithm."""
-    # Start with base permissions
-    permissions = base_permissions
-
-    # Step 1: Apply @everyone role overwrites
-    for overwrite in channel_overwrites:
-        if (
-            overwrite["type"] == 0 and overwrite["id"] == everyone_role_id
-        ):  # @everyone role
-            allow = int(overwrite.get("allow", "0"))
-            deny = int(overwrite.get("deny", "0"))
-            permissions = (permissions & ~deny) | allow
-            break
-
-    # Step 2: Apply role-specific overwrites (not @everyone)
-    for overwrite in channel_overwrites:
-        if (
-            overwrite["type"] == 0
-            and overwrite["id"] != everyone_role_id
-            and overwrite["id"] in member_roles
-        ):
-            allow = int(overwrite.get("allow", "0"))
-            deny = int(overwrite.get("deny", "0"))
-            permissions = (permissions & ~deny) | allow
-
-    # Step 3: Apply user-specific overwrites (highest priority)
-    for overwrite in channel_overwrites:
-        if overwrite["type"] == 1 and overwrite["id"] == user_id:  # User overwrite
-            allow = int(overwrite.get("allow", "0"))
-            deny = int(overwrite.get("deny", "0"))
-            permissions = (permissions & ~deny) | allow
+def get_channel_overwrites(channels: List[Dict[str, Any]]) -> Dict[str, List[Dict]]:
+    """Overwrites per channel, threads use the overwrites of their parent channel"""
+    channels_by_id = {channel["id"]: channel for channel in channels}
+    overwrites = {}
+    for channel in channels:
+        source = channel
+        if channel.get("type") in THREAD_CHANNEL_TYPES:
+            source = channels_by_id.get(channel.get("parent_id"), channel)
+        overwrites[channel["id"]] = source.get("permission_overwrites") or []
+    return overwrites
+
 
+def get_overwrites_hash(overwrites: List[Dict]) -> str:
+    data = json.dumps(
+        sorted(overwrites, key=lambda o: (o["type"], o["id"])), sort_keys=True
+    )
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def evaluate_channel_permissions(
+    snapshot: PermissionSnapshot, channel_overwrites: List[List[Dict]]
+) -> np.ndarray:
+    """
+    Effective permissions of a list of channels, following Discord's algorithm.
+
+    The overwrites that apply to the member are gathered into allow/deny rows
+    for @everyone, the member's roles and the member, then all channels are
+    evaluated in one pass: the base permissions are masked by each deny row and
+    extended by each allow row, in that order.
+    """
+    n_channels = len(channel_overwrites)
+    base_permissions = get_base_permissions(snapshot)
+    if base_permissions == ALL_PERMISSIONS:
+        return np.full(n_channels, ALL_PERMISSIONS, dtype=np.uint64)
+
+    member_role_ids = set(snapshot.member_role_ids)
+    # everyone allow, everyone deny, roles allow, roles deny, member allow, member deny
+    bits = np.zeros((6, n_channels), dtype=np.uint64)
+    for i, overwrites in enumerate(channel_overwrites):
+        for overwrite in overwrites:
+            overwrite_type = int(overwrite["type"])
+            if (
+                overwrite_type == ROLE_OVERWRITE
+                and overwrite["id"] == snapshot.guild_id
+            ):
+                row = 0
+            elif (
+                overwrite_type == ROLE_OVERWRITE and overwrite["id"] in member_role_ids
+            ):
+                row = 2
+            elif (
+                overwrite_type == MEMBER_OVERWRITE
+                and overwrite["id"] == snapshot.user_id
+            ):
+                row = 4
+            else:
+                continue
+            bits[row, i] |= np.uint64(int(overwrite.get("allow", "0")))
+            bits[row + 1, i] |= np.uint64(int(overwrite.get("deny", "0")))
+
+    permissions = np.full(n_channels, base_permissions, dtype=np.uint64)
+    for allow_row in (0, 2, 4):
+        permissions = (permissions & ~bits[allow_row + 1]) | bits[allow_row]
     return permissions
 
 
-def _has_channel_access(permissions: int) -> bool:
+def has_read_access(permissions: int) -> bool:
     """Check if user has basic read access to a channel."""
-    return (permissions & PERMISSIONS["VIEW_CHANNEL"]) and (
-        permissions & PERMISSIONS["READ_MESSAGE_HISTORY"]
+    return (int(permissions) & READ_ACCESS) == READ_ACCESS
+
+
+def resolve_channel_permissions(
+    conn, snapshot: PermissionSnapshot, channels: List[Dict[str, Any]]
+) -> Dict[str, int]:
+    """
+    Effective permissions per channel id, cached in the channel_permissions table.
+
+    A cached result is reused while it was computed after the roles last changed
+    and the channel's overwrites hash to the same value. The other channels are
+    evaluated together and stored.
+    """
+    overwrites = get_channel_overwrites(channels)
+    hashes = {
+        channel_id: get_overwrites_hash(o) for channel_id, o in overwrites.items()
+    }
+
+    cached = get_cached_channel_permissions(
+        conn, snapshot.guild_id, snapshot.user_id, snapshot.roles_updated_at or 0
     )
+    results = {
+        channel_id: permissions
+        for channel_id, (permissions, overwrites_hash) in cached.items()
+        if hashes.get(channel_id) == overwrites_hash
+    }
+
+    stale_ids = [channel_id for channel_id in hashes if channel_id not in results]
+    if stale_ids:
+        permissions = evaluate_channel_permissions(
+            snapshot, [overwrites[channel_id] for channel_id in stale_ids]
+        )
+        rows = [
+            (channel_id, int(p), hashes[channel_id])
+            for channel_id, p in zip(stale_ids, permissions)
+        ]
+        upsert_channel_permissions(conn, snapshot.guild_id, snapshot.user_id, rows)
+        results.update((channel_id, p) for channel_id, p, _ in rows)
+    return results
 
 
 def compute_channel_permissions(
@@ -102,79 +222,34 @@ def compute_channel_permissions(
         print(f"  ❌ Could not get current user: {e}")
         return {}
 
-    # Get member roles in this guild
-    member_roles = client.get_member_roles(guild_id, user_id)
-    print(f"  🎭 Member has {len(member_roles)} roles")
-
-    # Get guild roles
-    guild_roles = client.get_guild_roles(guild_id)
-    print(f"  📝 Guild has {len(guild_roles)} total roles")
-
-    # Find @everyone role ID (it's the same as guild ID)
-    everyone_role_id = guild_id
-
-    # Calculate base permissions
-    base_permissions = _calculate_base_permissions(member_roles, guild_roles)
-    print(f"  🔐 Base permissions: {base_permissions}")
-
-    # Get all channels
-    channels = list(client.get_guild_channels(guild_id))
-    print(f"  📺 Found {len(channels)} channels")
+    snapshot = fetch_permission_snapshot(client, guild_id, user_id)
+    if snapshot is None:
+        print("  ⚠️  Could not get guild roles")
+        return {}
+    print(
+        f"  🎭 Member has {len(snapshot.member_role_ids)} of "
+        f"{len(snapshot.role_permissions)} roles"
+    )
+    print(f"  🔐 Base permissions: {get_base_permissions(snapshot)}")
+
+    # Skip non-text channels
+    channels = [
+        channel
+        for channel in client.get_guild_channels(guild_id)
+        if channel.get("type", 0) in TEXT_CHANNEL_TYPES
+    ]
+    print(f"  📺 Found {len(channels)} text channels")
+
+    overwrites = get_channel_overwrites(channels)
+    permissions = evaluate_channel_permissions(
+        snapshot, [overwrites[channel["id"]] for channel in channels]
+    )
 
     results = {}
-
-    for channel in channels:
-        channel_id = channel["id"]
-        channel_name = channel.get("name", f"Channel-{channel_id}")
-        channel_type = channel.get("type", 0)
-
-        # Skip non-text channels
-        if channel_type not in [0, 1, 5, 10, 11, 12]:  # Text channel types
-            continue
-
-        # Apply channel overwrites
-        overwrites = channel.get("permission_overwrites", [])
-        effective_permissions = _apply_channel_overwrites(
-            base_permissions, overwrites, user_id, member_roles, everyone_role_id
-        )
-
-        # Check if user has access
-        has_access = _has_channel_access(effective_permissions)
-
-        results[channel_id] = has_access
+    for channel, channel_permissions in zip(channels, permissions):
+        has_access = has_read_access(channel_permissions)
+        results[channel["id"]] = has_access
         status = "✅ ACCESS" if has_access else "❌ NO ACCESS"
-        print(f"    {status}: #{channel_name} ({channel_id})")
-
-        # Debug: show permission details for failed channels
-        if not has_access:
-            can_view = bool(effective_permissions & PERMISSIONS["VIEW_CHANNEL"])
-            can_read_history = bool(
-                effective_permissions & PERMISSIONS["READ_MESSAGE_HISTORY"]
-            )
-            print(f"      View: {can_view}, Read History: {can_read_history}")
-
-            # Show overwrites that might be blocking
-            for overwrite in overwrites:
-                if overwrite["type"] == 0 and overwrite["id"] in member_roles + [
-                    everyone_role_id
-                ]:
-                    role_name = guild_roles.get(overwrite["id"], {}).get(
-                        "name", overwrite["id"]
-                    )
-                    if overwrite["id"] == everyone_role_id:
-                        role_name = "@everyone"
-                    deny = int(overwrite.get("deny", "0"))
-                    if deny & (
-                        PERMISSIONS["VIEW_CHANNEL"]
-                        | PERMISSIONS["READ_MESSAGE_HISTORY"]
-                    ):
-                        print(f"      🚫 Role {role_name} denies channel access")
-                elif overwrite["type"] == 1 and overwrite["id"] == user_id:
-                    deny = int(overwrite.get("deny", "0"))
-                    if deny & (
-                        PERMISSIONS["VIEW_CHANNEL"]
-                        | PERMISSIONS["READ_MESSAGE_HISTORY"]
-                    ):
-                        print("      🚫 User-specific deny overwrite")
+        print(f"    {status}: #{channel.get('name', channel['id'])} ({channel['id']})")
 
     return results
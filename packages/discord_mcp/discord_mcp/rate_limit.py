@@ -0,0 +1,228 @@
+"""Discord rate limit buckets, tracked from the response headers."""
+
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+# Requests per second across all routes, per token
+GLOBAL_RATE_LIMIT = 50
+# Assumed bucket size before a route has returned rate limit headers
+DEFAULT_BUCKET_LIMIT = 1
+
+# Path segments whose ID scopes the rate limit of a route
+MAJOR_PARAMETERS = ("channels", "guilds", "webhooks")
+SNOWFLAKE_RE = re.compile(r"^\d{15,}$")
+
+
+def get_route(method: str, endpoint: str) -> Tuple[str, str]:
+    """
+    The route template and major parameter of a request.
+
+    IDs are replaced by placeholders, except for the major parameter which has
+    its own buckets: "channels/1/messages?limit=100" and "channels/2/messages"
+    share a template but are limited separately.
+    """
+    path = endpoint.split("?", 1)[0].strip("/")
+    parts = path.split("/")
+    major = ""
+    template = []
+    for i, part in enumerate(parts):
+        if i == 1 and parts[0] in MAJOR_PARAMETERS:
+            major = part
+            template.append("{major}")
+        elif SNOWFLAKE_RE.match(part):
+            template.append("{id}")
+        else:
+            template.append(part)
+    return f"{method.upper()} {'/'.join(template)}", major
+
+
+@dataclass
+class RateLimitBucket:
+    limit: int = DEFAULT_BUCKET_LIMIT
+    remaining: int = DEFAULT_BUCKET_LIMIT
+    reset_at: float = 0.0
+    # The limits are known from headers, unknown buckets allow one request at a time
+    discovered: bool = False
+    in_flight: int = 0
+
+
+class DiscordRateLimiter:
+    """
+    Per-bucket and global rate limits of one Discord token.
+
+    Routes are mapped to the bucket hash from X-RateLimit-Bucket as soon as a
+    response reveals it, so routes that share a bucket also share its remaining
+    count. Buckets are kept per major parameter, so requests to different
+    channels or guilds never wait on each other. The global limit is a token
+    bucket of GLOBAL_RATE_LIMIT requests per second, and a global 429 blocks all
+    routes until its Retry-After has passed.
+
+    Thread safe, clients on different threads share the same bookkeeping.
+    """
+
+    def __init__(self, global_rate_limit: float = GLOBAL_RATE_LIMIT):
+        self._lock = threading.Lock()
+        self.global_rate_limit = global_rate_limit
+        self._global_tokens = float(global_rate_limit)
+        self._global_updated_at = time.monotonic()
+        self._global_blocked_until = 0.0
+        # route template -> bucket hash
+        self._route_buckets: Dict[str, str] = {}
+        # (bucket hash or route template, major parameter) -> bucket
+        self._buckets: Dict[Tuple[str, str], RateLimitBucket] = {}
+        self.n_requests = 0
+        self.n_rate_limited = 0
+        self.wait_seconds = 0.0
+
+    def _bucket(self, method: str, endpoint: str) -> RateLimitBucket:
+        route, major = get_route(method, endpoint)
+        key = (self._route_buckets.get(route, route), major)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = RateLimitBucket()
+        return bucket
+
+    def _refill_global(self, now: float):
+        elapsed = now - self._global_updated_at
+        self._global_tokens = min(
+            float(self.global_rate_limit),
+            self._global_tokens + elapsed * self.global_rate_limit,
+        )
+        self._global_updated_at = now
+
+    def try_acquire(self, method: str, endpoint: str) -> float:
+        """Take a request slot, or return the seconds to wait before trying again.
+
+        The returned wait is added to wait_seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill_global(now)
+            wait = self._global_blocked_until - now
+            if self._global_tokens < 1:
+                wait = max(wait, (1 - self._global_tokens) / self.global_rate_limit)
+
+            bucket = self._bucket(method, endpoint)
+            if bucket.reset_at <= now:
+                bucket.remaining = bucket.limit - bucket.in_flight
+            if bucket.remaining <= 0:
+                # Unknown buckets are retried once the first response is in
+                wait = max(wait, bucket.reset_at - now, 0.05)
+
+            if wait > 0:
+                self.wait_seconds += wait
+                return wait
+            self._global_tokens -= 1
+            bucket.remaining -= 1
+            bucket.in_flight += 1
+            self.n_requests += 1
+            return 0.0
+
+    def acquire(self, method: str, endpoint: str):
+        while (wait := self.try_acquire(method, endpoint)) > 0:
+            time.sleep(wait)
+
+    def update(self, method: str, endpoint: str, response: Optional[httpx.Response]):
+        """Record the rate limit headers of a response, call after every acquire"""
+        with self._lock:
+            now = time.monotonic()
+            route, major = get_route(method, endpoint)
+            bucket = self._bucket(method, endpoint)
+            bucket.in_flight = max(bucket.in_flight - 1, 0)
+            if response is None:
+                # The request failed, free the slot of an undiscovered bucket
+                if not bucket.discovered:
+                    bucket.remaining = max(bucket.remaining, 1)
+                return
+
+            headers = response.headers
+            bucket_hash = headers.get("X-RateLimit-Bucket")
+            if bucket_hash and self._route_buckets.get(route) != bucket_hash:
+                self._remap_route(route, bucket_hash)
+                # Continue with the shared bucket, it may already be tracked
+                bucket = self._bucket(method, endpoint)
+
+            limit = headers.get("X-RateLimit-Limit")
+            remaining = headers.get("X-RateLimit-Remaining")
+            reset_after = headers.get("X-RateLimit-Reset-After")
+            if limit is not None and remaining is not None and reset_after is not None:
+                bucket.limit = int(limit)
+                # Other requests may have been sent since this one
+                bucket.remaining = min(int(remaining), bucket.limit - bucket.in_flight)
+                bucket.reset_at = now + float(reset_after)
+                bucket.discovered = True
+            elif not bucket.discovered:
+                # Routes without rate limit headers are only globally limited
+                bucket.limit = bucket.remaining = GLOBAL_RATE_LIMIT
+                bucket.discovered = True
+
+            if response.status_code == 429:
+                self.n_rate_limited += 1
+                retry_after = get_retry_after(response)
+                if headers.get("X-RateLimit-Global", "").lower() == "true" or (
+                    headers.get("X-RateLimit-Scope") == "global"
+                ):
+                    self._global_blocked_until = max(
+                        self._global_blocked_until, now + retry_after
+                    )
+                else:
+                    bucket.remaining = 0
+                    bucket.reset_at = max(bucket.reset_at, now + retry_after)
+
+    def _remap_route(self, route: str, bucket_hash: str):
+        """Map a route to its bucket hash, moving the requests in flight along.
+
+        Call with the lock held. Until its hash is known a route has a bucket of
+        its own per major parameter, the requests in flight there are released
+        on the shared buckets from now on.
+        """
+        old_key = self._route_buckets.get(route, route)
+        self._route_buckets[route] = bucket_hash
+        if old_key != route:
+            # The hash of the route changed, the old bucket may be shared with
+            # other routes whose requests in flight can't be told apart
+            return
+        for key, major in list(self._buckets):
+            if key != route:
+                continue
+            in_flight = self._buckets.pop((key, major)).in_flight
+            bucket = self._buckets.get((bucket_hash, major))
+            if bucket is None:
+                bucket = self._buckets[(bucket_hash, major)] = RateLimitBucket()
+            bucket.in_flight += in_flight
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            return {
+                "n_requests": self.n_requests,
+                "n_rate_limited": self.n_rate_limited,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "n_buckets": len(self._buckets),
+            }
+
+
+def get_retry_after(response: httpx.Response, default: float = 1.0) -> float:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        try:
+            retry_after = response.json().get("retry_after")
+        except Exception:
+            retry_after = None
+    return float(retry_after) if retry_after is not None else default
+
+
+_rate_limiters: Dict[str, DiscordRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(token: str) -> DiscordRateLimiter:
+    """Rate limits apply per token, clients with the same token share a limiter"""
+    with _rate_limiters_lock:
+        if token not in _rate_limiters:
+            _rate_limiters[token] = DiscordRateLimiter()
+        return _rate_limiters[token]
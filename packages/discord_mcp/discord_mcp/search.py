@@ -0,0 +1,178 @@
+"""Hybrid keyword and semantic search over Discord messages."""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Self
+
+from discord_mcp.db import (
+    get_chunk_messages,
+    get_chunks_by_id,
+    get_keyword_matches,
+    get_matching_chunks,
+)
+from discord_mcp.embedding_background_worker import get_embedding
+
+
+class MessageQueryBuilder:
+    """
+    Search query over message chunks, like toolbox_store's ChunkQueryBuilder.
+
+    Semantic queries rank embedded chunks by distance, keyword queries rank
+    messages with BM25 over the messages_fts index and map them to the chunk they
+    belong to. Messages that are not embedded yet are returned as chunks of their
+    own, with chunk_id None. With both set, the rankings are combined with
+    Reciprocal Rank Fusion. Filters are applied in SQL before ranking, a chunk
+    matches if one of its messages does.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._semantic_query: str | list[float] | None = None
+        self._keyword_query: str | None = None
+        self._limit: int = 10
+        self._filters: dict[str, Any] | None = None
+
+        # Hybrid search parameters
+        self._hybrid_k: int = 60
+        self._semantic_weight: float = 1.0
+        self._keyword_weight: float = 1.0
+
+    def semantic(self, query: str | list[float]) -> Self:
+        self._semantic_query = query
+        return self
+
+    def keyword(self, query: str) -> Self:
+        self._keyword_query = query
+        return self
+
+    def where(self, filters: dict[str, Any]) -> Self:
+        """Filter on channel_id, author_id, since and until (datetimes)"""
+        if self._filters is None:
+            self._filters = {}
+        self._filters.update(filters)
+        return self
+
+    def limit(self, n: int) -> Self:
+        self._limit = n
+        return self
+
+    def hybrid(
+        self,
+        method: str = "rrf",
+        *,
+        k: int = 60,
+        semantic_weight: float = 1.0,
+        keyword_weight: float = 1.0,
+    ) -> Self:
+        """Configure hybrid search, only 'rrf' (Reciprocal Rank Fusion) is supported"""
+        if method != "rrf":
+            raise ValueError(f"Unsupported hybrid method: {method}")
+        self._hybrid_k = k
+        self._semantic_weight = semantic_weight
+        self._keyword_weight = keyword_weight
+        return self
+
+    def _execute_semantic_search(self, limit: int) -> list[dict]:
+        if isinstance(self._semantic_query, str):
+            query_embedding = get_embedding(self._semantic_query)
+        else:
+            query_embedding = self._semantic_query
+
+        return get_matching_chunks(self.conn, query_embedding, limit, self._filters)
+
+    def _execute_keyword_search(self, limit: int) -> list[dict]:
+        # A chunk is as good as its best matching message
+        chunks = {}
+        for match in get_keyword_matches(
+            self.conn, self._keyword_query, limit, self._filters
+        ):
+            if match["chunk_id"] is None:
+                chunks[f"message:{match['message_id']}"] = {
+                    "chunk_id": None,
+                    "message_ids": [match["message_id"]],
+                    "chunk_text": match["content"],
+                }
+            else:
+                chunks.setdefault(match["chunk_id"], None)
+
+        chunk_ids = [key for key, chunk in chunks.items() if chunk is None]
+        for chunk in get_chunks_by_id(self.conn, chunk_ids):
+            chunks[chunk["chunk_id"]] = chunk
+        return [chunk for chunk in chunks.values() if chunk is not None]
+
+    def get(self) -> list[dict]:
+        """Matching chunks with chunk_id, chunk_text and message_ids, best first"""
+        if self._semantic_query is None and self._keyword_query is None:
+            raise ValueError(
+                "No query set. Use .semantic() or .keyword() to set a query."
+            )
+
+        if self._semantic_query is not None and self._keyword_query is not None:
+            fetch_limit = self._limit * 3
+            combined = combine_rrf(
+                self._execute_semantic_search(fetch_limit),
+                self._execute_keyword_search(fetch_limit),
+                weights=[self._semantic_weight, self._keyword_weight],
+                k=self._hybrid_k,
+            )
+            return combined[: self._limit]
+
+        if self._semantic_query is not None:
+            return self._execute_semantic_search(self._limit)
+        return self._execute_keyword_search(self._limit)
+
+    def get_with_messages(self) -> list[dict]:
+        """
+        Matching chunks with their messages, in one query. Filters select chunks
+        with a matching message, but only the matching messages are returned.
+        """
+        return get_chunk_messages(self.conn, self.get(), self._filters)
+
+
+def get_chunk_key(chunk: dict) -> str:
+    return chunk["chunk_id"] or f"message:{chunk['message_ids'][0]}"
+
+
+def combine_rrf(
+    *result_sets: list[dict],
+    weights: list[float] | None = None,
+    k: int = 60,
+) -> list[dict]:
+    """Combine rank-ordered chunk lists using weighted Reciprocal Rank Fusion.
+
+    RRF(d) = Σ(r ∈ R) weight_r * (1 / (k + rank_r(d)))
+
+    The score is stored on each chunk under "score", higher is better.
+    """
+    if weights is None:
+        weights = [1.0] * len(result_sets)
+    if len(weights) != len(result_sets):
+        raise ValueError(
+            f"Number of weights ({len(weights)}) must match number of result sets ({len(result_sets)})"
+        )
+
+    rrf_scores = {}
+    chunk_map = {}
+    for weight, results in zip(weights, result_sets):
+        for rank, chunk in enumerate(results, 1):
+            key = get_chunk_key(chunk)
+            rrf_scores[key] = rrf_scores.get(key, 0) + weight * (1 / (k + rank))
+            # First occurrence wins
+            chunk_map.setdefault(key, chunk)
+
+    results = []
+    for key, score in sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True):
+        chunk = chunk_map[key]
+        chunk["score"] = score
+        results.append(chunk)
+    return results
+
+
+def get_message_filters(
+    channel_id: str | None = None,
+    author_id: str | None = None,
+    last_n_days: int | None = None,
+) -> dict[str, Any]:
+    filters = {"channel_id": channel_id, "author_id": author_id}
+    if last_n_days is not None:
+        filters["since"] = datetime.now(timezone.utc) - timedelta(days=last_n_days)
+    return {key: value for key, value in filters.items() if value is not None}
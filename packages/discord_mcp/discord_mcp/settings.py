@@ -3,7 +3,10 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     embedding_provider: str = "ollama"  # "ollama" or "syftbox"
-    max_messages_per_hour: int = 100
+    # Budget of the embedding worker, tokens sent to the embedding model per minute
+    embedding_tokens_per_minute: int = 100_000
+    # Chunks per embedding request
+    embedding_batch_size: int = 32
     ollama_port: int = 11434
     discord_mcp_port: int = 8005
 
@@ -0,0 +1,708 @@
+"""
+Sync benchmark of the Discord crawler against a fake Discord API.
+
+FakeDiscordAPI serves a deterministic synthetic workspace of guilds, channels,
+threads, users and messages through an httpx.MockTransport, with per-route
+rate limit buckets, the same rate limit headers as Discord and 429s when a
+bucket is overrun. The real background worker downloads it into a fresh
+database, after which the real EmbeddingScheduler drains the embedding
+backlog against a fake Ollama server.
+
+    python -m tests.sync_benchmark --guilds 2 --channels 10 --messages 1000
+
+Reports messages/sec, API calls per message, 429s, the time spent in the
+database during the sync and the time to drain the embedding backlog.
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import random
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+import numpy as np
+import uvicorn
+from discord_mcp.background_worker import (
+    run_discord_mesage_download_and_write_background_worker_single,
+)
+from discord_mcp.client import DiscordClient
+from discord_mcp.db import (
+    EMBEDDINGS_LEN,
+    count_messages_without_embeddings,
+    get_discord_connection,
+    get_message_count,
+)
+from discord_mcp.embedding_background_worker import (
+    IDLE_SECONDS,
+    EmbeddingScheduler,
+)
+from discord_mcp.models import datetime_to_snowflake
+from discord_mcp.permissions_api import PERMISSIONS, ROLE_OVERWRITE
+from discord_mcp.rate_limit import DiscordRateLimiter, get_route
+from discord_mcp.settings import settings
+from fastapi import FastAPI
+from toolbox_store.embedding import approx_token_count
+
+API_PREFIX = "/api/v10/"
+# Requests per bucket and reset window, per route and major parameter
+BUCKET_LIMIT = 5
+BUCKET_RESET_AFTER = 1.0
+# Requests per second across all routes, like Discord's global limit
+GLOBAL_LIMIT = 50
+# Seconds every fake API response takes
+API_LATENCY = 0.05
+# Seconds every fake embedding request takes
+EMBED_LATENCY = 0.05
+
+WORDS = (
+    "deploy build release error fix bug test merge branch review server client "
+    "database query index cache latency timeout retry token channel thread guild "
+    "message search embedding model vector sync crawler worker queue config docs "
+    "api endpoint schema migration rollback incident alert metric dashboard log "
+    "the a is it we should can not with for on in to of and but maybe today now"
+).split()
+
+EVERYONE_PERMISSIONS = (
+    PERMISSIONS["VIEW_CHANNEL"]
+    | PERMISSIONS["READ_MESSAGE_HISTORY"]
+    | PERMISSIONS["SEND_MESSAGES"]
+)
+
+
+@dataclass
+class WorkspaceSpec:
+    """Shape of the synthetic workspace, the same seed gives the same workspace"""
+
+    n_guilds: int = 2
+    channels_per_guild: int = 10
+    threads_per_channel: int = 1
+    messages_per_channel: int = 500
+    messages_per_thread: int = 50
+    n_users: int = 100
+    # Messages are spread over the last `days` days
+    days: int = 30
+    # Every nth channel is hidden from @everyone, 0 to make all channels readable
+    private_channel_every: int = 5
+    seed: int = 0
+
+
+class FakeDiscordAPI:
+    """
+    The Discord REST endpoints used by the crawler, on a synthetic workspace.
+
+    Use `transport` as the transport of a DiscordClient. Objects get sequential
+    ids, messages get snowflakes of their creation time so after/before
+    pagination behaves like Discord. Message times are relative to when the
+    fake is created, so they fall inside the crawler's days_back window.
+    Messages are generated per channel on the first request for them.
+
+    Every route and major parameter has a bucket of `bucket_limit` requests per
+    `bucket_reset_after` seconds, reported in X-RateLimit-* headers. Overrunning
+    a bucket or the global limit returns a 429 with Retry-After.
+    """
+
+    def __init__(
+        self,
+        spec: Optional[WorkspaceSpec] = None,
+        bucket_limit: int = BUCKET_LIMIT,
+        bucket_reset_after: float = BUCKET_RESET_AFTER,
+        global_limit: int = GLOBAL_LIMIT,
+        latency: float = API_LATENCY,
+    ):
+        self.spec = spec or WorkspaceSpec()
+        self.bucket_limit = bucket_limit
+        self.bucket_reset_after = bucket_reset_after
+        self.global_limit = global_limit
+        self.latency = latency
+        self.now = datetime.now(timezone.utc)
+
+        self._lock = threading.Lock()
+        # (route, major parameter) -> (window start, requests in window)
+        self._buckets: Dict[tuple, tuple[float, int]] = {}
+        self._global_window = (0.0, 0)
+        self.calls_per_route: Counter = Counter()
+        self.n_rate_limited = 0
+
+        self._next_id = 10**17
+        self.users = [self._make_user(i) for i in range(self.spec.n_users + 1)]
+        # The crawler runs as the first user, the second one owns the guilds
+        self.current_user = self.users[0]
+        self.guilds: List[Dict] = []
+        self.channels: Dict[str, Dict] = {}
+        self.guild_channels: Dict[str, List[Dict]] = {}
+        self._messages: Dict[str, tuple[List[int], List[Dict]]] = {}
+        for i in range(self.spec.n_guilds):
+            self._make_guild(i)
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _make_user(self, i: int) -> Dict:
+        return {
+            "id": self._new_id(),
+            "username": f"user{i}",
+            "discriminator": "0",
+            "global_name": f"User {i}",
+            "avatar": None,
+            "public_flags": 0,
+        }
+
+    def _make_guild(self, i: int):
+        guild_id = self._new_id()
+        self.guilds.append({"id": guild_id, "name": f"guild-{i}", "icon": None})
+        channels = []
+        for j in range(self.spec.channels_per_guild):
+            channel_id = self._new_id()
+            overwrites = []
+            every = self.spec.private_channel_every
+            if every and j % every == every - 1:
+                overwrites.append(
+                    {
+                        "id": guild_id,
+                        "type": ROLE_OVERWRITE,
+                        "allow": "0",
+                        "deny": str(PERMISSIONS["VIEW_CHANNEL"]),
+                    }
+                )
+            channels.append(
+                {
+                    "id": channel_id,
+                    "type": 0,
+                    "guild_id": guild_id,
+                    "name": f"channel-{j}",
+                    "position": j,
+                    "topic": None,
+                    "nsfw": False,
+                    "rate_limit_per_user": 0,
+                    "permission_overwrites": overwrites,
+                }
+            )
+            for k in range(self.spec.threads_per_channel):
+                channels.append(
+                    {
+                        "id": self._new_id(),
+                        "type": 11,
+                        "guild_id": guild_id,
+                        "parent_id": channel_id,
+                        "name": f"thread-{j}-{k}",
+                        "thread_metadata": {"archived": False, "locked": False},
+                    }
+                )
+        self.guild_channels[guild_id] = channels
+        self.channels.update({channel["id"]: channel for channel in channels})
+
+    def _generate_messages(self, channel: Dict) -> tuple[List[int], List[Dict]]:
+        """Messages of a channel, oldest first, in bursts of conversation"""
+        is_thread = channel["type"] == 11
+        n_messages = (
+            self.spec.messages_per_thread
+            if is_thread
+            else self.spec.messages_per_channel
+        )
+        rng = random.Random(f"{self.spec.seed}:{channel['guild_id']}:{channel['name']}")
+        start = (self.now - timedelta(days=self.spec.days)).timestamp()
+        end = (self.now - timedelta(minutes=1)).timestamp()
+
+        times = []
+        while len(times) < n_messages:
+            t = rng.uniform(start, end)
+            for _ in range(min(rng.randint(1, 20), n_messages - len(times))):
+                times.append(min(t, end))
+                t += rng.expovariate(1 / 45)
+        times.sort()
+
+        # Channels get distinct low bits, so messages at the same ms get distinct ids
+        channel_bits = int(channel["id"]) % (1 << 22)
+        ids, messages = [], []
+        previous_ms = 0
+        for t in times:
+            ms = max(int(t * 1000), previous_ms + 1)
+            previous_ms = ms
+            created_at = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+            message_id = int(datetime_to_snowflake(created_at)) + channel_bits
+            n_words = rng.randint(3, 30)
+            ids.append(message_id)
+            messages.append(
+                {
+                    "id": str(message_id),
+                    "channel_id": channel["id"],
+                    "author": rng.choice(self.users[1:]),
+                    "content": " ".join(rng.choices(WORDS, k=n_words)),
+                    "timestamp": created_at.isoformat(),
+                    "edited_timestamp": None,
+                    "type": 0,
+                    "tts": False,
+                    "pinned": False,
+                    "mention_everyone": False,
+                    "mentions": [],
+                    "mention_roles": [],
+                    "attachments": [],
+                    "embeds": [],
+                    "flags": 0,
+                }
+            )
+        return ids, messages
+
+    def get_messages(
+        self,
+        channel_id: str,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[Dict]:
+        """A page of messages newest first, selected like Discord does"""
+        with self._lock:
+            if channel_id not in self._messages:
+                channel = self.channels[channel_id]
+                self._messages[channel_id] = self._generate_messages(channel)
+            ids, messages = self._messages[channel_id]
+
+        limit = max(1, min(limit, 100))
+        if after is not None:
+            # The oldest messages after `after`
+            start = bisect.bisect_right(ids, int(after))
+            page = messages[start : start + limit]
+        else:
+            end = bisect.bisect_left(ids, int(before)) if before else len(ids)
+            page = messages[max(end - limit, 0) : end]
+        return page[::-1]
+
+    def count_messages(self, readable_only: bool = True) -> int:
+        """Messages in the workspace, in the channels the current user can read"""
+        n_messages = 0
+        for channel in self.channels.values():
+            parent = self.channels.get(channel.get("parent_id"), channel)
+            if readable_only and parent["permission_overwrites"]:
+                continue
+            if channel["type"] == 11:
+                n_messages += self.spec.messages_per_thread
+            else:
+                n_messages += self.spec.messages_per_channel
+        return n_messages
+
+    def _take(self, route: str, major: str) -> tuple[Dict[str, str], Optional[float]]:
+        """Count a request against its bucket, returns its headers and retry_after"""
+        now = time.time()
+        window_start, n_requests = self._buckets.get((route, major), (now, 0))
+        if now - window_start >= self.bucket_reset_after:
+            window_start, n_requests = now, 0
+        n_requests += 1
+        self._buckets[(route, major)] = (window_start, n_requests)
+
+        reset_after = max(window_start + self.bucket_reset_after - now, 0.0)
+        headers = {
+            "X-RateLimit-Bucket": hashlib.md5(route.encode()).hexdigest(),
+            "X-RateLimit-Limit": str(self.bucket_limit),
+            "X-RateLimit-Remaining": str(max(self.bucket_limit - n_requests, 0)),
+            "X-RateLimit-Reset": f"{now + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        }
+        if n_requests > self.bucket_limit:
+            headers.update(
+                {"Retry-After": f"{reset_after:.3f}", "X-RateLimit-Scope": "user"}
+            )
+            return headers, reset_after
+
+        global_start, n_global = self._global_window
+        if now - global_start >= 1.0:
+            global_start, n_global = now, 0
+        self._global_window = (global_start, n_global + 1)
+        if n_global + 1 > self.global_limit:
+            retry_after = max(global_start + 1.0 - now, 0.0)
+            headers.update(
+                {
+                    "Retry-After": f"{retry_after:.3f}",
+                    "X-RateLimit-Global": "true",
+                    "X-RateLimit-Scope": "global",
+                }
+            )
+            return headers, retry_after
+        return headers, None
+
+    def _get(self, path: str, params: httpx.QueryParams) -> Any:
+        """The response body of a GET request, None for unknown paths"""
+        parts = path.strip("/").split("/")
+        if parts == ["users", "@me"]:
+            return self.current_user
+        if parts == ["users", "@me", "channels"]:
+            return []
+        if parts == ["users", "@me", "guilds"]:
+            after = int(params.get("after", "0"))
+            limit = int(params.get("limit", "200"))
+            return [g for g in self.guilds if int(g["id"]) > after][:limit]
+
+        if parts[0] == "guilds" and len(parts) > 1:
+            guild = next((g for g in self.guilds if g["id"] == parts[1]), None)
+            if guild is None:
+                return None
+            if len(parts) == 2:
+                return {**guild, "owner_id": self.users[1]["id"], "features": []}
+            if parts[2:] == ["channels"]:
+                return self.guild_channels[guild["id"]]
+            if parts[2:] == ["roles"]:
+                everyone = {
+                    "id": guild["id"],
+                    "name": "@everyone",
+                    "permissions": str(EVERYONE_PERMISSIONS),
+                    "position": 0,
+                }
+                return [everyone]
+            if parts[2] == "members" and len(parts) == 4:
+                return {"user": self.current_user, "roles": []}
+            return None
+
+        if parts[0] == "channels" and len(parts) > 1:
+            channel = self.channels.get(parts[1])
+            if channel is None:
+                return None
+            if len(parts) == 2:
+                return channel
+            if parts[2:] == ["messages"]:
+                return self.get_messages(
+                    channel["id"],
+                    after=params.get("after"),
+                    before=params.get("before"),
+                    limit=int(params.get("limit", "50")),
+                )
+        return None
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix(API_PREFIX)
+        route, major = get_route(request.method, path)
+        with self._lock:
+            self.calls_per_route[route] += 1
+            headers, retry_after = self._take(route, major)
+            if retry_after is not None:
+                self.n_rate_limited += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if retry_after is not None:
+            body = {
+                "message": "You are being rate limited.",
+                "retry_after": retry_after,
+                "global": headers.get("X-RateLimit-Global") == "true",
+            }
+            return httpx.Response(429, headers=headers, json=body)
+        body = self._get(path, request.url.params) if request.method == "GET" else None
+        if body is None:
+            return httpx.Response(404, headers=headers, json={"message": "Unknown"})
+        return httpx.Response(200, headers=headers, json=body)
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    @property
+    def n_calls(self) -> int:
+        return sum(self.calls_per_route.values())
+
+
+class TimedConnection:
+    """A sqlite connection that adds up the time spent in its calls"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.seconds = 0.0
+        self.n_commits = 0
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def execute(self, *args):
+        return self._timed(self._conn.execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(self._conn.executemany, *args)
+
+    def commit(self):
+        self.n_commits += 1
+        return self._timed(self._conn.commit)
+
+    def cursor(self):
+        return TimedCursor(self, self._conn.cursor())
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.n_commits += 1
+        return self._timed(self._conn.__exit__, *exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TimedCursor:
+    def __init__(self, timed_conn: TimedConnection, cursor):
+        self._timed_conn = timed_conn
+        self._cursor = cursor
+
+    def execute(self, *args):
+        self._timed_conn._timed(self._cursor.execute, *args)
+        return self
+
+    def executemany(self, *args):
+        self._timed_conn._timed(self._cursor.executemany, *args)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@contextmanager
+def serve_in_thread(app: FastAPI) -> Iterator[int]:
+    """Serve an app on a free local port until the context exits, yields the port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(
+        target=server.run, kwargs={"sockets": [sock]}, daemon=True
+    )
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Fake server did not start")
+        time.sleep(0.01)
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        sock.close()
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    """A deterministic unit vector per text"""
+    vector = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def create_fake_ollama_app(dim: int, latency: float = EMBED_LATENCY) -> FastAPI:
+    """The Ollama endpoint used by the embedding worker"""
+    app = FastAPI()
+    app.state.n_requests = 0
+
+    @app.post("/api/embed")
+    def embed(payload: dict):
+        app.state.n_requests += 1
+        if latency:
+            time.sleep(latency)
+        texts = payload["input"]
+        return {
+            "model": payload["model"],
+            "embeddings": [fake_embedding(text, dim) for text in texts],
+            "prompt_eval_count": sum(map(approx_token_count, texts)),
+        }
+
+    return app
+
+
+def drain_embedding_backlog(
+    conn, scheduler: EmbeddingScheduler, max_seconds: float = 600
+) -> Dict[str, Any]:
+    """Run the scheduler until every message is embedded, or it gives up"""
+    backlog = count_messages_without_embeddings(conn)
+    start = time.perf_counter()
+    n_iterations = 0
+    while time.perf_counter() - start < max_seconds:
+        if count_messages_without_embeddings(conn) == 0:
+            break
+        wait = scheduler.run_once(conn)
+        n_iterations += 1
+        if wait >= IDLE_SECONDS:
+            # Nothing could be embedded, the embedding requests failed
+            break
+        time.sleep(wait)
+    seconds = time.perf_counter() - start
+
+    remaining = count_messages_without_embeddings(conn)
+    embedded = backlog - remaining
+    return {
+        "backlog_messages": backlog,
+        "remaining_messages": remaining,
+        "iterations": n_iterations,
+        "drain_seconds": round(seconds, 3),
+        "messages_per_second": round(embedded / seconds, 1) if seconds else None,
+    }
+
+
+def run_benchmark(
+    spec: Optional[WorkspaceSpec] = None,
+    db_path: Optional[Path] = None,
+    max_workers: int = 4,
+    api_latency: float = API_LATENCY,
+    bucket_limit: int = BUCKET_LIMIT,
+    bucket_reset_after: float = BUCKET_RESET_AFTER,
+    embed: bool = True,
+    embed_latency: float = EMBED_LATENCY,
+    tokens_per_minute: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Sync a synthetic workspace into a fresh database and embed it.
+
+    The database is written through one connection shared by the crawler
+    threads, so the DB time is the time the crawler spent in sqlite calls.
+    """
+    spec = spec or WorkspaceSpec()
+    api = FakeDiscordAPI(
+        spec,
+        bucket_limit=bucket_limit,
+        bucket_reset_after=bucket_reset_after,
+        latency=api_latency,
+    )
+    rate_limiter = DiscordRateLimiter()
+    client = DiscordClient(
+        "benchmark-token", rate_limiter=rate_limiter, transport=api.transport
+    )
+    if db_path is None:
+        db_path = Path(tempfile.mkdtemp()) / "discord_benchmark.sqlite"
+
+    results: Dict[str, Any] = {"spec": asdict(spec), "db_path": str(db_path)}
+    with get_discord_connection(db_path) as conn:
+        timed_conn = TimedConnection(conn)
+        start = time.perf_counter()
+        run_discord_mesage_download_and_write_background_worker_single(
+            timed_conn,
+            client,
+            days_back=spec.days + 1,
+            max_workers=max_workers,
+        )
+        sync_seconds = time.perf_counter() - start
+        client.close()
+
+        n_messages = get_message_count(conn)
+        limiter_metrics = rate_limiter.get_metrics()
+        results["sync"] = {
+            "messages": n_messages,
+            "expected_messages": api.count_messages(),
+            "seconds": round(sync_seconds, 3),
+            "messages_per_second": round(n_messages / sync_seconds, 1),
+            "api_calls": api.n_calls,
+            "api_calls_per_message": (
+                round(api.n_calls / n_messages, 4) if n_messages else None
+            ),
+            "api_calls_per_route": dict(api.calls_per_route.most_common()),
+            "rate_limited_responses": api.n_rate_limited,
+            "rate_limit_wait_seconds": limiter_metrics["wait_seconds"],
+            "db_seconds": round(timed_conn.seconds, 3),
+            "db_commits": timed_conn.n_commits,
+        }
+
+        if embed:
+            scheduler = EmbeddingScheduler(tokens_per_minute=tokens_per_minute)
+            app = create_fake_ollama_app(EMBEDDINGS_LEN, latency=embed_latency)
+            previous = settings.embedding_provider, settings.ollama_port
+            with serve_in_thread(app) as port:
+                settings.embedding_provider = "ollama"
+                settings.ollama_port = port
+                try:
+                    results["embedding"] = drain_embedding_backlog(conn, scheduler)
+                finally:
+                    settings.embedding_provider, settings.ollama_port = previous
+            results["embedding"]["requests"] = app.state.n_requests
+            results["embedding"]["tokens_per_minute"] = scheduler.tokens_per_minute
+    return results
+
+
+def print_results(results: Dict[str, Any]):
+    sync = results["sync"]
+    print("\n" + "=" * 50)
+    print("SYNC BENCHMARK")
+    print("=" * 50)
+    print(f"Messages: {sync['messages']} of {sync['expected_messages']}")
+    print(f"  Total time: {sync['seconds']:.2f}s")
+    print(f"  Rate: {sync['messages_per_second']} messages/sec")
+    print(f"  API calls: {sync['api_calls']} ({sync['api_calls_per_message']}/message)")
+    for key, n_calls in sync["api_calls_per_route"].items():
+        print(f"    {key}: {n_calls}")
+    print(f"  429 responses: {sync['rate_limited_responses']}")
+    print(f"  Rate limit wait: {sync['rate_limit_wait_seconds']:.2f}s")
+    print(f"  DB time: {sync['db_seconds']:.2f}s in {sync['db_commits']} commits")
+
+    embedding = results.get("embedding")
+    if embedding:
+        print("\n" + "=" * 50)
+        print("EMBEDDING BACKLOG")
+        print("=" * 50)
+        print(f"Backlog: {embedding['backlog_messages']} messages")
+        print(f"  Drain time: {embedding['drain_seconds']:.2f}s")
+        print(f"  Rate: {embedding['messages_per_second']} messages/sec")
+        print(f"  Embedding requests: {embedding['requests']}")
+        print(f"  Remaining: {embedding['remaining_messages']} messages")
+
+
+def main():
+    defaults = WorkspaceSpec()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=defaults.n_guilds)
+    parser.add_argument("--channels", type=int, default=defaults.channels_per_guild)
+    parser.add_argument("--threads", type=int, default=defaults.threads_per_channel)
+    parser.add_argument("--messages", type=int, default=defaults.messages_per_channel)
+    parser.add_argument(
+        "--thread-messages", type=int, default=defaults.messages_per_thread
+    )
+    parser.add_argument("--users", type=int, default=defaults.n_users)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--api-latency", type=float, default=API_LATENCY)
+    parser.add_argument("--bucket-limit", type=int, default=BUCKET_LIMIT)
+    parser.add_argument("--bucket-reset", type=float, default=BUCKET_RESET_AFTER)
+    parser.add_argument("--embed-latency", type=float, default=EMBED_LATENCY)
+    parser.add_argument("--tokens-per-minute", type=int, default=None)
+    parser.add_argument("--no-embed", action="store_true")
+    parser.add_argument("--db", type=Path, default=None)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    spec = WorkspaceSpec(
+        n_guilds=args.guilds,
+        channels_per_guild=args.channels,
+        threads_per_channel=args.threads,
+        messages_per_channel=args.messages,
+        messages_per_thread=args.thread_messages,
+        n_users=args.users,
+        days=args.days,
+        seed=args.seed,
+    )
+    results = run_benchmark(
+        spec,
+        db_path=args.db,
+        max_workers=args.workers,
+        api_latency=args.api_latency,
+        bucket_limit=args.bucket_limit,
+        bucket_reset_after=args.bucket_reset,
+        embed=not args.no_embed,
+        embed_latency=args.embed_latency,
+        tokens_per_minute=args.tokens_per_minute,
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
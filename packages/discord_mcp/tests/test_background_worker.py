@@ -1,23 +1,27 @@
 """Unit tests for Discord background worker functionality."""
 
 import tempfile
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from unittest.mock import patch
+from urllib.parse import parse_qs
 
 from discord_mcp.background_worker import (
+    TEXT_CHANNEL_TYPES,
     datetime_to_discord_timestamp,
-    get_time_windows_to_fetch,
     parse_discord_timestamp,
     run_discord_mesage_download_and_write_background_worker_single,
 )
+from discord_mcp.client import TokenKind
 from discord_mcp.db import (
+    get_channel_sync_state,
     get_discord_connection,
     get_earliest_timestamp_from_db,
     get_latest_timestamp_from_db,
     get_message_count,
 )
+from discord_mcp.models import datetime_to_snowflake
 
 from tests.mock_client import MockDiscordClient
 from tests.utils import get_random_tmp_file
@@ -29,6 +33,10 @@ class TestableDiscordClient(MockDiscordClient):
     def __init__(self, token: str = "mock_token", **kwargs):
         super().__init__(token, **kwargs)
         self.current_data_set = "first_batch"  # Can be 'first_batch' or 'second_batch'
+        # Fixed, so the generated history is the same for every request
+        self.now = datetime.now(timezone.utc)
+        # (channel_id, query params) of every message request
+        self.message_requests: List[tuple[str, Dict[str, List[str]]]] = []
 
     def set_data_set(self, data_set: str):
         """Switch between different data sets for testing."""
@@ -38,9 +46,7 @@ class TestableDiscordClient(MockDiscordClient):
         self, messages: List[Dict[str, Any]], days_old_start: int, days_old_end: int
     ) -> List[Dict[str, Any]]:
         """Adjust message timestamps to be between days_old_start and days_old_end days ago."""
-        from datetime import timezone
-
-        now = datetime.now(timezone.utc)
+        now = self.now
         start_time = now - timedelta(days=days_old_start)
         end_time = now - timedelta(days=days_old_end)
 
@@ -55,24 +61,18 @@ class TestableDiscordClient(MockDiscordClient):
 
         return adjusted_messages
 
+    def _get_batch(self, data_set: str) -> List[Dict[str, Any]]:
+        messages_data = self._load_test_data("messages_with_users_test_data.json")
+        if data_set == "first_batch":
+            # Use only a small subset of messages for testing (first 10 messages)
+            return self._adjust_message_timestamps(messages_data["messages"][:10], 7, 4)
+        return self._adjust_message_timestamps(messages_data["messages"][10:20], 4, 1)
+
     def get_messages_since(
         self, channel_id: str, since: datetime, until=None, before=None
     ):
         """Override to return time-appropriate test data."""
-        # Get base messages data
-        messages_data = self._load_test_data("messages_with_users_test_data.json")
-        if self.current_data_set == "first_batch":
-            # Use only a small subset of messages for testing (first 10 messages)
-            test_messages = messages_data["messages"][:10]
-            days_old_start, days_old_end = 7, 4
-        else:  # second_batch
-            days_old_start, days_old_end = 4, 1
-            test_messages = messages_data["messages"][10:20]
-
-        # Adjust timestamps to be the right age
-        messages = self._adjust_message_timestamps(
-            test_messages, days_old_start, days_old_end
-        )
+        messages = self._get_batch(self.current_data_set)
 
         # Filter messages based on time window (since and until)
         filtered_messages = []
@@ -85,6 +85,50 @@ class TestableDiscordClient(MockDiscordClient):
 
         return filtered_messages
 
+    def get_channel_history(self) -> List[Dict[str, Any]]:
+        """Channel history of the current data set, with IDs that follow the timestamps."""
+        data_sets = ["first_batch"]
+        if self.current_data_set == "second_batch":
+            data_sets.append("second_batch")
+
+        history = []
+        for data_set in data_sets:
+            for i, message in enumerate(self._get_batch(data_set)):
+                message_time = datetime.fromisoformat(message["timestamp"])
+                snowflake = int(datetime_to_snowflake(message_time)) + i
+                history.append({**message, "id": str(snowflake)})
+        return history
+
+    def _make_request(
+        self,
+        method: str,
+        endpoint: str,
+        token_kind: Optional[TokenKind] = None,
+        **kwargs,
+    ):
+        endpoint_path, _, query_string = endpoint.partition("?")
+        if not (
+            endpoint_path.startswith("channels/")
+            and endpoint_path.endswith("/messages")
+        ):
+            return super()._make_request(method, endpoint, token_kind, **kwargs)
+
+        params = parse_qs(query_string)
+        self.message_requests.append((endpoint_path.split("/")[1], params))
+        limit = int(params.get("limit", ["100"])[0])
+        messages = sorted(
+            self.get_channel_history(), key=lambda m: int(m["id"]), reverse=True
+        )
+        if "after" in params:
+            after = int(params["after"][0])
+            newer = [m for m in messages if int(m["id"]) > after]
+            return newer[-limit:]
+        if "before" in params:
+            before = int(params["before"][0])
+            messages = [m for m in messages if int(m["id"]) < before]
+        # Discord returns newest first
+        return messages[:limit]
+
 
 class TestBackgroundWorker:
     """Test Discord background worker functionality."""
@@ -105,49 +149,6 @@ class TestBackgroundWorker:
         self.db_path_patcher.stop()
         Path(self.temp_db.name).unlink(missing_ok=True)
 
-    def test_time_window_logic_empty_db(self):
-        """Test time window calculation when database is empty."""
-        windows = get_time_windows_to_fetch(None, None, days_back=7)
-
-        assert len(windows) == 1
-        start_time, end_time = windows[0]
-
-        # Should cover the last 7 days
-        from datetime import timezone
-
-        now = datetime.now(timezone.utc)
-        expected_start = now - timedelta(days=7)
-
-        # Allow some tolerance for test execution time
-        assert abs((end_time - now).total_seconds()) < 60  # Within 1 minute of now
-        assert (
-            abs((start_time - expected_start).total_seconds()) < 60
-        )  # Within 1 minute of expected
-
-    def test_time_window_logic_with_data(self):
-        """Test time window calculation when database has existing data."""
-        from datetime import timezone
-
-        now = datetime.now(timezone.utc)
-
-        # Simulate existing data from 5 days ago to 2 days ago
-        earliest_ts = datetime_to_discord_timestamp(now - timedelta(days=5))
-        latest_ts = datetime_to_discord_timestamp(now - timedelta(days=2))
-
-        windows = get_time_windows_to_fetch(earliest_ts, latest_ts, days_back=7)
-
-        assert len(windows) == 2
-
-        # First window should be from latest_ts to now (newer messages)
-        newer_start, newer_end = windows[0]
-        assert abs((newer_end - now).total_seconds()) < 60
-        assert abs((newer_start - (now - timedelta(days=2))).total_seconds()) < 60
-
-        # Second window should be from 7 days ago to earliest_ts (older messages)
-        older_start, older_end = windows[1]
-        assert abs((older_start - (now - timedelta(days=7))).total_seconds()) < 60
-        assert abs((older_end - (now - timedelta(days=5))).total_seconds()) < 60
-
     def test_background_worker_single_run_two_batches(self):
         """Test that background worker correctly handles two time-separated batches of messages."""
 
@@ -207,8 +208,8 @@ class TestBackgroundWorker:
             print(f"After second run: {second_batch_count} messages")
             print(f"Time range: {second_earliest} to {second_latest}")
 
-            # Second run uses same message IDs so count stays the same (upsert replaces)
-            # But we verify the time range has expanded to cover both batches
+            # The second run only fetches the messages after the first batch
+            assert second_batch_count > first_batch_count
             second_earliest_dt = parse_discord_timestamp(second_earliest)  # noqa: F841
             second_latest_dt = parse_discord_timestamp(second_latest)
 
@@ -285,6 +286,64 @@ class TestBackgroundWorker:
             orphaned_messages = cursor.fetchone()[0]
             assert orphaned_messages == 0, "All messages should have valid channels"
 
+    def test_incremental_sync_requests_only_new_messages(self):
+        """A synced channel needs a single after= request when nothing is new."""
+        client = TestableDiscordClient("test_token")
+
+        with get_discord_connection(get_random_tmp_file()) as conn:
+            client.set_data_set("first_batch")
+            run_discord_mesage_download_and_write_background_worker_single(
+                conn, client, guild_names=["Claude Developers"]
+            )
+            channel_ids = {channel_id for channel_id, _ in client.message_requests}
+            assert channel_ids, "Should have fetched messages"
+            for channel_id in channel_ids:
+                state = get_channel_sync_state(conn, channel_id)
+                assert state.backfill_complete
+                assert state.latest_message_id == max(
+                    (m["id"] for m in client.get_channel_history()), key=int
+                )
+
+            client.message_requests.clear()
+            run_discord_mesage_download_and_write_background_worker_single(
+                conn, client, guild_names=["Claude Developers"]
+            )
+
+            assert len(client.message_requests) == len(channel_ids)
+            for _, params in client.message_requests:
+                assert "after" in params and "before" not in params
+
+    def test_backfill_stops_at_days_back(self):
+        """The backfill of a new channel does not go past the sync window."""
+        client = TestableDiscordClient("test_token")
+
+        with get_discord_connection(get_random_tmp_file()) as conn:
+            client.set_data_set("first_batch")
+            run_discord_mesage_download_and_write_background_worker_single(
+                conn, client, guild_names=["Claude Developers"], days_back=5
+            )
+
+            now = datetime.now(timezone.utc)
+            earliest_dt = parse_discord_timestamp(get_earliest_timestamp_from_db(conn))
+            assert (now - earliest_dt) <= timedelta(days=5, minutes=1)
+            assert 0 < get_message_count(conn) < 10
+
+    def test_sync_skips_non_text_channels(self):
+        """Only text channels are crawled."""
+        client = TestableDiscordClient("test_token")
+
+        with get_discord_connection(get_random_tmp_file()) as conn:
+            run_discord_mesage_download_and_write_background_worker_single(
+                conn, client, guild_names=["Claude Developers"]
+            )
+
+        channel_types = {
+            channel["id"]: channel.get("type", 0)
+            for channel in client._test_data["permissions_guild_channels"]
+        }
+        for channel_id, _ in client.message_requests:
+            assert channel_types[channel_id] in TEXT_CHANNEL_TYPES
+
     def test_parse_discord_timestamp(self):
         """Test Discord timestamp parsing."""
         # Test with Z suffix
@@ -0,0 +1,56 @@
+"""Test the sync benchmark and its fake Discord API."""
+
+import httpx
+
+from tests.sync_benchmark import FakeDiscordAPI, WorkspaceSpec, run_benchmark
+from tests.utils import get_random_tmp_file
+
+SPEC = WorkspaceSpec(
+    n_guilds=1,
+    channels_per_guild=3,
+    threads_per_channel=1,
+    messages_per_channel=150,
+    messages_per_thread=20,
+    n_users=5,
+    private_channel_every=3,
+)
+
+
+def test_fake_api_paginates_and_rate_limits():
+    api = FakeDiscordAPI(SPEC, bucket_limit=2, latency=0)
+    channel_id = api.guild_channels[api.guilds[0]["id"]][0]["id"]
+
+    newest = api.get_messages(channel_id, limit=100)
+    older = api.get_messages(channel_id, before=newest[-1]["id"], limit=100)
+    assert len(newest) == 100 and len(older) == 50
+    assert int(newest[0]["id"]) > int(newest[-1]["id"]) > int(older[0]["id"])
+    after = api.get_messages(channel_id, after=older[0]["id"], limit=100)
+    assert [m["id"] for m in after] == [m["id"] for m in newest]
+
+    # The same seed gives the same workspace
+    again = FakeDiscordAPI(SPEC, latency=0).get_messages(channel_id, limit=5)
+    assert [m["content"] for m in again] == [m["content"] for m in newest[:5]]
+
+    client = httpx.Client(transport=api.transport)
+    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
+    responses = [client.get(url) for _ in range(3)]
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[0].headers["X-RateLimit-Remaining"] == "1"
+    assert float(responses[2].headers["Retry-After"]) > 0
+    assert api.n_rate_limited == 1
+
+
+def test_benchmark_syncs_and_embeds_readable_channels():
+    tmp_db_path = get_random_tmp_file()
+    results = run_benchmark(SPEC, db_path=tmp_db_path, api_latency=0, embed_latency=0)
+
+    sync = results["sync"]
+    # The private channel and its thread are skipped
+    assert sync["messages"] == sync["expected_messages"] == 2 * 150 + 2 * 20
+    assert sync["api_calls_per_message"] < 0.1
+    assert sync["db_seconds"] > 0
+
+    embedding = results["embedding"]
+    assert embedding["backlog_messages"] == sync["messages"]
+    assert embedding["remaining_messages"] == 0
+    tmp_db_path.unlink(missing_ok=True)
@@ -0,0 +1,72 @@
+"""Test grouping messages into conversation windows."""
+
+from datetime import datetime, timedelta, timezone
+
+from discord_mcp.chunking import chunk_messages
+from discord_mcp.db import (
+    get_discord_connection,
+    get_messages_without_embeddings,
+    get_trailing_chunk,
+    upsert_chunks,
+    upsert_message,
+)
+from discord_mcp.models import DiscordMessage
+
+from tests.utils import get_random_tmp_file
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_message(
+    i: int, minutes: float, content: str = "hello there"
+) -> DiscordMessage:
+    return DiscordMessage(
+        id=str(1000000000000000000 + i),
+        channel_id="2000000000000000001",
+        author_id="3000000000000000001",
+        content=content,
+        timestamp=(START + timedelta(minutes=minutes)).isoformat(),
+        type=0,
+    )
+
+
+def test_windows_split_on_time_gap_and_token_budget():
+    messages = [make_message(i, minutes=i) for i in range(5)]
+    # Two hours of silence starts a new conversation
+    messages.append(make_message(5, minutes=120))
+    # Long messages fill up the token budget
+    for i in range(6, 9):
+        messages.append(make_message(i, minutes=115 + i, content="word " * 100))
+
+    chunks = chunk_messages(messages)
+
+    assert [len(chunk["message_ids"]) for chunk in chunks] == [5, 3, 2]
+    # The overlap repeats the last message of a window closed by the token budget
+    assert chunks[2]["message_ids"] == [messages[7].id, messages[8].id]
+
+
+def test_trailing_chunk_is_extended_with_new_messages():
+    tmp_db_path = get_random_tmp_file()
+    with get_discord_connection(tmp_db_path) as conn:
+        for message in [make_message(i, minutes=i) for i in range(3)]:
+            upsert_message(conn, message)
+        first_chunks = chunk_messages(get_messages_without_embeddings(conn))
+        upsert_chunks(conn, [{**c, "embedding": [0.0] * 768} for c in first_chunks])
+        assert len(first_chunks) == 1
+
+        for message in [make_message(i, minutes=i) for i in range(3, 5)]:
+            upsert_message(conn, message)
+        channel_id = "2000000000000000001"
+        trailing = {channel_id: get_trailing_chunk(conn, channel_id)}
+        new_chunks = chunk_messages(get_messages_without_embeddings(conn), trailing)
+
+        assert len(new_chunks) == 1
+        assert new_chunks[0]["chunk_id"] == first_chunks[0]["chunk_id"]
+        assert len(new_chunks[0]["message_ids"]) == 5
+
+        upsert_chunks(conn, [{**c, "embedding": [0.0] * 768} for c in new_chunks])
+        assert get_messages_without_embeddings(conn) == []
+        cursor = conn.execute("SELECT COUNT(*) FROM message_embeddings_vec")
+        assert cursor.fetchone()[0] == 1
+
+    tmp_db_path.unlink(missing_ok=True)
@@ -0,0 +1,70 @@
+"""Test the shared database connection manager."""
+
+import sqlite3
+import threading
+
+import pytest
+from discord_mcp.db import (
+    get_connection_manager,
+    get_discord_connection,
+    get_message_count,
+    upsert_message,
+)
+from discord_mcp.models import DiscordMessage
+
+from tests.utils import get_random_tmp_file
+
+
+def make_message(i: int) -> DiscordMessage:
+    return DiscordMessage(
+        id=str(1000000000000000000 + i),
+        channel_id="2000000000000000001",
+        author_id="3000000000000000001",
+        content=f"message {i}",
+        timestamp="2024-01-01T00:00:00Z",
+        type=0,
+    )
+
+
+def test_connections_are_reused_and_migrated_once():
+    tmp_db_path = get_random_tmp_file()
+    manager = get_connection_manager(tmp_db_path)
+
+    with get_discord_connection(tmp_db_path) as conn_1:
+        pass
+    with get_discord_connection(tmp_db_path) as conn_2:
+        assert conn_1 is conn_2
+        assert conn_2.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    with get_discord_connection(tmp_db_path, readonly=True) as reader:
+        assert reader is not conn_1
+        with pytest.raises(sqlite3.OperationalError):
+            upsert_message(reader, make_message(0))
+
+    stats = manager.get_stats()
+    assert stats["write"]["count"] == 2
+    assert stats["read"]["count"] == 1
+    manager.close()
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_readers_see_committed_writes_from_other_threads():
+    tmp_db_path = get_random_tmp_file()
+    n_messages = 50
+
+    def write_messages():
+        for i in range(n_messages):
+            with get_discord_connection(tmp_db_path) as conn:
+                upsert_message(conn, make_message(i))
+
+    writers = [threading.Thread(target=write_messages) for _ in range(2)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+
+    with get_discord_connection(tmp_db_path, readonly=True) as reader:
+        assert get_message_count(reader) == n_messages
+
+    get_connection_manager(tmp_db_path).close()
+    tmp_db_path.unlink(missing_ok=True)
@@ -0,0 +1,162 @@
+"""Test database queries."""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from discord_mcp.db import (
+    close_connections,
+    get_chunk_messages,
+    get_discord_connection,
+    get_message_count,
+    get_messages_from_channel,
+    upsert_chunks,
+    upsert_message,
+    upsert_messages,
+    upsert_users,
+)
+from discord_mcp.models import (
+    DiscordMessage,
+    DiscordUser,
+    datetime_to_snowflake,
+    snowflake_to_timestamp_ms,
+)
+
+from tests.utils import get_random_tmp_file
+
+
+def test_get_chunk_messages_keeps_chunk_and_message_order():
+    tmp_db_path = get_random_tmp_file()
+    message_ids = [str(1000000000000000000 + i) for i in range(6)]
+
+    with get_discord_connection(tmp_db_path) as conn:
+        for i, message_id in enumerate(message_ids):
+            upsert_message(
+                conn,
+                DiscordMessage(
+                    id=message_id,
+                    channel_id="2000000000000000001",
+                    author_id="3000000000000000001",
+                    content=f"message {i}",
+                    timestamp="2024-01-01T00:00:00Z",
+                    type=0,
+                ),
+            )
+
+        chunks = [
+            {"chunk_id": "b", "message_ids": message_ids[3:], "chunk_text": "b"},
+            {"chunk_id": "a", "message_ids": message_ids[:3], "chunk_text": "a"},
+            {"chunk_id": "missing", "message_ids": ["1"], "chunk_text": "c"},
+        ]
+        upsert_chunks(conn, [{**chunk, "embedding": [0.0] * 768} for chunk in chunks])
+
+        result = get_chunk_messages(conn, chunks)
+
+    assert [chunk["chunk_id"] for chunk in result] == ["b", "a", "missing"]
+    assert [msg.id for msg in result[0]["messages"]] == message_ids[3:]
+    assert [msg.id for msg in result[1]["messages"]] == message_ids[:3]
+    assert result[2]["messages"] == []
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_bulk_upserts_return_inserted_and_updated_counts():
+    tmp_db_path = get_random_tmp_file()
+    messages = [
+        DiscordMessage(
+            id=str(1000000000000000000 + i),
+            channel_id="2000000000000000001",
+            author_id="3000000000000000001",
+            content=f"message {i}",
+            timestamp="2024-01-01T00:00:00Z",
+            type=0,
+        )
+        for i in range(5)
+    ]
+
+    with get_discord_connection(tmp_db_path) as conn:
+        assert upsert_messages(conn, messages[:3]) == (3, 0)
+        # Duplicates in a batch count once, the last version is stored
+        edited = messages[2].model_copy(update={"content": "edited"})
+        assert upsert_messages(conn, messages[1:] + [edited]) == (2, 2)
+        assert upsert_messages(conn, []) == (0, 0)
+
+        assert get_message_count(conn) == 5
+        content = conn.execute(
+            "SELECT content FROM messages WHERE id = ?", (messages[2].id,)
+        ).fetchone()[0]
+        assert content == "edited"
+
+        users = [
+            DiscordUser(id="3000000000000000001", username="a"),
+            DiscordUser(id="3000000000000000002", username="b"),
+        ]
+        assert upsert_users(conn, users) == (2, 0)
+        assert upsert_users(conn, users) == (0, 2)
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_channel_time_range_uses_the_snowflake_index():
+    tmp_db_path = get_random_tmp_file()
+    now = datetime.now(timezone.utc)
+    channel_id = "2000000000000000001"
+    # Offsets that sort differently as strings than in time
+    timestamps = [
+        (now - timedelta(days=1)).isoformat(),
+        (now - timedelta(days=3)).astimezone(timezone(timedelta(hours=9))).isoformat(),
+        (now - timedelta(days=10)).isoformat(),
+    ]
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_messages(
+            conn,
+            [
+                DiscordMessage(
+                    id=datetime_to_snowflake(datetime.fromisoformat(timestamp)),
+                    channel_id=channel_id,
+                    author_id="3000000000000000001",
+                    content=f"message {i}",
+                    timestamp=timestamp,
+                    type=0,
+                )
+                for i, timestamp in enumerate(timestamps)
+            ],
+        )
+        messages = get_messages_from_channel(conn, channel_id, n_days_old=5)
+        assert [m.content for m in messages] == ["message 0", "message 1"]
+
+        plan = " ".join(
+            row["detail"]
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM messages "
+                "WHERE channel_id = ? AND ts_ms >= ? ORDER BY ts_ms DESC",
+                (channel_id, 0),
+            )
+        )
+        assert "idx_messages_channel_id_ts_ms" in plan
+        assert "TEMP B-TREE" not in plan
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_ts_ms_is_filled_for_existing_databases():
+    tmp_db_path = get_random_tmp_file()
+    message_id = "1200000000000000000"
+    conn = sqlite3.connect(tmp_db_path)
+    conn.execute(
+        "CREATE TABLE messages (id TEXT PRIMARY KEY, channel_id TEXT NOT NULL, "
+        "author_id TEXT NOT NULL, content TEXT NOT NULL, timestamp TEXT NOT NULL, "
+        "edited_timestamp TEXT, type INTEGER NOT NULL, pinned BOOLEAN, "
+        "mention_everyone BOOLEAN, tts BOOLEAN, mentions TEXT, mention_roles TEXT, "
+        "attachments TEXT, embeds TEXT, components TEXT, flags INTEGER)"
+    )
+    conn.execute(
+        "INSERT INTO messages (id, channel_id, author_id, content, timestamp, type) "
+        "VALUES (?, '1', '2', 'old', '2024-01-01T00:00:00+00:00', 0)",
+        (message_id,),
+    )
+    conn.commit()
+    conn.close()
+
+    with get_discord_connection(tmp_db_path, readonly=True) as conn:
+        row = conn.execute("SELECT ts_ms FROM messages").fetchone()
+        assert row["ts_ms"] == snowflake_to_timestamp_ms(message_id)
+    close_connections()
+    tmp_db_path.unlink(missing_ok=True)
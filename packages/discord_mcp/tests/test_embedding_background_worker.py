@@ -1,21 +1,55 @@
 """Test the embedding background worker."""
 
+import subprocess
 from unittest.mock import patch
 
+from discord_mcp import embedding_background_worker
 from discord_mcp.db import (
+    count_messages_without_embeddings,
     get_discord_connection,
+    get_embedding_ledger_totals,
     get_matching_chunks,
     get_messages_without_embeddings,
     upsert_message,
+    upsert_messages,
 )
 from discord_mcp.embedding_background_worker import (
+    EmbeddingScheduler,
+    ensure_ollama_model,
     run_embedding_background_worker_single,
 )
 from discord_mcp.models import DiscordMessage
+from toolbox_store.embedding import approx_token_count
 
 from tests.utils import get_random_tmp_file
 
 
+def mock_get_embedding(text):
+    # Return a simple hash-based vector for reproducible results
+    hash_val = hash(text) % 1000000
+    return [(hash_val + i) / 1000000.0 for i in range(768)]
+
+
+def mock_get_embeddings(texts):
+    return [mock_get_embedding(text) for text in texts], sum(
+        map(approx_token_count, texts)
+    )
+
+
+def make_messages(n: int, n_channels: int = 1) -> list[DiscordMessage]:
+    return [
+        DiscordMessage(
+            id=str(1000000000000000000 + i),
+            channel_id=str(2000000000000000000 + i % n_channels),
+            author_id="3000000000000000001",
+            content=f"message {i} " + "word " * 50,
+            timestamp=f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}Z",
+            type=0,
+        )
+        for i in range(n)
+    ]
+
+
 def test_embedding_background_worker():
     """Test the embedding background worker with mock data."""
     # Create a temporary database
@@ -60,16 +94,10 @@ def test_embedding_background_worker():
             messages_without_embeddings = get_messages_without_embeddings(conn)
             assert len(messages_without_embeddings) == 3
 
-        # Mock the embedding function to return deterministic vectors
-        def mock_get_embedding(text):
-            # Return a simple hash-based vector for reproducible results
-            hash_val = hash(text) % 1000000
-            return [(hash_val + i) / 1000000.0 for i in range(768)]
-
         # Patch the embedding function and run worker
         with patch(
-            "discord_mcp.embedding_background_worker.get_embedding",
-            side_effect=mock_get_embedding,
+            "discord_mcp.embedding_background_worker.get_embeddings",
+            side_effect=mock_get_embeddings,
         ):
             with get_discord_connection(tmp_db_path) as conn:
                 # Run one iteration of the background worker
@@ -85,8 +113,8 @@ def test_embedding_background_worker():
 
         # Test the RAG functionality by directly calling the db functions
         with patch(
-            "discord_mcp.embedding_background_worker.get_embedding",
-            side_effect=mock_get_embedding,
+            "discord_mcp.embedding_background_worker.get_embeddings",
+            side_effect=mock_get_embeddings,
         ):
             with get_discord_connection(tmp_db_path) as conn:
                 # Test searching for embeddings
@@ -107,3 +135,66 @@ def test_embedding_background_worker():
         # Clean up temporary database
         if tmp_db_path.exists():
             tmp_db_path.unlink()
+
+
+def test_scheduler_drains_backlog_within_token_budget():
+    tmp_db_path = get_random_tmp_file()
+    scheduler = EmbeddingScheduler(tokens_per_minute=2000, batch_size=4)
+
+    with (
+        patch(
+            "discord_mcp.embedding_background_worker.get_embeddings",
+            side_effect=mock_get_embeddings,
+        ) as get_embeddings,
+        get_discord_connection(tmp_db_path) as conn,
+    ):
+        upsert_messages(conn, make_messages(120, n_channels=3))
+        assert scheduler.get_status(conn)["eta_seconds"] is None
+
+        # Backlog left and budget left: no wait
+        waits = []
+        while not waits or waits[-1] == 0:
+            waits.append(scheduler.run_once(conn))
+
+        # The budget ran out before the backlog did
+        assert 0 < waits[-1] <= 60
+        assert count_messages_without_embeddings(conn) > 0
+        totals = get_embedding_ledger_totals(conn, 0)
+        assert totals["n_calls"] == get_embeddings.call_count
+        # One chunk may overshoot the budget
+        assert totals["n_tokens"] <= 2000 + max(
+            approx_token_count(text)
+            for call in get_embeddings.call_args_list
+            for text in call.args[0]
+        )
+        assert all(len(call.args[0]) <= 4 for call in get_embeddings.call_args_list)
+
+        status = scheduler.get_status(conn)
+        assert status["backlog_messages"] == count_messages_without_embeddings(conn)
+        assert status["tokens_last_minute"] == totals["n_tokens"]
+        assert status["messages_per_second"] > 0
+        assert status["eta_seconds"] > 0
+
+        # Without budget limits the rest is embedded in the same way
+        unlimited = EmbeddingScheduler(tokens_per_minute=10**9, batch_size=4)
+        while unlimited.run_once(conn) == 0:
+            pass
+        assert count_messages_without_embeddings(conn) == 0
+        assert unlimited.get_status(conn)["eta_seconds"] == 0
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_failed_model_pull_is_retried(monkeypatch, caplog):
+    monkeypatch.setattr(embedding_background_worker, "_ollama_model_ready", False)
+    failure = subprocess.CalledProcessError(1, ["ollama", "pull"])
+
+    with patch.object(subprocess, "run", side_effect=[failure, None]) as run:
+        ensure_ollama_model()
+        assert "Failed to pull Ollama model" in caplog.text
+        assert not embedding_background_worker._ollama_model_ready
+
+        ensure_ollama_model()
+        ensure_ollama_model()
+
+    assert run.call_count == 2
+    assert embedding_background_worker._ollama_model_ready
@@ -1,6 +1,6 @@
 """Unit tests for Discord MCP server functionality."""
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 from discord_mcp.db import (
     get_discord_connection,
@@ -16,7 +16,13 @@ from discord_mcp.mcp_server import (
     get_user_id_for_name,
     get_users,
 )
-from discord_mcp.models import DiscordChannel, DiscordGuild, DiscordMessage, DiscordUser
+from discord_mcp.models import (
+    DiscordChannel,
+    DiscordGuild,
+    DiscordMessage,
+    DiscordUser,
+    datetime_to_snowflake,
+)
 
 from tests.utils import get_random_tmp_file
 
@@ -84,7 +90,7 @@ class TestMCPServer:
             upsert_user(conn, user)
 
         # Create 5 messages (3 in channel1, 2 in channel2)
-        now = datetime.now()
+        now = datetime.now(timezone.utc)
         messages = []
 
         for i in range(5):
@@ -93,7 +99,8 @@ class TestMCPServer:
             message_time = now - timedelta(days=i + 1)  # Messages from 1-5 days ago
 
             message = DiscordMessage(
-                id=f"30000000000000000{i + 1}",
+                # Message times are derived from their snowflake ids
+                id=datetime_to_snowflake(message_time),
                 channel_id=channel_id,
                 author_id=f"10000000000000000{user_idx + 1}",
                 content=f"This is test message {i + 1}",
@@ -110,8 +117,8 @@ class TestMCPServer:
             import discord_mcp.mcp_server as mcp_module
 
             original_get_connection = mcp_module.db.get_discord_connection
-            mcp_module.db.get_discord_connection = lambda: get_discord_connection(
-                self.test_db_path
+            mcp_module.db.get_discord_connection = (
+                lambda **kwargs: get_discord_connection(self.test_db_path, **kwargs)
             )
 
             try:
@@ -142,8 +149,8 @@ class TestMCPServer:
             import discord_mcp.mcp_server as mcp_module
 
             original_get_connection = mcp_module.db.get_discord_connection
-            mcp_module.db.get_discord_connection = lambda: get_discord_connection(
-                self.test_db_path
+            mcp_module.db.get_discord_connection = (
+                lambda **kwargs: get_discord_connection(self.test_db_path, **kwargs)
             )
 
             try:
@@ -174,8 +181,8 @@ class TestMCPServer:
             import discord_mcp.mcp_server as mcp_module
 
             original_get_connection = mcp_module.db.get_discord_connection
-            mcp_module.db.get_discord_connection = lambda: get_discord_connection(
-                self.test_db_path
+            mcp_module.db.get_discord_connection = (
+                lambda **kwargs: get_discord_connection(self.test_db_path, **kwargs)
             )
 
             try:
@@ -208,8 +215,8 @@ class TestMCPServer:
             import discord_mcp.mcp_server as mcp_module
 
             original_get_connection = mcp_module.db.get_discord_connection
-            mcp_module.db.get_discord_connection = lambda: get_discord_connection(
-                self.test_db_path
+            mcp_module.db.get_discord_connection = (
+                lambda **kwargs: get_discord_connection(self.test_db_path, **kwargs)
             )
 
             try:
@@ -234,8 +241,8 @@ class TestMCPServer:
             import discord_mcp.mcp_server as mcp_module
 
             original_get_connection = mcp_module.db.get_discord_connection
-            mcp_module.db.get_discord_connection = lambda: get_discord_connection(
-                self.test_db_path
+            mcp_module.db.get_discord_connection = (
+                lambda **kwargs: get_discord_connection(self.test_db_path, **kwargs)
             )
 
             try:
@@ -0,0 +1,35 @@
+"""Test the fuzzy name index over the users and channels tables."""
+
+from discord_mcp.db import (
+    get_discord_connection,
+    get_user_id_for_name,
+    upsert_channels,
+    upsert_users,
+)
+from discord_mcp.models import DiscordChannel, DiscordUser
+
+from tests.utils import get_random_tmp_file
+
+
+def test_get_user_id_for_name_sees_new_and_renamed_rows():
+    tmp_db_path = get_random_tmp_file()
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_users(
+            conn,
+            [
+                DiscordUser(id="1", username="jose", global_name="José García"),
+                DiscordUser(id="2", username="maria"),
+            ],
+        )
+        matches = get_user_id_for_name(conn, "JOSE GARCIA", top_n=1)
+        assert matches[0]["id"] == "1"
+        assert matches[0]["name"] == "José García"
+
+        upsert_channels(conn, [DiscordChannel(id="3", type=0, name="general")])
+        upsert_users(conn, [DiscordUser(id="2", username="mariana")])
+
+        assert get_user_id_for_name(conn, "general", top_n=1)[0]["type"] == "channel"
+        matches = get_user_id_for_name(conn, "mariana", top_n=5)
+        assert {m["name"] for m in matches if m["id"] == "2"} == {"mariana"}
+    tmp_db_path.unlink(missing_ok=True)
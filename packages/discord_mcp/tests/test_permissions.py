@@ -1,8 +1,43 @@
 """Unit tests for Discord permission computation functionality."""
 
-from discord_mcp.permissions_api import compute_channel_permissions
+import copy
+import time
+
+from discord_mcp.background_worker import get_readable_channels, get_writer
+from discord_mcp.db import get_discord_connection
+from discord_mcp.permissions_api import (
+    PERMISSIONS,
+    TEXT_CHANNEL_TYPES,
+    compute_channel_permissions,
+    fetch_permission_snapshot,
+    has_read_access,
+    resolve_channel_permissions,
+)
 
 from tests.mock_client import MockDiscordClient
+from tests.utils import get_random_tmp_file
+
+GUILD_ID = "1072196207201501266"
+
+
+class CountingDiscordClient(MockDiscordClient):
+    """Mock client that records the endpoints it was asked for"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+
+    def _make_request(self, method, endpoint, *args, **kwargs):
+        self.requests.append(endpoint)
+        return super()._make_request(method, endpoint, *args, **kwargs)
+
+
+def get_text_channels(client):
+    return [
+        c
+        for c in client.get_guild_channels(GUILD_ID)
+        if c.get("type", 0) in TEXT_CHANNEL_TYPES
+    ]
 
 
 class TestPermissions:
@@ -170,6 +205,72 @@ class TestPermissions:
             "Should have channels with permission overwrites"
         )
 
+    def test_resolved_permissions_are_cached_until_overwrites_or_roles_change(self):
+        client = MockDiscordClient("test_token", use_permissions_data=True)
+        user_id = client.get_current_user()["id"]
+        channels = get_text_channels(client)
+        snapshot = fetch_permission_snapshot(client, GUILD_ID, user_id)
+        tmp_db_path = get_random_tmp_file()
+
+        with get_discord_connection(tmp_db_path) as conn:
+            permissions = resolve_channel_permissions(conn, snapshot, channels)
+            assert sum(has_read_access(p) for p in permissions.values()) == 12
+
+            # A channel whose overwrites changed is evaluated again
+            hidden = next(
+                c for c in channels if not has_read_access(permissions[c["id"]])
+            )
+            changed = copy.deepcopy(channels)
+            for channel in changed:
+                if channel["id"] == hidden["id"]:
+                    channel["permission_overwrites"] = []
+            permissions = resolve_channel_permissions(conn, snapshot, changed)
+            assert has_read_access(permissions[hidden["id"]])
+            assert sum(has_read_access(p) for p in permissions.values()) == 13
+
+            # So is every channel once the roles changed
+            snapshot.role_permissions[GUILD_ID] |= PERMISSIONS["ADMINISTRATOR"]
+            snapshot.roles_updated_at = time.time()
+            permissions = resolve_channel_permissions(conn, snapshot, channels)
+            assert all(has_read_access(p) for p in permissions.values())
+        tmp_db_path.unlink(missing_ok=True)
+
+    def test_readable_channels_reuse_the_stored_roles(self):
+        client = CountingDiscordClient("test_token", use_permissions_data=True)
+        user_id = client.get_current_user()["id"]
+        channels = get_text_channels(client)
+        tmp_db_path = get_random_tmp_file()
+
+        with get_discord_connection(tmp_db_path) as conn:
+            writer = get_writer(conn)
+            for _ in range(3):
+                readable = get_readable_channels(
+                    writer, client, GUILD_ID, user_id, channels
+                )
+                assert len(readable) == 12
+
+        role_requests = [
+            r for r in client.requests if "/roles" in r or "/members/" in r
+        ]
+        assert len(role_requests) == 2
+        tmp_db_path.unlink(missing_ok=True)
+
+    def test_owner_reads_every_channel(self):
+        client = MockDiscordClient("test_token", use_permissions_data=True)
+        user_id = client.get_current_user()["id"]
+        snapshot = fetch_permission_snapshot(
+            client, GUILD_ID, user_id, owner_id=user_id
+        )
+        tmp_db_path = get_random_tmp_file()
+
+        with get_discord_connection(tmp_db_path) as conn:
+            permissions = resolve_channel_permissions(
+                conn, snapshot, get_text_channels(client)
+            )
+        assert len(permissions) == 47
+        assert all(has_read_access(p) for p in permissions.values())
+        tmp_db_path.unlink(missing_ok=True)
+
 
 if __name__ == "__main__":
     # Run tests directly
@@ -0,0 +1,186 @@
+"""Test the per-bucket Discord rate limiter and the clients that use it."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from discord_mcp.client import DiscordClient, TokenKind
+from discord_mcp.rate_limit import DiscordRateLimiter, get_route
+
+CHANNEL_A = "1000000000000000001"
+CHANNEL_B = "1000000000000000002"
+
+
+def make_response(
+    status_code: int = 200, remaining=None, reset_after=None, bucket=None, **headers
+) -> httpx.Response:
+    if remaining is not None:
+        headers.update(
+            {
+                "X-RateLimit-Limit": "5",
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset-After": str(reset_after),
+            }
+        )
+    if bucket is not None:
+        headers["X-RateLimit-Bucket"] = bucket
+    return httpx.Response(status_code, headers=headers, json=[])
+
+
+def test_route_keeps_major_parameter():
+    assert get_route("get", f"channels/{CHANNEL_A}/messages?limit=100") == (
+        "GET channels/{major}/messages",
+        CHANNEL_A,
+    )
+    assert get_route("GET", f"guilds/{CHANNEL_A}/members/{CHANNEL_B}") == (
+        "GET guilds/{major}/members/{id}",
+        CHANNEL_A,
+    )
+    assert get_route("GET", "users/@me/guilds") == ("GET users/@me/guilds", "")
+
+
+def test_exhausted_bucket_only_blocks_its_channel():
+    limiter = DiscordRateLimiter()
+    endpoint_a = f"channels/{CHANNEL_A}/messages"
+    endpoint_b = f"channels/{CHANNEL_B}/messages"
+
+    assert limiter.try_acquire("GET", endpoint_a) == 0
+    limiter.update(
+        "GET", endpoint_a, make_response(remaining=0, reset_after=10, bucket="abc")
+    )
+
+    assert limiter.try_acquire("GET", endpoint_a) > 5
+    assert limiter.try_acquire("GET", endpoint_b) == 0
+
+
+def test_routes_with_the_same_bucket_share_remaining():
+    limiter = DiscordRateLimiter()
+    messages = f"channels/{CHANNEL_A}/messages"
+    channel = f"channels/{CHANNEL_A}"
+
+    for endpoint in (messages, channel):
+        assert limiter.try_acquire("GET", endpoint) == 0
+        limiter.update(
+            "GET", endpoint, make_response(remaining=1, reset_after=10, bucket="abc")
+        )
+
+    assert limiter.try_acquire("GET", messages) == 0
+    assert limiter.try_acquire("GET", channel) > 0
+
+
+def test_global_limit():
+    limiter = DiscordRateLimiter(global_rate_limit=5)
+    for i in range(5):
+        assert limiter.try_acquire("GET", f"channels/{CHANNEL_A}{i}/messages") == 0
+    assert limiter.try_acquire("GET", f"channels/{CHANNEL_B}/messages") > 0
+
+
+def test_global_429_blocks_all_routes():
+    limiter = DiscordRateLimiter()
+    endpoint = f"channels/{CHANNEL_A}/messages"
+    assert limiter.try_acquire("GET", endpoint) == 0
+    limiter.update(
+        "GET",
+        endpoint,
+        make_response(429, **{"Retry-After": "3", "X-RateLimit-Global": "true"}),
+    )
+
+    assert limiter.try_acquire("GET", "users/@me/guilds") > 2
+    assert limiter.get_metrics()["n_rate_limited"] == 1
+
+
+def test_client_retries_after_429():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(
+                429,
+                headers={"Retry-After": "0.05", "X-RateLimit-Scope": "user"},
+                json={"retry_after": 0.05},
+            )
+        return httpx.Response(200, json={"id": CHANNEL_A})
+
+    client = DiscordClient(
+        "token",
+        rate_limiter=DiscordRateLimiter(),
+        transport=httpx.MockTransport(handler),
+    )
+    client._resolved_token_kind = TokenKind.BOT
+
+    assert client.get_channel(CHANNEL_A) == {"id": CHANNEL_A}
+    assert len(calls) == 2
+    assert client.rate_limiter.get_metrics()["n_rate_limited"] == 1
+
+
+def test_remapped_route_keeps_requests_in_flight():
+    limiter = DiscordRateLimiter()
+    endpoint_a = f"channels/{CHANNEL_A}/messages"
+    endpoint_b = f"channels/{CHANNEL_B}/messages"
+    assert limiter.try_acquire("GET", endpoint_a) == 0
+    assert limiter.try_acquire("GET", endpoint_b) == 0
+
+    # The first response reveals the bucket while the request to B is in flight
+    limiter.update(
+        "GET", endpoint_a, make_response(remaining=4, reset_after=10, bucket="abc")
+    )
+    assert limiter._buckets[("abc", CHANNEL_B)].in_flight == 1
+    limiter.update(
+        "GET", endpoint_b, make_response(remaining=4, reset_after=10, bucket="abc")
+    )
+
+    assert set(limiter._buckets) == {("abc", CHANNEL_A), ("abc", CHANNEL_B)}
+    assert all(bucket.in_flight == 0 for bucket in limiter._buckets.values())
+    assert limiter._buckets[("abc", CHANNEL_B)].remaining == 4
+
+
+def test_wait_seconds_counts_every_wait():
+    limiter = DiscordRateLimiter()
+    endpoint = f"channels/{CHANNEL_A}/messages"
+    assert limiter.try_acquire("GET", endpoint) == 0
+    limiter.update(
+        "GET", endpoint, make_response(remaining=0, reset_after=0.1, bucket="abc")
+    )
+
+    waits = [limiter.try_acquire("GET", endpoint) for _ in range(3)]
+
+    assert all(wait > 0 for wait in waits)
+    assert limiter.get_metrics()["wait_seconds"] == round(sum(waits), 3)
+
+
+def test_client_threads_fetch_channels_in_parallel():
+    n_channels = 5
+    delay = 0.1
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        time.sleep(delay)
+        return httpx.Response(
+            200,
+            headers={
+                "X-RateLimit-Limit": "5",
+                "X-RateLimit-Remaining": "4",
+                "X-RateLimit-Reset-After": "1",
+                "X-RateLimit-Bucket": "messages",
+            },
+            json=[{"id": request.url.path.split("/")[-2]}],
+        )
+
+    client = DiscordClient(
+        "token",
+        rate_limiter=DiscordRateLimiter(),
+        transport=httpx.MockTransport(handler),
+    )
+    client._resolved_token_kind = TokenKind.BOT
+
+    def fetch(channel_id: str):
+        return list(client.get_message_pages_before(channel_id))
+
+    channel_ids = [f"10000000000000000{i:02d}" for i in range(n_channels)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_channels) as executor:
+        results = list(executor.map(fetch, channel_ids))
+    elapsed = time.perf_counter() - start
+
+    assert [pages[0][0]["id"] for pages in results] == channel_ids
+    assert elapsed < delay * n_channels / 2
@@ -0,0 +1,216 @@
+"""Test hybrid keyword and semantic message search."""
+
+from datetime import datetime, timedelta, timezone
+
+from discord_mcp.db import (
+    EMBEDDINGS_LEN,
+    MESSAGES_FTS_TABLE,
+    add_messages_fts,
+    get_discord_connection,
+    upsert_chunks,
+    upsert_messages,
+)
+from discord_mcp.models import DiscordMessage, datetime_to_snowflake
+from discord_mcp.search import MessageQueryBuilder, combine_rrf
+
+from tests.utils import get_random_tmp_file
+
+CHANNEL_A = "2000000000000000001"
+CHANNEL_B = "2000000000000000002"
+ALICE = "3000000000000000001"
+BOB = "3000000000000000002"
+
+
+def make_message(content: str, channel_id: str, author_id: str, days_ago: float):
+    created_at = datetime.now(timezone.utc) - timedelta(days=days_ago)
+    return DiscordMessage(
+        id=datetime_to_snowflake(created_at),
+        channel_id=channel_id,
+        author_id=author_id,
+        content=content,
+        timestamp=created_at.isoformat(),
+        type=0,
+    )
+
+
+def make_embedding(i: int) -> list[float]:
+    embedding = [0.0] * EMBEDDINGS_LEN
+    embedding[i] = 1.0
+    return embedding
+
+
+def get_fts_count(conn, term: str) -> int:
+    return conn.execute(
+        f"SELECT COUNT(*) FROM {MESSAGES_FTS_TABLE} WHERE {MESSAGES_FTS_TABLE} MATCH ?",
+        (term,),
+    ).fetchone()[0]
+
+
+def test_fts_index_follows_inserts_and_edits():
+    tmp_db_path = get_random_tmp_file()
+    message = make_message("first draft", CHANNEL_A, ALICE, days_ago=1)
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_messages(conn, [message])
+        upsert_messages(conn, [message])
+        assert get_fts_count(conn, "draft") == 1
+
+        edited = message.model_copy(update={"content": "final version"})
+        upsert_messages(conn, [edited])
+        assert get_fts_count(conn, "draft") == 0
+        assert get_fts_count(conn, "final") == 1
+
+        conn.execute("DELETE FROM messages")
+        assert get_fts_count(conn, "final") == 0
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_fts_index_with_its_own_copy_is_rebuilt():
+    tmp_db_path = get_random_tmp_file()
+    message = make_message("legacy content", CHANNEL_A, ALICE, days_ago=1)
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_messages(conn, [message])
+        conn.execute(f"DROP TABLE {MESSAGES_FTS_TABLE}")
+        conn.execute(f"CREATE VIRTUAL TABLE {MESSAGES_FTS_TABLE} USING fts5(content)")
+
+        add_messages_fts(conn)
+
+        sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = ?", (MESSAGES_FTS_TABLE,)
+        ).fetchone()["sql"]
+        assert "content='messages'" in sql
+        assert get_fts_count(conn, "legacy") == 1
+        # The text is stored once, in messages
+        assert not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?",
+            (f"{MESSAGES_FTS_TABLE}_content",),
+        ).fetchone()
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_keyword_search_matches_exact_terms_with_filters():
+    tmp_db_path = get_random_tmp_file()
+    messages = [
+        make_message("see https://example.com/a-b for E1234", CHANNEL_A, ALICE, 1),
+        make_message("E1234 again, in another channel", CHANNEL_B, BOB, 2),
+        make_message("old E1234 report", CHANNEL_A, BOB, 30),
+        make_message("unrelated chatter", CHANNEL_A, ALICE, 0.5),
+    ]
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_messages(conn, messages)
+
+        def search(query: str, **filters) -> list[str]:
+            chunks = MessageQueryBuilder(conn).keyword(query).where(filters).get()
+            assert all(chunk["chunk_id"] is None for chunk in chunks)
+            return [chunk["chunk_text"] for chunk in chunks]
+
+        assert search("https://example.com/a-b") == [messages[0].content]
+        assert len(search("E1234")) == 3
+        assert search("E1234", channel_id=CHANNEL_B) == [messages[1].content]
+        assert set(search("E1234", author_id=BOB)) == {
+            messages[1].content,
+            messages[2].content,
+        }
+        since = datetime.now(timezone.utc) - timedelta(days=7)
+        assert messages[2].content not in search("E1234", since=since)
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_hybrid_search_fuses_keyword_and_semantic_ranks():
+    tmp_db_path = get_random_tmp_file()
+    messages = [
+        make_message("deploy failed with E500", CHANNEL_A, ALICE, 3),
+        make_message("the weather is nice", CHANNEL_A, BOB, 2),
+        make_message("E500 again after the deploy", CHANNEL_B, BOB, 1),
+    ]
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_messages(conn, messages)
+        upsert_chunks(
+            conn,
+            [
+                {
+                    "chunk_id": f"chunk-{i}",
+                    "chunk_text": message.content,
+                    "message_ids": [message.id],
+                    "embedding": make_embedding(i),
+                }
+                for i, message in enumerate(messages[:2])
+            ],
+        )
+
+        chunks = (
+            MessageQueryBuilder(conn)
+            .semantic(make_embedding(0))
+            .keyword("E500")
+            .hybrid(keyword_weight=1.5)
+            .limit(3)
+            .get_with_messages()
+        )
+        # Ranked by both first, then the unembedded keyword match
+        assert [chunk["chunk_id"] for chunk in chunks] == ["chunk-0", None, "chunk-1"]
+        assert chunks[1]["messages"][0].id == messages[2].id
+
+        filtered = (
+            MessageQueryBuilder(conn)
+            .semantic(make_embedding(0))
+            .keyword("E500")
+            .where({"author_id": BOB})
+            .get()
+        )
+        assert "chunk-0" not in [chunk["chunk_id"] for chunk in filtered]
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_filters_select_chunks_and_their_matching_messages():
+    tmp_db_path = get_random_tmp_file()
+    conversation = [
+        make_message(f"message {i}", CHANNEL_A, ALICE if i % 2 else BOB, 3 - i / 10)
+        for i in range(4)
+    ]
+    others = [make_message(f"other {i}", CHANNEL_A, BOB, 2 - i / 10) for i in range(10)]
+
+    with get_discord_connection(tmp_db_path) as conn:
+        upsert_messages(conn, conversation + others)
+        chunks = [
+            {
+                "chunk_id": "conversation",
+                "chunk_text": "\n".join(m.content for m in conversation),
+                "message_ids": [m.id for m in conversation],
+                "embedding": make_embedding(0),
+            }
+        ] + [
+            {
+                "chunk_id": f"other-{i}",
+                "chunk_text": message.content,
+                "message_ids": [message.id],
+                "embedding": make_embedding(1 + i),
+            }
+            for i, message in enumerate(others)
+        ]
+        upsert_chunks(conn, chunks)
+
+        # Alice's chunk is found, although ten chunks are closer to the query
+        query = make_embedding(1)
+        results = (
+            MessageQueryBuilder(conn)
+            .semantic(query)
+            .where({"author_id": ALICE})
+            .limit(1)
+            .get_with_messages()
+        )
+
+        assert [chunk["chunk_id"] for chunk in results] == ["conversation"]
+        assert results[0]["chunk_text"] == chunks[0]["chunk_text"]
+        assert [m.author_id for m in results[0]["messages"]] == [ALICE, ALICE]
+    tmp_db_path.unlink(missing_ok=True)
+
+
+def test_combine_rrf_weights():
+    a = {"chunk_id": "a", "message_ids": ["1"]}
+    b = {"chunk_id": "b", "message_ids": ["2"]}
+    combined = combine_rrf([a, b], [b], weights=[1.0, 0.1])
+    assert [chunk["chunk_id"] for chunk in combined] == ["b", "a"]
+    assert combined[0]["score"] > combined[1]["score"]
@@ -1,144 +1,191 @@
 import asyncio
+import itertools
 import logging
 import time
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
+from pdf_mcp.indexing_jobs import (
+    STATUS_CANCELLED,
+    STATUS_COMPLETED,
+    IndexingJob,
+    IndexingJobManager,
+)
+
 logger = logging.getLogger(__name__)
 
 # Constants
-DEBOUNCE_DELAY = 2.0  # Wait 2 seconds after last modification
+DEBOUNCE_DELAY = 2.0  # Wait 2 seconds after the last event before flushing a batch
+BATCH_MAX_WAIT = 10.0  # Flush a batch at the latest 10 seconds after its first event
 FILE_STABILITY_CHECK_DELAY = 0.5  # Initial delay to check file stability
 FILE_STABILITY_WAIT = 2.0  # Additional wait if file is still being written
 OBSERVER_JOIN_TIMEOUT = 1.0  # Timeout when stopping observer
+INDEX_QUEUE_MAXSIZE = 256  # Bounded work queue, producers wait when it is full
 PDF_EXTENSION = ".pdf"
 
+# Event types passed to the batch callback
+EVENT_UPSERT = "upsert"
+EVENT_DELETED = "deleted"
+EVENT_RESCAN = "rescan"
+
+
+def is_pdf_file(path: str) -> bool:
+    """Check if a file path represents a PDF file"""
+    return path.lower().endswith(PDF_EXTENSION)
+
+
+def document_name_for(documents_dir: Path, file_path: Path) -> str:
+    """Name a document by its path relative to the documents directory"""
+    try:
+        return file_path.relative_to(documents_dir).as_posix()
+    except ValueError:
+        return file_path.name
+
+
+def is_hidden(documents_dir: Path, file_path: Path) -> bool:
+    """Check if a file, or a folder it is in, is hidden below the documents directory"""
+    try:
+        relative_parts = file_path.relative_to(documents_dir).parts
+    except ValueError:
+        relative_parts = (file_path.name,)
+    return any(part.startswith(".") for part in relative_parts)
+
+
+def list_pdf_files(documents_dir: Path) -> Dict[str, Path]:
+    """Recursively list PDF files, keyed by document name"""
+    if not documents_dir.exists():
+        return {}
+
+    pdf_files = {}
+    for file_path in documents_dir.rglob("*"):
+        if not is_pdf_file(file_path.name):
+            continue
+        if is_hidden(documents_dir, file_path):
+            continue
+        if file_path.is_file():
+            pdf_files[document_name_for(documents_dir, file_path)] = file_path
+    return pdf_files
+
 
 class PDFFileHandler(FileSystemEventHandler):
-    """Handler for PDF file system events"""
+    """Handler for PDF file system events, coalesces bursts into batches"""
 
-    def __init__(self, callback: Callable[[str, str, Path], None], event_loop=None):
+    def __init__(
+        self,
+        callback: Callable[[Dict[Path, str]], Awaitable[None]],
+        event_loop=None,
+    ):
         """
         Initialize the handler
 
         Args:
-            callback: Async callback function that takes (event_type, filename, file_path)
+            callback: Async callback function that takes a batch of {file_path: event_type}
             event_loop: Event loop to use for scheduling async callbacks
         """
         super().__init__()
         self.callback = callback
-        self.processing_files: Dict[str, float] = {}  # Track files being processed
         self.debounce_delay = DEBOUNCE_DELAY
+        self.batch_max_wait = BATCH_MAX_WAIT
         self.event_loop = event_loop
 
-    def _is_pdf_file(self, path: str) -> bool:
-        """Check if a file path represents a PDF file"""
-        return path.lower().endswith(PDF_EXTENSION)
+        # Only touched from the event loop thread
+        self.pending: Dict[Path, str] = {}
+        self.first_event_time: Optional[float] = None
+        self.last_event_time: Optional[float] = None
+        self.flush_task: Optional[asyncio.Task] = None
 
     def _should_process_event(self, event: FileSystemEvent) -> bool:
         """Check if an event should be processed (non-directory PDF file)"""
-        return not event.is_directory and self._is_pdf_file(event.src_path)
+        return not event.is_directory and is_pdf_file(event.src_path)
 
     def on_any_event(self, event):
         """Log PDF file system events"""
         src_path = getattr(event, "src_path", None)
-        if src_path and self._is_pdf_file(src_path):
-            logger.info(f"📄 PDF {event.event_type}: {Path(src_path).name}")
+        if src_path and is_pdf_file(src_path):
+            logger.debug(f"📄 PDF {event.event_type}: {Path(src_path).name}")
             if hasattr(event, "dest_path") and event.dest_path:
-                logger.info(f"   -> Destination: {Path(event.dest_path).name}")
+                logger.debug(f"   -> Destination: {Path(event.dest_path).name}")
 
     def on_created(self, event: FileSystemEvent):
         """Handle file creation events"""
-        if self._should_process_event(event):
-            file_path = Path(event.src_path)
-            logger.info(f"🟢 PDF file created: {file_path.name}")
-            self._schedule_processing("created", file_path)
+        if event.is_directory:
+            # Folders copied or moved in may not emit events for their contents
+            self._record_threadsafe(Path(event.src_path), EVENT_RESCAN)
+        elif self._should_process_event(event):
+            self._record_threadsafe(Path(event.src_path), EVENT_UPSERT)
 
     def on_modified(self, event: FileSystemEvent):
         """Handle file modification events"""
         if self._should_process_event(event):
-            file_path = Path(event.src_path)
-            logger.info(f"🟡 PDF file modified: {file_path.name}")
-            self._schedule_processing("modified", file_path)
+            self._record_threadsafe(Path(event.src_path), EVENT_UPSERT)
 
     def on_deleted(self, event: FileSystemEvent):
         """Handle file deletion events"""
-        if self._should_process_event(event):
-            file_path = Path(event.src_path)
-            logger.info(f"🔴 PDF file deleted: {file_path.name}")
-            # Process deletions immediately (no debouncing needed)
-            self._schedule_async_callback("deleted", file_path.name, file_path)
+        if event.is_directory:
+            self._record_threadsafe(Path(event.src_path), EVENT_RESCAN)
+        elif self._should_process_event(event):
+            self._record_threadsafe(Path(event.src_path), EVENT_DELETED)
 
     def on_moved(self, event: FileSystemEvent):
         """Handle file move/rename events"""
         if event.is_directory:
+            self._record_threadsafe(Path(event.src_path), EVENT_RESCAN)
             return
 
         # Handle as deletion of old file and creation of new file
-        if hasattr(event, "src_path") and self._is_pdf_file(event.src_path):
-            old_path = Path(event.src_path)
-            logger.info(f"🔄 PDF file moved from: {old_path.name}")
-            self._schedule_async_callback("deleted", old_path.name, old_path)
-
-        if hasattr(event, "dest_path") and self._is_pdf_file(event.dest_path):
-            new_path = Path(event.dest_path)
-            logger.info(f"🔄 PDF file moved to: {new_path.name}")
-            self._schedule_processing("created", new_path)
-
-    def _schedule_processing(self, event_type: str, file_path: Path):
-        """Schedule file processing with debouncing"""
-        filename = file_path.name
-        current_time = time.time()
-
-        # Update the last modification time for this file
-        self.processing_files[filename] = current_time
-
-        # Schedule the actual processing after debounce delay
-        self._schedule_coroutine(
-            self._debounced_processing(event_type, filename, file_path, current_time),
-            f"debounced {event_type} processing for {filename}",
-        )
-
-    async def _debounced_processing(
-        self, event_type: str, filename: str, file_path: Path, scheduled_time: float
-    ):
-        """Process file after debounce delay"""
-        await asyncio.sleep(self.debounce_delay)
-
-        # Check if this is still the latest modification for this file
-        if (
-            filename in self.processing_files
-            and self.processing_files[filename] == scheduled_time
-        ):
-            # Remove from tracking and process
-            self.processing_files.pop(filename, None)
-            await self._safe_callback(event_type, filename, file_path)
-
-    def _schedule_async_callback(self, event_type: str, filename: str, file_path: Path):
-        """Schedule an async callback to be executed immediately"""
-        self._schedule_coroutine(
-            self._safe_callback(event_type, filename, file_path),
-            f"{event_type} callback for {filename}",
-        )
-
-    def _schedule_coroutine(self, coro, description: str):
-        """Schedule a coroutine on the event loop with error handling"""
-        try:
-            loop = self._get_event_loop()
-            if loop:
-                future = asyncio.run_coroutine_threadsafe(coro, loop)
-                logger.debug(f"Scheduled {description}")
-                return future
-            else:
-                logger.error(f"No event loop available for {description}")
+        if hasattr(event, "src_path") and is_pdf_file(event.src_path):
+            self._record_threadsafe(Path(event.src_path), EVENT_DELETED)
 
-        except Exception as e:
-            logger.error(f"Failed to schedule {description}: {e}")
+        if hasattr(event, "dest_path") and is_pdf_file(event.dest_path):
+            self._record_threadsafe(Path(event.dest_path), EVENT_UPSERT)
+
+    def _record_threadsafe(self, file_path: Path, event_type: str):
+        """Hand an event from the observer thread over to the event loop"""
+        loop = self._get_event_loop()
+        if loop is None:
+            logger.error(f"No event loop available for {event_type} of {file_path}")
+            return
 
-        return None
+        try:
+            loop.call_soon_threadsafe(self.record_event, file_path, event_type)
+        except RuntimeError as e:
+            logger.error(f"Failed to schedule {event_type} of {file_path}: {e}")
+
+    def record_event(self, file_path: Path, event_type: str):
+        """Add an event to the pending batch, the latest event per path wins"""
+        current_time = time.monotonic()
+        if self.first_event_time is None:
+            self.first_event_time = current_time
+        self.last_event_time = current_time
+
+        if self.pending.get(file_path) != EVENT_RESCAN:
+            self.pending[file_path] = event_type
+
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self._flush_when_quiet())
+
+    async def _flush_when_quiet(self):
+        """Wait until events stop arriving, then hand the batch to the callback"""
+        while self.pending:
+            now = time.monotonic()
+            quiet_deadline = self.last_event_time + self.debounce_delay
+            max_deadline = self.first_event_time + self.batch_max_wait
+            deadline = min(quiet_deadline, max_deadline)
+
+            if now < deadline:
+                await asyncio.sleep(deadline - now)
+                continue
+
+            batch = self.pending
+            self.pending = {}
+            self.first_event_time = None
+            self.last_event_time = None
+
+            logger.info(f"Flushing batch of {len(batch)} file events")
+            await self._safe_callback(batch)
 
     def _get_event_loop(self):
         """Get the event loop to use for scheduling coroutines"""
@@ -152,40 +199,64 @@ class PDFFileHandler(FileSystemEventHandler):
         except RuntimeError:
             return None
 
-    async def _safe_callback(self, event_type: str, filename: str, file_path: Path):
+    async def _safe_callback(self, batch: Dict[Path, str]):
         """Safely call the callback with error handling"""
         try:
-            logger.debug(f"Executing {event_type} callback for {filename}")
-            await self.callback(event_type, filename, file_path)
-            logger.debug(f"Completed {event_type} callback for {filename}")
+            await self.callback(batch)
         except Exception as e:
-            logger.error(f"Error processing {event_type} event for {filename}: {e}")
+            logger.error(f"Error processing batch of {len(batch)} file events: {e}")
+
+    def cancel(self):
+        """Drop pending events and stop the flush task"""
+        self.pending = {}
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+        self.flush_task = None
 
 
 class DocumentFileWatcher:
-    """File watcher for PDF documents with automatic processing"""
+    """Recursive file watcher for PDF documents with batched background indexing"""
 
     def __init__(
-        self, documents_dir: str, rag_engine, loading_progress: Dict[str, Any]
+        self,
+        documents_dir: str,
+        rag_engine,
+        job_manager: IndexingJobManager,
+        queue_maxsize: int = INDEX_QUEUE_MAXSIZE,
     ):
         """
         Initialize the file watcher
 
         Args:
-            documents_dir: Directory to watch for PDF files
+            documents_dir: Directory to watch for PDF files, including subfolders
             rag_engine: RAG engine instance for processing documents
-            loading_progress: Progress tracking dictionary
+            job_manager: Job manager that runs the indexing off the event loop
+            queue_maxsize: Maximum number of files waiting to be indexed
         """
         self.documents_dir = Path(documents_dir)
         self.rag_engine = rag_engine
-        self.loading_progress = loading_progress
+        self.job_manager = job_manager
+        self.num_workers = job_manager.num_workers
+        self.queue_maxsize = queue_maxsize
         self.observer: Optional[Observer] = None
         self.handler: Optional[PDFFileHandler] = None
         self.is_running = False
         self.event_loop = None  # Store reference to the event loop
 
+        # Work queue ordered by (file size, insertion order) so small files go first
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.queued: Dict[str, IndexingJob] = {}
+        self.cancelled_states: Dict[str, Tuple[float, int]] = {}
+        self.workers: List[asyncio.Task] = []
+        self._counter = itertools.count()
+        self._index_dirty = False
+        self._n_indexing = 0  # Files the workers are indexing right now
+        self._reconcile_lock: Optional[asyncio.Lock] = None
+        # The event loop only keeps weak references to tasks
+        self._background_tasks: Set[asyncio.Task] = set()
+
     async def start_watching(self):
-        """Start watching the documents directory"""
+        """Start watching the documents directory and the indexing workers"""
         if self.is_running:
             logger.warning("File watcher is already running")
             return
@@ -208,13 +279,20 @@ class DocumentFileWatcher:
                 )
                 self.event_loop = None
 
+            self.queue = asyncio.PriorityQueue(maxsize=self.queue_maxsize)
+            self._reconcile_lock = asyncio.Lock()
+            self.workers = [
+                asyncio.create_task(self._index_worker(i))
+                for i in range(self.num_workers)
+            ]
+
             # Create handler and observer
-            self.handler = PDFFileHandler(self._handle_file_event, self.event_loop)
+            self.handler = PDFFileHandler(self._handle_batch, self.event_loop)
             self.observer = Observer()
 
             # Schedule and start the observer
             self.observer.schedule(
-                self.handler, str(self.documents_dir), recursive=False
+                self.handler, str(self.documents_dir), recursive=True
             )
             self.observer.start()
             self.is_running = True
@@ -223,7 +301,7 @@ class DocumentFileWatcher:
                 f"✅ File watcher started successfully for: {self.documents_dir}"
             )
             logger.info(
-                "🔍 Monitoring PDF files: create, modify, delete, and move operations"
+                "🔍 Monitoring PDF files recursively: create, modify, delete, and move operations"
             )
 
         except Exception as e:
@@ -240,74 +318,195 @@ class DocumentFileWatcher:
         self.observer.stop()
         self.observer.join()
         self.observer = None
+        if self.handler:
+            self.handler.cancel()
         self.handler = None
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
         self.is_running = False
         logger.info("File watcher stopped")
 
-    async def _handle_file_event(self, event_type: str, filename: str, file_path: Path):
-        """Handle file system events"""
+    async def reconcile(self) -> Dict[str, int]:
+        """
+        Diff the indexed documents against the filesystem by mtime and size.
+
+        New and changed files are queued for indexing and documents whose file is
+        gone are removed, so changes made while the server was down are picked up.
+
+        Returns:
+            Dict with the number of queued and removed documents
+        """
+        if not self.rag_engine:
+            logger.warning("RAG engine not available, skipping reconciliation")
+            return {"queued": 0, "removed": 0}
+
+        async with self._reconcile_lock:
+            pdf_files = await asyncio.to_thread(list_pdf_files, self.documents_dir)
+            indexed_documents = set(self.rag_engine.list_documents())
+
+            removed = 0
+            for document_name in indexed_documents - set(pdf_files):
+                removed += self.rag_engine.remove_document(document_name)
+                self.rag_engine.forget_file_state(document_name)
+            if removed:
+                await self.rag_engine.save_to_disk()
+
+            to_index = []
+            for document_name, file_path in pdf_files.items():
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                known_state = self.rag_engine.get_file_state(document_name)
+                if known_state is None and document_name in indexed_documents:
+                    # Indexed before file states were tracked, assume up to date
+                    self.rag_engine.set_file_state(
+                        document_name, stat.st_mtime, stat.st_size
+                    )
+                    continue
+                if self.cancelled_states.get(document_name) == (
+                    stat.st_mtime,
+                    stat.st_size,
+                ):
+                    continue
+                if known_state is None or (
+                    known_state["mtime"] != stat.st_mtime
+                    or known_state["size"] != stat.st_size
+                ):
+                    to_index.append((document_name, file_path, stat.st_size))
+
+            logger.info(
+                f"Reconciled {len(pdf_files)} PDF files: "
+                f"{len(to_index)} to index, {removed} chunks removed"
+            )
+            await self._enqueue_all(to_index)
+
+        return {"queued": len(to_index), "removed": removed}
+
+    def start_reconcile(self) -> asyncio.Task:
+        """Run reconcile in the background, failures are logged"""
+        task = asyncio.create_task(self.reconcile())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+        return task
+
+    def _on_background_task_done(self, task: asyncio.Task):
+        """Drop the reference to a finished task and log its failure"""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background reconciliation failed: {task.exception()!r}")
+
+    async def wait_until_idle(self):
+        """Wait until all queued files have been indexed"""
+        if self.queue is not None:
+            await self.queue.join()
+
+    def pending_count(self) -> int:
+        """Number of files waiting to be indexed"""
+        return sum(not job.is_finished for job in self.queued.values())
+
+    async def _handle_batch(self, batch: Dict[Path, str]):
+        """Handle a coalesced batch of file system events"""
         if not self.rag_engine:
             logger.warning("RAG engine not available, skipping file processing")
             return
 
-        logger.info(f"Processing {event_type} event for: {filename}")
+        if any(event_type == EVENT_RESCAN for event_type in batch.values()):
+            logger.info("Folder changed, reconciling the whole documents directory")
+            await self.reconcile()
+            return
 
-        try:
-            if event_type == "deleted":
-                await self._handle_file_deletion(filename)
-            elif event_type in ("created", "modified"):
-                await self._handle_file_addition_or_modification(filename, file_path)
-        except Exception as e:
-            logger.error(f"Error handling {event_type} event for {filename}: {e}")
-
-    async def _handle_file_deletion(self, filename: str):
-        """Handle file deletion by removing chunks"""
-        logger.info(f"Processing deletion for file: {filename}")
-
-        # Remove chunks for this document
-        chunks_before = len(self.rag_engine.chunks)
-        self.rag_engine.chunks = {
-            k: v
-            for k, v in self.rag_engine.chunks.items()
-            if v.document_name != filename
-        }
-        chunks_removed = chunks_before - len(self.rag_engine.chunks)
-
-        if chunks_removed > 0:
-            logger.info(f"Removed {chunks_removed} chunks for deleted file: {filename}")
+        removed = 0
+        to_index = []
+        for file_path, event_type in batch.items():
+            # Hidden files are never indexed, e.g. temporary files of editors
+            if is_hidden(self.documents_dir, file_path):
+                continue
+            document_name = document_name_for(self.documents_dir, file_path)
+            if event_type == EVENT_DELETED or not file_path.exists():
+                removed += self.rag_engine.remove_document(document_name)
+                self.rag_engine.forget_file_state(document_name)
+            else:
+                try:
+                    size = file_path.stat().st_size
+                except OSError:
+                    continue
+                to_index.append((document_name, file_path, size))
+
+        if removed:
+            logger.info(f"Removed {removed} chunks for deleted files")
             await self.rag_engine.save_to_disk()
-        else:
-            logger.info(f"No chunks found for deleted file: {filename}")
 
-    async def _handle_file_addition_or_modification(
-        self, filename: str, file_path: Path
-    ):
-        """Handle file addition or modification by processing the file"""
-        if not file_path.exists():
-            logger.warning(f"File no longer exists: {filename}")
+        await self._enqueue_all(to_index)
+
+    async def _enqueue_all(self, items: List[tuple]):
+        """Queue files for indexing, smallest first, skipping already queued files"""
+        new_items = [
+            item
+            for item in items
+            if item[0] not in self.queued or self.queued[item[0]].is_finished
+        ]
+
+        for document_name, file_path, size in sorted(new_items, key=lambda i: i[2]):
+            job = self.job_manager.create_job(document_name, file_path, size)
+            self.queued[document_name] = job
+            # Blocks when the queue is full, which throttles reconciliation
+            await self.queue.put((size, next(self._counter), job))
+
+    async def _index_worker(self, worker_id: int):
+        """Index queued files until cancelled"""
+        while True:
+            _, _, job = await self.queue.get()
+            self._n_indexing += 1
+            try:
+                if self.queued.get(job.document_name) is job:
+                    del self.queued[job.document_name]
+                await self._index_file(job)
+            except Exception as e:
+                logger.error(
+                    f"Worker {worker_id} failed to index {job.document_name}: {e}"
+                )
+            finally:
+                self._n_indexing -= 1
+                self.queue.task_done()
+
+            if self._n_indexing == 0 and self.queue.empty() and self._index_dirty:
+                # Persist once per drained burst rather than once per file, after
+                # the other workers finished their documents too
+                self._index_dirty = False
+                await self.rag_engine.save_to_disk()
+
+    async def _index_file(self, job: IndexingJob):
+        """Index a single file, replacing any existing chunks for it"""
+        if job.is_finished:
+            self._remember_cancelled(job)
             return
 
-        logger.info(f"Processing file: {filename}")
-
-        try:
-            # Wait for file to stabilize
-            await self._wait_for_file_stability(file_path, filename)
-
-            # Read and validate file
-            data = file_path.read_bytes()
-            if len(data) == 0:
-                logger.warning(f"File {filename} is empty, skipping")
-                return
+        if not job.file_path.exists():
+            logger.warning(f"File no longer exists: {job.document_name}")
+            self.job_manager.cancel(job.id)
+            return
 
-            # Process the document (this will replace existing chunks if any)
-            chunk_count = await self.rag_engine.add_document(filename, data)
-            logger.info(f"Successfully processed {filename} with {chunk_count} chunks")
+        await self._wait_for_file_stability(job.file_path, job.document_name)
 
-            # Save the updated chunks to disk
-            await self.rag_engine.save_to_disk()
+        stat = job.file_path.stat()
+        await self.job_manager.run_job(job)
+        if job.status == STATUS_COMPLETED:
+            self.rag_engine.set_file_state(
+                job.document_name, stat.st_mtime, stat.st_size
+            )
+            self._index_dirty = True
+        elif job.status == STATUS_CANCELLED:
+            self._remember_cancelled(job)
 
-        except Exception as e:
-            logger.error(f"Error processing file {filename}: {e}")
+    def _remember_cancelled(self, job: IndexingJob):
+        """Don't index a cancelled file again until it changes"""
+        try:
+            stat = job.file_path.stat()
+        except OSError:
+            return
+        self.cancelled_states[job.document_name] = (stat.st_mtime, stat.st_size)
 
     async def _wait_for_file_stability(self, file_path: Path, filename: str):
         """Wait for file to finish being written by checking size stability"""
@@ -346,7 +545,7 @@ class DocumentFileWatcher:
                 # Re-schedule the handler
                 logger.info(f"Re-scheduling observer to watch: {self.documents_dir}")
                 watch = self.observer.schedule(
-                    self.handler, str(self.documents_dir), recursive=False
+                    self.handler, str(self.documents_dir), recursive=True
                 )
                 logger.info(f"Watch re-scheduled: {watch}")
 
@@ -357,6 +556,8 @@ class DocumentFileWatcher:
                 # Verify it's alive
                 if self.observer.is_alive():
                     logger.info("✅ Observer restarted successfully")
+                    # Events may have been missed while the observer was dead
+                    await self.reconcile()
                     return True
                 else:
                     logger.error("❌ Failed to restart observer - still not alive")
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Constants
+INDEXING_WORKERS = 2  # Threads doing extraction and embedding
+MAX_FINISHED_JOBS = 200  # Finished jobs kept around for status reporting
+
+# Job statuses
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)
+
+
+class IndexingCancelled(Exception):
+    """Raised inside the indexing pipeline when its job was cancelled"""
+
+
+@dataclass
+class IndexingJob:
+    """Indexing of a single document, progress is updated from a worker thread"""
+
+    id: str
+    document_name: str
+    file_path: Path
+    size: int = 0
+    status: str = STATUS_QUEUED
+    pages_extracted: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def check_cancelled(self):
+        """Abort the pipeline at the next checkpoint if the job was cancelled"""
+        if self.cancel_event.is_set():
+            raise IndexingCancelled(f"Indexing of {self.document_name} was cancelled")
+
+    def eta_seconds(self) -> Optional[float]:
+        """Estimate the remaining time from the embedding rate so far"""
+        if self.status != STATUS_RUNNING or not self.chunks_embedded:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = self.chunks_total - self.chunks_embedded
+        return elapsed / self.chunks_embedded * remaining
+
+    def to_dict(self) -> dict:
+        end_time = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "document": self.document_name,
+            "status": self.status,
+            "pages_extracted": self.pages_extracted,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_total": self.chunks_total,
+            "elapsed_seconds": (
+                round(end_time - self.started_at, 1) if self.started_at else None
+            ),
+            "eta_seconds": (
+                round(self.eta_seconds(), 1) if self.eta_seconds() is not None else None
+            ),
+            "error": self.error,
+        }
+
+
+class IndexingJobManager:
+    """Runs document indexing on a dedicated thread pool, off the event loop"""
+
+    def __init__(self, rag_engine, num_workers: int = INDEXING_WORKERS):
+        """
+        Initialize the job manager
+
+        Args:
+            rag_engine: RAG engine instance for processing documents
+            num_workers: Number of documents processed concurrently
+        """
+        self.rag_engine = rag_engine
+        self.num_workers = num_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="pdf-indexer"
+        )
+        self.jobs: "OrderedDict[str, IndexingJob]" = OrderedDict()
+        self.completed_durations: List[float] = []
+
+    def create_job(
+        self, document_name: str, file_path: Path, size: int = 0
+    ) -> IndexingJob:
+        """Register a queued job, it starts when passed to run_job"""
+        job = IndexingJob(
+            id=uuid.uuid4().hex[:8],
+            document_name=document_name,
+            file_path=file_path,
+            size=size,
+        )
+        self.jobs[job.id] = job
+        self._prune_finished_jobs()
+        return job
+
+    async def run_job(self, job: IndexingJob) -> IndexingJob:
+        """Extract, chunk and embed the document in the worker pool, then swap it in"""
+        if job.cancel_event.is_set():
+            self._finish(job, STATUS_CANCELLED)
+            return job
+
+        job.status = STATUS_RUNNING
+        job.started_at = time.time()
+        loop = asyncio.get_running_loop()
+
+        try:
+            data = await loop.run_in_executor(self.executor, job.file_path.read_bytes)
+            if len(data) == 0:
+                raise ValueError(f"File {job.document_name} is empty")
+
+            chunks = await loop.run_in_executor(
+                self.executor,
+                self.rag_engine.prepare_document,
+                job.document_name,
+                data,
+                job,
+            )
+            job.check_cancelled()
+
+            # Swapped in on the event loop, searches see either old or new chunks
+            self.rag_engine.replace_document(job.document_name, chunks)
+            self._finish(job, STATUS_COMPLETED)
+            logger.info(
+                f"Indexed {job.document_name}: {len(chunks)} chunks "
+                f"in {job.finished_at - job.started_at:.1f}s"
+            )
+        except IndexingCancelled:
+            self._finish(job, STATUS_CANCELLED)
+            logger.info(f"Cancelled indexing of {job.document_name}")
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, STATUS_FAILED)
+            logger.error(f"Failed to index {job.document_name}: {e}")
+
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job, returns False if there is nothing to cancel"""
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        job.cancel_event.set()
+        if job.status == STATUS_QUEUED:
+            self._finish(job, STATUS_CANCELLED)
+        return True
+
+    def cancel_all(self) -> int:
+        """Cancel all unfinished jobs, returns the number of cancelled jobs"""
+        return sum(self.cancel(job_id) for job_id in list(self.jobs))
+
+    def get_job(self, job_id: str) -> Optional[IndexingJob]:
+        return self.jobs.get(job_id)
+
+    def active_jobs(self) -> List[IndexingJob]:
+        return [job for job in self.jobs.values() if not job.is_finished]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Counts per status and an estimate of the time until the queue is drained"""
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING)}
+        counts.update({status: 0 for status in FINISHED_STATUSES})
+        for job in self.jobs.values():
+            counts[job.status] += 1
+
+        eta = None
+        if self.completed_durations and (
+            counts[STATUS_QUEUED] or counts[STATUS_RUNNING]
+        ):
+            recent = self.completed_durations[-50:]
+            avg_duration = sum(recent) / len(recent)
+            running_eta = max(
+                (
+                    job.eta_seconds() or avg_duration
+                    for job in self.jobs.values()
+                    if job.status == STATUS_RUNNING
+                ),
+                default=0.0,
+            )
+            eta = running_eta + avg_duration * counts[STATUS_QUEUED] / self.num_workers
+
+        return {**counts, "eta_seconds": round(eta, 1) if eta is not None else None}
+
+    def shutdown(self):
+        """Cancel outstanding work and stop the worker threads"""
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, job: IndexingJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        if status == STATUS_COMPLETED:
+            self.completed_durations.append(job.finished_at - job.started_at)
+            del self.completed_durations[:-MAX_FINISHED_JOBS]
+
+    def _prune_finished_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
@@ -1,12 +1,13 @@
 import asyncio
+import json
 import logging
 import os
-import time
 from pathlib import Path
 
 from mcp.server.fastmcp import FastMCP
 
-from pdf_mcp.file_watcher import DocumentFileWatcher
+from pdf_mcp.file_watcher import DocumentFileWatcher, list_pdf_files
+from pdf_mcp.indexing_jobs import IndexingJobManager
 from pdf_mcp.rag_engine import RagEngine
 
 # Configure logging
@@ -27,38 +28,25 @@ mcp = FastMCP("PDF RAG MCP Server", stateless_http=True)
 # Global RAG engine instance
 rag_engine: RagEngine = None
 file_watcher: DocumentFileWatcher = None
+job_manager: IndexingJobManager = None
 initialization_status = "not_started"
-loading_progress = {
-    "total_files": 0,
-    "processed_files": 0,
-    "current_file": "",
-    "current_file_chunks": 0,
-    "total_chunks": 0,
-    "start_time": None,
-    "estimated_remaining": None,
-}
 
 
 async def initialize_rag_engine():
-    """Initialize the RAG engine and load documents"""
-    global rag_engine, file_watcher, initialization_status, loading_progress
+    """Initialize the RAG engine and start indexing documents in the background"""
+    global rag_engine, file_watcher, job_manager, initialization_status
 
     try:
         initialization_status = "initializing"
         logger.info("Initializing RAG engine...")
         rag_engine = RagEngine(str(DATA_DIR))
         await rag_engine.initialize()
-
-        # Auto-load documents from Documents directory
-        logger.info("Starting automatic document loading...")
-        await start_document_loading_with_progress(str(DOCUMENTS_DIR))
+        job_manager = IndexingJobManager(rag_engine)
 
         # Initialize and start file watcher
         logger.info("Starting file watcher for automatic updates...")
         logger.info(f"Documents directory for watching: {DOCUMENTS_DIR}")
-        file_watcher = DocumentFileWatcher(
-            str(DOCUMENTS_DIR), rag_engine, loading_progress
-        )
+        file_watcher = DocumentFileWatcher(str(DOCUMENTS_DIR), rag_engine, job_manager)
         await file_watcher.start_watching()
 
         # Verify file watcher is running
@@ -73,6 +61,11 @@ async def initialize_rag_engine():
         else:
             logger.warning("❌ File watcher failed to start properly")
 
+        # Index files added, changed or removed while the server was down. This runs
+        # in the background, searches cover the already indexed documents meanwhile.
+        logger.info("Reconciling document index with the Documents directory...")
+        file_watcher.start_reconcile()
+
         initialization_status = "ready"
         logger.info("RAG engine initialization complete with file watching enabled")
     except Exception as e:
@@ -82,62 +75,7 @@ async def initialize_rag_engine():
         # Don't fail startup, just log the error
         rag_engine = None
         file_watcher = None
-
-
-async def start_document_loading_with_progress(directory_path: str = None):
-    """Start document loading with progress tracking"""
-    global loading_progress, initialization_status
-
-    if not rag_engine:
-        return "RAG engine not initialized"
-
-    if directory_path is None:
-        directory_path = str(DOCUMENTS_DIR)
-
-    try:
-        import time
-        from pathlib import Path
-
-        documents_path = Path(directory_path)
-        if not documents_path.exists():
-            return f"Directory does not exist: {directory_path}"
-
-        pdf_files = list(documents_path.glob("*.pdf"))
-        if not pdf_files:
-            return f"No PDF files found in: {directory_path}"
-
-        # Initialize progress tracking
-        loading_progress.update(
-            {
-                "total_files": len(pdf_files),
-                "processed_files": 0,
-                "current_file": "",
-                "current_file_chunks": 0,
-                "total_chunks": 0,
-                "start_time": time.time(),
-                "estimated_remaining": None,
-            }
-        )
-
-        initialization_status = "loading_documents"
-        logger.info(
-            f"Starting to load {len(pdf_files)} PDF files with progress tracking..."
-        )
-
-        # Load documents with progress updates
-        await rag_engine.load_documents_from_dir_with_progress(
-            directory_path, loading_progress
-        )
-
-        initialization_status = "ready"
-        logger.info("Document loading completed!")
-
-        return f"Successfully loaded {loading_progress['processed_files']} documents with {loading_progress['total_chunks']} total chunks"
-
-    except Exception as e:
-        initialization_status = "failed"
-        logger.error(f"Error loading documents: {e}")
-        return f"Error loading documents: {str(e)}"
+        job_manager = None
 
 
 @mcp.tool()
@@ -163,8 +101,14 @@ async def search_documents(query: str, top_k: int = 5) -> str:
 
         formatted_results = []
         for i, result in enumerate(results, 1):
+            source = result.document
+            if result.page_start is not None:
+                if result.page_start == result.page_end:
+                    source += f", p. {result.page_start}"
+                else:
+                    source += f", pp. {result.page_start}-{result.page_end}"
             formatted_results.append(
-                f"**Result {i}** (Score: {result.score:.3f}) [{result.document}]\n"
+                f"**Result {i}** (Score: {result.score:.3f}) [{source}]\n"
                 f"{result.text}\n"
             )
 
@@ -179,62 +123,27 @@ async def search_documents(query: str, top_k: int = 5) -> str:
 
 async def get_loading_progress() -> str:
     """
-    Get detailed progress of document loading and chunking.
+    Get a summary of background document indexing.
     Internal function - not exposed as MCP tool.
 
     Returns:
-        str: Detailed progress information including current file, chunks, and time estimates
+        str: Number of queued, running and finished jobs with a time estimate
     """
-    if initialization_status == "loading_documents":
-        import time
-
-        current_time = time.time()
-        elapsed_time = current_time - (loading_progress["start_time"] or current_time)
-
-        # Calculate progress percentage
-        file_progress = (
-            loading_progress["processed_files"]
-            / max(loading_progress["total_files"], 1)
-        ) * 100
-
-        # Estimate remaining time
-        if loading_progress["processed_files"] > 0 and elapsed_time > 0:
-            avg_time_per_file = elapsed_time / loading_progress["processed_files"]
-            remaining_files = (
-                loading_progress["total_files"] - loading_progress["processed_files"]
-            )
-            estimated_remaining = avg_time_per_file * remaining_files
-            loading_progress["estimated_remaining"] = estimated_remaining
+    if not job_manager:
+        return f"Status: {initialization_status} (no indexing in progress)"
 
-        progress_info = []
-        progress_info.append(f"📊 Loading Progress: {file_progress:.1f}% complete")
-        progress_info.append(
-            f"📁 Files: {loading_progress['processed_files']}/{loading_progress['total_files']}"
-        )
-        progress_info.append(f"📄 Current: {loading_progress['current_file']}")
-        progress_info.append(
-            f"🔢 Current file chunks: {loading_progress['current_file_chunks']}"
-        )
-        progress_info.append(
-            f"📦 Total chunks so far: {loading_progress['total_chunks']}"
-        )
-        progress_info.append(f"⏱️  Elapsed: {elapsed_time:.1f}s")
+    summary = job_manager.summary()
+    progress_info = [
+        f"⏳ Queued: {summary['queued']}",
+        f"⚙️  Running: {summary['running']}",
+        f"✅ Completed: {summary['completed']}",
+        f"❌ Failed: {summary['failed']}",
+        f"🚫 Cancelled: {summary['cancelled']}",
+    ]
+    if summary["eta_seconds"] is not None:
+        progress_info.append(f"⏱️  Estimated remaining: {summary['eta_seconds']:.1f}s")
 
-        if loading_progress["estimated_remaining"]:
-            progress_info.append(
-                f"⏳ Estimated remaining: {loading_progress['estimated_remaining']:.1f}s"
-            )
-
-        return "\n".join(progress_info)
-
-    elif initialization_status == "ready":
-        return f"✅ Loading complete! Processed {loading_progress['total_chunks']} chunks from {loading_progress['processed_files']} documents."
-
-    elif initialization_status == "failed":
-        return "❌ Loading failed. Check logs for details."
-
-    else:
-        return f"Status: {initialization_status} (no loading in progress)"
+    return "\n".join(progress_info)
 
 
 async def get_initialization_status() -> str:
@@ -248,7 +157,6 @@ async def get_initialization_status() -> str:
     status_messages = {
         "not_started": "Initialization has not started yet",
         "initializing": "RAG engine is initializing...",
-        "loading_documents": "Loading and processing PDF documents from Documents folder...",
         "ready": "RAG engine is ready",
         "failed": "Initialization failed",
     }
@@ -259,8 +167,8 @@ async def get_initialization_status() -> str:
         doc_count = len(rag_engine.list_documents())
         chunk_count = len(rag_engine.chunks)
         message += f" - {doc_count} documents loaded with {chunk_count} chunks"
-    elif initialization_status == "loading_documents":
-        message += "\nThis may take several minutes depending on the number and size of PDF files being processed."
+        if job_manager and job_manager.active_jobs():
+            message += f", {len(job_manager.active_jobs())} documents being indexed"
 
     return f"Status: {initialization_status}\n{message}"
 
@@ -274,9 +182,7 @@ async def get_document_list() -> str:
         str: List of document names
     """
     if initialization_status != "ready":
-        if initialization_status == "loading_documents":
-            return "Still loading documents from your Documents folder. This may take several minutes."
-        elif initialization_status == "failed":
+        if initialization_status == "failed":
             return "RAG engine initialization failed. Check logs for details."
         else:
             return f"RAG engine is {initialization_status}."
@@ -298,91 +204,78 @@ async def get_document_list() -> str:
         return f"Error listing documents: {str(e)}"
 
 
-async def load_documents_from_directory(directory_path: str = None) -> str:
+async def start_auto_loading() -> str:
     """
-    Load and process PDF documents from a directory.
+    Re-scan the Documents directory and index new or changed documents.
     Internal function - not exposed as MCP tool.
 
-    Args:
-        directory_path (str, optional): Path to directory containing PDFs.
-                                      If not provided, uses default Documents directory.
-
     Returns:
-        str: Status of the loading process
+        str: Status of the loading process initiation
     """
-    if not rag_engine:
+    if not rag_engine or not file_watcher:
         return "RAG engine not initialized yet. Please wait for initialization to complete."
 
-    if directory_path is None:
-        directory_path = str(DOCUMENTS_DIR)
-
     try:
-        documents_path = Path(directory_path)
-        if not documents_path.exists():
-            return f"Directory does not exist: {directory_path}"
-
-        pdf_files = list(documents_path.glob("*.pdf"))
-        if not pdf_files:
-            return f"No PDF files found in: {directory_path}"
+        # Start loading in the background
+        file_watcher.start_reconcile()
+        return f"Started document loading from {DOCUMENTS_DIR}."
 
-        logger.info(
-            f"Starting to load {len(pdf_files)} PDF files from {directory_path}"
-        )
+    except Exception as e:
+        logger.error(f"Error starting loading: {e}")
+        return f"Error starting loading: {str(e)}"
 
-        # Use progress tracking if available
-        if hasattr(rag_engine, "load_documents_from_dir_with_progress"):
-            # Initialize progress tracking
-            loading_progress.update(
-                {
-                    "total_files": len(pdf_files),
-                    "processed_files": 0,
-                    "current_file": "",
-                    "current_file_chunks": 0,
-                    "total_chunks": 0,
-                    "start_time": time.time(),
-                    "estimated_remaining": None,
-                }
-            )
-            initialization_status = "loading_documents"  # noqa: F841
-            await rag_engine.load_documents_from_dir_with_progress(
-                directory_path, loading_progress
-            )
-        else:
-            await rag_engine.load_documents_from_dir(directory_path)
 
-        doc_count = len(rag_engine.list_documents())
-        chunk_count = len(rag_engine.chunks)
-        return f"Successfully loaded documents from {directory_path}. Total: {doc_count} documents with {chunk_count} chunks."
+@mcp.tool()
+async def get_indexing_status(job_id: str = "") -> str:
+    """
+    Get the progress of background document indexing.
 
-    except Exception as e:
-        logger.error(f"Error loading documents: {e}")
-        return f"Error loading documents: {str(e)}"
+    Documents are indexed in the background, searches return results from the
+    documents that are already indexed in the meantime.
 
+    Args:
+        job_id (str): Optional id of a single indexing job to report on
 
-async def start_auto_loading() -> str:
+    Returns:
+        str: JSON with a summary and per-job progress (pages extracted, chunks embedded, ETA)
     """
-    Restart document loading from the Documents directory.
-    Internal function - not exposed as MCP tool.
+    if not job_manager:
+        return "RAG engine not initialized"
 
-    Returns:
-        str: Status of the loading process initiation
+    if job_id:
+        job = job_manager.get_job(job_id)
+        if job is None:
+            return f"No indexing job found with id: {job_id}"
+        return json.dumps(job.to_dict(), indent=2)
+
+    status = {
+        "summary": job_manager.summary(),
+        "active_jobs": [job.to_dict() for job in job_manager.active_jobs()[:20]],
+    }
+    return json.dumps(status, indent=2)
+
+
+@mcp.tool()
+async def cancel_indexing_job(job_id: str) -> str:
     """
-    global initialization_status
+    Cancel a queued or running document indexing job.
 
-    if initialization_status == "loading_documents":
-        return "Document loading is already in progress."
+    Args:
+        job_id (str): Id of the job, as reported by get_indexing_status. Use "all"
+            to cancel every queued and running job.
 
-    if not rag_engine:
-        return "RAG engine not initialized yet. Please wait for initialization to complete."
+    Returns:
+        str: Whether the job was cancelled
+    """
+    if not job_manager:
+        return "RAG engine not initialized"
 
-    try:
-        # Start loading in the background
-        asyncio.create_task(start_document_loading_with_progress())
-        return f"Started document loading from {DOCUMENTS_DIR}."
+    if job_id == "all":
+        return f"Cancelled {job_manager.cancel_all()} indexing jobs."
 
-    except Exception as e:
-        logger.error(f"Error starting loading: {e}")
-        return f"Error starting loading: {str(e)}"
+    if job_manager.cancel(job_id):
+        return f"Cancelled indexing job {job_id}."
+    return f"No queued or running indexing job found with id: {job_id}"
 
 
 async def periodic_health_check():
@@ -399,21 +292,11 @@ async def periodic_health_check():
                         "🔄 File watcher observer was restarted during health check"
                     )
 
-            # Quick sync check - only clean up stale entries (deleted files)
-            if rag_engine:
-                documents_path = Path(DOCUMENTS_DIR)
-                if documents_path.exists():
-                    current_pdf_files = set(
-                        pdf_file.name for pdf_file in documents_path.glob("*.pdf")
-                    )
-                    indexed_documents = set(rag_engine.list_documents())
-                    stale_entries = indexed_documents - current_pdf_files
-
-                    if stale_entries:
-                        logger.info(
-                            f"🧹 Cleaning up {len(stale_entries)} stale entries from index"
-                        )
-                        await sync_document_index()
+            # Pick up anything the observer missed (new, changed or deleted files)
+            if rag_engine and file_watcher:
+                result = await file_watcher.reconcile()
+                if result["queued"] or result["removed"]:
+                    logger.info(f"🧹 Reconciled document index: {result}")
 
         except Exception as e:
             logger.error(f"Error in periodic health check: {e}")
@@ -432,8 +315,6 @@ async def get_rag_stats() -> str:
 
     try:
         stats = rag_engine.get_stats()
-        import json
-
         return f"RAG System Stats:\n{json.dumps(stats, indent=2)}"
 
     except Exception as e:
@@ -502,15 +383,16 @@ async def get_file_watcher_status() -> str:
 
     # Check current files in directory
     if documents_dir.exists():
-        pdf_files = list(documents_dir.glob("*.pdf"))
+        pdf_files = sorted(list_pdf_files(documents_dir))
         result += f"Current PDF files in directory: {len(pdf_files)}\n"
         if pdf_files:
             result += (
                 "Files: "
-                + ", ".join([f.name for f in pdf_files[:5]])
+                + ", ".join(pdf_files[:5])
                 + ("..." if len(pdf_files) > 5 else "")
                 + "\n"
             )
+    result += f"Files waiting to be indexed: {file_watcher.pending_count()}\n"
 
     # Check indexed documents
     if rag_engine:
@@ -540,9 +422,7 @@ async def sync_document_index() -> str:
             return f"Documents directory does not exist: {DOCUMENTS_DIR}"
 
         # Get current files in the Documents folder
-        current_pdf_files = set(
-            pdf_file.name for pdf_file in documents_path.glob("*.pdf")
-        )
+        current_pdf_files = set(list_pdf_files(documents_path))
 
         # Get documents currently in the index
         indexed_documents = set(rag_engine.list_documents())
@@ -557,14 +437,8 @@ async def sync_document_index() -> str:
         chunks_removed = 0
         for missing_doc in missing_documents:
             logger.info(f"Removing chunks for missing document: {missing_doc}")
-            chunks_before = len(rag_engine.chunks)
-            rag_engine.chunks = {
-                k: v
-                for k, v in rag_engine.chunks.items()
-                if v.document_name != missing_doc
-            }
-            chunks_after = len(rag_engine.chunks)
-            chunks_removed += chunks_before - chunks_after
+            chunks_removed += rag_engine.remove_document(missing_doc)
+            rag_engine.forget_file_state(missing_doc)
 
         # Save the updated chunks to disk
         await rag_engine.save_to_disk()
@@ -586,7 +460,7 @@ async def sync_document_index() -> str:
 
 async def cleanup_resources():
     """Cleanup resources when shutting down"""
-    global file_watcher
+    global file_watcher, job_manager
 
     if file_watcher:
         logger.info("Stopping file watcher...")
@@ -594,6 +468,10 @@ async def cleanup_resources():
         file_watcher = None
         logger.info("File watcher stopped")
 
+    if job_manager:
+        job_manager.shutdown()
+        job_manager = None
+
 
 # Startup will be handled by app.py lifespan
 
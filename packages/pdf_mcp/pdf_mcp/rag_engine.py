@@ -1,21 +1,39 @@
 import asyncio
+import bisect
 import json
 import logging
 import os
 import subprocess
 import tempfile
+import threading
 import time
 import uuid
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import requests
 from sklearn.metrics.pairwise import cosine_similarity
+from toolbox_store.embedding import (
+    approx_token_count,
+    create_splitter,
+    model_max_tokens,
+)
+
+from pdf_mcp.indexing_jobs import IndexingJob
 
 logger = logging.getLogger(__name__)
 
+EMBED_BATCH_SIZE = 32  # Chunks per /api/embed request
+
+# Chunking, in (approximate) tokens of the embedding model
+CHUNK_MAX_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 32
+CHUNK_MIN_TOKENS = 64  # Smaller chunks are merged into the previous one if it fits
+# pdftotext separates pages with a form feed, three newlines rank above a paragraph break
+PAGE_SEPARATOR = "\n\n\n"
+
 
 @dataclass
 class DocumentChunk:
@@ -24,6 +42,15 @@ class DocumentChunk:
     text: str
     embedding: List[float]
     chunk_index: int
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+
+@dataclass
+class TextChunk:
+    text: str
+    page_start: int
+    page_end: int
 
 
 @dataclass
@@ -32,6 +59,8 @@ class SearchResult:
     score: float
     document: str
     chunk_id: str
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
 
 
 class EmbeddingService:
@@ -64,6 +93,7 @@ class EmbeddingService:
         )
 
         self._model_pulled = False
+        self._model_lock = threading.Lock()
 
     def ollama_available(self) -> bool:
         """Check if ollama is available"""
@@ -74,45 +104,50 @@ class EmbeddingService:
         except Exception:
             return False
 
-    async def ensure_model_available(self):
+    def ensure_model_available(self):
         """Ensure model is pulled (only once)"""
-        if self._model_pulled:
-            return
+        with self._model_lock:
+            if self._model_pulled:
+                return
 
-        try:
-            import subprocess
+            try:
+                logger.info(f"Pulling Ollama model {self.model} (one-time setup)...")
+                subprocess.run(
+                    ["ollama", "pull", self.model],
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                self._model_pulled = True
+                logger.info(f"Model {self.model} is ready")
+            except Exception as e:
+                logger.warning(f"Failed to pull model {self.model}: {e}")
+                # Continue anyway - model might already exist
 
-            logger.info(f"Pulling Ollama model {self.model} (one-time setup)...")
-            subprocess.run(
-                ["ollama", "pull", self.model],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            self._model_pulled = True
-            logger.info(f"Model {self.model} is ready")
-        except Exception as e:
-            logger.warning(f"Failed to pull model {self.model}: {e}")
-            # Continue anyway - model might already exist
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of texts with a single Ollama request.
 
-    async def get_embedding(self, text: str) -> List[float]:
-        """Generate embedding for text using Ollama"""
-        await self.ensure_model_available()
+        Blocking, call it from a worker thread.
+        """
+        if not texts:
+            return []
+
+        self.ensure_model_available()
 
         try:
             # Pre-serialize JSON to avoid repeated serialization overhead
-            payload = json.dumps({"model": self.model, "prompt": text})
+            payload = json.dumps({"model": self.model, "input": texts})
 
             response = self.session.post(
-                f"{self.base_url}/api/embeddings", data=payload, timeout=30
+                f"{self.base_url}/api/embed", data=payload, timeout=120
             )
             response.raise_for_status()
 
             data = response.json()
-            embedding = data.get("embedding")
-            if embedding is None or not isinstance(embedding, list):
-                raise ValueError(f"No embedding returned from Ollama: {data}")
-            return embedding
+            embeddings = data.get("embeddings")
+            if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+                raise ValueError(f"Unexpected embeddings returned from Ollama: {data}")
+            return embeddings
         except requests.exceptions.ConnectionError:
             logger.error(
                 f"Cannot connect to Ollama at {self.base_url}. Is Ollama running?"
@@ -121,55 +156,13 @@ class EmbeddingService:
                 f"Ollama connection failed. Please ensure Ollama is running at {self.base_url}"
             )
         except Exception as e:
-            logger.error(f"Failed to generate embedding: {e}")
+            logger.error(f"Failed to generate embeddings: {e}")
             raise
 
-    async def get_embeddings_batch(
-        self, texts: List[str], batch_size: int = 20
-    ) -> List[List[float]]:
-        """Generate embeddings for multiple texts using true batch processing"""
-        await self.ensure_model_available()
-
-        if not texts:
-            return []
-
-        # For small batches, use individual requests with connection reuse
-        if len(texts) <= 5:
-            tasks = [self.get_embedding(text) for text in texts]
-            return await asyncio.gather(*tasks)
-
-        # For larger batches, process in chunks to avoid memory issues
-        embeddings = []
-
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i : i + batch_size]
-            logger.debug(
-                f"Processing batch {i // batch_size + 1}/{(len(texts) + batch_size - 1) // batch_size} ({len(batch_texts)} texts)"
-            )
-
-            # Use concurrent requests with connection reuse - much faster than sequential
-            batch_tasks = [self.get_embedding(text) for text in batch_texts]
-            batch_embeddings = await asyncio.gather(
-                *batch_tasks, return_exceptions=True
-            )
-
-            # Handle any failures gracefully
-            valid_embeddings = []
-            for j, result in enumerate(batch_embeddings):
-                if isinstance(result, Exception):
-                    logger.warning(f"Failed to embed text {i + j}: {result}")
-                    # Use zero vector as fallback
-                    valid_embeddings.append([0.0] * 768)  # nomic-embed-text dimension
-                else:
-                    valid_embeddings.append(result)
-
-            embeddings.extend(valid_embeddings)
-
-            # Brief pause between large batches to prevent overwhelming Ollama
-            if len(batch_texts) == batch_size and i + batch_size < len(texts):
-                await asyncio.sleep(0.05)  # Reduced from 0.1s
-
-        return embeddings
+    async def get_embedding(self, text: str) -> List[float]:
+        """Generate embedding for text using Ollama, without blocking the event loop"""
+        embeddings = await asyncio.to_thread(self.embed_texts, [text])
+        return embeddings[0]
 
 
 class RagEngine:
@@ -179,14 +172,31 @@ class RagEngine:
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         self.chunks: Dict[str, DocumentChunk] = {}
+        # mtime/size of each indexed file, used to detect changes on startup
+        self.file_states: Dict[str, Dict[str, float]] = {}
         self.embedding_service = EmbeddingService()
+        self._search_matrix: Optional[Tuple[List[DocumentChunk], np.ndarray]] = None
+
+        # Keep chunks well within the context window so nothing gets truncated
+        self.chunk_max_tokens = min(
+            CHUNK_MAX_TOKENS, model_max_tokens(self.embedding_service.model)
+        )
+        self.splitter = create_splitter(
+            self.chunk_max_tokens, CHUNK_OVERLAP_TOKENS, unit="tokens"
+        )
 
     async def initialize(self):
         """Initialize the RAG engine"""
         await self.load_from_disk()
 
-    async def add_document(self, filename: str, data: bytes) -> int:
-        """Add a document to the RAG system"""
+    def prepare_document(
+        self, filename: str, data: bytes, job: Optional[IndexingJob] = None
+    ) -> List[DocumentChunk]:
+        """Extract, chunk and embed a document without touching the index.
+
+        Blocking, meant to run in a worker thread. Progress is reported on the
+        job, which is also checked for cancellation between embedding batches.
+        """
         logger.info(f"Processing document: {filename}")
 
         # Check if Ollama is available before processing
@@ -200,137 +210,88 @@ class RagEngine:
         if not text.strip():
             raise ValueError("No text extracted from PDF")
 
-        # Create chunks
-        chunks = self.chunk_text(text, chunk_size=500)
-        logger.info(f"Created {len(chunks)} chunks for {filename}")
-
-        # Remove existing chunks for this document
-        self.chunks = {
-            k: v for k, v in self.chunks.items() if v.document_name != filename
-        }
-
-        # Filter valid chunks
-        valid_chunks = [
-            (i, chunk_text)
-            for i, chunk_text in enumerate(chunks)
-            if len(chunk_text.strip()) >= 10
+        # Create chunks, skipping the ones without meaningful content
+        text_chunks = [
+            chunk for chunk in self.chunk_text(text) if len(chunk.text) >= 10
         ]
+        logger.info(f"Created {len(text_chunks)} chunks for {filename}")
+        if job:
+            job.pages_extracted = max(
+                (chunk.page_end for chunk in text_chunks), default=0
+            )
+            job.chunks_total = len(text_chunks)
 
-        if not valid_chunks:
+        if not text_chunks:
             logger.warning(f"No valid chunks found in {filename}")
-            return 0
+            return []
 
-        logger.info(
-            f"Generating embeddings for {len(valid_chunks)} chunks from {filename}..."
-        )
         start_time = time.time()
+        embeddings: List[List[float]] = []
+        for i in range(0, len(text_chunks), EMBED_BATCH_SIZE):
+            if job:
+                job.check_cancelled()
+            batch = text_chunks[i : i + EMBED_BATCH_SIZE]
+            embeddings.extend(
+                self.embedding_service.embed_texts([chunk.text for chunk in batch])
+            )
+            if job:
+                job.chunks_embedded = len(embeddings)
 
-        # Extract texts for batch processing
-        chunk_texts = [chunk_text for _, chunk_text in valid_chunks]
-
-        # Generate embeddings in batches (much faster!)
-        embeddings = await self.embedding_service.get_embeddings_batch(
-            chunk_texts, batch_size=20
-        )
-
-        embedding_time = time.time() - start_time
+        embedding_time = max(time.time() - start_time, 1e-6)
         logger.info(
             f"Generated {len(embeddings)} embeddings in {embedding_time:.2f}s ({len(embeddings) / embedding_time:.1f} embeddings/sec)"
         )
 
-        # Create and store chunks
-        chunk_count = 0
-        for (i, chunk_text), embedding in zip(valid_chunks, embeddings):
-            chunk = DocumentChunk(
+        return [
+            DocumentChunk(
                 id=str(uuid.uuid4()),
                 document_name=filename,
-                text=chunk_text,
+                text=text_chunk.text,
                 embedding=embedding,
                 chunk_index=i,
+                page_start=text_chunk.page_start,
+                page_end=text_chunk.page_end,
             )
+            for i, (text_chunk, embedding) in enumerate(zip(text_chunks, embeddings))
+        ]
 
+    def replace_document(self, filename: str, chunks: List[DocumentChunk]):
+        """Replace all chunks of a document at once"""
+        self.remove_document(filename)
+        for chunk in chunks:
             self.chunks[chunk.id] = chunk
-            chunk_count += 1
-
-        await self.save_to_disk()
-        logger.info(f"Successfully processed {chunk_count} chunks for {filename}")
-        return chunk_count
-
-    async def add_document_with_progress(
-        self, filename: str, data: bytes, progress_tracker: dict
-    ) -> int:
-        """Add a document to the RAG system with progress tracking"""
-        logger.info(f"Processing document: {filename}")
-
-        # Check if Ollama is available before processing
-        if not self.embedding_service.ollama_available():
-            raise ValueError(
-                "Ollama is not available. Please ensure Ollama is running."
-            )
+        self._search_matrix = None
 
-        # Extract text from PDF
-        text = self.extract_pdf_text(data)
-        if not text.strip():
-            raise ValueError("No text extracted from PDF")
+    async def add_document(self, filename: str, data: bytes, save: bool = True) -> int:
+        """Add a document to the RAG system"""
+        chunks = await asyncio.to_thread(self.prepare_document, filename, data)
+        self.replace_document(filename, chunks)
 
-        # Create chunks
-        chunks = self.chunk_text(text, chunk_size=500)
-        logger.info(f"Created {len(chunks)} chunks for {filename}")
+        if save:
+            await self.save_to_disk()
+        logger.info(f"Successfully processed {len(chunks)} chunks for {filename}")
+        return len(chunks)
 
-        # Remove existing chunks for this document
+    def remove_document(self, filename: str) -> int:
+        """Remove all chunks of a document, returns the number of removed chunks"""
+        chunks_before = len(self.chunks)
         self.chunks = {
             k: v for k, v in self.chunks.items() if v.document_name != filename
         }
+        self._search_matrix = None
+        return chunks_before - len(self.chunks)
 
-        # Filter valid chunks
-        valid_chunks = [
-            (i, chunk_text)
-            for i, chunk_text in enumerate(chunks)
-            if len(chunk_text.strip()) >= 10
-        ]
+    def get_file_state(self, filename: str) -> Optional[Dict[str, float]]:
+        """Get the recorded mtime and size of an indexed file"""
+        return self.file_states.get(filename)
 
-        if not valid_chunks:
-            logger.warning(f"No valid chunks found in {filename}")
-            return 0
+    def set_file_state(self, filename: str, mtime: float, size: int):
+        """Record the mtime and size of an indexed file"""
+        self.file_states[filename] = {"mtime": mtime, "size": size}
 
-        logger.info(
-            f"Generating embeddings for {len(valid_chunks)} chunks from {filename}..."
-        )
-        start_time = time.time()
-
-        # Extract texts for batch processing
-        chunk_texts = [chunk_text for _, chunk_text in valid_chunks]
-
-        # Generate embeddings in batches (much faster!)
-        embeddings = await self.embedding_service.get_embeddings_batch(
-            chunk_texts, batch_size=20
-        )
-
-        embedding_time = time.time() - start_time
-        logger.info(
-            f"Generated {len(embeddings)} embeddings in {embedding_time:.2f}s ({len(embeddings) / embedding_time:.1f} embeddings/sec)"
-        )
-
-        # Create and store chunks
-        chunk_count = 0
-        for (i, chunk_text), embedding in zip(valid_chunks, embeddings):
-            chunk = DocumentChunk(
-                id=str(uuid.uuid4()),
-                document_name=filename,
-                text=chunk_text,
-                embedding=embedding,
-                chunk_index=i,
-            )
-
-            self.chunks[chunk.id] = chunk
-            chunk_count += 1
-
-            # Update progress tracker
-            progress_tracker["current_file_chunks"] = chunk_count
-
-        await self.save_to_disk()
-        logger.info(f"Successfully processed {chunk_count} chunks for {filename}")
-        return chunk_count
+    def forget_file_state(self, filename: str):
+        """Drop the recorded state of a file that is no longer indexed"""
+        self.file_states.pop(filename, None)
 
     async def search(self, query: str, top_k: int = 5) -> List[SearchResult]:
         """Search documents using optimized vectorized similarity"""
@@ -344,9 +305,8 @@ class RagEngine:
         query_embedding = await self.embedding_service.get_embedding(query)
         query_array = np.array(query_embedding).reshape(1, -1)
 
-        # Prepare chunk data for vectorized operations
-        chunks_list = list(self.chunks.values())
-        embeddings_matrix = np.array([chunk.embedding for chunk in chunks_list])
+        # Reuse the embedding matrix until the index changes
+        chunks_list, embeddings_matrix = self._get_search_matrix()
 
         # Vectorized cosine similarity calculation (much faster)
         similarities = cosine_similarity(query_array, embeddings_matrix)[0]
@@ -368,10 +328,20 @@ class RagEngine:
                 score=float(similarities[idx]),
                 document=chunks_list[idx].document_name,
                 chunk_id=chunks_list[idx].id,
+                page_start=chunks_list[idx].page_start,
+                page_end=chunks_list[idx].page_end,
             )
             for idx in top_indices
         ]
 
+    def _get_search_matrix(self) -> Tuple[List[DocumentChunk], np.ndarray]:
+        """Chunks and their embeddings as a matrix, rebuilt only after index changes"""
+        if self._search_matrix is None:
+            chunks_list = list(self.chunks.values())
+            embeddings_matrix = np.array([chunk.embedding for chunk in chunks_list])
+            self._search_matrix = (chunks_list, embeddings_matrix)
+        return self._search_matrix
+
     def list_documents(self) -> List[str]:
         """List all processed documents"""
         docs = set(chunk.document_name for chunk in self.chunks.values())
@@ -384,84 +354,6 @@ class RagEngine:
 
         return {"documents": doc_count, "chunks": chunk_count, "status": "ready"}
 
-    async def load_documents_from_dir(self, documents_dir: str):
-        """Load all PDFs from a directory"""
-        documents_path = Path(documents_dir)
-        if not documents_path.exists():
-            logger.warning(f"Documents directory does not exist: {documents_dir}")
-            return
-
-        for pdf_file in documents_path.glob("*.pdf"):
-            filename = pdf_file.name
-
-            # Skip if already processed
-            if any(chunk.document_name == filename for chunk in self.chunks.values()):
-                logger.info(f"Document {filename} already processed, skipping")
-                continue
-
-            try:
-                logger.info(f"Loading document: {filename}")
-                data = pdf_file.read_bytes()
-                chunk_count = await self.add_document(filename, data)
-                logger.info(
-                    f"Successfully processed {filename} with {chunk_count} chunks"
-                )
-
-                # Yield control after each document to keep server responsive
-                await asyncio.sleep(0.001)
-
-            except Exception as e:
-                logger.warning(f"Skipping {filename}: {e}")
-
-    async def load_documents_from_dir_with_progress(
-        self, documents_dir: str, progress_tracker: dict
-    ):
-        """Load all PDFs from a directory with progress tracking"""
-        documents_path = Path(documents_dir)
-        if not documents_path.exists():
-            logger.warning(f"Documents directory does not exist: {documents_dir}")
-            return
-
-        pdf_files = list(documents_path.glob("*.pdf"))
-        progress_tracker["total_files"] = len(pdf_files)
-
-        for file_index, pdf_file in enumerate(pdf_files):
-            filename = pdf_file.name
-            progress_tracker["current_file"] = filename
-            progress_tracker["current_file_chunks"] = 0
-
-            # Skip if already processed
-            if any(chunk.document_name == filename for chunk in self.chunks.values()):
-                logger.info(f"Document {filename} already processed, skipping")
-                progress_tracker["processed_files"] += 1
-                continue
-
-            try:
-                logger.info(
-                    f"Loading document {file_index + 1}/{len(pdf_files)}: {filename}"
-                )
-                data = pdf_file.read_bytes()
-
-                # Process document and track chunks
-                chunk_count = await self.add_document_with_progress(
-                    filename, data, progress_tracker
-                )
-
-                progress_tracker["processed_files"] += 1
-                progress_tracker["total_chunks"] += chunk_count
-                progress_tracker["current_file_chunks"] = chunk_count
-
-                logger.info(
-                    f"Successfully processed {filename} with {chunk_count} chunks"
-                )
-
-                # Yield control after each document
-                await asyncio.sleep(0.001)
-
-            except Exception as e:
-                logger.warning(f"Skipping {filename}: {e}")
-                progress_tracker["processed_files"] += 1  # Still count as processed
-
     def extract_pdf_text(self, data: bytes) -> str:
         """Extract text from PDF using pdftotext (poppler)"""
         logger.info("Extracting PDF text using pdftotext")
@@ -497,45 +389,71 @@ class RagEngine:
         finally:
             os.unlink(temp_path)
 
-    def chunk_text(
-        self, text: str, chunk_size: int = 500, overlap: int = 50
-    ) -> List[str]:
-        """Split text into overlapping chunks for better context preservation"""
+    def chunk_text(self, text: str) -> List[TextChunk]:
+        """Split text into token-bounded chunks along page and paragraph boundaries"""
         if not text.strip():
             return []
 
-        words = text.split()
-        if len(words) <= chunk_size:
-            return [text] if text.strip() else []
-
-        chunks = []
-        step_size = chunk_size - overlap
-
-        for i in range(0, len(words), step_size):
-            chunk_words = words[i : i + chunk_size]
-            if len(chunk_words) >= 10:  # Only include meaningful chunks
-                chunk_text = " ".join(chunk_words)
-                chunks.append(chunk_text)
-
-            # Break if we've covered all words
-            if i + chunk_size >= len(words):
-                break
+        pages = text.split("\f")
+        # pdftotext terminates the last page with a form feed as well
+        if len(pages) > 1 and not pages[-1].strip():
+            pages.pop()
+
+        page_offsets = []
+        offset = 0
+        for page in pages:
+            page_offsets.append(offset)
+            offset += len(page) + len(PAGE_SEPARATOR)
+        joined = PAGE_SEPARATOR.join(pages)
+
+        # Merge tiny chunks into their predecessor instead of embedding them alone,
+        # as long as the merged span stays within the token budget
+        spans: List[List[int]] = []
+        for start, chunk in self.splitter.chunk_indices(joined):
+            end = start + len(chunk)
+            if spans and approx_token_count(chunk) < CHUNK_MIN_TOKENS:
+                merged_start, merged_end = spans[-1][0], max(spans[-1][1], end)
+                merged = joined[merged_start:merged_end]
+                if approx_token_count(merged) <= self.chunk_max_tokens:
+                    spans[-1][1] = merged_end
+                    continue
+            spans.append([start, end])
 
-        return chunks
+        return [
+            TextChunk(
+                text=joined[start:end].strip(),
+                page_start=bisect.bisect_right(page_offsets, start),
+                page_end=bisect.bisect_right(page_offsets, end - 1),
+            )
+            for start, end in spans
+        ]
 
     async def save_to_disk(self):
-        """Save chunks to disk with optimized I/O"""
+        """Save chunks to disk with optimized I/O, serialized in a worker thread"""
+        chunks_snapshot = list(self.chunks.values())
+        file_states_snapshot = dict(self.file_states)
+        await asyncio.to_thread(
+            self._write_to_disk, chunks_snapshot, file_states_snapshot
+        )
+
+    def _write_to_disk(
+        self,
+        chunks: List[DocumentChunk],
+        file_states: Dict[str, Dict[str, float]],
+    ):
         chunks_file = self.data_dir / "chunks.json"
 
         # Use more efficient JSON serialization
         chunks_data = {}
-        for k, v in self.chunks.items():
-            chunks_data[k] = {
+        for v in chunks:
+            chunks_data[v.id] = {
                 "id": v.id,
                 "document_name": v.document_name,
                 "text": v.text,
                 "embedding": v.embedding,
                 "chunk_index": v.chunk_index,
+                "page_start": v.page_start,
+                "page_end": v.page_end,
             }
 
         # Write atomically to prevent corruption
@@ -548,7 +466,18 @@ class RagEngine:
 
             # Atomic rename
             temp_file.replace(chunks_file)
-            logger.debug(f"Saved {len(self.chunks)} chunks to disk")
+            logger.debug(f"Saved {len(chunks)} chunks to disk")
+        except Exception as e:
+            if temp_file.exists():
+                temp_file.unlink()
+            raise e
+
+        file_states_file = self.data_dir / "file_states.json"
+        temp_file = file_states_file.with_suffix(".json.tmp")
+        try:
+            with open(temp_file, "w") as f:
+                json.dump(file_states, f, separators=(",", ":"))
+            temp_file.replace(file_states_file)
         except Exception as e:
             if temp_file.exists():
                 temp_file.unlink()
@@ -573,10 +502,19 @@ class RagEngine:
                     if chunk_count % 50 == 0:
                         await asyncio.sleep(0.001)  # Very short sleep to yield control
 
+                self._search_matrix = None
                 logger.info(f"Loaded {len(self.chunks)} chunks from disk")
             except Exception as e:
                 logger.warning(f"Failed to load chunks from disk: {e}")
 
+        file_states_file = self.data_dir / "file_states.json"
+        if file_states_file.exists():
+            try:
+                with open(file_states_file, "r") as f:
+                    self.file_states = json.load(f)
+            except Exception as e:
+                logger.warning(f"Failed to load file states from disk: {e}")
+
     def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
         if len(a) != len(b):
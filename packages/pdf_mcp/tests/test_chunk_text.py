@@ -0,0 +1,83 @@
+"""Test the token-bounded page and paragraph chunking of the RAG engine."""
+
+import re
+
+import pytest
+from pdf_mcp.rag_engine import CHUNK_MIN_TOKENS, RagEngine
+from toolbox_store.embedding import approx_token_count
+
+
+@pytest.fixture
+def rag_engine(tmp_path) -> RagEngine:
+    return RagEngine(str(tmp_path))
+
+
+def make_page(page: int, n_paragraphs: int, n_words: int) -> str:
+    return "\n\n".join(
+        f"Page {page} paragraph {k}. " + " ".join(["lorem"] * n_words) + "."
+        for k in range(n_paragraphs)
+    )
+
+
+def test_empty_text_has_no_chunks(rag_engine):
+    assert rag_engine.chunk_text("") == []
+    assert rag_engine.chunk_text(" \n\f\n ") == []
+
+
+def test_chunks_record_their_page_range(rag_engine):
+    pages = [make_page(page, n_paragraphs=6, n_words=60) for page in range(1, 6)]
+    # pdftotext terminates every page with a form feed
+    chunks = rag_engine.chunk_text("\f".join(pages) + "\f")
+
+    assert len(chunks) > 1
+    assert chunks[0].page_start == 1
+    assert chunks[-1].page_end == 5
+    for chunk in chunks:
+        assert chunk.page_start <= chunk.page_end
+        pages_in_text = {int(n) for n in re.findall(r"Page (\d+)", chunk.text)}
+        assert pages_in_text
+        assert min(pages_in_text) >= chunk.page_start
+        assert max(pages_in_text) <= chunk.page_end
+
+
+def test_short_pages_share_a_chunk(rag_engine):
+    pages = [make_page(page, n_paragraphs=1, n_words=10) for page in range(1, 4)]
+    chunks = rag_engine.chunk_text("\f".join(pages))
+
+    assert len(chunks) == 1
+    assert (chunks[0].page_start, chunks[0].page_end) == (1, 3)
+
+
+def test_chunks_stay_within_the_token_budget(rag_engine):
+    pages = [make_page(page, n_paragraphs=9, n_words=45) for page in range(1, 8)]
+    chunks = rag_engine.chunk_text("\f".join(pages))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert approx_token_count(chunk.text) <= rag_engine.chunk_max_tokens
+
+
+def test_small_chunk_is_merged_into_the_previous_one(rag_engine):
+    # The heading on top of page 2 is split off from the long paragraph after it
+    heading = "Chapter two"
+    pages = [
+        " ".join(["lorem"] * 250) + ".",
+        heading + "\n\n" + " ".join(["Ipsum dolor sit amet."] * 120),
+    ]
+    chunks = rag_engine.chunk_text("\f".join(pages))
+
+    assert len(chunks) == 3
+    assert chunks[0].text.endswith(heading)
+    assert (chunks[0].page_start, chunks[0].page_end) == (1, 2)
+    assert (chunks[1].page_start, chunks[1].page_end) == (2, 2)
+
+
+def test_small_chunk_stays_alone_when_merging_exceeds_the_budget(rag_engine):
+    body = " ".join(f"word{i}" for i in range(rag_engine.chunk_max_tokens - 12))
+    tail = " ".join(f"tail{i}" for i in range(30))
+    chunks = rag_engine.chunk_text(body + ".\n\n" + tail + ".")
+
+    assert len(chunks) == 2
+    assert approx_token_count(chunks[-1].text) < CHUNK_MIN_TOKENS
+    for chunk in chunks:
+        assert approx_token_count(chunk.text) <= rag_engine.chunk_max_tokens
@@ -0,0 +1,294 @@
+"""Test the batching of file events and the reconciliation of the PDF index."""
+
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+from pdf_mcp import file_watcher
+from pdf_mcp.file_watcher import (
+    EVENT_DELETED,
+    EVENT_RESCAN,
+    EVENT_UPSERT,
+    DocumentFileWatcher,
+    PDFFileHandler,
+    list_pdf_files,
+)
+from pdf_mcp.indexing_jobs import IndexingJobManager
+from pdf_mcp.rag_engine import DocumentChunk, RagEngine
+
+
+@pytest.fixture
+def documents_dir(tmp_path) -> Path:
+    path = tmp_path / "documents"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def rag_engine(tmp_path) -> RagEngine:
+    return RagEngine(str(tmp_path / "data"))
+
+
+def write_pdf(path: Path, content: bytes = b"%PDF-1.4") -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def add_indexed_document(rag_engine: RagEngine, document_name: str, path=None):
+    chunk = DocumentChunk(
+        id=f"{document_name}-0",
+        document_name=document_name,
+        text="text",
+        embedding=[0.0],
+        chunk_index=0,
+    )
+    rag_engine.replace_document(document_name, [chunk])
+    if path is not None:
+        stat = path.stat()
+        rag_engine.set_file_state(document_name, stat.st_mtime, stat.st_size)
+
+
+def create_watcher(documents_dir: Path, rag_engine: RagEngine) -> DocumentFileWatcher:
+    """A watcher with its queue but without the observer and the workers"""
+    watcher = DocumentFileWatcher(
+        str(documents_dir), rag_engine, IndexingJobManager(rag_engine)
+    )
+    watcher.queue = asyncio.PriorityQueue()
+    watcher._reconcile_lock = asyncio.Lock()
+    return watcher
+
+
+def collect_batches(debounce_delay: float, batch_max_wait: float = 10.0):
+    batches = []
+
+    async def callback(batch):
+        batches.append(batch)
+
+    handler = PDFFileHandler(callback)
+    handler.debounce_delay = debounce_delay
+    handler.batch_max_wait = batch_max_wait
+    return handler, batches
+
+
+def test_list_pdf_files_skips_hidden_files(documents_dir):
+    write_pdf(documents_dir / "a.pdf")
+    write_pdf(documents_dir / "sub" / "B.PDF")
+    write_pdf(documents_dir / ".a.pdf")
+    write_pdf(documents_dir / ".trash" / "c.pdf")
+    (documents_dir / "notes.txt").write_text("not a pdf")
+
+    assert set(list_pdf_files(documents_dir)) == {"a.pdf", "sub/B.PDF"}
+    assert list_pdf_files(documents_dir / "missing") == {}
+
+
+def test_handler_coalesces_a_burst_into_one_batch():
+    handler, batches = collect_batches(debounce_delay=0.05)
+
+    async def burst():
+        handler.record_event(Path("a.pdf"), EVENT_UPSERT)
+        handler.record_event(Path("a.pdf"), EVENT_UPSERT)
+        handler.record_event(Path("b.pdf"), EVENT_UPSERT)
+        handler.record_event(Path("b.pdf"), EVENT_DELETED)
+        handler.record_event(Path("sub"), EVENT_RESCAN)
+        handler.record_event(Path("sub"), EVENT_UPSERT)
+        await handler.flush_task
+
+    asyncio.run(burst())
+
+    # The latest event per path wins, except that a rescan is never downgraded
+    assert batches == [
+        {
+            Path("a.pdf"): EVENT_UPSERT,
+            Path("b.pdf"): EVENT_DELETED,
+            Path("sub"): EVENT_RESCAN,
+        }
+    ]
+
+
+def test_handler_flushes_a_long_burst_after_the_max_wait():
+    handler, batches = collect_batches(debounce_delay=0.2, batch_max_wait=0.3)
+
+    async def steady_stream():
+        for i in range(20):
+            handler.record_event(Path(f"{i}.pdf"), EVENT_UPSERT)
+            await asyncio.sleep(0.05)
+        await handler.flush_task
+
+    asyncio.run(steady_stream())
+
+    # Events never stop for the debounce delay, the max wait still flushes them
+    assert len(batches) > 1
+    assert sum(len(batch) for batch in batches) == 20
+
+
+def test_handler_cancel_drops_pending_events():
+    handler, batches = collect_batches(debounce_delay=0.05)
+
+    async def cancelled_burst():
+        handler.record_event(Path("a.pdf"), EVENT_UPSERT)
+        handler.cancel()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(cancelled_burst())
+
+    assert batches == []
+    assert handler.pending == {}
+
+
+def test_handle_batch_removes_deleted_and_queues_changed_files(
+    documents_dir, rag_engine
+):
+    kept = write_pdf(documents_dir / "sub" / "kept.pdf")
+    hidden = write_pdf(documents_dir / ".hidden.pdf")
+    add_indexed_document(rag_engine, "deleted.pdf")
+    add_indexed_document(rag_engine, "vanished.pdf")
+    rag_engine.set_file_state("deleted.pdf", 1.0, 1)
+
+    async def handle():
+        watcher = create_watcher(documents_dir, rag_engine)
+        await watcher._handle_batch(
+            {
+                documents_dir / "deleted.pdf": EVENT_DELETED,
+                # Modified, but gone by the time the batch is handled
+                documents_dir / "vanished.pdf": EVENT_UPSERT,
+                kept: EVENT_UPSERT,
+                hidden: EVENT_UPSERT,
+            }
+        )
+        return watcher
+
+    watcher = asyncio.run(handle())
+
+    assert rag_engine.list_documents() == []
+    assert rag_engine.get_file_state("deleted.pdf") is None
+    assert list(watcher.queued) == ["sub/kept.pdf"]
+    assert watcher.queue.qsize() == 1
+    assert (rag_engine.data_dir / "chunks.json").exists()
+
+
+def test_handle_batch_reconciles_on_folder_events(documents_dir, rag_engine):
+    write_pdf(documents_dir / "moved" / "a.pdf")
+    write_pdf(documents_dir / "moved" / "b.pdf")
+
+    async def handle():
+        watcher = create_watcher(documents_dir, rag_engine)
+        await watcher._handle_batch({documents_dir / "moved": EVENT_RESCAN})
+        return watcher
+
+    watcher = asyncio.run(handle())
+
+    assert set(watcher.queued) == {"moved/a.pdf", "moved/b.pdf"}
+
+
+def test_reconcile_diffs_the_index_by_mtime_and_size(documents_dir, rag_engine):
+    unchanged = write_pdf(documents_dir / "unchanged.pdf")
+    add_indexed_document(rag_engine, "unchanged.pdf", unchanged)
+
+    resized = write_pdf(documents_dir / "resized.pdf")
+    add_indexed_document(rag_engine, "resized.pdf", resized)
+    write_pdf(resized, b"%PDF-1.4 with more content")
+
+    touched = write_pdf(documents_dir / "touched.pdf")
+    add_indexed_document(rag_engine, "touched.pdf", touched)
+    stat = touched.stat()
+    os.utime(touched, (stat.st_atime, stat.st_mtime + 10))
+
+    # Indexed before file states were recorded, assumed to be up to date
+    legacy = write_pdf(documents_dir / "legacy.pdf")
+    add_indexed_document(rag_engine, "legacy.pdf")
+
+    write_pdf(documents_dir / "sub" / "new.pdf")
+    write_pdf(documents_dir / ".hidden" / "new.pdf")
+    add_indexed_document(rag_engine, "deleted.pdf")
+
+    async def reconcile():
+        watcher = create_watcher(documents_dir, rag_engine)
+        return watcher, await watcher.reconcile()
+
+    watcher, result = asyncio.run(reconcile())
+
+    assert result == {"queued": 3, "removed": 1}
+    assert set(watcher.queued) == {"resized.pdf", "touched.pdf", "sub/new.pdf"}
+    assert "deleted.pdf" not in rag_engine.list_documents()
+    assert rag_engine.get_file_state("legacy.pdf") == {
+        "mtime": legacy.stat().st_mtime,
+        "size": legacy.stat().st_size,
+    }
+
+
+def test_reconcile_skips_unchanged_cancelled_files(documents_dir, rag_engine):
+    cancelled = write_pdf(documents_dir / "cancelled.pdf")
+
+    async def reconcile():
+        watcher = create_watcher(documents_dir, rag_engine)
+        stat = cancelled.stat()
+        watcher.cancelled_states["cancelled.pdf"] = (stat.st_mtime, stat.st_size)
+        skipped = await watcher.reconcile()
+        write_pdf(cancelled, b"%PDF-1.4 changed since")
+        changed = await watcher.reconcile()
+        return skipped, changed
+
+    skipped, changed = asyncio.run(reconcile())
+
+    assert skipped["queued"] == 0
+    assert changed["queued"] == 1
+
+
+def test_workers_save_the_index_once_after_a_burst(
+    documents_dir, rag_engine, monkeypatch
+):
+    monkeypatch.setattr(file_watcher, "FILE_STABILITY_CHECK_DELAY", 0)
+
+    def prepare_document(document_name, data, job=None):
+        chunk = DocumentChunk(f"{document_name}-0", document_name, "text", [0.0], 0)
+        return [chunk]
+
+    saved_documents = []
+
+    async def save_to_disk():
+        saved_documents.append(len(rag_engine.list_documents()))
+
+    monkeypatch.setattr(rag_engine, "prepare_document", prepare_document)
+    monkeypatch.setattr(rag_engine, "save_to_disk", save_to_disk)
+    for i in range(5):
+        write_pdf(documents_dir / f"{i}.pdf")
+
+    async def index():
+        watcher = create_watcher(documents_dir, rag_engine)
+        watcher.workers = [
+            asyncio.create_task(watcher._index_worker(i)) for i in range(2)
+        ]
+        await watcher.reconcile()
+        await watcher.wait_until_idle()
+        await asyncio.sleep(0.05)
+        for worker in watcher.workers:
+            worker.cancel()
+        watcher.job_manager.shutdown()
+
+    asyncio.run(index())
+
+    # Saved once, after both workers finished their last document
+    assert saved_documents == [5]
+
+
+def test_start_reconcile_keeps_the_task_until_done(documents_dir, rag_engine, caplog):
+    write_pdf(documents_dir / "a.pdf")
+
+    async def failing_enqueue(items):
+        raise RuntimeError("queue is gone")
+
+    async def reconcile_in_background():
+        watcher = create_watcher(documents_dir, rag_engine)
+        watcher._enqueue_all = failing_enqueue
+        task = watcher.start_reconcile()
+        assert watcher._background_tasks == {task}
+        await asyncio.wait([task])
+        await asyncio.sleep(0)
+        return watcher
+
+    watcher = asyncio.run(reconcile_in_background())
+
+    assert watcher._background_tasks == set()
+    assert "Background reconciliation failed" in caplog.text
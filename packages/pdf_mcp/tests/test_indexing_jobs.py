@@ -0,0 +1,154 @@
+"""Test the background indexing jobs: cancellation, progress and pruning."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from pdf_mcp import indexing_jobs
+from pdf_mcp.indexing_jobs import (
+    STATUS_CANCELLED,
+    STATUS_COMPLETED,
+    STATUS_FAILED,
+    STATUS_QUEUED,
+    STATUS_RUNNING,
+    IndexingJobManager,
+)
+
+
+class FakeRagEngine:
+    """Prepares one chunk per document, optionally blocking until released"""
+
+    def __init__(self):
+        self.documents = {}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def prepare_document(self, document_name, data, job=None):
+        self.started.set()
+        job.chunks_total = 2
+        self.release.wait(timeout=5)
+        job.check_cancelled()
+        job.chunks_embedded = 2
+        return [data.decode()]
+
+    def replace_document(self, document_name, chunks):
+        self.documents[document_name] = chunks
+
+
+@pytest.fixture
+def rag_engine() -> FakeRagEngine:
+    return FakeRagEngine()
+
+
+@pytest.fixture
+def job_manager(rag_engine):
+    manager = IndexingJobManager(rag_engine, num_workers=2)
+    yield manager
+    manager.shutdown()
+
+
+def test_run_job_swaps_in_the_document(job_manager, rag_engine, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"content")
+    job = job_manager.create_job("a.pdf", path, size=7)
+
+    asyncio.run(job_manager.run_job(job))
+
+    assert job.status == STATUS_COMPLETED
+    assert rag_engine.documents == {"a.pdf": ["content"]}
+    assert job.to_dict()["chunks_embedded"] == 2
+    assert job_manager.active_jobs() == []
+
+
+def test_failed_job_records_the_error(job_manager, rag_engine, tmp_path):
+    path = tmp_path / "empty.pdf"
+    path.write_bytes(b"")
+    job = job_manager.create_job("empty.pdf", path)
+
+    asyncio.run(job_manager.run_job(job))
+
+    assert job.status == STATUS_FAILED
+    assert "empty" in job.error
+    assert rag_engine.documents == {}
+
+
+def test_cancel_queued_job_never_runs(job_manager, rag_engine, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"content")
+    job = job_manager.create_job("a.pdf", path)
+
+    assert job_manager.cancel(job.id)
+    assert job.status == STATUS_CANCELLED
+    asyncio.run(job_manager.run_job(job))
+
+    assert job.status == STATUS_CANCELLED
+    assert not rag_engine.started.is_set()
+    # Finished jobs can't be cancelled again
+    assert not job_manager.cancel(job.id)
+    assert not job_manager.cancel("unknown")
+
+
+def test_cancel_running_job_keeps_the_old_chunks(job_manager, rag_engine, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"new content")
+    rag_engine.documents["a.pdf"] = ["old content"]
+    rag_engine.release.clear()
+    job = job_manager.create_job("a.pdf", path)
+
+    async def cancel_while_running():
+        task = asyncio.create_task(job_manager.run_job(job))
+        await asyncio.to_thread(rag_engine.started.wait, 5)
+        assert job.status == STATUS_RUNNING
+        assert job_manager.cancel_all() == 1
+        rag_engine.release.set()
+        await task
+
+    asyncio.run(cancel_while_running())
+
+    assert job.status == STATUS_CANCELLED
+    assert rag_engine.documents == {"a.pdf": ["old content"]}
+
+
+def test_eta_from_the_embedding_rate(job_manager, tmp_path):
+    job = job_manager.create_job("a.pdf", tmp_path / "a.pdf")
+    assert job.eta_seconds() is None
+
+    job.status = STATUS_RUNNING
+    job.started_at = time.time() - 10
+    job.chunks_total = 40
+    job.chunks_embedded = 10
+
+    assert job.eta_seconds() == pytest.approx(30, abs=1)
+    assert job.to_dict()["eta_seconds"] == pytest.approx(30, abs=1)
+
+
+def test_summary_estimates_the_queue_drain_time(job_manager, tmp_path):
+    job_manager.completed_durations = [4.0, 6.0]
+    running = job_manager.create_job("running.pdf", tmp_path / "running.pdf")
+    running.status = STATUS_RUNNING
+    running.started_at = time.time()
+    for i in range(4):
+        job_manager.create_job(f"{i}.pdf", tmp_path / f"{i}.pdf")
+
+    summary = job_manager.summary()
+
+    assert summary[STATUS_QUEUED] == 4
+    assert summary[STATUS_RUNNING] == 1
+    # The running job has no rate yet: one average duration, plus 4 jobs on 2 workers
+    assert summary["eta_seconds"] == pytest.approx(5.0 + 5.0 * 4 / 2)
+
+
+def test_finished_jobs_are_pruned(job_manager, tmp_path, monkeypatch):
+    monkeypatch.setattr(indexing_jobs, "MAX_FINISHED_JOBS", 3)
+    jobs = [job_manager.create_job(f"{i}.pdf", tmp_path / f"{i}.pdf") for i in range(5)]
+    for job in jobs[:4]:
+        job_manager.cancel(job.id)
+
+    job_manager.create_job("last.pdf", tmp_path / "last.pdf")
+
+    # The oldest finished job is dropped, unfinished jobs are always kept
+    assert jobs[0].id not in job_manager.jobs
+    assert [job.id for job in jobs[1:]] == list(job_manager.jobs)[:4]
+    assert len(job_manager.active_jobs()) == 2
@@ -0,0 +1,63 @@
+"""
+Load test for the nomic embedding server.
+
+Start the server first, e.g. on CPU without a model:
+    USE_MOCK_EMBEDDINGS=true MOCK_SECONDS_PER_TOKEN=0.00001 python slack_mcp/remote_server/nomic_app.py
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+
+WORDS = (
+    "the quick brown fox jumps over the lazy dog while slack messages pile up".split()
+)
+
+
+def random_prompt() -> str:
+    n_words = random.choice([8, 16, 32, 64, 128, 300])
+    return "search_document: " + " ".join(random.choices(WORDS, k=n_words))
+
+
+async def run_client(client: httpx.AsyncClient, n_requests: int, max_prompts: int):
+    latencies = []
+    for _ in range(n_requests):
+        payload = [
+            {"chunk_id": str(uuid.uuid4()), "prompt": random_prompt()}
+            for _ in range(random.randint(1, max_prompts))
+        ]
+        start = time.perf_counter()
+        response = await client.post("/embeddings", json=payload)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=300) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[
+                run_client(client, args.requests, args.max_prompts)
+                for _ in range(args.clients)
+            ]
+        )
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency for result in results for latency in result)
+        print(f"{len(latencies)} requests in {elapsed:.2f}s")
+        print(f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms")
+        print(f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms")
+        print("server metrics", (await client.get("/metrics")).json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8020")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max-prompts", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
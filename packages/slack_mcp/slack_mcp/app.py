@@ -6,6 +6,7 @@ import uvicorn
 from fastapi import FastAPI
 from fastsyftbox import FastSyftBox
 
+from slack_mcp import db
 from slack_mcp.background_worker import run_slack_mesage_dump_background_worker_loop
 from slack_mcp.fastsyftbox_server import config, router
 from slack_mcp.mcp_server import mcp
@@ -15,6 +16,9 @@ from slack_mcp.settings import settings
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with contextlib.AsyncExitStack() as stack:
+        # Run migrations once, before any worker or tool touches the db
+        db.get_connection_manager().initialize()
+        stack.callback(db.close_connections)
         if settings.start_polling_thread:
             thread = Thread(target=run_slack_mesage_dump_background_worker_loop)
             thread.start()
@@ -1,130 +1,320 @@
-import math
 import os
 import time
-from datetime import datetime
+import traceback
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
 
-from slack_sdk import WebClient
-from tqdm import tqdm
+import requests
 
+from slack_mcp.auth import get_syftbox_credentials
 from slack_mcp.db import (
-    get_earliest_timestamp_from_db,
-    get_latest_timestamp_from_db,
+    count_messages_without_embeddings,
+    get_active_threads,
+    get_channel_sync_state,
+    get_channel_sync_states,
     get_slack_connection,
-    upsert_message,
+    get_stored_latest_replies,
+    upsert_channel_sync_state,
+    upsert_messages,
 )
+from slack_mcp.models import ChannelSyncState
 from slack_mcp.overview_utils import (
-    get_channel_messages_with_thread_tree,
+    get_conversations_replies,
     get_my_active_channels_from_search,
+    iter_channel_history_pages,
 )
+from slack_mcp.rate_limit import (
+    PRIORITY_BACKGROUND,
+    RateLimitedWebClient,
+    slack_rate_limiter,
+)
+from slack_mcp.settings import settings
 
 token = os.getenv("SLACK_TOKEN")
 d_cookie = os.getenv("SLACK_D_COOKIE")
 
+# Channels synced at the same time, all share the process wide rate limiter
+SYNC_CONCURRENCY = 4
+# Thread reply fetches in flight across all channels
+THREAD_FETCH_CONCURRENCY = 8
+HISTORY_DAYS = 365
+# History pages per pass above the high-water mark, a larger gap is resumed
+# in the next pass
+INCREMENTAL_MAX_PAGES = 100
+# Stored threads with a reply this recent are checked for new replies
+THREAD_REFRESH_DAYS = 7
+SYNC_INTERVAL_SECONDS = 60
 
-def get_timestamp_batches(from_ts, to_ts, batch_days=30):
-    batch_seconds = batch_days * 24 * 60 * 60
 
-    n_batches = math.ceil((to_ts - from_ts) / batch_seconds)
-    for i in range(n_batches):
-        start = from_ts + i * batch_seconds
-        end = start + batch_seconds
-        yield (start, end)
+def get_webclient():
+    headers = {
+        "Cookie": f"d={d_cookie}",
+        "User-Agent": "Mozilla/5.0 (compatible; Python)",
+    }
+    # Background requests wait behind queued MCP tool requests
+    return RateLimitedWebClient(
+        token=token, headers=headers, priority=PRIORITY_BACKGROUND
+    )
+
 
+def get_threads_to_expand(channel_id, page) -> list[str]:
+    """
+    thread_ts of the threads started in a history page, except threads whose
+    latest reply is the same as when their replies were last stored
+    """
+    latest_replies = {
+        message["thread_ts"]: message.get("latest_reply")
+        for message in page
+        if "thread_ts" in message and message.get("reply_count", 0) > 0
+    }
+    with get_slack_connection(readonly=True) as conn:
+        stored = get_stored_latest_replies(conn, channel_id, list(latest_replies))
+    return [
+        thread_ts
+        for thread_ts, latest_reply in latest_replies.items()
+        if latest_reply is None or stored.get(thread_ts) != latest_reply
+    ]
 
-def get_messages_from_channels(client, channel_ids, from_ts=None, to_ts=None):
-    all_messages_as_tree = []
-    all_messaages_flat = []
 
-    for channel in tqdm(channel_ids):
-        message_tree = get_channel_messages_with_thread_tree(
-            client, channel, max_pages=100, oldest=from_ts, latest=to_ts
+def fetch_thread_replies(
+    client, channel_id, thread_tss: list[str], executor: Executor | None = None
+) -> list[dict]:
+    """Fetch the replies of threads, concurrently if an executor is given"""
+
+    def fetch(thread_ts):
+        return get_conversations_replies(
+            client, channel_id, thread_ts, limit=200, max_pages=20
         )
-        all_messages_as_tree.extend(message_tree)
-        print(f"Got {len(message_tree)} messages for channel {channel}")
 
-    for message in all_messages_as_tree:
-        to_add = [message] + message.get("replies", [])
-        for msg in to_add:
-            msg["channel_id"] = channel
-        all_messaages_flat.extend(to_add)
+    if executor is None:
+        results = map(fetch, thread_tss)
+    else:
+        results = executor.map(fetch, thread_tss)
+    return [reply for replies in results for reply in replies]
 
-    return all_messaages_flat
 
+def expand_page(client, channel_id, page, executor: Executor | None = None):
+    """Add thread replies to a history page and tag every message with its channel"""
+    thread_tss = get_threads_to_expand(channel_id, page)
+    messages = page + fetch_thread_replies(client, channel_id, thread_tss, executor)
+    for message in messages:
+        message["channel_id"] = channel_id
+    # skip bot messages for now
+    return [message for message in messages if "user" in message]
 
-def get_webclient():
-    headers = {
-        "Cookie": f"d={d_cookie}",
-        "User-Agent": "Mozilla/5.0 (compatible; Python)",
-    }
-    return WebClient(token=token, headers=headers)
 
+def write_page(messages, state: ChannelSyncState) -> tuple[int, int]:
+    """Store a page of messages, then move the channel cursors past it"""
+    with get_slack_connection() as conn:
+        counts = upsert_messages(conn, messages)
+        upsert_channel_sync_state(conn, state)
+    return counts
 
-def run_slack_mesage_dump_background_worker_single(
-    conn, client, min_ts, min_batch_length=10 * 60
-):
-    print("getting active channels")
 
-    n_days_since_min_ts = (time.time() - min_ts) // (24 * 60 * 60)
-    channel_ids = get_my_active_channels_from_search(
-        client, last_n_days=n_days_since_min_ts, max_pages=100
-    )
-    earliest_message_ts = get_earliest_timestamp_from_db(conn)
-    latest_message_ts = get_latest_timestamp_from_db(conn)
+def sync_new_messages(
+    client,
+    state: ChannelSyncState,
+    reply_executor: Executor | None = None,
+    max_pages: int = INCREMENTAL_MAX_PAGES,
+) -> tuple[int, int]:
+    """
+    Fetch the messages after the high-water mark, newest first. The first page
+    moves latest_ts, what is left between the old mark and the oldest message
+    fetched is kept as a gap. The next pass closes the gap before it moves the
+    mark again.
+    """
+    n_inserted = n_updated = 0
+    pages_left = max_pages
+    while pages_left > 0:
+        resumed = state.gap_oldest_ts is not None
+        if not resumed:
+            state.gap_oldest_ts, state.gap_latest_ts = state.latest_ts, None
+        for page, has_more in iter_channel_history_pages(
+            client,
+            state.channel_id,
+            oldest=state.gap_oldest_ts,
+            latest=state.gap_latest_ts,
+            max_pages=pages_left,
+        ):
+            pages_left -= 1
+            if page:
+                page_tss = [m["ts"] for m in page]
+                state.latest_ts = max(state.latest_ts, *page_tss, key=float)
+                state.gap_latest_ts = min(page_tss, key=float)
+            if not has_more:
+                state.gap_oldest_ts = state.gap_latest_ts = None
+            inserted, updated = write_page(
+                expand_page(client, state.channel_id, page, reply_executor), state
+            )
+            n_inserted += inserted
+            n_updated += updated
+        # Once a resumed gap is closed, continue with what is new since
+        if not resumed or state.gap_oldest_ts is not None:
+            break
+    return n_inserted, n_updated
 
-    if earliest_message_ts is None:
-        earliest_message_ts = math.inf
-        latest_message_ts = -math.inf
 
-    # get the time batches from now until min_ts, and check if its in the range
-    now = time.time()
-    for batch_start, batch_end in get_timestamp_batches(min_ts, now, batch_days=30):
-        batch_end = min(batch_end, time.time())
+def get_thread_parent(client, channel_id, thread_ts) -> dict | None:
+    """The parent of a thread, with its current reply_count and latest_reply"""
+    result = client.conversations_replies(channel=channel_id, ts=thread_ts, limit=1)
+    return next((m for m in result["messages"] if m["ts"] == thread_ts), None)
 
-        date_str_start = datetime.fromtimestamp(batch_start).strftime("%Y-%m-%d")
-        date_str_end = datetime.fromtimestamp(batch_end).strftime("%Y-%m-%d")
 
-        print(
-            f"Processing batch from {date_str_start} to {date_str_end} for {len(channel_ids)} channels"
+def refresh_active_threads(
+    client,
+    state: ChannelSyncState,
+    posted_before: str,
+    reply_executor: Executor | None = None,
+) -> tuple[int, int]:
+    """
+    New replies to threads started before the high-water mark are not in new
+    history pages. Check the parents of recently active stored threads, and
+    expand the threads whose latest reply changed.
+    """
+    replied_since = time.time() - THREAD_REFRESH_DAYS * 24 * 60 * 60
+    with get_slack_connection(readonly=True) as conn:
+        thread_tss = get_active_threads(
+            conn, state.channel_id, replied_since, posted_before
         )
+    if not thread_tss:
+        return 0, 0
+    fetch = partial(get_thread_parent, client, state.channel_id)
+    if reply_executor is None:
+        parents = map(fetch, thread_tss)
+    else:
+        parents = reply_executor.map(fetch, thread_tss)
+    parents = [parent for parent in parents if parent is not None]
+    changed = set(get_threads_to_expand(state.channel_id, parents))
+    page = [parent for parent in parents if parent["ts"] in changed]
+    return write_page(
+        expand_page(client, state.channel_id, page, reply_executor), state
+    )
 
-        batch_length = batch_end - batch_start
-        if batch_length < min_batch_length:
-            # skip this batch, too short
-            print(
-                f"Skipping batch {date_str_start} to {date_str_end} because it's too short"
-            )
-            continue
 
-        if batch_start >= earliest_message_ts and batch_end <= latest_message_ts:
-            # skip this batch, already indexed
-            print(
-                f"Skipping batch {date_str_start} to {date_str_end} because it's already indexed"
+def sync_channel(
+    client, channel_id: str, min_ts: float, reply_executor: Executor | None = None
+) -> tuple[int, int]:
+    """
+    Fetch new messages since the channel's high-water mark and new replies to
+    older threads, then continue the backfill from its oldest cursor down to
+    min_ts. Returns (inserted, updated). Thread replies are fetched on
+    reply_executor, if given.
+    """
+    started_at = time.time()
+    with get_slack_connection(readonly=True) as conn:
+        state = get_channel_sync_state(conn, channel_id)
+    n_inserted = n_updated = 0
+
+    if state.latest_ts is not None:
+        # Threads started after the mark are expanded with their history page
+        posted_before = state.latest_ts
+        for inserted, updated in [
+            sync_new_messages(client, state, reply_executor),
+            refresh_active_threads(client, state, posted_before, reply_executor),
+        ]:
+            n_inserted += inserted
+            n_updated += updated
+
+    if state.oldest_ts is None or float(state.oldest_ts) > min_ts:
+        # Backfill: older history, resumable page by page
+        for page, has_more in iter_channel_history_pages(
+            client, channel_id, oldest=str(min_ts), latest=state.oldest_ts
+        ):
+            if page:
+                page_tss = [m["ts"] for m in page]
+                state.oldest_ts = min(page_tss, key=float)
+                if state.latest_ts is None:
+                    state.latest_ts = max(page_tss, key=float)
+            if not has_more:
+                state.oldest_ts = str(min_ts)
+                if state.latest_ts is None:
+                    # Empty channel, new messages are fetched from here on
+                    state.latest_ts = str(started_at)
+            inserted, updated = write_page(
+                expand_page(client, channel_id, page, reply_executor), state
             )
-            continue
+            n_inserted += inserted
+            n_updated += updated
 
-        # TODO: this is probably more efficient with search?
-        all_messaages_flat = get_messages_from_channels(
-            client,
-            channel_ids,
-            from_ts=batch_start,
-            to_ts=batch_end,
-        )
+    return n_inserted, n_updated
 
-        print(f"Got {len(all_messaages_flat)} messages, adding to db")
-        for msg in all_messaages_flat:
-            # TODO: fix threading here
-            # skip bot messages for now
-            if "user" not in msg:
-                continue
-            upsert_message(conn, msg)
+
+def get_channels_to_sync(client, min_ts: float) -> list[str]:
+    """
+    Known channels plus channels with recent activity. Search only looks back to the
+    previous sync, so new channels are found without searching the whole history.
+    """
+    with get_slack_connection(readonly=True) as conn:
+        states = get_channel_sync_states(conn)
+    known_channel_ids = [state.channel_id for state in states]
+
+    last_synced_at = max((state.updated_at or 0 for state in states), default=0)
+    search_from_ts = max(min_ts, last_synced_at)
+    n_days = int((time.time() - search_from_ts) // (24 * 60 * 60)) + 1
+    active_channel_ids = get_my_active_channels_from_search(
+        client, last_n_days=n_days, max_pages=100
+    )
+    return list(dict.fromkeys(known_channel_ids + active_channel_ids))
+
+
+def run_slack_mesage_dump_background_worker_single(
+    client,
+    min_ts,
+    concurrency=SYNC_CONCURRENCY,
+    thread_fetch_concurrency=THREAD_FETCH_CONCURRENCY,
+):
+    print("getting active channels")
+    channel_ids = get_channels_to_sync(client, min_ts)
+    print(f"Syncing {len(channel_ids)} channels")
+
+    def sync(channel_id):
+        try:
+            return sync_channel(client, channel_id, min_ts, reply_executor)
+        except Exception:
+            print(f"Failed to sync channel {channel_id}: {traceback.format_exc()}")
+            return 0, 0
+
+    # Reply fetches get their own pool, channel workers block on their results
+    with (
+        ThreadPoolExecutor(
+            max_workers=thread_fetch_concurrency, thread_name_prefix="slack-replies"
+        ) as reply_executor,
+        ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="slack-sync"
+        ) as executor,
+    ):
+        results = list(executor.map(sync, channel_ids))
+
+    n_inserted = sum(inserted for inserted, _ in results)
+    n_updated = sum(updated for _, updated in results)
+    print(f"Added {n_inserted} new messages, updated {n_updated} messages")
+    print(f"Slack API stats: {slack_rate_limiter.get_metrics()}")
+    return n_inserted, n_updated
+
+
+def send_indexer_heartbeat():
+    """Tell the remote indexer how many messages wait for an embedding"""
+    if not settings.indexer_url:
+        return
+    with get_slack_connection(readonly=True) as conn:
+        backlog = count_messages_without_embeddings(conn)
+    email, access_token = get_syftbox_credentials()
+    try:
+        response = requests.post(
+            f"{settings.indexer_url}/heartbeat",
+            json={"email": email, "access_token": access_token, "backlog": backlog},
+            timeout=10,
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Failed to send heartbeat to the indexer: {e}")
 
 
 def run_slack_mesage_dump_background_worker_loop():
-    # check what the last timestamp is locally
-    with get_slack_connection() as conn:
-        client = get_webclient()
+    client = get_webclient()
 
-        while True:
-            min_ts = time.time() - 365 * 24 * 60 * 60  # one year ago
-            run_slack_mesage_dump_background_worker_single(conn, client, min_ts)
-            time.sleep(60)
+    while True:
+        min_ts = time.time() - HISTORY_DAYS * 24 * 60 * 60
+        run_slack_mesage_dump_background_worker_single(client, min_ts)
+        send_indexer_heartbeat()
+        time.sleep(SYNC_INTERVAL_SECONDS)
@@ -0,0 +1,46 @@
+import uuid
+
+from toolbox_store.chat import window_conversations
+
+from slack_mcp.models import Chunk, SlackMessage
+
+
+def conversation_key(message: SlackMessage) -> tuple[str, str]:
+    """Thread replies form their own conversation, everything else is the channel"""
+    if message.thread_ts and message.thread_ts != message.ts:
+        return message.channel_id, message.thread_ts
+    return message.channel_id, ""
+
+
+def window_to_chunk(window: list[SlackMessage], chunk_id=None) -> Chunk:
+    return Chunk(
+        chunk_id=chunk_id or uuid.uuid4(),
+        channel_ids=[message.channel_id for message in window],
+        tss=[message.ts for message in window],
+        chunk_text="\n".join(message.text for message in window),
+    )
+
+
+def chunk_messages(
+    messages: list[SlackMessage],
+    trailing_chunks: dict[tuple[str, str], tuple[str, list[SlackMessage]]]
+    | None = None,
+) -> list[Chunk]:
+    """
+    Group new messages into conversation windows.
+
+    trailing_chunks maps a conversation to the id and messages of its last embedded
+    chunk, that chunk is replaced if the new messages extend it, see
+    toolbox_store.chat.window_conversations.
+    """
+    return [
+        window_to_chunk(window, chunk_id)
+        for chunk_id, window in window_conversations(
+            messages,
+            get_conversation=conversation_key,
+            get_position=lambda m: float(m.ts),
+            get_text=lambda m: m.text,
+            get_time=lambda m: float(m.ts),
+            trailing_windows=trailing_chunks,
+        )
+    ]
@@ -1,15 +1,21 @@
 import json
-import sqlite3
-import uuid
+import time
 from collections import defaultdict
-from contextlib import contextmanager
 from pathlib import Path
 
 import numpy as np
-import sqlite_vec
 from sqlite_vec import serialize_float32
-
-from slack_mcp.models import Chunk, ChunkWithMessages, SlackMessage
+from toolbox_store.chat import MessageChunkTables
+from toolbox_store.connection import ConnectionManager, ConnectionRegistry
+
+from slack_mcp.chunking import chunk_messages, conversation_key
+from slack_mcp.models import (
+    ChannelSyncState,
+    Chunk,
+    ChunkWithMessages,
+    SlackMessage,
+)
+from slack_mcp.settings import settings
 
 HOME = Path.home()
 SLACK_MCP_DB_PATH = HOME / ".slack_mcp" / "db.sqlite"
@@ -17,30 +23,42 @@ SLACK_MCP_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 EMBEDDINGS_TABLE = "message_embeddings_vec"
 EMBEDDINGS_LEN = 768
+# Bumped when stored chunk embeddings are no longer comparable to new queries,
+# older chunks are dropped and embedded again. 1: nomic task prefixes
+EMBEDDINGS_VERSION = 1
+# Unembedded messages grouped into chunks per request for new chunks
+MAX_MESSAGES_PER_GATHER = 1000
 
 
 def deserialize_float32(blob: bytes) -> list[float]:
     return np.frombuffer(blob, dtype=np.float32).tolist()
 
 
-def _get_slack_connection():
-    conn = sqlite3.connect(SLACK_MCP_DB_PATH)
-    conn.row_factory = sqlite3.Row
+_connections = ConnectionRegistry(
+    migrate=lambda conn: create_tables(conn),
+    default_path=lambda: settings.slack_mcp_db_path or SLACK_MCP_DB_PATH,
+)
+
+
+def get_connection_manager(path: Path | None = None) -> ConnectionManager:
+    """The shared connection manager for a database, migrations run on first use"""
+    return _connections.get(path)
+
+
+def get_slack_connection(readonly: bool = False):
+    """
+    Check out a shared connection. Writers are serialized, readonly connections
+    are per thread and can be used while a write is in progress.
+    """
+    return _connections.connect(readonly=readonly)
+
 
-    conn.enable_load_extension(True)
-    sqlite_vec.load(conn)
-    conn.enable_load_extension(False)
-    create_tables(conn)
-    return conn
+def get_connection_stats() -> list[dict]:
+    return _connections.get_stats()
 
 
-@contextmanager
-def get_slack_connection():
-    conn = _get_slack_connection()
-    try:
-        yield conn
-    finally:
-        conn.close()
+def close_connections():
+    _connections.close()
 
 
 def create_tables(conn):
@@ -87,37 +105,104 @@ def create_tables(conn):
         FOREIGN KEY (channel_id, ts) REFERENCES messages(channel_id, ts)
     )
     """)
+    # Per channel sync progress: newest ts fetched, how far back history goes,
+    # and the part of the history below latest_ts that is not fetched yet
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS channel_sync_state (
+        channel_id TEXT PRIMARY KEY,
+        latest_ts TEXT,
+        oldest_ts TEXT,
+        gap_oldest_ts TEXT,
+        gap_latest_ts TEXT,
+        updated_at REAL
+    )
+    """)
+    add_missing_columns(
+        cursor,
+        "channel_sync_state",
+        {"gap_oldest_ts": "TEXT", "gap_latest_ts": "TEXT"},
+    )
+    # Lookups from a message to its chunks, used to find unembedded messages
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_chunk_messages_channel_ts
+    ON chunk_messages (channel_id, ts)
+    """)
+
+    drop_outdated_chunks(cursor)
 
     conn.commit()
 
 
-def get_messages_without_embeddings(conn, limit=10):
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-    SELECT messages.*
-    FROM messages
-    LEFT JOIN chunk_messages ON messages.ts = chunk_messages.ts AND messages.channel_id = chunk_messages.channel_id
-    WHERE chunk_messages.chunk_id IS NULL
-    LIMIT ?
-    """,
-        (limit,),
+def drop_outdated_chunks(cursor):
+    """Drop chunks of an older EMBEDDINGS_VERSION, their messages are chunked again"""
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] >= EMBEDDINGS_VERSION:
+        return
+    cursor.execute(f"DELETE FROM {EMBEDDINGS_TABLE}")
+    cursor.execute("DELETE FROM chunk_messages")
+    cursor.execute(f"PRAGMA user_version = {EMBEDDINGS_VERSION}")
+
+
+def add_missing_columns(cursor, table: str, columns: dict[str, str]):
+    """Add columns to a table created by an older version"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+
+CHUNK_TABLES = MessageChunkTables(
+    EMBEDDINGS_TABLE,
+    key_columns={"channel_id": "channel_id", "ts": "ts"},
+    position="CAST(messages.ts AS REAL)",
+    from_row=SlackMessage.from_sqlite_row,
+)
+
+
+def get_messages_without_embeddings(conn, limit=10) -> list[SlackMessage]:
+    return CHUNK_TABLES.get_messages_without_chunks(conn, limit)
+
+
+def count_messages_without_embeddings(conn) -> int:
+    return CHUNK_TABLES.count_messages_without_chunks(conn)
+
+
+def get_conversation_condition(key: tuple[str, str]) -> tuple[str, tuple[str, str]]:
+    """Messages of a conversation, thread_ts is empty for the channel itself"""
+    condition = (
+        "messages.channel_id = ? "
+        "AND COALESCE(NULLIF(messages.thread_ts, messages.ts), '') = ?"
+    )
+    return condition, key
+
+
+def get_trailing_chunk(
+    conn, channel_id: str, thread_ts: str
+) -> tuple[str, list[SlackMessage]] | None:
+    """
+    The chunk with the latest embedded message of a conversation, and its messages.
+    thread_ts is empty for the channel itself.
+    """
+    return CHUNK_TABLES.get_trailing_chunk(
+        conn, *get_conversation_condition((channel_id, thread_ts))
     )
-    return [SlackMessage.from_sqlite_row(msg) for msg in cursor.fetchall()]
 
 
-def gather_chunks_without_embeddings(conn, limit=10) -> list[Chunk]:
-    messages = get_messages_without_embeddings(conn, limit=limit)
-    chunks = []
-    for message in messages:
-        chunk = Chunk(
-            chunk_id=uuid.uuid4(),
-            channel_ids=[message.channel_id],
-            tss=[message.ts],
-            chunk_text=message.text,
-        )
-        chunks.append(chunk)
-    return chunks
+def gather_chunks_without_embeddings(
+    conn, limit=10, max_messages=MAX_MESSAGES_PER_GATHER
+) -> list[Chunk]:
+    """
+    Group unembedded messages into conversation windows. Windows that extend the
+    last embedded chunk of a conversation reuse its id, so they replace it on upload.
+    """
+    messages = get_messages_without_embeddings(conn, limit=max_messages)
+    trailing_chunks = CHUNK_TABLES.get_trailing_chunks(
+        conn,
+        {conversation_key(message) for message in messages},
+        get_conversation_condition,
+    )
+    return chunk_messages(messages, trailing_chunks)[:limit]
 
 
 def get_matching_chunks(conn, query_embedding: list[float], limit=10) -> list[Chunk]:
@@ -126,15 +211,16 @@ def get_matching_chunks(conn, query_embedding: list[float], limit=10) -> list[Ch
         f"""
     SELECT chunks.chunk_id, chunks.chunk_text, chunks.sample_embedding as embedding, chunk_messages.channel_id, chunk_messages.ts
     FROM (
-    SELECT * FROM {EMBEDDINGS_TABLE} WHERE sample_embedding match ?
-    ORDER BY distance
-    LIMIT ?
+    SELECT chunk_id, chunk_text, sample_embedding, distance FROM {EMBEDDINGS_TABLE}
+    WHERE sample_embedding match ? AND k = ?
     ) as chunks
     JOIN chunk_messages ON chunks.chunk_id = chunk_messages.chunk_id
+    ORDER BY chunks.distance, CAST(chunk_messages.ts AS REAL)
     """,
         (serialize_float32(query_embedding), limit),
     )
     all_rows = cursor.fetchall()
+    # dicts keep insertion order, so chunks stay sorted by distance
     rows_for_chunk = defaultdict(list)
     for row in all_rows:
         rows_for_chunk[row["chunk_id"]].append(row)
@@ -154,29 +240,25 @@ def get_matching_chunks(conn, query_embedding: list[float], limit=10) -> list[Ch
 
 
 def get_chunk_messages(conn, chunks: list[Chunk]) -> list[ChunkWithMessages]:
-    cursor = conn.cursor()
-    res = []
-    for chunk in chunks:
-        where_clauses = " OR ".join(
-            ["(channel_id = ? AND ts = ?)"] * len(chunk.channel_ids)
-        )
-
-        cursor.execute(
-            f"""
-        SELECT * FROM messages WHERE {where_clauses}
-        """,
-            [single for pair in zip(chunk.channel_ids, chunk.tss) for single in pair],
-        )
-        messages = [SlackMessage.from_sqlite_row(msg) for msg in cursor.fetchall()]
-        chunk_with_messages = ChunkWithMessages(
+    """Fetch the messages of all chunks in one query, keeping the order of chunks"""
+    messages = CHUNK_TABLES.get_chunk_messages(
+        conn, [list(zip(chunk.channel_ids, chunk.tss)) for chunk in chunks]
+    )
+    return [
+        ChunkWithMessages(
             chunk_id=chunk.chunk_id,
             channel_ids=chunk.channel_ids,
             tss=chunk.tss,
             chunk_text=chunk.chunk_text,
-            messages=messages,
+            messages=chunk_messages,
         )
-        res.append(chunk_with_messages)
-    return res
+        for chunk, chunk_messages in zip(chunks, messages)
+    ]
+
+
+def delete_chunks(conn, chunk_ids: list[str]):
+    """Remove chunks and their message mapping, without committing"""
+    CHUNK_TABLES.delete_chunks(conn, chunk_ids)
 
 
 def upsert_chunks(conn, chunks: list[Chunk]):
@@ -184,33 +266,18 @@ def upsert_chunks(conn, chunks: list[Chunk]):
         if chunk.embedding is None:
             raise ValueError("Chunk embedding is required")
 
-    cursor = conn.cursor()
-    cursor.executemany(
-        f"""
-    INSERT OR REPLACE INTO {EMBEDDINGS_TABLE} (chunk_id, sample_embedding, chunk_text)
-    VALUES (?, ?, ?)
-    """,
+    CHUNK_TABLES.upsert_chunks(
+        conn,
         [
             (
                 str(chunk.chunk_id),
-                serialize_float32(chunk.embedding),
+                chunk.embedding,
                 chunk.chunk_text,
+                list(zip(chunk.channel_ids, chunk.tss)),
             )
             for chunk in chunks
         ],
     )
-    cursor.executemany(
-        """
-    INSERT OR REPLACE INTO chunk_messages (chunk_id, channel_id, ts)
-    VALUES (?, ?, ?)
-    """,
-        [
-            (str(chunk.chunk_id), channel_id, ts)
-            for chunk in chunks
-            for channel_id, ts in zip(chunk.channel_ids, chunk.tss)
-        ],
-    )
-    conn.commit()
 
 
 def get_message(conn, channel_id, ts) -> SlackMessage:
@@ -224,38 +291,177 @@ def get_message(conn, channel_id, ts) -> SlackMessage:
     return SlackMessage.from_sqlite_row(cursor.fetchone())
 
 
-def upsert_message(conn, message: SlackMessage):
+MESSAGE_COLUMNS = (
+    "channel_id",
+    "user",
+    "type",
+    "ts",
+    "text",
+    "reply_count",
+    "reply_users",
+    "reply_users_count",
+    "latest_reply",
+    "is_locked",
+    "subscribed",
+    "client_msg_id",
+    "team",
+    "parent_user_id",
+    "thread_ts",
+    "blocks",
+    "reactions",
+    "attachments",
+)
+JSON_MESSAGE_COLUMNS = {"reply_users", "blocks", "reactions", "attachments"}
+REQUIRED_MESSAGE_COLUMNS = {"channel_id", "user", "type", "ts", "text"}
+
+UPSERT_MESSAGE_SQL = f"""
+INSERT INTO messages ({", ".join(MESSAGE_COLUMNS)})
+VALUES ({", ".join("?" * len(MESSAGE_COLUMNS))})
+ON CONFLICT (channel_id, ts) DO UPDATE SET
+{", ".join(f"{col} = excluded.{col}" for col in MESSAGE_COLUMNS if col not in ("channel_id", "ts"))}
+"""
+
+
+def json_or_none(x):
+    if x is None:
+        return None
+    return json.dumps(x)
+
+
+def _message_to_row(message: dict) -> tuple:
+    row = []
+    for col in MESSAGE_COLUMNS:
+        if col in REQUIRED_MESSAGE_COLUMNS:
+            row.append(message[col])
+        elif col in JSON_MESSAGE_COLUMNS:
+            row.append(json_or_none(message.get(col)))
+        else:
+            row.append(message.get(col))
+    return tuple(row)
+
+
+def get_existing_message_keys(
+    conn, keys: list[tuple[str, str]]
+) -> set[tuple[str, str]]:
+    """Return the (channel_id, ts) pairs from keys that are already stored"""
+    if not keys:
+        return set()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+    SELECT messages.channel_id, messages.ts
+    FROM json_each(?) AS k
+    JOIN messages
+    ON messages.channel_id = json_extract(k.value, '$[0]')
+    AND messages.ts = json_extract(k.value, '$[1]')
+    """,
+        (json.dumps(keys),),
+    )
+    return {(row["channel_id"], row["ts"]) for row in cursor.fetchall()}
+
+
+def get_stored_latest_replies(
+    conn, channel_id: str, thread_tss: list[str]
+) -> dict[str, str | None]:
+    """Return latest_reply of the stored thread parents among thread_tss"""
+    if not thread_tss:
+        return {}
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+    SELECT messages.ts, messages.latest_reply
+    FROM json_each(?) AS k
+    JOIN messages
+    ON messages.channel_id = ? AND messages.ts = k.value
+    """,
+        (json.dumps(thread_tss), channel_id),
+    )
+    return {row["ts"]: row["latest_reply"] for row in cursor.fetchall()}
+
+
+def get_active_threads(
+    conn, channel_id: str, replied_since: float, posted_before: str
+) -> list[str]:
+    """
+    ts of the stored thread parents posted before posted_before, whose latest
+    stored reply is newer than replied_since
+    """
     cursor = conn.cursor()
+    cursor.execute(
+        """
+    SELECT ts FROM messages
+    WHERE channel_id = ?
+    AND reply_count > 0
+    AND CAST(latest_reply AS REAL) > ?
+    AND CAST(ts AS REAL) <= CAST(? AS REAL)
+    """,
+        (channel_id, replied_since, posted_before),
+    )
+    return [row["ts"] for row in cursor.fetchall()]
+
+
+def upsert_messages(conn, messages: list[dict]) -> tuple[int, int]:
+    """
+    Upsert a batch of messages in a single transaction.
+    Returns (n_inserted, n_updated).
+    """
+    # Last write wins for duplicate keys within a batch, same as sequential upserts
+    rows_by_key = {}
+    for message in messages:
+        rows_by_key[(message["channel_id"], message["ts"])] = _message_to_row(message)
+    if not rows_by_key:
+        return 0, 0
+
+    with conn:
+        existing = get_existing_message_keys(conn, list(rows_by_key))
+        conn.executemany(UPSERT_MESSAGE_SQL, list(rows_by_key.values()))
+
+    n_updated = len(existing)
+    return len(rows_by_key) - n_updated, n_updated
 
-    def json_or_none(x):
-        if x is None:
-            return None
-        return json.dumps(x)
 
+def upsert_message(conn, message: dict):
+    upsert_messages(conn, [message])
+
+
+def get_channel_sync_state(conn, channel_id: str) -> ChannelSyncState:
+    cursor = conn.cursor()
     cursor.execute(
+        "SELECT * FROM channel_sync_state WHERE channel_id = ?", (channel_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return ChannelSyncState(channel_id=channel_id)
+    return ChannelSyncState(**dict(row))
+
+
+def get_channel_sync_states(conn) -> list[ChannelSyncState]:
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM channel_sync_state")
+    return [ChannelSyncState(**dict(row)) for row in cursor.fetchall()]
+
+
+def upsert_channel_sync_state(conn, state: ChannelSyncState):
+    conn.execute(
         """
-    INSERT OR REPLACE INTO messages (channel_id, user, type, ts, text, reply_count, reply_users, reply_users_count, latest_reply, is_locked, subscribed, client_msg_id, team, parent_user_id, thread_ts, blocks, reactions, attachments)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    INSERT INTO channel_sync_state (
+        channel_id, latest_ts, oldest_ts, gap_oldest_ts, gap_latest_ts, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (channel_id) DO UPDATE SET
+    latest_ts = excluded.latest_ts,
+    oldest_ts = excluded.oldest_ts,
+    gap_oldest_ts = excluded.gap_oldest_ts,
+    gap_latest_ts = excluded.gap_latest_ts,
+    updated_at = excluded.updated_at
     """,
         (
-            message["channel_id"],
-            message["user"],
-            message["type"],
-            message["ts"],
-            message["text"],
-            message.get("reply_count", None),
-            json_or_none(message.get("reply_users", None)),
-            message.get("reply_users_count", None),
-            message.get("latest_reply", None),
-            message.get("is_locked", None),
-            message.get("subscribed", None),
-            message.get("client_msg_id", None),
-            message.get("team", None),
-            message.get("parent_user_id", None),
-            message.get("thread_ts", None),
-            json_or_none(message.get("blocks", None)),
-            json_or_none(message.get("reactions", None)),
-            json_or_none(message.get("attachments", None)),
+            state.channel_id,
+            state.latest_ts,
+            state.oldest_ts,
+            state.gap_oldest_ts,
+            state.gap_latest_ts,
+            time.time(),
         ),
     )
     conn.commit()
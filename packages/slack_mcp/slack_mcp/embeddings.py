@@ -1,40 +1,106 @@
 import os
+import threading
 
 import requests
+from cachetools import LRUCache
+from loguru import logger
 
 OLLAMA_PORT = os.getenv("OLLAMA_PORT", 11434)
 OLLAMA_URL = f"http://localhost:{OLLAMA_PORT}"
 
+EMBEDDING_MODEL = "nomic-embed-text:v1.5"
+# nomic-embed-text is trained with task prefixes, queries and documents differ
+QUERY_PREFIX = "search_query: "
+DOCUMENT_PREFIX = "search_document: "
 
-def get_embedding(query: str) -> list[float]:
-    """get the embedding for a query using Ollama API v1.5"""
-    import subprocess
-
-    try:
-        subprocess.run(
-            ["ollama", "pull", "nomic-embed-text:v1.5"],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+QUERY_CACHE_SIZE = 256
+
+
+class OllamaEmbeddingClient:
+    """
+    Embeds queries with Ollama over a pooled HTTP session. Documents are embedded
+    by the remote indexer, with DOCUMENT_PREFIX.
+    The model is checked (and pulled if missing) once, and again after a failure.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_URL, model: str = EMBEDDING_MODEL):
+        self.base_url = base_url
+        self.model = model
+        self.session = requests.Session()
+        self._model_ready = False
+        self._model_lock = threading.Lock()
+        self._query_cache: LRUCache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+        self._query_cache_lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether the Ollama server responds"""
+        try:
+            response = self.session.get(self.base_url, timeout=2)
+            response.raise_for_status()
+            return True
+        except Exception:
+            return False
+
+    def ensure_model(self):
+        with self._model_lock:
+            if self._model_ready:
+                return
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=10)
+            response.raise_for_status()
+            local_models = {m["name"] for m in response.json().get("models", [])}
+            if self.model not in local_models:
+                logger.info(f"Pulling {self.model}, this only happens once")
+                response = self.session.post(
+                    f"{self.base_url}/api/pull",
+                    json={"model": self.model, "stream": False},
+                    timeout=600,
+                )
+                response.raise_for_status()
+            self._model_ready = True
+
+    def _embed(self, inputs: list[str]) -> list[list[float]]:
+        response = self.session.post(
+            f"{self.base_url}/api/embed",
+            json={"model": self.model, "input": inputs},
+            timeout=60,
         )
-    except Exception:
-        pass
+        response.raise_for_status()
+        data = response.json()
+        embeddings = data.get("embeddings")
+        if not isinstance(embeddings, list) or len(embeddings) != len(inputs):
+            raise ValueError(f"No embeddings returned from Ollama: {data}")
+        return embeddings
 
-    payload = {"model": "nomic-embed-text:v1.5", "prompt": query}
-    response = requests.post(f"{OLLAMA_URL}/api/embeddings", json=payload, timeout=10)
-    response.raise_for_status()
-    data = response.json()
-    embedding = data.get("embedding")
-    if embedding is None or not isinstance(embedding, list):
-        raise ValueError(f"No embedding returned from Ollama: {data}")
-    return embedding
+    def embed(self, inputs: list[str]) -> list[list[float]]:
+        """Embed inputs as they are, in a single request"""
+        self.ensure_model()
+        try:
+            return self._embed(inputs)
+        except requests.HTTPError:
+            # The model may have been removed, check again and retry once
+            self._model_ready = False
+            self.ensure_model()
+            return self._embed(inputs)
+
+    def embed_query(self, query: str) -> list[float]:
+        """Embed a search query, recent queries are cached"""
+        with self._query_cache_lock:
+            embedding = self._query_cache.get(query)
+        if embedding is None:
+            embedding = self.embed([QUERY_PREFIX + query])[0]
+            with self._query_cache_lock:
+                self._query_cache[query] = embedding
+        return embedding
+
+
+embedding_client = OllamaEmbeddingClient()
+
+
+def get_embedding(query: str) -> list[float]:
+    """get the embedding for a search query using Ollama"""
+    return embedding_client.embed_query(query)
 
 
 def ollama_available() -> bool:
     """check if ollama is available"""
-    try:
-        response = requests.get(OLLAMA_URL, timeout=10)
-        response.raise_for_status()
-        return True
-    except Exception:
-        return False
+    return embedding_client.available()
@@ -11,9 +11,17 @@ from slack_mcp import db
 from slack_mcp.auth import authenticate
 from slack_mcp.db import get_slack_connection
 from slack_mcp.models import Chunk
+from slack_mcp.rate_limit import slack_rate_limiter
 from slack_mcp.settings import settings
+from slack_mcp.wire import (
+    PackedEmbeddings,
+    negotiate_version,
+    pack_chunks,
+    unpack_embedded_chunks,
+)
 
 APP_NAME = "slack-mcp"
+MAX_CHUNKS_PER_REQUEST = 500
 
 
 print("settings.dev_mode", settings.dev_mode)
@@ -42,28 +50,54 @@ def root():
 # normal fastapi
 @router.post("/healthcheck")
 def healthcheck():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "db": db.get_connection_stats(),
+        "slack_api": slack_rate_limiter.get_metrics(),
+    }
+
+
+class GetNewChunksRequest(BaseModel):
+    limit: int = 10
+    # Highest wire format the indexer understands, see slack_mcp.wire
+    wire_version: int = 0
 
 
 class GetNewChunksResponse(BaseModel):
     chunks: list[Chunk]
+    # Messages still waiting for an embedding, including the ones in chunks
+    backlog: int | None = None
+    wire_version: int = 0
+    # Replaces chunks from wire version 1 on
+    packed_chunks: str | None = None
 
 
 @router.post("/get_new_chunks", tags=["syftbox"])
 def get_new_chunks(
+    request: GetNewChunksRequest | None = None,
     limit: int = 10,
     current_user_email: str = Depends(authenticate),
 ) -> GetNewChunksResponse:
+    wire_version = 0
+    if request is not None:
+        limit = request.limit
+        wire_version = negotiate_version(request.wire_version)
+    limit = min(limit, MAX_CHUNKS_PER_REQUEST)
     try:
-        with get_slack_connection() as conn:
+        with get_slack_connection(readonly=True) as conn:
             chunks = db.gather_chunks_without_embeddings(conn, limit=limit)
-        print(f"returning {len(chunks)} chunks")
-        if len(chunks) > 0:
-            res = GetNewChunksResponse(chunks=chunks)
-            return res.model_dump(mode="json")
+            backlog = db.count_messages_without_embeddings(conn)
+        print(f"returning {len(chunks)} chunks, {backlog} messages to embed")
+        if wire_version >= 1:
+            res = GetNewChunksResponse(
+                chunks=[],
+                backlog=backlog,
+                wire_version=wire_version,
+                packed_chunks=pack_chunks(chunks),
+            )
         else:
-            print("returning empty chunks")
-            return GetNewChunksResponse(chunks=[]).model_dump(mode="json")
+            res = GetNewChunksResponse(chunks=chunks, backlog=backlog)
+        return res.model_dump(mode="json")
     except Exception as e:
         import traceback
 
@@ -86,6 +120,22 @@ def upload_embeddings(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/upload_embeddings_packed", tags=["syftbox"])
+def upload_embeddings_packed(
+    packed: PackedEmbeddings,
+    current_user_email: str = Depends(authenticate),
+):
+    try:
+        chunks = unpack_embedded_chunks(packed)
+        with get_slack_connection() as conn:
+            db.upsert_chunks(conn, chunks)
+    except Exception as e:
+        import traceback
+
+        logger.error(f"Error submitting chunks: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 app = FastSyftBox(
     app_name=APP_NAME,
     syftbox_config=config,
@@ -103,7 +153,6 @@ app.enable_debug_tool(
 
 
 if __name__ == "__main__":
-    with get_slack_connection() as conn:
-        db.create_tables(conn)
+    db.get_connection_manager().initialize()
     print(settings)
     uvicorn.run(app, host="0.0.0.0", port=8004)
@@ -3,7 +3,6 @@ import os
 import traceback
 
 from mcp.server.fastmcp import FastMCP
-from slack_sdk import WebClient
 
 from slack_mcp import db
 from slack_mcp.embeddings import get_embedding, ollama_available
@@ -11,7 +10,9 @@ from slack_mcp.models import ChunkWithMessages, NamesMatchResponse
 from slack_mcp.overview_utils import (
     get_my_active_channels_from_search,
 )
+from slack_mcp.rate_limit import PRIORITY_INTERACTIVE, RateLimitedWebClient
 from slack_mcp.utils import (
+    channel_name_index,
     compute_channelid_to_name_cached,
     get_favourite_channel_ids,
     get_matches_for_name,
@@ -28,7 +29,10 @@ token = os.getenv("SLACK_TOKEN")
 d_cookie = os.getenv("SLACK_D_COOKIE")
 
 headers = {"Cookie": f"d={d_cookie}", "User-Agent": "Mozilla/5.0 (compatible; Python)"}
-client = WebClient(token=token, headers=headers)
+# Tool calls go ahead of the background sync when both wait for the same method
+client = RateLimitedWebClient(
+    token=token, headers=headers, priority=PRIORITY_INTERACTIVE
+)
 
 logger = logging.getLogger(__name__)
 
@@ -38,12 +42,9 @@ def get_channel_id_for_name(query: str) -> dict:
     """get the channel id for a name **of a channel or user**. on slack"""
     try:
         favourite_channel_ids = get_favourite_channel_ids(client)
-        channel_to_name, _ = compute_channelid_to_name_cached(client)
-        favourite_names = [channel_to_name[x] for x in favourite_channel_ids]
-        name2channelid = {v: k for k, v in channel_to_name.items()}
-        all_names = list(name2channelid.keys())
+        channel_name_index.refresh(client)
         result: NamesMatchResponse = get_matches_for_name(
-            query, favourite_names, all_names, name2channelid
+            query, favourite_channel_ids, channel_name_index
         )
         res = result.model_dump_json()
     except Exception:
@@ -138,7 +139,7 @@ def rag(query: str) -> dict:
         if not ollama_available():
             print("Ollama is not available")
             raise ValueError("Ollama is not available")
-        with db.get_slack_connection() as conn:
+        with db.get_slack_connection(readonly=True) as conn:
             query_embedding = get_embedding(query)
             chunks = db.get_matching_chunks(
                 conn, query_embedding=query_embedding, limit=limit
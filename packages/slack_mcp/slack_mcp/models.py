@@ -62,5 +62,20 @@ class SlackMessage(BaseModel):
         return cls(**data)
 
 
+class ChannelSyncState(BaseModel):
+    """
+    Sync cursors of a channel, everything between oldest_ts and latest_ts is
+    stored, except the messages between gap_oldest_ts and gap_latest_ts
+    """
+
+    channel_id: str
+    latest_ts: str | None = None
+    oldest_ts: str | None = None
+    gap_oldest_ts: str | None = None
+    # None while the first page of the gap is not fetched, the gap is open ended
+    gap_latest_ts: str | None = None
+    updated_at: float | None = None
+
+
 class ChunkWithMessages(Chunk):
     messages: list[SlackMessage]
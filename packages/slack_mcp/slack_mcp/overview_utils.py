@@ -9,9 +9,8 @@ def get_my_active_channels_from_search(client, last_n_days=7, max_pages=50):
     current_page = 1
     after_date = (datetime.now() - timedelta(days=last_n_days)).strftime("%Y-%m-%d")
     query = f"after:{after_date}"  # filter messages after this date
-    MAX_RATE_LIMIT_RETRIES = 20
-    rate_limit_retries = 0
     while current_page <= max_pages:
+        # Rate limits are waited out by the client, see slack_mcp.rate_limit
         try:
             response = client.search_messages(
                 query=query,
@@ -20,33 +19,22 @@ def get_my_active_channels_from_search(client, last_n_days=7, max_pages=50):
                 count=100,
                 page=current_page,
             )
+        except SlackApiError as e:
+            print(f"Slack API Error: {e.response}")
+            break
 
-            matches = response["messages"]["matches"]
-            for match in matches:
-                channel_id = match["channel"]["id"]
-                active_channel_ids.add(channel_id)
-
-            paging = response["messages"].get("paging", {})
-            total_pages = paging.get("pages", 1)
+        matches = response["messages"]["matches"]
+        for match in matches:
+            channel_id = match["channel"]["id"]
+            active_channel_ids.add(channel_id)
 
-            if current_page >= total_pages:
-                break
+        paging = response["messages"].get("paging", {})
+        total_pages = paging.get("pages", 1)
 
-            current_page += 1
+        if current_page >= total_pages:
+            break
 
-        except SlackApiError as e:
-            if (
-                e.response["error"] == "ratelimited"
-                and rate_limit_retries < MAX_RATE_LIMIT_RETRIES
-            ):
-                rate_limit_retries += 1
-                print(
-                    "Got rate limited by slack, sleeping for 60 seconds and continuing"
-                )
-                time.sleep(60)
-            else:
-                print(f"Slack API Error: {e.response}")
-                break
+        current_page += 1
 
     return list(active_channel_ids)
 
@@ -55,66 +43,59 @@ def get_channel_messages(client, channel_id, oldest=None, latest=None, max_pages
     messages = []
     cursor = None
     current_page = 1
-    MAX_RATE_LIMIT_RETRIES = 20
-    rate_limit_retries = 0
     while current_page <= max_pages:
-        try:
-            history = client.conversations_history(
-                channel=channel_id,
-                oldest=oldest,
-                latest=latest,
-                limit=1000,
-                cursor=cursor,
-                page=current_page,
-            )
-            messages.extend(history["messages"])
-            current_page += 1
-            cursor = history.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
-        except SlackApiError as e:
-            if (
-                e.response["error"] == "ratelimited"
-                and rate_limit_retries < MAX_RATE_LIMIT_RETRIES
-            ):
-                rate_limit_retries += 1
-                print(
-                    "Got rate limited by slack, sleeping for 60 seconds and continuing"
-                )
-                time.sleep(60)
-            else:
-                raise e
+        history = client.conversations_history(
+            channel=channel_id,
+            oldest=oldest,
+            latest=latest,
+            limit=1000,
+            cursor=cursor,
+            page=current_page,
+        )
+        messages.extend(history["messages"])
+        current_page += 1
+        cursor = history.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
     return messages
 
 
+def iter_channel_history_pages(
+    client, channel_id, oldest=None, latest=None, limit=200, max_pages=100
+):
+    """
+    Yield conversations.history pages, newest first. Rate limits are waited out
+    by the client.
+    """
+    cursor = None
+    for _ in range(max_pages):
+        history = client.conversations_history(
+            channel=channel_id,
+            oldest=oldest,
+            latest=latest,
+            limit=limit,
+            cursor=cursor,
+        )
+        cursor = history.get("response_metadata", {}).get("next_cursor")
+        yield history["messages"], bool(cursor)
+        if not cursor:
+            break
+
+
 def get_conversations_replies(client, channel_id, ts, limit=1000, max_pages=50):
     current_page = 1
     replies = []
-    MAX_RATE_LIMIT_RETRIES = 20
-    rate_limit_retries = 0
+    cursor = None
     while current_page <= max_pages:
-        try:
-            replies_result = client.conversations_replies(
-                channel=channel_id, ts=ts, limit=limit
-            )
-            # Skip the first message (it's the same as the parent)
-            replies.extend(replies_result["messages"][1:])
-            current_page += 1
-            cursor = replies_result.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
-        except SlackApiError as e:
-            if (
-                e.response["error"] == "ratelimited"
-                and rate_limit_retries < MAX_RATE_LIMIT_RETRIES
-            ):
-                rate_limit_retries += 1
-                print(
-                    "Got rate limited by slack, sleeping for 60 seconds and continuing"
-                )
-                time.sleep(60)
-            else:
-                raise e
+        replies_result = client.conversations_replies(
+            channel=channel_id, ts=ts, limit=limit, cursor=cursor
+        )
+        # Skip the parent, it is returned along with the replies
+        replies.extend(m for m in replies_result["messages"] if m["ts"] != ts)
+        current_page += 1
+        cursor = replies_result.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
     return replies
 
 
@@ -124,50 +105,36 @@ def get_channel_messages_with_thread_tree(
     messages = []
     cursor = None
     current_page = 1
-    MAX_RATE_LIMIT_RETRIES = 20
-    rate_limit_retries = 0
     while current_page <= max_pages:
-        try:
-            history = client.conversations_history(
-                channel=channel_id,
-                oldest=oldest,
-                latest=latest,
-                limit=1000,
-                cursor=cursor,
-            )
+        history = client.conversations_history(
+            channel=channel_id,
+            oldest=oldest,
+            latest=latest,
+            limit=1000,
+            cursor=cursor,
+        )
 
-            for message in history["messages"]:
-                # Initialize thread replies as an empty list
-                message["replies"] = []
-
-                # Check if the message starts a thread
-                if "thread_ts" in message and message.get("reply_count", 0) > 0:
-                    replies = get_conversations_replies(
-                        client,
-                        channel_id,
-                        message["thread_ts"],
-                        limit=100,
-                        max_pages=20,
-                    )
-                    message["replies"].extend(replies)
+        for message in history["messages"]:
+            # Initialize thread replies as an empty list
+            message["replies"] = []
+
+            # Check if the message starts a thread
+            if "thread_ts" in message and message.get("reply_count", 0) > 0:
+                replies = get_conversations_replies(
+                    client,
+                    channel_id,
+                    message["thread_ts"],
+                    limit=100,
+                    max_pages=20,
+                )
+                message["replies"].extend(replies)
 
-                messages.append(message)
+            messages.append(message)
 
-            cursor = history.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
-        except SlackApiError as e:
-            if (
-                e.response["error"] == "ratelimited"
-                and rate_limit_retries < MAX_RATE_LIMIT_RETRIES
-            ):
-                rate_limit_retries += 1
-                print(
-                    "Got rate limited by slack, sleeping for 60 seconds and continuing"
-                )
-                time.sleep(60)
-            else:
-                raise e
+        current_page += 1
+        cursor = history.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
 
     return messages
 
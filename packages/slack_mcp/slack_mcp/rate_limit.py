@@ -0,0 +1,230 @@
+import heapq
+import itertools
+import threading
+import time
+
+from loguru import logger
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+
+# Requests per minute of Slack's rate limit tiers
+# https://api.slack.com/apis/rate-limits
+TIER_LIMITS_PER_MINUTE = {1: 1, 2: 20, 3: 50, 4: 100}
+DEFAULT_TIER = 3
+
+SLACK_METHOD_TIERS = {
+    "conversations.history": 3,
+    "conversations.replies": 3,
+    "conversations.list": 2,
+    "conversations.info": 3,
+    "search.messages": 2,
+    "stars.list": 3,
+    "users.list": 2,
+    "users.info": 4,
+    # Special tier, roughly one message per second
+    "chat.postMessage": 4,
+}
+
+# Stay a bit under the documented limits, they are enforced per workspace
+SAFETY_FACTOR = 0.9
+# Requests that can go out at once after a quiet period, as a fraction of a minute
+BURST_FRACTION = 1 / 6
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+MAX_RATE_LIMIT_RETRIES = 5
+DEFAULT_RETRY_AFTER_SECONDS = 30.0
+# Upper bound for a single wait, so waiters re-check the queue regularly
+MAX_WAIT_SECONDS = 1.0
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`, one token per request"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if now <= self.updated_at:
+            return
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def time_until_available(self, now: float) -> float:
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float, now: float):
+        """Hand out nothing for `seconds`, then start again from an empty bucket"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated_at = self.blocked_until
+
+
+class SlackRateLimiter:
+    """
+    Schedules Slack API calls of all clients in the process.
+
+    Every method has a token bucket sized to its Slack tier. Callers wait in a
+    per-method priority queue, so interactive requests go ahead of queued
+    background requests for the same method. A 429 blocks the method's bucket
+    for the Retry-After period.
+    """
+
+    def __init__(
+        self,
+        method_tiers: dict[str, int] = SLACK_METHOD_TIERS,
+        safety_factor: float = SAFETY_FACTOR,
+    ):
+        self.method_tiers = method_tiers
+        self.safety_factor = safety_factor
+        self._cond = threading.Condition()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._queues: dict[str, list[tuple[int, int]]] = {}
+        self._tickets = itertools.count()
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def limit_per_minute(self, method: str) -> float:
+        tier = self.method_tiers.get(method, DEFAULT_TIER)
+        return TIER_LIMITS_PER_MINUTE[tier] * self.safety_factor
+
+    def _bucket(self, method: str) -> TokenBucket:
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            per_minute = self.limit_per_minute(method)
+            bucket = TokenBucket(
+                rate=per_minute / 60, capacity=max(1.0, per_minute * BURST_FRACTION)
+            )
+            self._buckets[method] = bucket
+        return bucket
+
+    def _method_stats(self, method: str) -> dict[str, float]:
+        return self._stats.setdefault(
+            method,
+            {"calls": 0, "rate_limited": 0, "wait_seconds": 0.0, "max_wait": 0.0},
+        )
+
+    def acquire(self, method: str, priority: int = PRIORITY_BACKGROUND) -> float:
+        """Block until a request to `method` may be sent, returns the seconds waited"""
+        start = time.monotonic()
+        ticket = (priority, next(self._tickets))
+        with self._cond:
+            bucket = self._bucket(method)
+            queue = self._queues.setdefault(method, [])
+            heapq.heappush(queue, ticket)
+            try:
+                while True:
+                    wait = bucket.time_until_available(time.monotonic())
+                    if queue[0] == ticket and wait <= 0:
+                        break
+                    self._cond.wait(timeout=min(max(wait, 0.01), MAX_WAIT_SECONDS))
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                # The next ticket in line may be able to go
+                self._cond.notify_all()
+            bucket.take()
+
+            waited = time.monotonic() - start
+            stats = self._method_stats(method)
+            stats["calls"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+        return waited
+
+    def report_rate_limited(self, method: str, retry_after: float):
+        """Slack answered 429, hold all requests to `method` for retry_after seconds"""
+        with self._cond:
+            self._bucket(method).block(retry_after, time.monotonic())
+            self._method_stats(method)["rate_limited"] += 1
+            self._cond.notify_all()
+
+    def get_metrics(self) -> dict[str, dict[str, float]]:
+        with self._cond:
+            now = time.monotonic()
+            res = {}
+            for method, stats in self._stats.items():
+                bucket = self._buckets[method]
+                calls = stats["calls"]
+                res[method] = {
+                    "calls": calls,
+                    "rate_limited": stats["rate_limited"],
+                    "queued": len(self._queues.get(method, [])),
+                    "limit_per_minute": round(bucket.rate * 60, 2),
+                    "tokens": round(max(bucket.tokens, 0.0), 2),
+                    "blocked_for_seconds": round(
+                        max(bucket.blocked_until - now, 0.0), 2
+                    ),
+                    "avg_wait_ms": round(stats["wait_seconds"] / calls * 1000, 3)
+                    if calls
+                    else 0.0,
+                    "max_wait_ms": round(stats["max_wait"] * 1000, 3),
+                }
+            return res
+
+
+slack_rate_limiter = SlackRateLimiter()
+
+
+def get_retry_after(response: SlackResponse) -> float:
+    headers = response.headers or {}
+    value = headers.get("Retry-After", headers.get("retry-after"))
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
+
+
+class RateLimitedWebClient(WebClient):
+    """
+    WebClient that sends every API call through a shared SlackRateLimiter and
+    retries calls that are rate limited anyway after their Retry-After.
+    """
+
+    def __init__(
+        self,
+        *args,
+        priority: int = PRIORITY_BACKGROUND,
+        rate_limiter: SlackRateLimiter | None = None,
+        max_rate_limit_retries: int = MAX_RATE_LIMIT_RETRIES,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.priority = priority
+        self.rate_limiter = rate_limiter or slack_rate_limiter
+        self.max_rate_limit_retries = max_rate_limit_retries
+
+    def api_call(self, api_method: str, **kwargs) -> SlackResponse:
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(api_method, self.priority)
+            try:
+                return super().api_call(api_method, **kwargs)
+            except SlackApiError as e:
+                if (
+                    e.response.status_code != 429
+                    or attempt >= self.max_rate_limit_retries
+                ):
+                    raise
+                attempt += 1
+                retry_after = get_retry_after(e.response)
+                logger.warning(
+                    f"Rate limited by slack on {api_method}, retrying in {retry_after}s"
+                )
+                self.rate_limiter.report_rate_limited(api_method, retry_after)
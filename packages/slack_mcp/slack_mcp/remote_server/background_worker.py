@@ -1,46 +1,49 @@
 import threading
-import time
 import traceback
 from concurrent.futures import ThreadPoolExecutor
 
 import httpx
 import requests
 from fastsyftbox.simple_client import SimpleRPCClient
+from slack_mcp.embeddings import DOCUMENT_PREFIX
 from slack_mcp.models import Chunk
 from slack_mcp.remote_server import server_db as db
+from slack_mcp.remote_server.dispatcher import dispatcher
 from slack_mcp.remote_server.server_models import EmbeddingRequest
 from slack_mcp.remote_server.server_settings import settings
 from slack_mcp.remote_server.user_polling_manager import UserPollingManager
 from slack_mcp.syftbox_client import create_authenticated_client
+from slack_mcp.wire import WIRE_VERSION, pack_embedded_chunks, unpack_chunks
 
-ACTIVITY_THRESHOLD_SECONDS = 10
-EMBEDDING_POLL_INTERVAL = 1
+# Users indexed at the same time, also the size of the indexer thread pool
+INDEXER_CONCURRENCY = 3
+CHUNK_PAGE_SIZE = 200
+# Pages pulled from a user before others get a turn
+MAX_PAGES_PER_TURN = 5
 
 
-def poll_for_chunks_to_index(stop_event: threading.Event, executor: ThreadPoolExecutor):
+def poll_for_chunks_to_index(
+    stop_event: threading.Event,
+    executor: ThreadPoolExecutor,
+    max_concurrent_users: int = INDEXER_CONCURRENCY,
+):
     with db.get_indexer_db() as conn:
         polling_manager = UserPollingManager(executor)
         while not stop_event.is_set():
             users = db.get_users(conn)
-            users_already_processed = set()
-            users_inactive = set()
-            for user in users:
-                if (
-                    db.active_since(conn, user.email, ACTIVITY_THRESHOLD_SECONDS)
-                    or True
-                ):
-                    future = polling_manager.submit_job(
-                        user.id, _poll_for_new_chunks, (user.id,)
-                    )
-                    if future is not None:
-                        print(f"Polling for new slack messages for user {user.email}")
-                    else:
-                        users_already_processed.add(user.email)
-                else:
-                    users_inactive.add(user.email)
             if len(users) == 0:
                 print("No users found to emebed")
-            time.sleep(EMBEDDING_POLL_INTERVAL)
+            dispatcher.sync_users([user.id for user in users])
+
+            running = polling_manager.get_active_users()
+            n_free = max_concurrent_users - len(running)
+            for user_id in dispatcher.next_users(n_free, exclude=running):
+                polling_manager.submit_job(user_id, _index_user_turn, (user_id,))
+
+            running = polling_manager.get_active_users()
+            dispatcher.wait(
+                stop_event, running, full=len(running) >= max_concurrent_users
+            )
 
         # Shutdown the polling manager when the main polling loop stops
         polling_manager.shutdown()
@@ -55,7 +58,7 @@ def embed(chunks: list[Chunk]) -> list[float]:
             f"{settings.nomic_url}:{settings.nomic_port}/embeddings",
             json=[
                 EmbeddingRequest(
-                    chunk_id=chunk.chunk_id, prompt=chunk.chunk_text
+                    chunk_id=chunk.chunk_id, prompt=DOCUMENT_PREFIX + chunk.chunk_text
                 ).model_dump(mode="json")
                 for chunk in chunks
             ],
@@ -65,70 +68,98 @@ def embed(chunks: list[Chunk]) -> list[float]:
         return [embedding["embedding"] for embedding in response.json()]
 
 
-def upload_embeddings(client: SimpleRPCClient, embeddings: list[Chunk]):
-    client.post(
-        "upload_embeddings/",
-        json=[x.model_dump(mode="json") for x in embeddings],
+class EmbeddingError(Exception):
+    """The embedding server failed, as opposed to the user's client"""
+
+
+def upload_embeddings(
+    client: SimpleRPCClient, embeddings: list[Chunk], wire_version: int = 0
+):
+    if wire_version >= 1:
+        packed = pack_embedded_chunks(embeddings, dtype=settings.embedding_wire_dtype)
+        response = client.post(
+            "upload_embeddings_packed/", json=packed.model_dump(mode="json")
+        )
+    else:
+        response = client.post(
+            "upload_embeddings/",
+            json=[x.model_dump(mode="json") for x in embeddings],
+        )
+    response.raise_for_status()
+
+
+def get_new_chunks(client: SimpleRPCClient) -> tuple[list[Chunk], int | None, int]:
+    """
+    Pull a page of chunks. Returns the chunks, the user's backlog (None from
+    older clients) and the wire version the client agreed to.
+    """
+    result = client.post(
+        "get_new_chunks/", json={"limit": CHUNK_PAGE_SIZE, "wire_version": WIRE_VERSION}
     )
+    result.raise_for_status()
+    data = result.json()
+    wire_version = data.get("wire_version", 0)
+    if wire_version >= 1:
+        chunks = unpack_chunks(data["packed_chunks"])
+    else:
+        chunks = [Chunk.model_validate(chunk) for chunk in data["chunks"]]
+    return chunks, data.get("backlog"), wire_version
 
 
-def _poll_for_new_chunks(user_id: str):
+def _index_user_turn(user_id: int):
+    """Pull, embed and upload chunk pages of a user while it has a backlog"""
+    n_chunks = 0
+    backlog = None
+    reachable = True
+    embedding_failed = False
     with db.get_indexer_db() as conn:
         user = db.get_user_by_id(conn, user_id)
-        client = create_authenticated_client(
-            app_name="slack-mcp",
-            user_email=user.email,
-            access_token=user.access_token,
-        )
-        try:
-            result = client.post("get_new_chunks/")
-            result.raise_for_status()
-            chunks = [Chunk.model_validate(chunk) for chunk in result.json()["chunks"]]
-            print(f"Found {len(chunks)} new chunks to index")
-
-        except httpx.ReadTimeout:
-            print(
-                f"Read timeout calling {client.app_name} on {client.app_owner}/get_new_chunks, probably not online",
-                flush=True,
-            )
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 504:
-                print(f"Could not reach user {client.app_owner} for /get_new_chunks")
-                return
-            else:
-                raise e
-        except Exception:
-            print(
-                f"Failed calling {client.app_name} on {client.app_owner}/get_new_chunks: {traceback.format_exc()}"
-            )
-        try:
-            embeddings = embed(chunks)
-            print(f"embedded {len(chunks)} chunks")
-        except Exception:
-            print(f"Failed to embed {len(chunks)} chunks: {traceback.format_exc()}")
-            return
-
-        try:
+    client = create_authenticated_client(
+        app_name="slack-mcp",
+        user_email=user.email,
+        access_token=user.access_token,
+    )
+    try:
+        for _ in range(MAX_PAGES_PER_TURN):
+            chunks, backlog, wire_version = get_new_chunks(client)
+            print(f"Found {len(chunks)} new chunks to index for {user.email}")
+            if not chunks:
+                break
+
+            try:
+                embeddings = embed(chunks)
+            except Exception as e:
+                raise EmbeddingError(f"Failed to embed {len(chunks)} chunks") from e
             for chunk, embedding in zip(chunks, embeddings):
                 chunk.embedding = embedding
-            upload_embeddings(client, chunks)
-            print(f"Successfully uploaded {len(chunks)} chunks")
-        except httpx.ReadTimeout:
-            print(
-                f"Read timeout calling {client.app_name} on {client.app_owner}/upload_embeddings, probably not online",
-                flush=True,
-            )
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 504:
-                print(
-                    f"Could not reach user {client.app_owner} for /upload_embeddings",
-                    flush=True,
-                )
-                return
-            else:
-                raise e
-        except Exception:
-            print(
-                f"Failed calling {client.app_name} on {client.app_owner}/upload_embeddings: {traceback.format_exc()}",
-                flush=True,
-            )
+            upload_embeddings(client, chunks, wire_version)
+            print(f"Successfully uploaded {len(chunks)} chunks for {user.email}")
+
+            n_chunks += len(chunks)
+            if backlog is not None:
+                backlog = max(backlog - sum(len(chunk.tss) for chunk in chunks), 0)
+                if backlog == 0:
+                    break
+    except EmbeddingError as e:
+        embedding_failed = True
+        print(f"{e} of {client.app_owner}: {e.__cause__!r}", flush=True)
+    except httpx.ReadTimeout:
+        reachable = False
+        print(
+            f"Read timeout calling {client.app_name} on {client.app_owner}, probably not online",
+            flush=True,
+        )
+    except httpx.HTTPStatusError as e:
+        reachable = False
+        if e.response.status_code == 504:
+            print(f"Could not reach user {client.app_owner}", flush=True)
+        else:
+            print(f"Failed calling {client.app_name} on {client.app_owner}: {e}")
+    except Exception:
+        reachable = False
+        print(
+            f"Failed indexing chunks of {client.app_owner}: {traceback.format_exc()}",
+            flush=True,
+        )
+    finally:
+        dispatcher.record_turn(user_id, n_chunks, backlog, reachable, embedding_failed)
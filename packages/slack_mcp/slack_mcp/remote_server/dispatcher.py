@@ -0,0 +1,146 @@
+import threading
+import time
+from dataclasses import dataclass
+
+INITIAL_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 10 * 60
+# Longest sleep of the dispatch loop, heartbeats wake it up earlier
+MAX_IDLE_WAIT_SECONDS = 5.0
+# Retry delay after our own embedding server failed, the user is not backed off
+EMBEDDING_RETRY_SECONDS = 10.0
+
+
+@dataclass
+class UserDispatchState:
+    user_id: int
+    # Messages waiting for an embedding as last reported, None if unknown
+    backlog: int | None = None
+    next_poll_at: float = 0.0
+    n_idle: int = 0
+    last_served_at: float = 0.0
+    last_heartbeat_at: float | None = None
+    n_chunks_indexed: int = 0
+
+
+def backoff_seconds(n_idle: int) -> float:
+    return min(MAX_BACKOFF_SECONDS, INITIAL_BACKOFF_SECONDS * 2 ** max(n_idle - 1, 0))
+
+
+class IndexingDispatcher:
+    """
+    Decides which users the indexer pulls chunks from next.
+
+    Users with a backlog are served first, and among them the one served least
+    recently, so a large backlog can not starve the others. Users that turn out
+    idle or unreachable are polled with exponential backoff until a heartbeat
+    reports new work.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._users: dict[int, UserDispatchState] = {}
+        # Set when something changed since the dispatch loop last looked
+        self._changed = False
+
+    def sync_users(self, user_ids: list[int]):
+        with self._cond:
+            for user_id in user_ids:
+                self._users.setdefault(user_id, UserDispatchState(user_id=user_id))
+            for user_id in set(self._users) - set(user_ids):
+                del self._users[user_id]
+
+    def report_backlog(self, user_id: int, backlog: int):
+        """A client heartbeat, work is picked up right away if there is any"""
+        with self._cond:
+            state = self._users.setdefault(user_id, UserDispatchState(user_id=user_id))
+            state.backlog = backlog
+            state.last_heartbeat_at = time.time()
+            if backlog > 0:
+                state.n_idle = 0
+                state.next_poll_at = 0.0
+                self._changed = True
+                self._cond.notify_all()
+
+    def record_turn(
+        self,
+        user_id: int,
+        n_chunks: int,
+        backlog: int | None,
+        reachable: bool,
+        embedding_failed: bool = False,
+    ):
+        with self._cond:
+            state = self._users.get(user_id)
+            if state is None:
+                return
+            now = time.time()
+            state.last_served_at = now
+            state.n_chunks_indexed += n_chunks
+            if reachable:
+                state.backlog = backlog
+            if embedding_failed:
+                # Not the user's fault, the chunks are pulled again shortly
+                state.next_poll_at = now + EMBEDDING_RETRY_SECONDS
+            # A reported backlog that yields no chunks counts as idle too
+            elif reachable and n_chunks > 0:
+                state.n_idle = 0
+                # Clients that do not report a backlog may have more work too
+                more_work = backlog is None or backlog > 0
+                state.next_poll_at = now if more_work else now + INITIAL_BACKOFF_SECONDS
+            else:
+                state.n_idle += 1
+                state.next_poll_at = now + backoff_seconds(state.n_idle)
+            self._changed = True
+            self._cond.notify_all()
+
+    def next_users(self, n: int, exclude: set[int]) -> list[int]:
+        """Up to n users that are due, in the order they should be served"""
+        with self._cond:
+            now = time.time()
+            due = [
+                state
+                for state in self._users.values()
+                if state.next_poll_at <= now and state.user_id not in exclude
+            ]
+            due.sort(key=lambda s: (not s.backlog, s.last_served_at))
+            return [state.user_id for state in due[:n]]
+
+    def wait(self, stop_event: threading.Event, running: set[int], full: bool):
+        """
+        Sleep until a user that is not running is due, or until a heartbeat
+        arrives or a turn finishes. When all workers are busy (full), only a
+        finished turn or a heartbeat ends the wait.
+        """
+        with self._cond:
+            if self._changed:
+                self._changed = False
+                return
+            next_poll_at = min(
+                (
+                    state.next_poll_at
+                    for state in self._users.values()
+                    if state.user_id not in running and not full
+                ),
+                default=float("inf"),
+            )
+            timeout = min(next_poll_at - time.time(), MAX_IDLE_WAIT_SECONDS)
+            if timeout > 0 and not stop_event.is_set():
+                self._cond.wait(timeout=timeout)
+            self._changed = False
+
+    def get_stats(self) -> list[dict]:
+        with self._cond:
+            now = time.time()
+            return [
+                {
+                    "user_id": state.user_id,
+                    "backlog": state.backlog,
+                    "n_idle": state.n_idle,
+                    "next_poll_in_seconds": round(max(state.next_poll_at - now, 0), 1),
+                    "n_chunks_indexed": state.n_chunks_indexed,
+                }
+                for state in self._users.values()
+            ]
+
+
+dispatcher = IndexingDispatcher()
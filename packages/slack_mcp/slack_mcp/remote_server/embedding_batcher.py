@@ -0,0 +1,193 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+# Padded tokens (batch size x longest input) of a single forward pass
+MAX_BATCH_TOKENS = 16384
+# How long the first queued prompt waits for others to share its batch
+BATCH_DEADLINE_SECONDS = 0.01
+MAX_INPUT_TOKENS = 512
+MIN_BUCKET_TOKENS = 16
+LATENCY_WINDOW = 1000
+
+
+def length_bucket(n_tokens: int) -> int:
+    """Smallest power of two >= n_tokens, inputs in a bucket pad to at most 2x"""
+    bucket = MIN_BUCKET_TOKENS
+    while bucket < n_tokens:
+        bucket *= 2
+    return min(bucket, MAX_INPUT_TOKENS)
+
+
+@dataclass
+class PendingPrompt:
+    prompt: str
+    n_tokens: int
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class BatcherMetrics:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.n_requests = 0
+        self.n_prompts = 0
+        self.n_batches = 0
+        self.n_tokens = 0
+        self.n_padded_tokens = 0
+        self.inference_seconds = 0.0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def summary(self, queue_size: int) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[int(p * (len(latencies) - 1))] * 1000, 3)
+
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "requests": self.n_requests,
+            "prompts": self.n_prompts,
+            "batches": self.n_batches,
+            "queued_prompts": queue_size,
+            "avg_batch_size": round(self.n_prompts / max(self.n_batches, 1), 2),
+            "padding_efficiency": round(
+                self.n_tokens / max(self.n_padded_tokens, 1), 3
+            ),
+            "prompts_per_second": round(self.n_prompts / elapsed, 2),
+            "inference_prompts_per_second": round(
+                self.n_prompts / max(self.inference_seconds, 1e-9), 2
+            ),
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "latency_p99_ms": percentile(0.99),
+        }
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces prompts of concurrent requests into batches.
+
+    Prompts are grouped by token length bucket, so a batch pads to at most twice
+    its shortest input, and batches are capped at max_batch_tokens padded tokens.
+    Token counting and inference run on a single worker thread, off the event
+    loop. Both use the model's tokenizer, which can't be used from two threads.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[list[str]], list[list[float]]],
+        count_tokens: Callable[[list[str]], list[int]],
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        deadline_seconds: float = BATCH_DEADLINE_SECONDS,
+    ):
+        self.embed_fn = embed_fn
+        self.count_tokens = count_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.deadline_seconds = deadline_seconds
+        self.metrics = BatcherMetrics()
+        self._buckets: dict[int, deque[PendingPrompt]] = defaultdict(deque)
+        self._n_queued = 0
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="embedding-inference"
+        )
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def embed(self, prompts: list[str]) -> list[list[float]]:
+        """Queue prompts and wait for their embeddings, in order"""
+        if not prompts:
+            return []
+        loop = asyncio.get_running_loop()
+        n_tokens = await loop.run_in_executor(
+            self._executor, self.count_tokens, prompts
+        )
+        futures = []
+        for prompt, count in zip(prompts, n_tokens):
+            pending = PendingPrompt(prompt, count, loop.create_future())
+            self._buckets[length_bucket(count)].append(pending)
+            futures.append(pending.future)
+        self._n_queued += len(prompts)
+        self.metrics.n_requests += 1
+        self._wakeup.set()
+        return list(await asyncio.gather(*futures))
+
+    def _next_batch(self) -> tuple[int, list[PendingPrompt]]:
+        """Take a batch from the bucket with the longest waiting prompt"""
+        bucket = min(
+            (b for b, queue in self._buckets.items() if queue),
+            key=lambda b: self._buckets[b][0].queued_at,
+        )
+        queue = self._buckets[bucket]
+        max_batch_size = max(1, self.max_batch_tokens // bucket)
+        batch = [queue.popleft() for _ in range(min(max_batch_size, len(queue)))]
+        self._n_queued -= len(batch)
+        return bucket, batch
+
+    def _batch_is_full(self) -> bool:
+        return any(
+            len(queue) * bucket >= self.max_batch_tokens
+            for bucket, queue in self._buckets.items()
+        )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._n_queued == 0:
+                continue
+            # Give other requests a moment to join, unless a batch is already full
+            if not self._batch_is_full():
+                await asyncio.sleep(self.deadline_seconds)
+
+            while self._n_queued > 0:
+                _, batch = self._next_batch()
+                batch = [p for p in batch if not p.future.cancelled()]
+                if not batch:
+                    continue
+                prompts = [p.prompt for p in batch]
+                start = time.perf_counter()
+                try:
+                    embeddings = await loop.run_in_executor(
+                        self._executor, self.embed_fn, prompts
+                    )
+                except Exception as e:
+                    for pending in batch:
+                        if not pending.future.done():
+                            pending.future.set_exception(e)
+                    continue
+                end = time.perf_counter()
+
+                self.metrics.n_batches += 1
+                self.metrics.n_prompts += len(batch)
+                self.metrics.inference_seconds += end - start
+                self.metrics.n_tokens += sum(p.n_tokens for p in batch)
+                self.metrics.n_padded_tokens += len(batch) * max(
+                    p.n_tokens for p in batch
+                )
+                for pending, embedding in zip(batch, embeddings):
+                    self.metrics.latencies.append(end - pending.queued_at)
+                    if not pending.future.done():
+                        pending.future.set_result(embedding)
+
+    def get_metrics(self) -> dict:
+        return self.metrics.summary(self._n_queued)
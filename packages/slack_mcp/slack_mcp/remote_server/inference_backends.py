@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import partial
+
+import numpy as np
+import torch
+from slack_mcp.remote_server.embedding_batcher import MAX_INPUT_TOKENS
+from transformers import AutoModel, AutoTokenizer
+
+EMBEDDING_DIM = 768
+# Exported graph shipped in the nomic-embed-text-v1.5 model repository
+ONNX_MODEL_FILE = "onnx/model.onnx"
+
+# Warm-up and accuracy check inputs, shaped like indexed Slack conversations
+FIXTURE_PROMPTS = [
+    "search_document: can someone review my PR before the release?",
+    "search_document: the deploy failed again, looks like the migration timed out",
+    "search_document: lunch at 12:30?\nsure, the usual place\nsounds good",
+    "search_document: We moved the weekly sync to Thursday. Agenda: roadmap, "
+    "hiring, on-call rotation and the incident from last week.",
+    "search_document: " + "the embedding server keeps up with the indexer now " * 20,
+    "search_query: when is the next release",
+    "search_query: who owns the billing service",
+    "search_document: 👍",
+]
+
+
+def mean_pool(last_hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[..., None].astype(last_hidden.dtype)
+    return (last_hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    # Ollama's /api/embed, used for queries, returns unit vectors as well
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.clip(norms, 1e-12, None)
+
+
+class EmbeddingBackend(ABC):
+    """Embeds a batch of prompts, implementations differ in runtime and precision.
+
+    The HF tokenizer is not thread-safe, every use of it goes through the lock.
+    """
+
+    name = "base"
+
+    def __init__(self, model_name: str, num_threads: int | None = None):
+        self.model_name = model_name
+        self.num_threads = num_threads
+        self.tokenizer = None
+        self._tokenizer_lock = threading.Lock()
+
+    def load(self):
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            self.model_name, trust_remote_code=True
+        )
+
+    def tokenize(self, prompts: list[str], return_tensors: str):
+        with self._tokenizer_lock:
+            return self.tokenizer(
+                prompts,
+                return_tensors=return_tensors,
+                padding=True,
+                truncation=True,
+                max_length=MAX_INPUT_TOKENS,
+            )
+
+    def count_tokens(self, prompts: list[str]) -> list[int]:
+        with self._tokenizer_lock:
+            inputs = self.tokenizer(
+                prompts, truncation=True, max_length=MAX_INPUT_TOKENS
+            )
+        return [len(input_ids) for input_ids in inputs["input_ids"]]
+
+    @abstractmethod
+    def embed(self, prompts: list[str]) -> list[list[float]]:
+        pass
+
+    def warm_up(self, n_rounds: int = 3) -> float:
+        """Run the fixtures a few times so allocations and kernels are ready"""
+        start = time.perf_counter()
+        for _ in range(n_rounds):
+            self.embed(FIXTURE_PROMPTS)
+        return time.perf_counter() - start
+
+
+class MockBackend(EmbeddingBackend):
+    """Zero vectors, optionally with a simulated cost per padded token"""
+
+    name = "mock"
+
+    def __init__(self, model_name: str, num_threads=None, seconds_per_token=0.0):
+        super().__init__(model_name, num_threads)
+        self.seconds_per_token = seconds_per_token
+
+    def load(self):
+        pass
+
+    def count_tokens(self, prompts: list[str]) -> list[int]:
+        return [min(len(prompt.split()) + 2, MAX_INPUT_TOKENS) for prompt in prompts]
+
+    def embed(self, prompts: list[str]) -> list[list[float]]:
+        if self.seconds_per_token:
+            padded_tokens = len(prompts) * max(self.count_tokens(prompts))
+            time.sleep(padded_tokens * self.seconds_per_token)
+        return [[0.0] * EMBEDDING_DIM for _ in prompts]
+
+
+class TorchBackend(EmbeddingBackend):
+    """PyTorch model in fp32, or with int8 dynamically quantized linear layers on CPU"""
+
+    def __init__(self, model_name: str, num_threads=None, quantize: bool = False):
+        super().__init__(model_name, num_threads)
+        self.quantize = quantize
+        self.name = "torch-int8" if quantize else "torch"
+        # Dynamically quantized kernels only exist for CPU
+        use_cuda = torch.cuda.is_available() and not quantize
+        self.device = torch.device("cuda" if use_cuda else "cpu")
+        self.model = None
+
+    def load(self):
+        super().load()
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        model = AutoModel.from_pretrained(self.model_name, trust_remote_code=True)
+        model.eval()
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = model.to(self.device)
+
+    def embed(self, prompts: list[str]) -> list[list[float]]:
+        inputs = self.tokenize(prompts, return_tensors="pt")
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+        # Use the mean pooling of the last hidden state as embedding
+        last_hidden = outputs.last_hidden_state.float().cpu().numpy()
+        attention_mask = inputs["attention_mask"].cpu().numpy()
+        return l2_normalize(mean_pool(last_hidden, attention_mask)).tolist()
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime on CPU, needs the optional onnxruntime package"""
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, num_threads=None, model_file=ONNX_MODEL_FILE):
+        super().__init__(model_name, num_threads)
+        self.model_file = model_file
+        self.session = None
+
+    def load(self):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "The onnx backend needs onnxruntime, install it with `pip install onnxruntime`"
+            ) from e
+        from huggingface_hub import hf_hub_download
+
+        super().load()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        path = hf_hub_download(self.model_name, self.model_file)
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {x.name for x in self.session.get_inputs()}
+
+    def embed(self, prompts: list[str]) -> list[list[float]]:
+        inputs = self.tokenize(prompts, return_tensors="np")
+        feed = {
+            k: v.astype(np.int64) for k, v in inputs.items() if k in self.input_names
+        }
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+        last_hidden = self.session.run(None, feed)[0]
+        embeddings = mean_pool(last_hidden, inputs["attention_mask"])
+        return l2_normalize(embeddings).tolist()
+
+
+BACKENDS = {
+    "mock": MockBackend,
+    "torch": TorchBackend,
+    "torch-int8": partial(TorchBackend, quantize=True),
+    "onnx": OnnxBackend,
+}
+
+
+def create_backend(
+    name: str, model_name: str, num_threads: int | None = None, **kwargs
+) -> EmbeddingBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, choose from {list(BACKENDS)}")
+    return BACKENDS[name](model_name, num_threads, **kwargs)
+
+
+def default_num_threads() -> int:
+    # Physical cores are not exposed by os, assume two hardware threads per core
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+def check_accuracy(
+    backend: EmbeddingBackend,
+    reference: EmbeddingBackend,
+    prompts: list[str] = FIXTURE_PROMPTS,
+) -> dict[str, float]:
+    """Cosine similarity between the embeddings of backend and the reference"""
+    a = np.asarray(backend.embed(prompts))
+    b = np.asarray(reference.embed(prompts))
+    cosine = (a * b).sum(axis=1) / (
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12
+    )
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
@@ -2,25 +2,70 @@ import os
 from contextlib import asynccontextmanager
 from uuid import UUID
 
-import torch
 import uvicorn
 from fastapi import APIRouter, FastAPI
+from loguru import logger
 from pydantic import BaseModel
-from transformers import AutoModel, AutoTokenizer
-
-router = APIRouter()
-
-tokenizer = AutoTokenizer.from_pretrained(
-    "nomic-ai/nomic-embed-text-v1.5", trust_remote_code=True
+from slack_mcp.remote_server.embedding_batcher import (
+    BATCH_DEADLINE_SECONDS,
+    MAX_BATCH_TOKENS,
+    EmbeddingBatcher,
 )
-model = AutoModel.from_pretrained(
-    "nomic-ai/nomic-embed-text-v1.5", trust_remote_code=True
+from slack_mcp.remote_server.inference_backends import (
+    check_accuracy,
+    create_backend,
+    default_num_threads,
 )
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
+
+router = APIRouter()
 
 PORT = os.getenv("NOMIC_PORT", 8020)
 USE_MOCK_EMBEDDINGS = os.getenv("USE_MOCK_EMBEDDINGS", "False").lower() == "true"
+# A small model with the same interface can be used to benchmark on CPU
+MODEL_NAME = os.getenv("NOMIC_MODEL_NAME", "nomic-ai/nomic-embed-text-v1.5")
+# mock, torch, torch-int8 or onnx. The last two are the fast options on CPU
+BACKEND = os.getenv("NOMIC_BACKEND", "mock" if USE_MOCK_EMBEDDINGS else "torch")
+NUM_THREADS = int(os.getenv("NOMIC_NUM_THREADS", default_num_threads()))
+# Simulated inference cost of the mock embeddings, per padded token
+MOCK_SECONDS_PER_TOKEN = float(os.getenv("MOCK_SECONDS_PER_TOKEN", "0"))
+# Compare a reduced precision backend with fp32 torch before serving
+ACCURACY_CHECK = os.getenv("NOMIC_ACCURACY_CHECK", "True").lower() == "true"
+MIN_COSINE = float(os.getenv("NOMIC_MIN_COSINE", "0.99"))
+
+if BACKEND == "mock":
+    backend = create_backend(
+        BACKEND, MODEL_NAME, seconds_per_token=MOCK_SECONDS_PER_TOKEN
+    )
+else:
+    backend = create_backend(BACKEND, MODEL_NAME, NUM_THREADS)
+
+batcher = EmbeddingBatcher(
+    embed_fn=backend.embed,
+    count_tokens=backend.count_tokens,
+    max_batch_tokens=int(os.getenv("NOMIC_MAX_BATCH_TOKENS", MAX_BATCH_TOKENS)),
+    deadline_seconds=float(
+        os.getenv("NOMIC_BATCH_DEADLINE_SECONDS", BATCH_DEADLINE_SECONDS)
+    ),
+)
+backend_info = {"backend": backend.name, "num_threads": NUM_THREADS}
+
+
+def load_backend():
+    backend.load()
+    if ACCURACY_CHECK and backend.name not in ("mock", "torch"):
+        reference = create_backend("torch", MODEL_NAME, NUM_THREADS)
+        reference.load()
+        accuracy = check_accuracy(backend, reference)
+        del reference
+        backend_info.update(accuracy)
+        logger.info(f"{backend.name} vs fp32 torch: {accuracy}")
+        if accuracy["min_cosine"] < MIN_COSINE:
+            raise RuntimeError(
+                f"{backend.name} embeddings deviate from fp32, min cosine "
+                f"{accuracy['min_cosine']:.4f} < {MIN_COSINE}"
+            )
+    backend_info["warm_up_seconds"] = round(backend.warm_up(), 3)
+    logger.info(f"Loaded embedding backend: {backend_info}")
 
 
 @router.get("/health")
@@ -28,6 +73,11 @@ async def health():
     return {"status": "ok"}
 
 
+@router.get("/metrics")
+async def metrics():
+    return {**batcher.get_metrics(), **backend_info}
+
+
 class EmbeddingRequest(BaseModel):
     chunk_id: UUID
     prompt: str
@@ -35,32 +85,8 @@ class EmbeddingRequest(BaseModel):
 
 @router.post("/embeddings")
 async def embeddings(request: list[EmbeddingRequest]):
-    if USE_MOCK_EMBEDDINGS:
-        return [
-            {"chunk_id": str(x.chunk_id), "embedding": [0.0] * 768} for x in request
-        ]
-    if len(request) == 0:
-        return []
-
-    inputs = tokenizer(
-        [x.prompt for x in request],
-        return_tensors="pt",
-        padding=True,
-        truncation=True,
-        max_length=512,
-    )
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-
-    with torch.no_grad():
-        outputs = model(**inputs)
-        # Use the mean pooling of the last hidden state as embedding
-        last_hidden = outputs.last_hidden_state
-        attention_mask = inputs["attention_mask"]
-        mask_expanded = attention_mask.unsqueeze(-1).expand(last_hidden.size()).float()
-        sum_embeddings = torch.sum(last_hidden * mask_expanded, 1)
-        sum_mask = torch.clamp(mask_expanded.sum(1), min=1e-9)
-        embeddings = (sum_embeddings / sum_mask).tolist()
-
+    # Prompts of concurrent requests are batched together
+    embeddings = await batcher.embed([x.prompt for x in request])
     return [
         {"chunk_id": str(x.chunk_id), "embedding": embedding}
         for x, embedding in zip(request, embeddings)
@@ -69,12 +95,15 @@ async def embeddings(request: list[EmbeddingRequest]):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    load_backend()
+    batcher.start()
     yield
+    await batcher.stop()
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 if __name__ == "__main__":
-    print(f"Using device: {device}", flush=True)
-    uvicorn.run(app, host="0.0.0.0", port=8020)
+    print(f"Using backend: {BACKEND}", flush=True)
+    uvicorn.run(app, host="0.0.0.0", port=int(PORT))
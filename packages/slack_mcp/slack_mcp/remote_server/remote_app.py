@@ -4,7 +4,10 @@ from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
-from slack_mcp.remote_server.background_worker import poll_for_chunks_to_index
+from slack_mcp.remote_server.background_worker import (
+    INDEXER_CONCURRENCY,
+    poll_for_chunks_to_index,
+)
 from slack_mcp.remote_server.server import router
 from slack_mcp.remote_server.server_settings import settings
 
@@ -14,7 +17,7 @@ stop_event = threading.Event()
 def start_background_workers():
     """Start background workers with optional user authentication."""
     print("Starting meeting indexer")
-    indexer_executor = ThreadPoolExecutor(max_workers=3)
+    indexer_executor = ThreadPoolExecutor(max_workers=INDEXER_CONCURRENCY)
     poll_indexer_thread = threading.Thread(
         target=poll_for_chunks_to_index,
         args=(stop_event, indexer_executor),
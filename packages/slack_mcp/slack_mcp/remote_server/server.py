@@ -3,8 +3,18 @@ import threading
 import traceback
 
 from fastapi import APIRouter, Depends, HTTPException
-from slack_mcp.remote_server.server_db import get_indexer_db, insert_user
-from slack_mcp.remote_server.server_models import UserRegistration, UserResponse
+from slack_mcp.remote_server.dispatcher import dispatcher
+from slack_mcp.remote_server.server_db import (
+    get_indexer_db,
+    get_user_by_email,
+    insert_user,
+    set_heartbeat,
+)
+from slack_mcp.remote_server.server_models import (
+    HeartbeatRequest,
+    UserRegistration,
+    UserResponse,
+)
 
 router = APIRouter()
 
@@ -13,6 +23,21 @@ stop_event = threading.Event()
 
 @router.get("/health")
 async def health():
+    return {"status": "ok", "users": dispatcher.get_stats()}
+
+
+@router.post("/heartbeat")
+def heartbeat(
+    request: HeartbeatRequest,
+    conn_manager: sqlite3.Connection = Depends(get_indexer_db),
+):
+    """Clients report how many messages wait for an embedding."""
+    with conn_manager as conn:
+        user = get_user_by_email(conn, request.email)
+        if user is None or user["access_token"] != request.access_token:
+            raise HTTPException(status_code=401, detail="Unknown user or access token")
+        set_heartbeat(conn, request.email)
+    dispatcher.report_backlog(user["id"], request.backlog)
     return {"status": "ok"}
 
 
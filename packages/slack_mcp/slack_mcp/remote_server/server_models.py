@@ -32,3 +32,10 @@ class UserResponse(BaseModel):
 class EmbeddingRequest(BaseModel):
     chunk_id: UUID
     prompt: str
+
+
+class HeartbeatRequest(BaseModel):
+    email: EmailStr
+    access_token: str
+    # Messages waiting for an embedding on the client
+    backlog: int
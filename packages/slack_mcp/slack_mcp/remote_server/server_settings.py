@@ -10,6 +10,8 @@ class ServerSettings(BaseSettings):
     use_mock_embeddings: bool = True
     create_dev_user: bool = False
     dev_mode: bool = False
+    # float16 halves the upload size, float32 keeps embeddings exact
+    embedding_wire_dtype: str = "float16"
 
 
 settings = ServerSettings()
@@ -10,6 +10,10 @@ class Settings(BaseSettings):
     slack_mcp_port: int = 8004
     dev_email: str = "dev@openmined.org"
     dev_access_token: str = "dev_mode"
+    # Remote indexer to notify about messages waiting for embeddings, off if empty
+    indexer_url: str = ""
+    # Database of the downloaded messages, ~/.slack_mcp/db.sqlite if empty
+    slack_mcp_db_path: str = ""
 
 
 settings = Settings()
@@ -1,9 +1,16 @@
-from cachetools import TTLCache, cached
-from rapidfuzz import process
+import threading
+import time
+
+from rapidfuzz import fuzz, process
 from slack_sdk import WebClient
+from toolbox_store.name_index import NameIndex, normalize_name
 
 from slack_mcp.models import MatchedContact, NamesMatchResponse
 
+# Channels and users are fetched again after this, names of unchanged channels
+# stay in the index
+NAME_INDEX_TTL_SECONDS = 300
+
 
 def get_all_channels(client: WebClient):
     channels = []
@@ -33,12 +40,44 @@ def get_favourite_channel_ids(client: WebClient):
     return favourite_channel_ids
 
 
-_channelid_to_name_cache = TTLCache(maxsize=8, ttl=300)
+class ChannelNameIndex:
+    """Channel and DM names of the workspace, indexed for fuzzy lookup"""
+
+    def __init__(self, ttl_seconds: float = NAME_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.index = NameIndex()
+        self.channel_to_name: dict[str, str] = {}
+        self.user_id_to_real_name: dict[str, str] = {}
+        self._refreshed_at: float | None = None
+        self._lock = threading.Lock()
+
+    def refresh(self, client: WebClient):
+        """Fetch the names again when they are older than the ttl"""
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._refreshed_at is not None
+                and now - self._refreshed_at < self.ttl_seconds
+            ):
+                return
+            channel_to_name, user_id_to_real_name = compute_channelid_to_name(client)
+            # Only channels that were added, renamed or removed touch the index
+            for channel_id in self.channel_to_name.keys() - channel_to_name.keys():
+                self.index.remove(channel_id)
+            for channel_id, name in channel_to_name.items():
+                if self.channel_to_name.get(channel_id) != name:
+                    self.index.upsert(channel_id, [name], channel_id)
+            self.channel_to_name = channel_to_name
+            self.user_id_to_real_name = user_id_to_real_name
+            self._refreshed_at = now
+
+
+channel_name_index = ChannelNameIndex()
 
 
-@cached(_channelid_to_name_cache)
 def compute_channelid_to_name_cached(client: WebClient):
-    return compute_channelid_to_name(client)
+    channel_name_index.refresh(client)
+    return channel_name_index.channel_to_name, channel_name_index.user_id_to_real_name
 
 
 def compute_channelid_to_name(client: WebClient):
@@ -73,23 +112,29 @@ def compute_channelid_to_name(client: WebClient):
     return channel_to_name, user_id_to_real_name
 
 
-def get_matches(query, choices):
-    return process.extract(query, choices, limit=10)
+def get_matches(query, choices: dict[str, str], limit: int = 10):
+    """Fuzzy matches of query among choices, a mapping of channel id to name"""
+    return process.extract(
+        query, choices, scorer=fuzz.WRatio, processor=normalize_name, limit=limit
+    )
 
 
-def get_matches_for_name(query, favourite_names, all_names, name2channelid):
-    matches_in_favourites = get_matches(query, favourite_names)
-    matches_including_ids = [(*m, name2channelid[m[0]]) for m in matches_in_favourites]
+def get_matches_for_name(
+    query, favourite_channel_ids: list[str], name_index: ChannelNameIndex
+):
+    favourite_names = {
+        channel_id: name_index.channel_to_name[channel_id]
+        for channel_id in favourite_channel_ids
+        if channel_id in name_index.channel_to_name
+    }
     matches_in_favourites_list = [
-        MatchedContact(query=query, name=m[0], score=m[1], channel_id=m[3])
-        for m in matches_including_ids
+        MatchedContact(query=query, name=name, score=score, channel_id=channel_id)
+        for name, score, channel_id in get_matches(query, favourite_names)
     ]
 
-    matches_in_all = get_matches(query, all_names)
-    matches_including_ids = [(*m, name2channelid[m[0]]) for m in matches_in_all]
     matches_in_all_list = [
-        MatchedContact(query=query, name=m[0], score=m[1], channel_id=m[3])
-        for m in matches_including_ids
+        MatchedContact(query=query, name=name, score=score, channel_id=channel_id)
+        for name, score, channel_id in name_index.index.search(query, limit=10)
     ]
 
     return NamesMatchResponse(
@@ -0,0 +1,81 @@
+import base64
+import json
+import zlib
+
+import numpy as np
+from pydantic import BaseModel
+
+from slack_mcp.models import Chunk
+
+# Wire formats of the indexer RPCs. Version 0 is a JSON list of chunks. Version 1
+# sends chunk texts as a zlib compressed JSON frame, and embeddings as a single
+# little-endian float matrix with the element layout serialize_float32 writes to
+# vec0. Both are base64 encoded to fit in the JSON bodies the RPC transport carries.
+WIRE_VERSION = 1
+EMBEDDING_DTYPES = {"float16": "<f2", "float32": "<f4"}
+DEFAULT_EMBEDDING_DTYPE = "float16"
+
+
+class PackedEmbeddings(BaseModel):
+    wire_version: int = WIRE_VERSION
+    # Compressed chunks without embeddings, see pack_chunks
+    chunks: str
+    dtype: str
+    dim: int
+    # base64 encoded (n_chunks, dim) matrix in row order of chunks
+    embeddings: str
+
+
+def negotiate_version(requested: int) -> int:
+    return max(0, min(requested, WIRE_VERSION))
+
+
+def pack_chunks(chunks: list[Chunk]) -> str:
+    frame = json.dumps(
+        [
+            {
+                "chunk_id": str(chunk.chunk_id),
+                "channel_ids": chunk.channel_ids,
+                "tss": chunk.tss,
+                "chunk_text": chunk.chunk_text,
+            }
+            for chunk in chunks
+        ],
+        separators=(",", ":"),
+    )
+    return base64.b64encode(zlib.compress(frame.encode())).decode()
+
+
+def unpack_chunks(data: str) -> list[Chunk]:
+    frame = zlib.decompress(base64.b64decode(data))
+    return [Chunk.model_validate(chunk) for chunk in json.loads(frame)]
+
+
+def pack_embedded_chunks(
+    chunks: list[Chunk], dtype: str = DEFAULT_EMBEDDING_DTYPE
+) -> PackedEmbeddings:
+    dims = {len(chunk.embedding or ()) for chunk in chunks}
+    if len(dims) != 1 or 0 in dims:
+        raise ValueError("All chunks need an embedding of the same length")
+    matrix = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+    blob = matrix.astype(EMBEDDING_DTYPES[dtype]).tobytes()
+    return PackedEmbeddings(
+        chunks=pack_chunks(chunks),
+        dtype=dtype,
+        dim=matrix.shape[1],
+        embeddings=base64.b64encode(blob).decode(),
+    )
+
+
+def unpack_embedded_chunks(packed: PackedEmbeddings) -> list[Chunk]:
+    if packed.dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {packed.dtype}")
+    chunks = unpack_chunks(packed.chunks)
+    matrix = np.frombuffer(
+        base64.b64decode(packed.embeddings), dtype=EMBEDDING_DTYPES[packed.dtype]
+    ).reshape(-1, packed.dim)
+    if len(matrix) != len(chunks):
+        raise ValueError(f"Got {len(matrix)} embeddings for {len(chunks)} chunks")
+    for chunk, embedding in zip(chunks, matrix.astype(np.float32)):
+        chunk.embedding = embedding.tolist()
+    return chunks
@@ -0,0 +1,21 @@
+import pytest
+from slack_mcp.db import close_connections, create_tables
+from slack_mcp.settings import settings
+from toolbox_store.connection import ConnectionManager
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """A writer connection to a fresh, migrated database"""
+    manager = ConnectionManager(tmp_path / "db.sqlite", create_tables)
+    with manager.writer() as conn:
+        yield conn
+    manager.close()
+
+
+@pytest.fixture
+def slack_db(tmp_path, monkeypatch):
+    """Point the shared connections of the package at a fresh database"""
+    monkeypatch.setattr(settings, "slack_mcp_db_path", str(tmp_path / "db.sqlite"))
+    yield
+    close_connections()
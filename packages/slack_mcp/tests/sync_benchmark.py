@@ -0,0 +1,647 @@
+"""
+Sync benchmark of the Slack crawler against a fake Slack Web API.
+
+FakeSlackAPI is a FastAPI app with the Web API methods used by the crawler,
+served on a local port so the real slack_sdk client can talk to it. It serves
+a deterministic synthetic workspace of channels, threads and users, enforces
+Slack's rate limit tiers and answers 429 with Retry-After when a tier is
+overrun. The tier limits are multiplied by `speedup`, in the fake and in the
+client's rate limiter, so large workspaces sync in minutes instead of hours.
+
+The real background worker downloads the workspace into a fresh database.
+The messages are then chunked into conversation windows and embedded against
+a fake Ollama server, the way the remote indexer drains the backlog.
+
+    python tests/sync_benchmark.py --channels 20 --messages 500 --speedup 60
+
+Reports messages/sec, API calls per message, 429s, the time the database
+writer was held and the time to drain the embedding backlog.
+"""
+
+import argparse
+import asyncio
+import base64
+import bisect
+import json
+import math
+import random
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import parse_qs
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from slack_mcp.background_worker import run_slack_mesage_dump_background_worker_single
+from slack_mcp.db import (
+    EMBEDDINGS_LEN,
+    count_messages_without_embeddings,
+    gather_chunks_without_embeddings,
+    get_connection_manager,
+    get_slack_connection,
+    upsert_chunks,
+)
+from slack_mcp.embeddings import DOCUMENT_PREFIX, OllamaEmbeddingClient
+from slack_mcp.rate_limit import (
+    DEFAULT_TIER,
+    SAFETY_FACTOR,
+    SLACK_METHOD_TIERS,
+    TIER_LIMITS_PER_MINUTE,
+    RateLimitedWebClient,
+    SlackRateLimiter,
+)
+from slack_mcp.settings import settings
+from toolbox_store.embedding import approx_token_count
+
+# Multiplier of Slack's tier limits, for the fake and the client
+SPEEDUP = 60
+# Seconds every fake API response takes
+API_LATENCY = 0.05
+# Seconds every fake embedding request takes
+EMBED_LATENCY = 0.05
+# Give up draining the embedding backlog after this long
+MAX_DRAIN_SECONDS = 600
+
+WORDS = (
+    "deploy build release error fix bug test merge branch review server client "
+    "database query index cache latency timeout retry token channel thread team "
+    "message search embedding model vector sync crawler worker queue config docs "
+    "api endpoint schema migration rollback incident alert metric dashboard log "
+    "the a is it we should can not with for on in to of and but maybe today now"
+).split()
+
+
+@dataclass
+class WorkspaceSpec:
+    """Shape of the synthetic workspace, the same seed gives the same workspace"""
+
+    n_channels: int = 20
+    messages_per_channel: int = 500
+    # Every nth message starts a thread
+    thread_every: int = 10
+    replies_per_thread: int = 5
+    n_users: int = 50
+    # Messages are spread over the last `days` days
+    days: int = 30
+    # Every nth message is posted by a bot, the crawler skips those
+    bot_message_every: int = 20
+    seed: int = 0
+
+
+def to_micros(ts: str | float) -> int:
+    return round(float(ts) * 1_000_000)
+
+
+def to_ts(micros: int) -> str:
+    return f"{micros // 1_000_000}.{micros % 1_000_000:06d}"
+
+
+def encode_cursor(value: str) -> str:
+    return base64.urlsafe_b64encode(f"next:{value}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    return base64.urlsafe_b64decode(cursor.encode()).decode().removeprefix("next:")
+
+
+class FakeSlackAPI:
+    """
+    The Slack Web API methods used by the crawler, on a synthetic workspace.
+
+    Serve `app` and point the client's base_url at its /api/ path. History is
+    returned newest first with exclusive oldest/latest bounds and cursor
+    pagination, replies include their parent, and search matches every
+    message after the date in the query, like Slack.
+
+    Every method may be called `speedup` times its TIER_LIMITS_PER_MINUTE per
+    minute. Calls over the limit get a 429 with Retry-After in whole seconds,
+    as Slack sends it.
+    """
+
+    def __init__(
+        self,
+        spec: WorkspaceSpec | None = None,
+        speedup: float = SPEEDUP,
+        latency: float = API_LATENCY,
+    ):
+        self.spec = spec or WorkspaceSpec()
+        self.speedup = speedup
+        self.latency = latency
+        self.now = datetime.now()
+
+        self._lock = threading.Lock()
+        # method -> (window start, calls in window)
+        self._windows: dict[str, tuple[float, int]] = {}
+        self.calls_per_method: Counter = Counter()
+        self.n_rate_limited = 0
+
+        self.user_ids = [f"U{i:08d}" for i in range(self.spec.n_users)]
+        self.channel_ids = [f"C{i:08d}" for i in range(self.spec.n_channels)]
+        # channel -> top level messages oldest first, and their ts in micros
+        self.history: dict[str, list[dict]] = {}
+        self._history_micros: dict[str, list[int]] = {}
+        # (channel, thread_ts) -> parent and replies, oldest first
+        self.threads: dict[tuple[str, str], list[dict]] = {}
+        for channel_id in self.channel_ids:
+            self._generate_channel(channel_id)
+
+        # Every message for search, newest first
+        matches = [
+            (to_micros(message["ts"]), channel_id, message)
+            for channel_id, messages in self.history.items()
+            for message in messages
+        ]
+        matches += [
+            (to_micros(reply["ts"]), channel_id, reply)
+            for (channel_id, _), messages in self.threads.items()
+            for reply in messages[1:]
+        ]
+        self._search_index = sorted(matches, key=lambda item: item[0], reverse=True)
+        self._search_micros = [-micros for micros, _, _ in self._search_index]
+
+        self.app = FastAPI()
+        self.app.add_api_route("/api/{method}", self.handle, methods=["GET", "POST"])
+
+    def _generate_channel(self, channel_id: str):
+        """Top level messages in bursts of conversation, some with a thread"""
+        rng = random.Random(f"{self.spec.seed}:{channel_id}")
+        start = to_micros((self.now - timedelta(days=self.spec.days)).timestamp())
+        end = to_micros((self.now - timedelta(minutes=1)).timestamp())
+
+        times = []
+        while len(times) < self.spec.messages_per_channel:
+            t = rng.randint(start, end)
+            n_burst = min(
+                rng.randint(1, 20), self.spec.messages_per_channel - len(times)
+            )
+            for _ in range(n_burst):
+                times.append(min(t, end))
+                t += int(rng.expovariate(1 / 45) * 1_000_000)
+        times.sort()
+
+        # ts are unique per channel, replies included
+        used: set[int] = set()
+
+        def unique(micros: int) -> int:
+            while micros in used:
+                micros += 1
+            used.add(micros)
+            return micros
+
+        messages = []
+        for i, micros in enumerate(times, 1):
+            ts = to_ts(unique(micros))
+            message = {"type": "message", "ts": ts, "text": self._text(rng)}
+            if self.spec.bot_message_every and i % self.spec.bot_message_every == 0:
+                message.update({"subtype": "bot_message", "bot_id": "B00000001"})
+                messages.append(message)
+                continue
+
+            message.update({"user": rng.choice(self.user_ids), "team": "T00000001"})
+            if self.spec.thread_every and i % self.spec.thread_every == 0:
+                replies = []
+                reply_micros = to_micros(ts)
+                for _ in range(self.spec.replies_per_thread):
+                    reply_micros += int(rng.expovariate(1 / 120) * 1_000_000) + 1
+                    replies.append(
+                        {
+                            "type": "message",
+                            "user": rng.choice(self.user_ids),
+                            "text": self._text(rng),
+                            "ts": to_ts(unique(reply_micros)),
+                            "thread_ts": ts,
+                            "parent_user_id": message["user"],
+                        }
+                    )
+                reply_users = sorted({reply["user"] for reply in replies})
+                message.update(
+                    {
+                        "thread_ts": ts,
+                        "reply_count": len(replies),
+                        "reply_users": reply_users,
+                        "reply_users_count": len(reply_users),
+                        "latest_reply": replies[-1]["ts"] if replies else None,
+                        "is_locked": False,
+                        "subscribed": False,
+                    }
+                )
+                self.threads[(channel_id, ts)] = [message] + replies
+            messages.append(message)
+
+        messages.sort(key=lambda message: to_micros(message["ts"]))
+        self.history[channel_id] = messages
+        self._history_micros[channel_id] = [to_micros(m["ts"]) for m in messages]
+
+    def _text(self, rng: random.Random) -> str:
+        return " ".join(rng.choices(WORDS, k=rng.randint(3, 30)))
+
+    def count_messages(self) -> int:
+        """Messages in the workspace, replies included, without bot messages"""
+        n_messages = sum(
+            1
+            for messages in self.history.values()
+            for message in messages
+            if "user" in message
+        )
+        return n_messages + sum(len(m) - 1 for m in self.threads.values())
+
+    def _take(self, method: str) -> float | None:
+        """Count a call against its tier, returns retry_after if it is over the limit"""
+        tier = SLACK_METHOD_TIERS.get(method, DEFAULT_TIER)
+        limit = TIER_LIMITS_PER_MINUTE[tier] * self.speedup
+        window = 60
+        now = time.monotonic()
+        with self._lock:
+            self.calls_per_method[method] += 1
+            window_start, n_calls = self._windows.get(method, (now, 0))
+            if now - window_start >= window:
+                window_start, n_calls = now, 0
+            n_calls += 1
+            self._windows[method] = (window_start, n_calls)
+            if n_calls <= limit:
+                return None
+            self.n_rate_limited += 1
+            return window_start + window - now
+
+    def conversations_history(self, params: dict[str, str]) -> dict:
+        channel_id = params["channel"]
+        messages = self.history.get(channel_id)
+        if messages is None:
+            return {"ok": False, "error": "channel_not_found"}
+        micros = self._history_micros[channel_id]
+        limit = min(int(params.get("limit") or 100), 999)
+
+        latest = params.get("latest")
+        if params.get("cursor"):
+            latest = decode_cursor(params["cursor"])
+        hi = bisect.bisect_left(micros, to_micros(latest)) if latest else len(micros)
+        oldest = params.get("oldest")
+        lo = bisect.bisect_right(micros, to_micros(oldest)) if oldest else 0
+
+        page = messages[max(lo, hi - limit) : hi][::-1]
+        has_more = hi - limit > lo
+        return {
+            "ok": True,
+            "messages": page,
+            "has_more": has_more,
+            "pin_count": 0,
+            "response_metadata": {
+                "next_cursor": encode_cursor(page[-1]["ts"]) if has_more else ""
+            },
+        }
+
+    def conversations_replies(self, params: dict[str, str]) -> dict:
+        messages = self.threads.get((params["channel"], params["ts"]))
+        if messages is None:
+            return {"ok": False, "error": "thread_not_found"}
+        limit = min(int(params.get("limit") or 1000), 1000)
+        offset = int(decode_cursor(params["cursor"])) if params.get("cursor") else 0
+
+        page = messages[offset : offset + limit]
+        has_more = offset + limit < len(messages)
+        return {
+            "ok": True,
+            "messages": page,
+            "has_more": has_more,
+            "response_metadata": {
+                "next_cursor": encode_cursor(str(offset + limit)) if has_more else ""
+            },
+        }
+
+    def search_messages(self, params: dict[str, str]) -> dict:
+        # Only after:YYYY-MM-DD queries are supported, matches start the day after
+        after = params.get("query", "").removeprefix("after:")
+        after_micros = to_micros(
+            (datetime.strptime(after, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+        )
+        count = min(int(params.get("count") or 20), 100)
+        page_number = int(params.get("page") or 1)
+
+        n_matches = bisect.bisect_right(self._search_micros, -after_micros)
+        start = (page_number - 1) * count
+        matches = [
+            {**message, "channel": {"id": channel_id, "name": channel_id.lower()}}
+            for _, channel_id, message in self._search_index[
+                start : min(start + count, n_matches)
+            ]
+        ]
+        return {
+            "ok": True,
+            "query": params.get("query"),
+            "messages": {
+                "matches": matches,
+                "total": n_matches,
+                "paging": {
+                    "count": count,
+                    "total": n_matches,
+                    "page": page_number,
+                    # Slack returns at most 100 pages
+                    "pages": min(math.ceil(n_matches / count), 100),
+                },
+            },
+        }
+
+    async def handle(self, method: str, request: Request) -> JSONResponse:
+        params = dict(request.query_params)
+        body = (await request.body()).decode()
+        if body:
+            params.update({k: v[0] for k, v in parse_qs(body).items()})
+
+        retry_after = self._take(method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if retry_after is not None:
+            return JSONResponse(
+                {"ok": False, "error": "ratelimited"},
+                status_code=429,
+                headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+            )
+
+        handler = {
+            "conversations.history": self.conversations_history,
+            "conversations.replies": self.conversations_replies,
+            "search.messages": self.search_messages,
+        }.get(method)
+        if handler is None:
+            return JSONResponse({"ok": False, "error": "unknown_method"})
+        return JSONResponse(handler(params))
+
+    @property
+    def n_calls(self) -> int:
+        return sum(self.calls_per_method.values())
+
+
+@contextmanager
+def serve_in_thread(app: FastAPI) -> Iterator[int]:
+    """Serve an app on a free local port until the context exits, yields the port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(
+        target=server.run, kwargs={"sockets": [sock]}, daemon=True
+    )
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Fake server did not start")
+        time.sleep(0.01)
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        sock.close()
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    """A deterministic unit vector per text"""
+    vector = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def create_fake_ollama_app(dim: int, latency: float = EMBED_LATENCY) -> FastAPI:
+    """The Ollama endpoints used by OllamaEmbeddingClient"""
+    app = FastAPI()
+    app.state.n_requests = 0
+
+    @app.get("/api/tags")
+    def tags():
+        return {"models": []}
+
+    @app.post("/api/pull")
+    def pull(payload: dict):
+        return {"status": "success"}
+
+    @app.post("/api/embed")
+    def embed(payload: dict):
+        app.state.n_requests += 1
+        if latency:
+            time.sleep(latency)
+        texts = payload["input"]
+        return {
+            "model": payload["model"],
+            "embeddings": [fake_embedding(text, dim) for text in texts],
+            "prompt_eval_count": sum(map(approx_token_count, texts)),
+        }
+
+    return app
+
+
+def get_write_seconds(stats: dict) -> float:
+    """Total time the writer connection was held, from the connection stats"""
+    write = stats.get("write")
+    if write is None:
+        return 0.0
+    return write["count"] * write["avg_held_ms"] / 1000
+
+
+def drain_embedding_backlog(
+    ollama_url: str,
+    page_size: int = 32,
+    max_seconds: float = MAX_DRAIN_SECONDS,
+) -> dict[str, Any]:
+    """
+    Drain the embedding backlog like the remote indexer: gather chunks of
+    unembedded messages, embed them with the document prefix and store them,
+    until every message is embedded.
+    """
+    embedding_client = OllamaEmbeddingClient(base_url=ollama_url)
+    with get_slack_connection(readonly=True) as conn:
+        backlog = count_messages_without_embeddings(conn)
+
+    n_chunks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < max_seconds:
+        with get_slack_connection(readonly=True) as conn:
+            chunks = gather_chunks_without_embeddings(conn, limit=page_size)
+        if not chunks:
+            break
+        embeddings = embedding_client.embed(
+            [DOCUMENT_PREFIX + chunk.chunk_text for chunk in chunks]
+        )
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk.embedding = embedding
+        with get_slack_connection() as conn:
+            upsert_chunks(conn, chunks)
+        n_chunks += len(chunks)
+    seconds = time.perf_counter() - start
+
+    with get_slack_connection(readonly=True) as conn:
+        remaining = count_messages_without_embeddings(conn)
+    embedded = backlog - remaining
+    return {
+        "backlog_messages": backlog,
+        "chunks": n_chunks,
+        "remaining_messages": remaining,
+        "drain_seconds": round(seconds, 3),
+        "messages_per_second": round(embedded / seconds, 1) if seconds else None,
+    }
+
+
+def run_benchmark(
+    spec: WorkspaceSpec | None = None,
+    db_dir: Path | None = None,
+    concurrency: int = 4,
+    thread_fetch_concurrency: int = 8,
+    speedup: float = SPEEDUP,
+    api_latency: float = API_LATENCY,
+    embed: bool = True,
+    embed_latency: float = EMBED_LATENCY,
+    page_size: int = 32,
+) -> dict[str, Any]:
+    """Sync a synthetic workspace into a fresh database and embed it"""
+    spec = spec or WorkspaceSpec()
+    db_dir = Path(db_dir or tempfile.mkdtemp())
+    db_dir.mkdir(parents=True, exist_ok=True)
+    api = FakeSlackAPI(spec, speedup=speedup, latency=api_latency)
+    # The client respects the raised tier limits, with the usual safety margin
+    rate_limiter = SlackRateLimiter(safety_factor=SAFETY_FACTOR * speedup)
+
+    results: dict[str, Any] = {"spec": asdict(spec), "db_dir": str(db_dir)}
+    previous_db_path = settings.slack_mcp_db_path
+    settings.slack_mcp_db_path = str(db_dir / "db.sqlite")
+    try:
+        with serve_in_thread(api.app) as port:
+            client = RateLimitedWebClient(
+                token="xoxb-benchmark",
+                base_url=f"http://127.0.0.1:{port}/api/",
+                rate_limiter=rate_limiter,
+            )
+            min_ts = time.time() - (spec.days + 1) * 24 * 60 * 60
+            start = time.perf_counter()
+            n_messages, _ = run_slack_mesage_dump_background_worker_single(
+                client, min_ts, concurrency, thread_fetch_concurrency
+            )
+            sync_seconds = time.perf_counter() - start
+
+        db_stats = get_connection_manager().get_stats()
+        with get_slack_connection(readonly=True) as conn:
+            indexer_backlog = count_messages_without_embeddings(conn)
+        limiter_metrics = rate_limiter.get_metrics()
+        results["sync"] = {
+            "messages": n_messages,
+            "expected_messages": api.count_messages(),
+            "seconds": round(sync_seconds, 3),
+            "messages_per_second": round(n_messages / sync_seconds, 1),
+            "api_calls": api.n_calls,
+            "api_calls_per_message": (
+                round(api.n_calls / n_messages, 4) if n_messages else None
+            ),
+            "api_calls_per_method": dict(api.calls_per_method.most_common()),
+            "rate_limited_responses": api.n_rate_limited,
+            "rate_limit_wait_seconds": round(
+                sum(
+                    m["avg_wait_ms"] * m["calls"] / 1000
+                    for m in limiter_metrics.values()
+                ),
+                3,
+            ),
+            "db_write_seconds": round(get_write_seconds(db_stats), 3),
+            "db_writes": db_stats.get("write", {}).get("count", 0),
+            "indexer_backlog_messages": indexer_backlog,
+        }
+
+        if embed:
+            app = create_fake_ollama_app(EMBEDDINGS_LEN, latency=embed_latency)
+            with serve_in_thread(app) as port:
+                results["embedding"] = drain_embedding_backlog(
+                    f"http://127.0.0.1:{port}", page_size=page_size
+                )
+            results["embedding"]["requests"] = app.state.n_requests
+    finally:
+        settings.slack_mcp_db_path = previous_db_path
+    return results
+
+
+def print_results(results: dict[str, Any]):
+    sync = results["sync"]
+    print("\n" + "=" * 50)
+    print("SYNC BENCHMARK")
+    print("=" * 50)
+    print(f"Messages: {sync['messages']} of {sync['expected_messages']}")
+    print(f"  Total time: {sync['seconds']:.2f}s")
+    print(f"  Rate: {sync['messages_per_second']} messages/sec")
+    print(f"  API calls: {sync['api_calls']} ({sync['api_calls_per_message']}/message)")
+    for key, n_calls in sync["api_calls_per_method"].items():
+        print(f"    {key}: {n_calls}")
+    print(f"  429 responses: {sync['rate_limited_responses']}")
+    print(f"  Rate limit wait: {sync['rate_limit_wait_seconds']:.2f}s")
+    print(
+        f"  DB write time: {sync['db_write_seconds']:.2f}s in {sync['db_writes']} writes"
+    )
+    print(f"  Indexer backlog: {sync['indexer_backlog_messages']} messages")
+
+    embedding = results.get("embedding")
+    if embedding:
+        print("\n" + "=" * 50)
+        print("EMBEDDING BACKLOG")
+        print("=" * 50)
+        print(
+            f"Backlog: {embedding['backlog_messages']} messages, "
+            f"embedded in {embedding['chunks']} chunks"
+        )
+        print(f"  Drain time: {embedding['drain_seconds']:.2f}s")
+        print(f"  Rate: {embedding['messages_per_second']} messages/sec")
+        print(f"  Embedding requests: {embedding['requests']}")
+        print(f"  Remaining: {embedding['remaining_messages']} messages")
+
+
+def main():
+    defaults = WorkspaceSpec()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--channels", type=int, default=defaults.n_channels)
+    parser.add_argument("--messages", type=int, default=defaults.messages_per_channel)
+    parser.add_argument("--thread-every", type=int, default=defaults.thread_every)
+    parser.add_argument("--replies", type=int, default=defaults.replies_per_thread)
+    parser.add_argument("--users", type=int, default=defaults.n_users)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--thread-concurrency", type=int, default=8)
+    parser.add_argument("--speedup", type=float, default=SPEEDUP)
+    parser.add_argument("--api-latency", type=float, default=API_LATENCY)
+    parser.add_argument("--embed-latency", type=float, default=EMBED_LATENCY)
+    parser.add_argument("--page-size", type=int, default=32)
+    parser.add_argument("--no-embed", action="store_true")
+    parser.add_argument("--db-dir", type=Path, default=None)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    spec = WorkspaceSpec(
+        n_channels=args.channels,
+        messages_per_channel=args.messages,
+        thread_every=args.thread_every,
+        replies_per_thread=args.replies,
+        n_users=args.users,
+        days=args.days,
+        seed=args.seed,
+    )
+    results = run_benchmark(
+        spec,
+        db_dir=args.db_dir,
+        concurrency=args.concurrency,
+        thread_fetch_concurrency=args.thread_concurrency,
+        speedup=args.speedup,
+        api_latency=args.api_latency,
+        embed=not args.no_embed,
+        embed_latency=args.embed_latency,
+        page_size=args.page_size,
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
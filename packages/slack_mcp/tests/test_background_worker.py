@@ -0,0 +1,218 @@
+"""Test the incremental Slack sync: cursors, gaps and thread refreshes."""
+
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from slack_mcp.background_worker import (
+    expand_page,
+    fetch_thread_replies,
+    sync_channel,
+    sync_new_messages,
+    write_page,
+)
+from slack_mcp.db import get_channel_sync_state, get_slack_connection
+from slack_mcp.models import ChannelSyncState
+
+CHANNEL_ID = "C1"
+# Recent enough for the thread refresh window
+BASE_TS = int(time.time()) - 24 * 60 * 60
+
+
+def ts_of(i: int) -> str:
+    return f"{BASE_TS + i}.000100"
+
+
+class FakeSlackClient:
+    """conversations.history and conversations.replies of a single channel"""
+
+    def __init__(self, page_size: int = 5):
+        self.page_size = page_size
+        self.history: dict[str, dict] = {}
+        self.replies: dict[str, list[dict]] = {}
+        self.calls = Counter()
+
+    def post(self, i: int):
+        self.history[ts_of(i)] = {
+            "type": "message",
+            "user": "U1",
+            "ts": ts_of(i),
+            "text": f"message {i}",
+        }
+
+    def reply(self, parent: int, i: int):
+        parent_ts = ts_of(parent)
+        replies = self.replies.setdefault(parent_ts, [])
+        replies.append(
+            {
+                "type": "message",
+                "user": "U2",
+                "ts": ts_of(i),
+                "text": f"reply {i}",
+                "thread_ts": parent_ts,
+                "parent_user_id": "U1",
+            }
+        )
+        self.history[parent_ts].update(
+            thread_ts=parent_ts, reply_count=len(replies), latest_reply=ts_of(i)
+        )
+
+    def conversations_history(
+        self, channel, oldest=None, latest=None, limit=200, cursor=None
+    ):
+        self.calls["conversations.history"] += 1
+        messages = sorted(
+            (
+                message
+                for ts, message in self.history.items()
+                if (oldest is None or float(ts) > float(oldest))
+                and (latest is None or float(ts) < float(latest))
+            ),
+            key=lambda m: float(m["ts"]),
+            reverse=True,
+        )
+        start = int(cursor or 0)
+        end = start + min(limit, self.page_size)
+        next_cursor = str(end) if end < len(messages) else ""
+        return {
+            "messages": [dict(m) for m in messages[start:end]],
+            "has_more": bool(next_cursor),
+            "response_metadata": {"next_cursor": next_cursor},
+        }
+
+    def conversations_replies(self, channel, ts, limit=200, cursor=None):
+        self.calls["conversations.replies"] += 1
+        messages = [self.history[ts], *self.replies.get(ts, [])]
+        return {
+            "messages": [dict(m) for m in messages[:limit]],
+            "response_metadata": {"next_cursor": ""},
+        }
+
+
+def stored_texts() -> set[str]:
+    with get_slack_connection(readonly=True) as conn:
+        rows = conn.execute(
+            "SELECT text FROM messages WHERE channel_id = ?", (CHANNEL_ID,)
+        ).fetchall()
+    return {row["text"] for row in rows}
+
+
+def stored_state() -> ChannelSyncState:
+    with get_slack_connection(readonly=True) as conn:
+        return get_channel_sync_state(conn, CHANNEL_ID)
+
+
+def test_large_gap_is_resumed_before_new_messages(slack_db):
+    client = FakeSlackClient(page_size=5)
+    for i in range(11, 36):
+        client.post(i)
+    state = ChannelSyncState(
+        channel_id=CHANNEL_ID, latest_ts=ts_of(10), oldest_ts=ts_of(0)
+    )
+
+    # Two pages: the newest messages, the rest stays a gap
+    assert sync_new_messages(client, state, max_pages=2) == (10, 0)
+    assert stored_texts() == {f"message {i}" for i in range(26, 36)}
+    assert stored_state().latest_ts == ts_of(35)
+    assert (state.gap_oldest_ts, state.gap_latest_ts) == (ts_of(10), ts_of(26))
+    assert stored_state().gap_latest_ts == ts_of(26)
+
+    # The gap is filled from its newest end
+    assert sync_new_messages(client, state, max_pages=2) == (10, 0)
+    assert state.gap_latest_ts == ts_of(16)
+
+    # Closing the gap continues with what is new since
+    for i in range(36, 39):
+        client.post(i)
+    assert sync_new_messages(client, state, max_pages=10) == (8, 0)
+    assert stored_texts() == {f"message {i}" for i in range(11, 39)}
+    final_state = stored_state()
+    assert final_state.latest_ts == ts_of(38)
+    assert final_state.gap_oldest_ts is None
+    assert final_state.gap_latest_ts is None
+
+
+def test_sync_without_new_messages_keeps_the_cursors(slack_db):
+    client = FakeSlackClient()
+    state = ChannelSyncState(channel_id=CHANNEL_ID, latest_ts=ts_of(10))
+
+    assert sync_new_messages(client, state) == (0, 0)
+    assert client.calls["conversations.history"] == 1
+    assert state.latest_ts == ts_of(10)
+    assert state.gap_oldest_ts is None
+
+
+def test_new_replies_to_older_threads_are_refreshed(slack_db):
+    client = FakeSlackClient()
+    for i in range(1, 11):
+        client.post(i)
+    client.reply(parent=5, i=12)
+    min_ts = BASE_TS - 1
+
+    # First pass: backfill of the history and the thread
+    assert sync_channel(client, CHANNEL_ID, min_ts) == (11, 0)
+    assert stored_state().latest_ts == ts_of(10)
+
+    # A new reply to a thread below the mark and a new message
+    client.reply(parent=5, i=13)
+    client.post(11)
+    client.calls.clear()
+    inserted, updated = sync_channel(client, CHANNEL_ID, min_ts)
+
+    assert "reply 13" in stored_texts()
+    assert "message 11" in stored_texts()
+    assert inserted == 2
+    # The parent check and the expansion of the changed thread
+    assert client.calls["conversations.replies"] == 2
+
+    # Nothing changed, only the parent is checked
+    client.calls.clear()
+    assert sync_channel(client, CHANNEL_ID, min_ts)[0] == 0
+    assert client.calls["conversations.replies"] == 1
+
+
+def test_expand_page_fetches_only_changed_threads(slack_db):
+    client = FakeSlackClient()
+    for i in range(1, 5):
+        client.post(i)
+    client.reply(parent=1, i=10)
+    client.reply(parent=2, i=11)
+    client.history[ts_of(4)].pop("user")  # a bot message
+    page = client.conversations_history(CHANNEL_ID)["messages"]
+    state = ChannelSyncState(channel_id=CHANNEL_ID)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        messages = expand_page(client, CHANNEL_ID, page, executor)
+        assert sorted(m["text"] for m in messages) == [
+            "message 1",
+            "message 2",
+            "message 3",
+            "reply 10",
+            "reply 11",
+        ]
+        assert all(m["channel_id"] == CHANNEL_ID for m in messages)
+        write_page(messages, state)
+
+        # Only the thread with a new reply is fetched again
+        client.reply(parent=2, i=12)
+        page = client.conversations_history(CHANNEL_ID)["messages"]
+        client.calls.clear()
+        messages = expand_page(client, CHANNEL_ID, page, executor)
+
+    assert client.calls["conversations.replies"] == 1
+    assert {m["text"] for m in messages} >= {"reply 11", "reply 12"}
+    assert "reply 10" not in {m["text"] for m in messages}
+
+
+def test_concurrent_reply_fetches_keep_the_thread_order(slack_db):
+    client = FakeSlackClient()
+    for i in range(1, 7):
+        client.post(i)
+        client.reply(parent=i, i=10 + i)
+    thread_tss = [ts_of(i) for i in range(1, 7)]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        replies = fetch_thread_replies(client, CHANNEL_ID, thread_tss, executor)
+
+    assert [m["text"] for m in replies] == [f"reply {10 + i}" for i in range(1, 7)]
+    assert replies == fetch_thread_replies(client, CHANNEL_ID, thread_tss)
@@ -0,0 +1,69 @@
+"""Test the sync benchmark and its fake Slack Web API."""
+
+import httpx
+from sync_benchmark import FakeSlackAPI, WorkspaceSpec, run_benchmark, serve_in_thread
+
+SPEC = WorkspaceSpec(
+    n_channels=2,
+    messages_per_channel=150,
+    thread_every=10,
+    replies_per_thread=3,
+    n_users=5,
+    days=5,
+)
+
+
+def test_fake_api_paginates_and_rate_limits():
+    # conversations.history is tier 3, 50 calls per minute, so 2 calls are allowed
+    api = FakeSlackAPI(SPEC, speedup=0.04, latency=0)
+    channel_id = api.channel_ids[0]
+
+    newest = api.conversations_history({"channel": channel_id, "limit": "100"})
+    cursor = newest["response_metadata"]["next_cursor"]
+    older = api.conversations_history(
+        {"channel": channel_id, "limit": "100", "cursor": cursor}
+    )
+    assert len(newest["messages"]) == 100 and len(older["messages"]) == 50
+    assert not older["has_more"]
+    tss = [m["ts"] for m in newest["messages"] + older["messages"]]
+    assert tss == sorted(tss, key=float, reverse=True)
+
+    # Replies come with their parent first
+    parent = next(m for m in newest["messages"] if m.get("reply_count"))
+    replies = api.conversations_replies({"channel": channel_id, "ts": parent["ts"]})
+    assert replies["messages"][0]["ts"] == parent["ts"]
+    assert len(replies["messages"]) == SPEC.replies_per_thread + 1
+
+    # The same seed gives the same workspace, timestamps are relative to now
+    again = FakeSlackAPI(SPEC, latency=0).conversations_history(
+        {"channel": channel_id, "limit": "5"}
+    )
+    assert [m["text"] for m in again["messages"]] == [
+        m["text"] for m in newest["messages"][:5]
+    ]
+
+    with serve_in_thread(api.app) as port:
+        url = f"http://127.0.0.1:{port}/api/conversations.history"
+        with httpx.Client() as client:
+            responses = [
+                client.get(url, params={"channel": channel_id}) for _ in range(3)
+            ]
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert int(responses[2].headers["Retry-After"]) > 0
+    assert api.n_rate_limited == 1
+
+
+def test_benchmark_syncs_and_embeds_the_workspace(tmp_path):
+    results = run_benchmark(SPEC, db_dir=tmp_path, api_latency=0, embed_latency=0)
+
+    sync = results["sync"]
+    # Bot messages are skipped
+    assert sync["messages"] == sync["expected_messages"]
+    assert sync["api_calls_per_message"] < 0.2
+    assert sync["indexer_backlog_messages"] == sync["messages"]
+
+    embedding = results["embedding"]
+    assert embedding["backlog_messages"] == sync["messages"]
+    assert embedding["remaining_messages"] == 0
+    # Messages are embedded in conversation windows
+    assert embedding["chunks"] < sync["messages"]
@@ -0,0 +1,49 @@
+"""Test grouping Slack messages into conversation windows."""
+
+import uuid
+
+from slack_mcp.chunking import chunk_messages
+from slack_mcp.models import SlackMessage
+
+
+def make_message(i: int, text: str = "hello there", thread: int | None = None):
+    fields = {key: None for key in SlackMessage.model_fields}
+    return SlackMessage(
+        **{
+            **fields,
+            "channel_id": "C1",
+            "user": "U1",
+            "type": "message",
+            "ts": f"{1700000000 + i * 60}.000100",
+            "text": text,
+            "thread_ts": None
+            if thread is None
+            else f"{1700000000 + thread * 60}.000100",
+        }
+    )
+
+
+def test_thread_replies_are_their_own_conversation():
+    channel = [make_message(i) for i in range(3)]
+    replies = [make_message(i, thread=1) for i in range(3, 5)]
+
+    chunks = chunk_messages(channel + replies)
+
+    assert [chunk.tss for chunk in chunks] == [
+        [m.ts for m in channel],
+        [m.ts for m in replies],
+    ]
+    assert chunks[0].chunk_text == "hello there\nhello there\nhello there"
+
+
+def test_trailing_chunk_keeps_its_id():
+    trailing = [make_message(i) for i in range(2)]
+    new_messages = [make_message(i) for i in range(2, 4)]
+
+    chunk_id = str(uuid.uuid4())
+
+    chunks = chunk_messages(new_messages, {("C1", ""): (chunk_id, trailing)})
+
+    assert len(chunks) == 1
+    assert str(chunks[0].chunk_id) == chunk_id
+    assert chunks[0].tss == [m.ts for m in trailing + new_messages]
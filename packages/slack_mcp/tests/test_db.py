@@ -0,0 +1,98 @@
+"""Test the message upserts and the chunk tables of the Slack database."""
+
+from slack_mcp.db import (
+    EMBEDDINGS_LEN,
+    count_messages_without_embeddings,
+    gather_chunks_without_embeddings,
+    get_chunk_messages,
+    get_message,
+    upsert_chunks,
+    upsert_message,
+    upsert_messages,
+)
+
+
+def make_message(channel_id: str, ts: str, text: str = "hi", **fields) -> dict:
+    """A message as returned by conversations.history"""
+    return {
+        "channel_id": channel_id,
+        "user": "U1",
+        "type": "message",
+        "ts": ts,
+        "text": text,
+        **fields,
+    }
+
+
+def test_upsert_messages_counts_inserts_and_updates(conn):
+    messages = [make_message("C1", f"1700000000.00000{i}") for i in range(3)]
+    assert upsert_messages(conn, messages) == (3, 0)
+
+    changed = [
+        make_message("C1", "1700000000.000001", text="edited", reply_count=2),
+        make_message("C2", "1700000000.000001"),
+    ]
+    assert upsert_messages(conn, changed) == (1, 1)
+
+    message = get_message(conn, "C1", "1700000000.000001")
+    assert message.text == "edited"
+    assert message.reply_count == 2
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 4
+
+
+def test_upsert_messages_last_duplicate_wins(conn):
+    messages = [
+        make_message("C1", "1700000000.000001", text="first"),
+        make_message("C1", "1700000000.000001", text="second"),
+    ]
+
+    assert upsert_messages(conn, messages) == (1, 0)
+    assert get_message(conn, "C1", "1700000000.000001").text == "second"
+    assert upsert_messages(conn, []) == (0, 0)
+
+
+def test_upsert_message_stores_json_fields(conn):
+    upsert_message(
+        conn,
+        make_message(
+            "C1",
+            "1700000000.000001",
+            reply_users=["U2", "U3"],
+            reactions=[{"name": "thumbsup", "count": 1}],
+        ),
+    )
+
+    message = get_message(conn, "C1", "1700000000.000001")
+    assert message.reply_users == ["U2", "U3"]
+    assert message.reactions == [{"name": "thumbsup", "count": 1}]
+    assert message.blocks is None
+
+
+def test_chunks_extend_the_trailing_chunk_of_a_conversation(conn):
+    upsert_messages(
+        conn, [make_message("C1", f"170000000{i}.000100") for i in range(2)]
+    )
+    upsert_messages(
+        conn,
+        [make_message("C1", "1700000005.000100", thread_ts="1700000000.000100")],
+    )
+
+    first = gather_chunks_without_embeddings(conn)
+    # The channel and the thread are separate conversations
+    assert sorted(len(chunk.tss) for chunk in first) == [1, 2]
+    for chunk in first:
+        chunk.embedding = [0.0] * EMBEDDINGS_LEN
+    upsert_chunks(conn, first)
+    assert count_messages_without_embeddings(conn) == 0
+
+    upsert_messages(conn, [make_message("C1", "1700000002.000100", text="new")])
+    [extended] = gather_chunks_without_embeddings(conn)
+    channel_chunk = next(chunk for chunk in first if len(chunk.tss) == 2)
+    assert extended.chunk_id == channel_chunk.chunk_id
+    extended.embedding = [0.0] * EMBEDDINGS_LEN
+    upsert_chunks(conn, [extended])
+
+    [with_messages] = get_chunk_messages(conn, [extended])
+    assert [m.text for m in with_messages.messages] == ["hi", "hi", "new"]
+    n_mapped = conn.execute("SELECT COUNT(*) FROM chunk_messages").fetchone()[0]
+    assert n_mapped == 4
@@ -0,0 +1,124 @@
+"""Test the backlog-driven dispatch of the remote indexer."""
+
+import threading
+import time
+
+import pytest
+from slack_mcp.remote_server.dispatcher import (
+    EMBEDDING_RETRY_SECONDS,
+    INITIAL_BACKOFF_SECONDS,
+    MAX_BACKOFF_SECONDS,
+    IndexingDispatcher,
+    backoff_seconds,
+)
+
+
+@pytest.fixture
+def dispatcher() -> IndexingDispatcher:
+    dispatcher = IndexingDispatcher()
+    dispatcher.sync_users([1, 2, 3])
+    return dispatcher
+
+
+def stats_of(dispatcher: IndexingDispatcher, user_id: int) -> dict:
+    return next(s for s in dispatcher.get_stats() if s["user_id"] == user_id)
+
+
+def test_backoff_doubles_up_to_the_max():
+    assert backoff_seconds(0) == INITIAL_BACKOFF_SECONDS
+    assert backoff_seconds(1) == INITIAL_BACKOFF_SECONDS
+    assert backoff_seconds(3) == INITIAL_BACKOFF_SECONDS * 4
+    assert backoff_seconds(100) == MAX_BACKOFF_SECONDS
+
+
+def test_users_with_a_backlog_go_first(dispatcher):
+    dispatcher.report_backlog(3, 50)
+
+    assert dispatcher.next_users(3, exclude=set()) == [3, 1, 2]
+    assert dispatcher.next_users(3, exclude={3}) == [1, 2]
+
+
+def test_least_recently_served_backlog_goes_first(dispatcher):
+    dispatcher.report_backlog(1, 500)
+    dispatcher.report_backlog(2, 10)
+    dispatcher.record_turn(1, n_chunks=200, backlog=300, reachable=True)
+
+    # Both still have work, user 1 was just served
+    assert dispatcher.next_users(2, exclude=set()) == [2, 1]
+
+
+def test_idle_and_unreachable_users_back_off(dispatcher):
+    dispatcher.record_turn(1, n_chunks=0, backlog=0, reachable=True)
+    dispatcher.record_turn(2, n_chunks=0, backlog=None, reachable=False)
+    dispatcher.record_turn(2, n_chunks=0, backlog=None, reachable=False)
+
+    assert dispatcher.next_users(3, exclude=set()) == [3]
+    assert stats_of(dispatcher, 1)["n_idle"] == 1
+    assert stats_of(dispatcher, 2)["n_idle"] == 2
+    assert stats_of(dispatcher, 2)["next_poll_in_seconds"] == pytest.approx(
+        backoff_seconds(2), abs=0.2
+    )
+
+
+def test_heartbeat_with_a_backlog_ends_the_backoff(dispatcher):
+    for _ in range(5):
+        dispatcher.record_turn(1, n_chunks=0, backlog=0, reachable=True)
+    assert 1 not in dispatcher.next_users(3, exclude=set())
+
+    dispatcher.report_backlog(1, 0)
+    assert 1 not in dispatcher.next_users(3, exclude=set())
+
+    dispatcher.report_backlog(1, 20)
+    assert dispatcher.next_users(1, exclude=set()) == [1]
+    assert stats_of(dispatcher, 1)["n_idle"] == 0
+
+
+def test_productive_turns_are_polled_again(dispatcher):
+    dispatcher.record_turn(1, n_chunks=200, backlog=100, reachable=True)
+    dispatcher.record_turn(2, n_chunks=200, backlog=None, reachable=True)
+    dispatcher.record_turn(3, n_chunks=50, backlog=0, reachable=True)
+
+    # Users 1 and 2 may have more work, user 3 drained its backlog
+    assert dispatcher.next_users(3, exclude=set()) == [1, 2]
+    assert stats_of(dispatcher, 3)["next_poll_in_seconds"] == pytest.approx(
+        INITIAL_BACKOFF_SECONDS, abs=0.2
+    )
+    assert stats_of(dispatcher, 3)["n_idle"] == 0
+
+
+def test_embedding_failures_do_not_back_off_the_user(dispatcher):
+    for _ in range(3):
+        dispatcher.record_turn(
+            1, n_chunks=0, backlog=100, reachable=True, embedding_failed=True
+        )
+
+    stats = stats_of(dispatcher, 1)
+    assert stats["n_idle"] == 0
+    assert stats["backlog"] == 100
+    assert stats["next_poll_in_seconds"] == pytest.approx(
+        EMBEDDING_RETRY_SECONDS, abs=0.2
+    )
+
+
+def test_sync_users_drops_removed_users(dispatcher):
+    dispatcher.sync_users([2, 4])
+
+    assert sorted(s["user_id"] for s in dispatcher.get_stats()) == [2, 4]
+
+
+def test_heartbeat_wakes_up_the_dispatch_loop(dispatcher):
+    for user_id in (1, 2, 3):
+        dispatcher.record_turn(user_id, n_chunks=0, backlog=0, reachable=True)
+    stop_event = threading.Event()
+    # Consume the change flag of the turns above
+    dispatcher.wait(stop_event, running=set(), full=False)
+
+    timer = threading.Timer(0.1, dispatcher.report_backlog, args=(2, 5))
+    timer.start()
+    start = time.monotonic()
+    dispatcher.wait(stop_event, running=set(), full=False)
+    elapsed = time.monotonic() - start
+    timer.join()
+
+    assert 0.05 < elapsed < 1
+    assert dispatcher.next_users(3, exclude=set()) == [2]
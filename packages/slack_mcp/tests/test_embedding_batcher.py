@@ -0,0 +1,130 @@
+"""Test the micro-batching of embedding requests in the nomic server."""
+
+import asyncio
+import time
+
+import pytest
+from slack_mcp.remote_server.embedding_batcher import (
+    MAX_INPUT_TOKENS,
+    EmbeddingBatcher,
+    length_bucket,
+)
+
+
+def count_tokens(prompts: list[str]) -> list[int]:
+    return [len(prompt.split()) for prompt in prompts]
+
+
+def make_prompt(n_tokens: int, name: str = "x") -> str:
+    return " ".join([name] * n_tokens)
+
+
+class RecordingEmbedder:
+    """Embeds a prompt as [number of tokens], records the batches"""
+
+    def __init__(self, fail: bool = False):
+        self.batches: list[list[str]] = []
+        self.fail = fail
+
+    def __call__(self, prompts: list[str]) -> list[list[float]]:
+        self.batches.append(prompts)
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return [[float(n)] for n in count_tokens(prompts)]
+
+
+async def run_with_batcher(batcher: EmbeddingBatcher, coro_fn):
+    batcher.start()
+    try:
+        return await coro_fn()
+    finally:
+        await batcher.stop()
+
+
+def test_length_bucket():
+    assert length_bucket(1) == 16
+    assert length_bucket(16) == 16
+    assert length_bucket(17) == 32
+    assert length_bucket(300) == 512
+    assert length_bucket(10_000) == MAX_INPUT_TOKENS
+
+
+def test_concurrent_requests_share_batches_per_length_bucket():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, count_tokens, deadline_seconds=0.05)
+    requests = [
+        [make_prompt(5, "a"), make_prompt(100, "b")],
+        [make_prompt(8, "c")],
+        [make_prompt(120, "d"), make_prompt(3, "e")],
+    ]
+
+    async def embed_concurrently():
+        return await asyncio.gather(*[batcher.embed(r) for r in requests])
+
+    results = asyncio.run(run_with_batcher(batcher, embed_concurrently))
+
+    # Results come back per request, in order
+    assert results == [[[5.0], [100.0]], [[8.0]], [[120.0], [3.0]]]
+    batches = sorted(sorted(count_tokens(batch)) for batch in embedder.batches)
+    assert batches == [[3, 5, 8], [100, 120]]
+    metrics = batcher.get_metrics()
+    assert metrics["requests"] == 3
+    assert metrics["batches"] == 2
+    assert metrics["queued_prompts"] == 0
+
+
+def test_batches_are_capped_at_max_batch_tokens():
+    embedder = RecordingEmbedder()
+    # Prompts in the 16 token bucket, 4 per batch
+    batcher = EmbeddingBatcher(embedder, count_tokens, max_batch_tokens=64)
+    prompts = [make_prompt(10)] * 10
+
+    results = asyncio.run(run_with_batcher(batcher, lambda: batcher.embed(prompts)))
+
+    assert len(results) == 10
+    assert [len(batch) for batch in embedder.batches] == [4, 4, 2]
+
+
+def test_deadline_waits_for_other_requests():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, count_tokens, deadline_seconds=0.2)
+
+    async def staggered():
+        first = asyncio.create_task(batcher.embed([make_prompt(4)]))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(batcher.embed([make_prompt(6)]))
+        await asyncio.gather(first, second)
+        # After the batch ran, a new request starts a new batch
+        await batcher.embed([make_prompt(2)])
+
+    asyncio.run(run_with_batcher(batcher, staggered))
+
+    assert [count_tokens(batch) for batch in embedder.batches] == [[4, 6], [2]]
+
+
+def test_full_batch_skips_the_deadline():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(
+        embedder, count_tokens, max_batch_tokens=32, deadline_seconds=5
+    )
+
+    async def embed_full_batch():
+        start = time.perf_counter()
+        await batcher.embed([make_prompt(10), make_prompt(12)])
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run_with_batcher(batcher, embed_full_batch))
+
+    assert elapsed < 1
+    assert len(embedder.batches) == 1
+
+
+def test_inference_errors_reach_the_callers():
+    batcher = EmbeddingBatcher(RecordingEmbedder(fail=True), count_tokens)
+
+    async def embed():
+        with pytest.raises(RuntimeError, match="model crashed"):
+            await batcher.embed([make_prompt(4)])
+        assert await batcher.embed([]) == []
+
+    asyncio.run(run_with_batcher(batcher, embed))
@@ -0,0 +1,96 @@
+"""Test the pooled Ollama client that embeds search queries."""
+
+import pytest
+import requests
+from slack_mcp.embeddings import EMBEDDING_MODEL, QUERY_PREFIX, OllamaEmbeddingClient
+
+
+class FakeResponse:
+    def __init__(self, data: dict, status_code: int = 200):
+        self.data = data
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self) -> dict:
+        return self.data
+
+
+class FakeOllamaSession:
+    """The /api/tags, /api/pull and /api/embed endpoints of an Ollama server"""
+
+    def __init__(self, models: list[str]):
+        self.models = set(models)
+        self.requests: list[tuple[str, dict | None]] = []
+
+    def get(self, url, timeout=None):
+        self.requests.append((url.rsplit("/", 1)[-1], None))
+        return FakeResponse({"models": [{"name": m} for m in self.models]})
+
+    def post(self, url, json=None, timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.requests.append((endpoint, json))
+        if endpoint == "pull":
+            self.models.add(json["model"])
+            return FakeResponse({"status": "success"})
+        if json["model"] not in self.models:
+            return FakeResponse({"error": "model not found"}, status_code=404)
+        return FakeResponse({"embeddings": [[float(len(s))] for s in json["input"]]})
+
+    def endpoints(self) -> list[str]:
+        return [endpoint for endpoint, _ in self.requests]
+
+
+def make_client(models: list[str]) -> tuple[OllamaEmbeddingClient, FakeOllamaSession]:
+    client = OllamaEmbeddingClient(base_url="http://ollama")
+    client.session = FakeOllamaSession(models)
+    return client, client.session
+
+
+def test_model_is_checked_once():
+    client, session = make_client([EMBEDDING_MODEL])
+
+    assert client.embed(["a", "bb"]) == [[1.0], [2.0]]
+    assert client.embed(["ccc"]) == [[3.0]]
+
+    assert session.endpoints() == ["tags", "embed", "embed"]
+
+
+def test_missing_model_is_pulled():
+    client, session = make_client([])
+
+    client.embed(["a"])
+
+    assert session.endpoints() == ["tags", "pull", "embed"]
+
+
+def test_removed_model_is_pulled_again():
+    client, session = make_client([EMBEDDING_MODEL])
+    client.embed(["a"])
+    session.models.clear()
+
+    assert client.embed(["bb"]) == [[2.0]]
+    assert session.endpoints()[1:] == ["embed", "embed", "tags", "pull", "embed"]
+
+
+def test_queries_are_prefixed_and_cached():
+    client, session = make_client([EMBEDDING_MODEL])
+
+    first = client.embed_query("hello")
+    second = client.embed_query("hello")
+
+    assert first == second == [float(len(QUERY_PREFIX + "hello"))]
+    embed_requests = [body for endpoint, body in session.requests if body]
+    assert embed_requests == [
+        {"model": EMBEDDING_MODEL, "input": [QUERY_PREFIX + "hello"]}
+    ]
+
+
+def test_wrong_number_of_embeddings_is_an_error():
+    client, session = make_client([EMBEDDING_MODEL])
+    session.post = lambda url, json=None, timeout=None: FakeResponse({"embeddings": []})
+
+    with pytest.raises(ValueError, match="No embeddings returned"):
+        client.embed(["a"])
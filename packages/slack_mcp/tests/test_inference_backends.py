@@ -0,0 +1,71 @@
+"""Test the inference backends of the nomic server, needs the embeddings group."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from slack_mcp.remote_server.embedding_batcher import MAX_INPUT_TOKENS  # noqa: E402
+from slack_mcp.remote_server.inference_backends import (  # noqa: E402
+    EMBEDDING_DIM,
+    EmbeddingBackend,
+    MockBackend,
+    check_accuracy,
+    create_backend,
+    l2_normalize,
+    mean_pool,
+)
+
+
+def test_mean_pool_ignores_padding():
+    last_hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]])
+    attention_mask = np.array([[1, 1, 0]])
+
+    assert mean_pool(last_hidden, attention_mask).tolist() == [[2.0, 3.0]]
+
+
+def test_l2_normalize_returns_unit_vectors():
+    embeddings = l2_normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+
+    assert embeddings[0].tolist() == pytest.approx([0.6, 0.8])
+    # Zero vectors stay zero instead of turning into NaNs
+    assert embeddings[1].tolist() == [0.0, 0.0]
+
+
+def test_create_backend():
+    backend = create_backend("mock", "nomic-ai/nomic-embed-text-v1.5")
+
+    assert isinstance(backend, MockBackend)
+    with pytest.raises(ValueError, match="Unknown backend"):
+        create_backend("tpu", "nomic-ai/nomic-embed-text-v1.5")
+
+
+def test_backends_must_implement_embed():
+    with pytest.raises(TypeError):
+        EmbeddingBackend("nomic-ai/nomic-embed-text-v1.5")
+
+
+def test_mock_backend():
+    backend = MockBackend("nomic-ai/nomic-embed-text-v1.5")
+    backend.load()
+
+    embeddings = backend.embed(["search_query: hi", "search_document: hello"])
+
+    assert len(embeddings) == 2
+    assert all(len(embedding) == EMBEDDING_DIM for embedding in embeddings)
+    assert backend.count_tokens(["a b c", "word " * 1000]) == [5, MAX_INPUT_TOKENS]
+    assert backend.warm_up(n_rounds=1) >= 0
+
+
+def test_check_accuracy_of_identical_backends():
+    class ConstantBackend(MockBackend):
+        def embed(self, prompts):
+            return [[1.0] * EMBEDDING_DIM for _ in prompts]
+
+    backend = ConstantBackend("nomic-ai/nomic-embed-text-v1.5")
+
+    accuracy = check_accuracy(backend, backend)
+
+    assert accuracy["min_cosine"] == pytest.approx(1.0)
+    assert accuracy["mean_cosine"] == pytest.approx(1.0)
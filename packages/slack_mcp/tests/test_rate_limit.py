@@ -0,0 +1,125 @@
+"""Test the shared Slack rate limiter and the web client that uses it."""
+
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from slack_mcp import rate_limit
+from slack_mcp.rate_limit import (
+    DEFAULT_RETRY_AFTER_SECONDS,
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RateLimitedWebClient,
+    SlackRateLimiter,
+    get_retry_after,
+)
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+
+METHOD = "conversations.history"
+
+
+@pytest.fixture
+def limiter(monkeypatch) -> SlackRateLimiter:
+    # 5 requests per second, a burst of 50
+    monkeypatch.setitem(rate_limit.TIER_LIMITS_PER_MINUTE, 3, 300)
+    return SlackRateLimiter(method_tiers={METHOD: 3}, safety_factor=1.0)
+
+
+def make_response(status_code: int, retry_after: str | None = None) -> SlackResponse:
+    return SlackResponse(
+        client=None,
+        http_verb="POST",
+        api_url=f"https://slack.com/api/{METHOD}",
+        req_args={},
+        data={"ok": status_code == 200},
+        headers={"Retry-After": retry_after} if retry_after else {},
+        status_code=status_code,
+    )
+
+
+def rate_limited(retry_after: str = "0.2") -> SlackApiError:
+    return SlackApiError("ratelimited", make_response(429, retry_after))
+
+
+def test_burst_then_refill_rate(limiter):
+    for _ in range(50):
+        assert limiter.acquire(METHOD) < 0.05
+
+    waited = limiter.acquire(METHOD)
+
+    assert 0.1 < waited < 0.4
+    metrics = limiter.get_metrics()[METHOD]
+    assert metrics["calls"] == 51
+    assert metrics["limit_per_minute"] == 300
+
+
+def test_interactive_requests_go_before_queued_background_requests(limiter):
+    bucket = limiter._bucket(METHOD)
+    bucket.tokens = 0.0
+    bucket.updated_at = time.monotonic()
+    order = []
+
+    def call(name: str, priority: int):
+        limiter.acquire(METHOD, priority)
+        order.append(name)
+
+    threads = [
+        threading.Thread(target=call, args=(f"background{i}", PRIORITY_BACKGROUND))
+        for i in range(3)
+    ]
+    threads.append(
+        threading.Thread(target=call, args=("interactive", PRIORITY_INTERACTIVE))
+    )
+    # The first token is available after 0.2s, everyone is queued by then
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ["interactive", "background0", "background1", "background2"]
+
+
+def test_retry_after_blocks_the_method(limiter):
+    limiter.report_rate_limited(METHOD, 0.3)
+
+    waited = limiter.acquire(METHOD)
+
+    assert waited >= 0.29
+    # Other methods have their own bucket
+    assert limiter.acquire("users.info") < 0.05
+    assert limiter.get_metrics()[METHOD]["rate_limited"] == 1
+
+
+def test_get_retry_after():
+    assert get_retry_after(make_response(429, "12")) == 12.0
+    assert get_retry_after(make_response(429)) == DEFAULT_RETRY_AFTER_SECONDS
+
+
+def test_client_retries_after_a_429(limiter):
+    client = RateLimitedWebClient(token="xoxp-test", rate_limiter=limiter)
+    ok = make_response(200)
+
+    with patch.object(WebClient, "api_call", side_effect=[rate_limited(), ok]):
+        start = time.monotonic()
+        assert client.api_call(METHOD) is ok
+        elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.19
+    assert limiter.get_metrics()[METHOD]["rate_limited"] == 1
+
+
+def test_client_gives_up_after_max_retries(limiter):
+    client = RateLimitedWebClient(
+        token="xoxp-test", rate_limiter=limiter, max_rate_limit_retries=1
+    )
+    errors = [rate_limited("0.05"), rate_limited("0.05")]
+
+    with patch.object(WebClient, "api_call", side_effect=errors) as api_call:
+        with pytest.raises(SlackApiError):
+            client.api_call(METHOD)
+
+    assert api_call.call_count == 2
@@ -0,0 +1,91 @@
+"""Test the wire format of the chunk and embedding RPCs."""
+
+import uuid
+
+import numpy as np
+import pytest
+from slack_mcp.models import Chunk
+from slack_mcp.wire import (
+    WIRE_VERSION,
+    PackedEmbeddings,
+    negotiate_version,
+    pack_chunks,
+    pack_embedded_chunks,
+    unpack_chunks,
+    unpack_embedded_chunks,
+)
+
+DIM = 768
+
+
+def make_chunks(n: int, with_embeddings: bool = False) -> list[Chunk]:
+    rng = np.random.default_rng(0)
+    return [
+        Chunk(
+            chunk_id=uuid.uuid4(),
+            channel_ids=["C1"] * 2,
+            tss=[f"1700000000.00000{i}", f"1700000001.00000{i}"],
+            chunk_text=f"search_document: hello {i}\nhow are you? ✅",
+            embedding=rng.standard_normal(DIM).tolist() if with_embeddings else None,
+        )
+        for i in range(n)
+    ]
+
+
+def test_negotiate_version():
+    assert negotiate_version(0) == 0
+    assert negotiate_version(WIRE_VERSION) == WIRE_VERSION
+    # Newer clients fall back to what the server speaks
+    assert negotiate_version(WIRE_VERSION + 1) == WIRE_VERSION
+
+
+def test_chunks_round_trip():
+    chunks = make_chunks(3)
+
+    assert unpack_chunks(pack_chunks(chunks)) == chunks
+    assert unpack_chunks(pack_chunks([])) == []
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 0), ("float16", 1e-2)])
+def test_embedded_chunks_round_trip(dtype, tolerance):
+    chunks = make_chunks(4, with_embeddings=True)
+
+    packed = pack_embedded_chunks(chunks, dtype=dtype)
+    # Goes over the RPC transport as JSON
+    packed = PackedEmbeddings.model_validate_json(packed.model_dump_json())
+    unpacked = unpack_embedded_chunks(packed)
+
+    assert packed.dim == DIM
+    assert [c.chunk_id for c in unpacked] == [c.chunk_id for c in chunks]
+    assert [c.chunk_text for c in unpacked] == [c.chunk_text for c in chunks]
+    for chunk, original in zip(unpacked, chunks):
+        assert np.allclose(chunk.embedding, original.embedding, atol=tolerance)
+
+
+def test_float16_is_smaller_than_json():
+    chunks = make_chunks(10, with_embeddings=True)
+    as_json = len("[" + ",".join(chunk.model_dump_json() for chunk in chunks) + "]")
+
+    packed = pack_embedded_chunks(chunks, dtype="float16")
+
+    assert len(packed.model_dump_json()) < as_json / 4
+
+
+def test_invalid_packed_embeddings_are_rejected():
+    chunks = make_chunks(2, with_embeddings=True)
+    packed = pack_embedded_chunks(chunks, dtype="float32")
+
+    with pytest.raises(ValueError, match="Unsupported embedding dtype"):
+        unpack_embedded_chunks(packed.model_copy(update={"dtype": "int8"}))
+    with pytest.raises(ValueError, match="embeddings for 1 chunks"):
+        unpack_embedded_chunks(
+            packed.model_copy(update={"chunks": pack_chunks(chunks[:1])})
+        )
+    chunks[1].embedding = chunks[1].embedding[:10]
+    with pytest.raises(ValueError, match="same length"):
+        pack_embedded_chunks(chunks)
+    chunks[1].embedding = None
+    with pytest.raises(ValueError, match="same length"):
+        pack_embedded_chunks(chunks)
+    with pytest.raises(ValueError, match="same length"):
+        pack_embedded_chunks([])
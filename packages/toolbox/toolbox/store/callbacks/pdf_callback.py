@@ -141,9 +141,7 @@ class InstallPDFMCPCallback(Callback):
         print(
             "📄 PDF MCP installed! Document loading will start automatically once the server is running."
         )
-        print(
-            "💡 Use 'get_loading_progress()' to track progress, or 'start_auto_loading()' to start manually."
-        )
+        print("💡 Use the 'get_indexing_status' tool to track progress.")
 
 
 class PDFMCPInstallationSummaryCallback(Callback):
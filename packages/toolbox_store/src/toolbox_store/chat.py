@@ -0,0 +1,299 @@
+"""
+Storage helpers shared by the chat connectors (Slack, Discord).
+
+Messages are grouped per conversation into windows of consecutive messages,
+and every window is embedded as one chunk. MessageChunkTables holds the
+queries on the chunk tables of a connector database.
+"""
+
+import json
+from itertools import groupby
+from typing import Any, Callable, Generic, Hashable, Iterable, Sequence, TypeVar
+
+from sqlite_vec import serialize_float32
+
+from toolbox_store.embedding import approx_token_count
+
+# Windows of consecutive messages in the same conversation are embedded together
+CHUNK_MAX_TOKENS = 256
+# A longer silence starts a new window
+CHUNK_MAX_GAP_SECONDS = 30 * 60
+CHUNK_OVERLAP_MESSAGES = 1
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+M = TypeVar("M")
+
+
+def split_into_windows(
+    messages: list[T],
+    get_text: Callable[[T], str],
+    get_time: Callable[[T], float],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    max_gap_seconds: float = CHUNK_MAX_GAP_SECONDS,
+    overlap: int = CHUNK_OVERLAP_MESSAGES,
+) -> list[list[T]]:
+    """
+    Split time sorted messages of one conversation into windows. A window is closed
+    when adding the next message would exceed max_tokens, or when the next message
+    is more than max_gap_seconds later. The last `overlap` messages of a window
+    are repeated at the start of the next one if they fit, unless the window was
+    closed by a gap.
+    """
+    windows = []
+    window = []
+    window_tokens = 0
+    for message in messages:
+        n_tokens = approx_token_count(get_text(message))
+        if window:
+            gap = get_time(message) - get_time(window[-1])
+            if gap > max_gap_seconds:
+                windows.append(window)
+                window, window_tokens = [], 0
+            elif window_tokens + n_tokens > max_tokens:
+                windows.append(window)
+                # Never carry over the whole window, the next one has to make progress
+                window = window[-overlap:] if 0 < overlap < len(window) else []
+                window_tokens = sum(approx_token_count(get_text(m)) for m in window)
+                if window_tokens + n_tokens > max_tokens:
+                    window, window_tokens = [], 0
+        window.append(message)
+        window_tokens += n_tokens
+    if window:
+        windows.append(window)
+    return windows
+
+
+def window_conversations(
+    messages: list[T],
+    get_conversation: Callable[[T], Hashable],
+    get_position: Callable[[T], Any],
+    get_text: Callable[[T], str],
+    get_time: Callable[[T], float],
+    trailing_windows: dict[Hashable, tuple[str, list[T]]] | None = None,
+) -> list[tuple[str | None, list[T]]]:
+    """
+    Group new messages into windows per conversation, ordered by get_position.
+    Returns (window id, messages) pairs, the id is None for new windows.
+
+    trailing_windows maps a conversation to the id and messages of its last
+    stored window. If that window ends before the new messages, its messages seed
+    the first window and the window keeps the id, so the stored window is replaced
+    instead of being left behind as a short fragment.
+    """
+    trailing_windows = trailing_windows or {}
+
+    windows = []
+    for key, group in groupby(
+        sorted(messages, key=lambda m: (get_conversation(m), get_position(m))),
+        key=get_conversation,
+    ):
+        new_messages = list(group)
+        trailing_id, seed = trailing_windows.get(key, (None, []))
+        if seed and get_position(seed[-1]) > get_position(new_messages[0]):
+            # Backfilled history older than the trailing window, start fresh windows
+            seed = []
+
+        conversation_windows = split_into_windows(
+            seed + new_messages, get_text=get_text, get_time=get_time
+        )
+        if seed:
+            first_window = conversation_windows.pop(0)
+            # Unless the trailing window was already closed, replace it
+            if list(map(get_position, first_window)) != list(map(get_position, seed)):
+                windows.append((trailing_id, first_window))
+        windows.extend((None, window) for window in conversation_windows)
+    return windows
+
+
+class MessageChunkTables(Generic[M]):
+    """
+    Queries on the vec0 chunk table and the chunk_messages mapping of a chat
+    connector database, shared by the Slack and Discord connectors.
+
+    key_columns maps the chunk_messages columns that identify a message to the
+    columns of the messages table, position is the SQL expression that orders
+    the messages of a conversation, and from_row turns a messages row into a
+    message.
+    """
+
+    def __init__(
+        self,
+        embeddings_table: str,
+        key_columns: dict[str, str],
+        position: str,
+        from_row: Callable[[dict], M],
+        message_filter: str = "",
+    ):
+        self.embeddings_table = embeddings_table
+        self.key_columns = key_columns
+        self.position = position
+        self.from_row = from_row
+        # Messages that are never chunked, e.g. without content
+        self.message_filter = f" AND {message_filter}" if message_filter else ""
+        self.join = " AND ".join(
+            f"messages.{message_column} = chunk_messages.{column}"
+            for column, message_column in key_columns.items()
+        )
+
+    def get_messages_without_chunks(self, conn, limit: int) -> list[M]:
+        """Messages that are not in a chunk yet, oldest first per channel"""
+        cursor = conn.execute(
+            f"""
+        SELECT messages.*
+        FROM messages
+        LEFT JOIN chunk_messages ON {self.join}
+        WHERE chunk_messages.chunk_id IS NULL {self.message_filter}
+        ORDER BY messages.channel_id, {self.position}
+        LIMIT ?
+        """,
+            (limit,),
+        )
+        return [self.from_row(dict(row)) for row in cursor.fetchall()]
+
+    def count_messages_without_chunks(self, conn) -> int:
+        cursor = conn.execute(
+            f"""
+        SELECT COUNT(*)
+        FROM messages
+        LEFT JOIN chunk_messages ON {self.join}
+        WHERE chunk_messages.chunk_id IS NULL {self.message_filter}
+        """
+        )
+        return cursor.fetchone()[0]
+
+    def get_trailing_chunk(
+        self, conn, conversation: str, params: Sequence
+    ) -> tuple[str, list[M]] | None:
+        """
+        The id and messages of the chunk holding the latest chunked message of a
+        conversation, selected by the conversation condition on messages.
+        """
+        row = conn.execute(
+            f"""
+        SELECT chunk_messages.chunk_id
+        FROM messages
+        JOIN chunk_messages ON {self.join}
+        WHERE {conversation}
+        ORDER BY {self.position} DESC
+        LIMIT 1
+        """,
+            params,
+        ).fetchone()
+        if row is None:
+            return None
+
+        chunk_id = row["chunk_id"]
+        cursor = conn.execute(
+            f"""
+        SELECT messages.*
+        FROM chunk_messages
+        JOIN messages ON {self.join}
+        WHERE chunk_messages.chunk_id = ?
+        ORDER BY {self.position}
+        """,
+            (chunk_id,),
+        )
+        return chunk_id, [self.from_row(dict(row)) for row in cursor.fetchall()]
+
+    def get_trailing_chunks(
+        self,
+        conn,
+        conversations: Iterable[K],
+        get_condition: Callable[[K], tuple[str, Sequence]],
+    ) -> dict[K, tuple[str, list[M]]]:
+        """The trailing chunks of the conversations that have one"""
+        trailing_chunks = {}
+        for key in conversations:
+            trailing_chunk = self.get_trailing_chunk(conn, *get_condition(key))
+            if trailing_chunk is not None:
+                trailing_chunks[key] = trailing_chunk
+        return trailing_chunks
+
+    def get_chunk_messages(
+        self,
+        conn,
+        message_keys: list[list[tuple]],
+        where_clause: str = "",
+        params: Sequence = (),
+    ) -> list[list[M]]:
+        """
+        The messages of every chunk in one query, message_keys holds the key
+        columns of the messages of each chunk. where_clause (" AND ...") filters
+        the messages. Returns the messages per chunk, in the order of the keys.
+        """
+        keys = [
+            [chunk_idx, *key]
+            for chunk_idx, chunk_keys in enumerate(message_keys)
+            for key in chunk_keys
+        ]
+        join = " AND ".join(
+            f"messages.{message_column} = json_extract(k.value, '$[{i + 1}]')"
+            for i, message_column in enumerate(self.key_columns.values())
+        )
+        cursor = conn.execute(
+            f"""
+        SELECT json_extract(k.value, '$[0]') AS chunk_idx, messages.*
+        FROM json_each(?) AS k
+        JOIN messages ON {join}
+        WHERE 1 = 1 {where_clause}
+        ORDER BY k.key
+        """,
+            (json.dumps(keys), *params),
+        )
+        messages = [[] for _ in message_keys]
+        for row in cursor.fetchall():
+            data = dict(row)
+            messages[data.pop("chunk_idx")].append(self.from_row(data))
+        return messages
+
+    def delete_chunks(self, conn, chunk_ids: list[str]):
+        """Remove chunks and their message mapping, without committing"""
+        chunk_ids_json = json.dumps(chunk_ids)
+        conn.execute(
+            f"""DELETE FROM {self.embeddings_table}
+            WHERE chunk_id IN (SELECT value FROM json_each(?))""",
+            (chunk_ids_json,),
+        )
+        conn.execute(
+            "DELETE FROM chunk_messages WHERE chunk_id IN (SELECT value FROM json_each(?))",
+            (chunk_ids_json,),
+        )
+
+    def upsert_chunks(
+        self, conn, chunks: list[tuple[str, list[float], str, list[tuple]]]
+    ):
+        """
+        Store (chunk_id, embedding, chunk_text, message keys) chunks. Re-chunked
+        windows keep their id, the stored version is replaced.
+        """
+        self.delete_chunks(conn, [chunk_id for chunk_id, *_ in chunks])
+        conn.executemany(
+            f"""
+        INSERT INTO {self.embeddings_table} (chunk_id, sample_embedding, chunk_text)
+        VALUES (?, ?, ?)
+        """,
+            [
+                (chunk_id, serialize_float32(embedding), chunk_text)
+                for chunk_id, embedding, chunk_text, _ in chunks
+            ],
+        )
+        columns = ["chunk_id", *self.key_columns]
+        conn.executemany(
+            f"""
+        INSERT OR REPLACE INTO chunk_messages ({", ".join(columns)})
+        VALUES ({", ".join("?" for _ in columns)})
+        """,
+            [
+                (chunk_id, *key)
+                for chunk_id, _, _, message_keys in chunks
+                for key in message_keys
+            ],
+        )
+        conn.commit()
+
+
+def to_fts_query(query: str) -> str:
+    """Quote every term, so punctuation is matched instead of parsed as FTS syntax."""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " OR ".join(f'"{term}"' for term in terms if term.strip('"'))
@@ -0,0 +1,212 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+import sqlite_vec
+
+BUSY_TIMEOUT_SECONDS = 30.0
+
+
+class ConnectionStats:
+    """Counts and timings of connection checkouts, per connection kind"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def record(self, kind: str, wait_seconds: float, held_seconds: float):
+        with self._lock:
+            stats = self._stats.setdefault(
+                kind,
+                {"count": 0, "wait_seconds": 0.0, "held_seconds": 0.0, "max_held": 0.0},
+            )
+            stats["count"] += 1
+            stats["wait_seconds"] += wait_seconds
+            stats["held_seconds"] += held_seconds
+            stats["max_held"] = max(stats["max_held"], held_seconds)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            res = {}
+            for kind, stats in self._stats.items():
+                count = stats["count"]
+                res[kind] = {
+                    "count": count,
+                    "avg_wait_ms": round(stats["wait_seconds"] / count * 1000, 3),
+                    "avg_held_ms": round(stats["held_seconds"] / count * 1000, 3),
+                    "max_held_ms": round(stats["max_held"] * 1000, 3),
+                }
+            return res
+
+
+class ConnectionManager:
+    """
+    Long-lived connections to a single sqlite database.
+
+    Migrations run once, before the first connection is handed out. Writes go
+    through a single WAL-mode connection guarded by a lock, reads use one
+    connection per thread and do not wait for the writer.
+    """
+
+    def __init__(self, path: Path, migrate: Callable[[sqlite3.Connection], None]):
+        self.path = Path(path)
+        self._migrate = migrate
+        self.stats = ConnectionStats()
+        self.connect_seconds = 0.0
+        self.migration_seconds = 0.0
+
+        self._init_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        start = time.perf_counter()
+        conn = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        self.connect_seconds += time.perf_counter() - start
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        with self._init_lock:
+            if self._writer is None:
+                conn = self._connect()
+                conn.execute("PRAGMA journal_mode = WAL")
+                start = time.perf_counter()
+                self._migrate(conn)
+                self.migration_seconds = time.perf_counter() - start
+                self._writer = conn
+            return self._writer
+
+    def _get_reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Make sure the schema exists before the first read
+            self._get_writer()
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._init_lock:
+                self._readers.append(conn)
+        return conn
+
+    def initialize(self):
+        """Open the writer and run migrations, call once at startup"""
+        self._get_writer()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Exclusive access to the writer, uncommitted work is committed on exit"""
+        requested_at = time.perf_counter()
+        conn = self._get_writer()
+        with self._write_lock:
+            acquired_at = time.perf_counter()
+            try:
+                yield conn
+                if conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                self.stats.record(
+                    "write",
+                    acquired_at - requested_at,
+                    time.perf_counter() - acquired_at,
+                )
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """The read-only connection of the calling thread"""
+        requested_at = time.perf_counter()
+        conn = self._get_reader()
+        acquired_at = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self.stats.record(
+                "read", acquired_at - requested_at, time.perf_counter() - acquired_at
+            )
+
+    def get_stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "n_readers": len(self._readers),
+            "connect_ms": round(self.connect_seconds * 1000, 3),
+            "migration_ms": round(self.migration_seconds * 1000, 3),
+            **self.stats.summary(),
+        }
+
+    def close(self):
+        with self._init_lock:
+            with self._write_lock:
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            # Threads holding a closed reader reconnect on their next checkout
+            self._local = threading.local()
+
+
+class ConnectionRegistry:
+    """
+    One shared ConnectionManager per database path, created on first use.
+    default_path is called on every lookup without a path, so it can follow
+    settings that change at runtime.
+    """
+
+    def __init__(
+        self,
+        migrate: Callable[[sqlite3.Connection], None],
+        default_path: Callable[[], Path | str],
+    ):
+        self._migrate = migrate
+        self._default_path = default_path
+        self._lock = threading.Lock()
+        self._managers: dict[Path, ConnectionManager] = {}
+
+    def get(self, path: Path | str | None = None) -> ConnectionManager:
+        """The shared connection manager for a database, migrations run on first use"""
+        path = Path(path or self._default_path())
+        with self._lock:
+            if path not in self._managers:
+                self._managers[path] = ConnectionManager(path, self._migrate)
+            return self._managers[path]
+
+    @contextmanager
+    def connect(
+        self, path: Path | str | None = None, readonly: bool = False
+    ) -> Iterator[sqlite3.Connection]:
+        """
+        Check out a shared connection. Writers are serialized, readonly connections
+        are per thread and can be used while a write is in progress.
+        """
+        manager = self.get(path)
+        with manager.reader() if readonly else manager.writer() as conn:
+            yield conn
+
+    def get_stats(self) -> list[dict]:
+        with self._lock:
+            managers = list(self._managers.values())
+        return [manager.get_stats() for manager in managers]
+
+    def close(self):
+        with self._lock:
+            managers = list(self._managers.values())
+            self._managers.clear()
+        for manager in managers:
+            manager.close()
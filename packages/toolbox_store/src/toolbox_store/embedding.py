@@ -1,6 +1,8 @@
 import itertools
+import re
 from abc import ABC, abstractmethod
 from functools import cached_property
+from typing import Literal
 
 from semantic_text_splitter import TextSplitter
 from tqdm import tqdm
@@ -26,10 +28,58 @@ PROMPTS: dict[str, dict[str, str]] = {
         "retrieval-document": "title: none | text: ",
         "sts": "task: sentence similarity | query: ",
         "summarization": "task: summarization | query: ",
-    }
+    },
+    # Source: https://huggingface.co/nomic-ai/nomic-embed-text-v1.5
+    "nomic-embed-text": {
+        "query": "search_query: ",
+        "document": "search_document: ",
+    },
 }
 
 
+# Context window (in tokens) of the embedding models, longer inputs get truncated
+MODEL_MAX_TOKENS: dict[str, int] = {
+    "embeddinggemma": 2048,
+    "nomic-embed-text": 2048,
+}
+DEFAULT_MAX_TOKENS = 512
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def approx_token_count(text: str) -> int:
+    """Cheap token count estimate: words and punctuation marks, ignoring whitespace."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def model_max_tokens(model_name: str) -> int:
+    """Context window of a model, e.g. "nomic-embed-text:v1.5" -> 2048."""
+    return MODEL_MAX_TOKENS.get(model_name.split(":")[0], DEFAULT_MAX_TOKENS)
+
+
+def create_splitter(
+    chunk_size: int,
+    chunk_overlap: int = 0,
+    unit: Literal["chars", "tokens"] = "chars",
+) -> TextSplitter:
+    """Create a splitter that cuts at the highest possible semantic level
+    (sections, paragraphs, sentences, words) while staying within chunk_size.
+
+    Args:
+        chunk_size: Maximum size of a chunk
+        chunk_overlap: Maximum overlap between consecutive chunks
+        unit: Measure sizes in characters or in (approximate) tokens
+
+    Returns:
+        A configured TextSplitter
+    """
+    if unit == "tokens":
+        return TextSplitter.from_callback(
+            approx_token_count, capacity=chunk_size, overlap=chunk_overlap
+        )
+    return TextSplitter(capacity=chunk_size, overlap=chunk_overlap)
+
+
 class Embedder(ABC):
     """Base class for all embedders with shared functionality."""
 
@@ -42,7 +92,7 @@ class Embedder(ABC):
     ):
         self.model_name = model_name
         self.batch_size = batch_size
-        self.splitter = TextSplitter(capacity=chunk_size, overlap=chunk_overlap)
+        self.splitter = create_splitter(chunk_size, chunk_overlap)
 
     @cached_property
     def base_model_name(self) -> str:
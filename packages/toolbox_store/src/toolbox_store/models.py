@@ -243,3 +243,8 @@ class TBDocumentChunk(BaseModel):
 
 class RetrievedChunk(TBDocumentChunk):
     distance: float
+
+
+# Resolve the forward reference now, so TBDocument subclasses defined in other
+# modules are complete too
+TBDocument.model_rebuild()
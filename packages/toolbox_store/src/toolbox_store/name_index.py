@@ -0,0 +1,156 @@
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Any, Hashable, Iterable
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# Rebuild the arrays once this share of the slots belongs to replaced entries
+MAX_DEAD_FRACTION = 0.5
+# Names that share the most grams with a query, scored by rapidfuzz
+MAX_CANDIDATES = 128
+
+
+def normalize_name(name: str) -> str:
+    """Casefold and strip accents, so "José" matches "jose" """
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def get_grams(normalized: str) -> set[str]:
+    """Trigrams, and the first letter of every word so short queries have grams too"""
+    padded = f" {normalized.strip()} "
+    grams = {padded[i : i + 3] for i in range(len(padded) - 2)}
+    grams.update(f" {word[0]}" for word in normalized.split())
+    return grams
+
+
+class NameIndex:
+    """
+    Fuzzy name lookup over a prebuilt choice array.
+
+    Entries are keyed, e.g. by user or channel id, and can have several names.
+    Upserting an entry only touches its own names: replaced names are marked
+    dead and the arrays are compacted when enough of them have piled up.
+    Queries are only scored against the MAX_CANDIDATES names that share the most
+    grams with them, and against all names if that yields too few.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # key -> slots of its names
+        self._slots_by_key: dict[Hashable, list[int]] = {}
+        self._names: list[str] = []
+        self._normalized: list[str] = []
+        self._payloads: list[Any] = []
+        self._alive: list[bool] = []
+        self._n_dead = 0
+        self._gram_postings: dict[str, list[int]] = defaultdict(list)
+        # Array copies of the postings and the alive flags, made on first use
+        self._posting_arrays: dict[str, np.ndarray] = {}
+        self._alive_array: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self._names) - self._n_dead
+
+    def _add_slot(self, name: str, payload: Any) -> int:
+        slot = len(self._names)
+        normalized = normalize_name(name).strip()
+        self._names.append(name)
+        self._normalized.append(normalized)
+        self._payloads.append(payload)
+        self._alive.append(True)
+        for gram in get_grams(normalized):
+            self._gram_postings[gram].append(slot)
+            self._posting_arrays.pop(gram, None)
+        self._alive_array = None
+        return slot
+
+    def _compact(self):
+        entries = [
+            (key, [(self._names[s], self._payloads[s]) for s in slots])
+            for key, slots in self._slots_by_key.items()
+        ]
+        self._reset()
+        for key, names in entries:
+            self._slots_by_key[key] = [
+                self._add_slot(name, payload) for name, payload in names
+            ]
+
+    def upsert(self, key: Hashable, names: Iterable[str], payload: Any):
+        """Set the names of an entry, empty names are skipped"""
+        names = list(dict.fromkeys(name for name in names if name and name.strip()))
+        with self._lock:
+            old_slots = self._slots_by_key.get(key, [])
+            if [self._names[s] for s in old_slots] == names and all(
+                self._payloads[s] == payload for s in old_slots
+            ):
+                return
+            for slot in old_slots:
+                self._alive[slot] = False
+            self._n_dead += len(old_slots)
+            self._alive_array = None
+            self._slots_by_key[key] = [self._add_slot(n, payload) for n in names]
+            if self._n_dead > MAX_DEAD_FRACTION * len(self._names):
+                self._compact()
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            for slot in self._slots_by_key.pop(key, []):
+                self._alive[slot] = False
+                self._n_dead += 1
+            self._alive_array = None
+
+    def keys(self) -> set[Hashable]:
+        with self._lock:
+            return set(self._slots_by_key)
+
+    def _get_posting_array(self, gram: str) -> np.ndarray:
+        array = self._posting_arrays.get(gram)
+        if array is None:
+            postings = self._gram_postings.get(gram, [])
+            array = self._posting_arrays[gram] = np.array(postings, dtype=np.int64)
+        return array
+
+    def _candidates(self, normalized_query: str) -> list[int]:
+        """Alive slots sharing the most grams with the query"""
+        if self._alive_array is None:
+            self._alive_array = np.array(self._alive, dtype=bool)
+        postings = [
+            self._get_posting_array(gram)
+            for gram in get_grams(normalized_query)
+            if gram in self._gram_postings
+        ]
+        if not postings:
+            return np.flatnonzero(self._alive_array).tolist()
+
+        slots, counts = np.unique(np.concatenate(postings), return_counts=True)
+        alive = self._alive_array[slots]
+        slots, counts = slots[alive], counts[alive]
+        if len(slots) > MAX_CANDIDATES:
+            top = np.argpartition(counts, -MAX_CANDIDATES)[-MAX_CANDIDATES:]
+            slots = np.sort(slots[top])
+        return slots.tolist()
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float, Any]]:
+        """Best matching (name, score, payload) tuples, best first"""
+        normalized_query = normalize_name(query).strip()
+        if not normalized_query:
+            return []
+        with self._lock:
+            candidates = self._candidates(normalized_query)
+            if len(candidates) < limit:
+                # Typos can share no gram with the name that was meant
+                candidates = [slot for slot, alive in enumerate(self._alive) if alive]
+            choices = [self._normalized[slot] for slot in candidates]
+            matches = process.extract(
+                normalized_query, choices, scorer=fuzz.WRatio, limit=limit
+            )
+            return [
+                (self._names[candidates[i]], score, self._payloads[candidates[i]])
+                for _, score, i in matches
+            ]
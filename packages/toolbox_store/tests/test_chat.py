@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from toolbox_store.chat import split_into_windows, window_conversations
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class ChatMessage(NamedTuple):
+    id: str
+    channel_id: str
+    author_id: str
+    text: str
+    timestamp: datetime
+
+    def format(self) -> str:
+        return f"{self.author_id}: {self.text}"
+
+
+def make_messages(
+    channel_id: str, texts: list[str], minutes_apart: float = 1, first: int = 0
+) -> list[ChatMessage]:
+    return [
+        ChatMessage(
+            id=str(first + i),
+            channel_id=channel_id,
+            author_id=f"user-{i % 2}",
+            text=text,
+            timestamp=START + timedelta(minutes=(first + i) * minutes_apart),
+        )
+        for i, text in enumerate(texts)
+    ]
+
+
+def get_text(message: ChatMessage) -> str:
+    return message.format()
+
+
+def get_time(message: ChatMessage) -> float:
+    return message.timestamp.timestamp()
+
+
+def test_split_into_windows_on_tokens_and_gaps() -> None:
+    messages = make_messages("c1", ["one two three"] * 4)
+    windows = split_into_windows(
+        messages, get_text=get_text, get_time=get_time, max_tokens=14, overlap=0
+    )
+    # "user-0: one two three" is 7 tokens
+    assert [len(window) for window in windows] == [2, 2]
+
+    far_apart = make_messages("c1", ["hi", "there"], minutes_apart=60)
+    assert len(split_into_windows(far_apart, get_text, get_time)) == 2
+
+
+def test_split_into_windows_repeats_the_overlap() -> None:
+    messages = make_messages("c1", ["one two three"] * 4)
+
+    windows = split_into_windows(messages, get_text, get_time, max_tokens=14)
+
+    assert [[m.id for m in window] for window in windows] == [
+        ["0", "1"],
+        ["1", "2"],
+        ["2", "3"],
+    ]
+
+
+def test_window_conversations_replaces_the_trailing_window() -> None:
+    messages = make_messages("c1", ["hello"] * 3) + make_messages("c2", ["hi"])
+
+    def window(trailing=None):
+        return window_conversations(
+            messages,
+            get_conversation=lambda m: m.channel_id,
+            get_position=lambda m: int(m.id),
+            get_text=get_text,
+            get_time=get_time,
+            trailing_windows=trailing,
+        )
+
+    assert [(id_, len(w)) for id_, w in window()] == [(None, 3), (None, 1)]
+
+    # The trailing window of c1 grows, c2 gets a new window
+    trailing = {"c1": ("w1", make_messages("c1", ["before"], first=-1))}
+    assert [(id_, len(w)) for id_, w in window(trailing)] == [("w1", 4), (None, 1)]
+
+    # History older than the trailing window starts fresh windows
+    trailing = {"c1": ("w1", make_messages("c1", ["after"], first=10))}
+    assert [(id_, len(w)) for id_, w in window(trailing)] == [(None, 3), (None, 1)]
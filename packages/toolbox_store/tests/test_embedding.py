@@ -0,0 +1,32 @@
+from toolbox_store.embedding import (
+    DEFAULT_MAX_TOKENS,
+    approx_token_count,
+    create_splitter,
+    model_max_tokens,
+)
+
+
+def test_approx_token_count_ignores_whitespace() -> None:
+    assert approx_token_count("Hello, world!") == 4
+    assert approx_token_count("Hello,     world!\n\n\n") == 4
+
+
+def test_model_max_tokens() -> None:
+    assert model_max_tokens("nomic-embed-text:v1.5") == 2048
+    assert model_max_tokens("unknown-model") == DEFAULT_MAX_TOKENS
+
+
+def test_token_splitter_respects_budget_and_paragraphs() -> None:
+    """Test that chunks stay within the token budget and split on paragraphs"""
+    paragraph_1 = "First paragraph sentence. " * 5
+    paragraph_2 = "Second paragraph sentence. " * 5
+    text = f"{paragraph_1.strip()}\n\n{paragraph_2.strip()}"
+
+    splitter = create_splitter(chunk_size=20, chunk_overlap=0, unit="tokens")
+    chunks = splitter.chunks(text)
+
+    assert len(chunks) == 2
+    assert chunks[0] == paragraph_1.strip()
+    assert chunks[1] == paragraph_2.strip()
+    for chunk in chunks:
+        assert approx_token_count(chunk) <= 20
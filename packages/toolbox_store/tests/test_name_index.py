@@ -0,0 +1,33 @@
+"""Test the in-memory fuzzy name index."""
+
+from toolbox_store.name_index import NameIndex, normalize_name
+
+
+def test_normalize_name_casefolds_and_strips_accents():
+    assert normalize_name("José Ñúñez") == "jose nunez"
+    assert normalize_name("STRASSE") == normalize_name("straße")
+
+
+def test_upsert_replaces_the_names_of_an_entry():
+    index = NameIndex()
+    index.upsert("u1", ["alice", "Alice Smith"], "u1")
+    index.upsert("u2", ["bob"], "u2")
+    assert index.search("alice", limit=1)[0][2] == "u1"
+
+    index.upsert("u1", ["carol"], "u1")
+    assert len(index) == 2
+    assert [payload for _, _, payload in index.search("carol", limit=1)] == ["u1"]
+    assert all(name != "alice" for name, _, _ in index.search("alice"))
+
+    index.remove("u2")
+    assert all(payload != "u2" for _, _, payload in index.search("bob"))
+
+
+def test_search_falls_back_to_all_names_for_typos():
+    index = NameIndex()
+    for i in range(100):
+        index.upsert(i, [f"member{i}"], i)
+    index.upsert("john", ["john"], "john")
+
+    # No trigram or first letter in common with "john"
+    assert index.search("ohjn", limit=3)